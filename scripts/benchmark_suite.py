@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+ChromaDB MCP ベンチマークスイート
+合成した日英混在の会話コーパスと決定的なダミー埋め込み関数でオフライン実行し、
+取り込み・検索・メンテナンス走査の性能をJSONで出力する（コミット間の回帰比較用）
+
+計測対象:
+- 取り込み: chroma_store_md_conversation / chroma_store_html_impl（チャンク/秒）
+- 検索: chroma_search_text / chroma_flexible_search（レイテンシ p50/p95/p99）
+- メンテナンス: chroma_cleanup_duplicates(dry_run) / chroma_integrity_validate_large_dataset
+
+使い方:
+    python scripts/benchmark_suite.py --sizes 10000,100000,1000000 --output bench.json
+    python scripts/benchmark_suite.py --sizes 10000 --compare bench_baseline.json
+
+時間計測中はtracemallocを使わない（トレースのオーバーヘッドで取り込み・走査の速度が歪むため）。
+メモリはresource.getrusageの最大RSS（プロセスの最高水位）と、その計測中の増加分を出す（resourceのないWindowsではNone）。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# src/をimportパスに追加（サーバー本体のモジュールを直接計測する）
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import chromadb
+from chromadb.config import Settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from chromadb.api.types import EmbeddingFunction
+except ImportError:  # 古いchromadb
+    EmbeddingFunction = object
+
+COLLECTION_NAME = "bench_conversations"
+DEFAULT_DIM = 64
+
+JA_SPEAKERS = ["ユーザー", "アシスタント", "山田", "佐藤", "鈴木"]
+EN_SPEAKERS = ["User", "Assistant", "Alice", "Bob"]
+JA_TOPICS = ["ChromaDBの設定", "埋め込みモデル", "バックアップ手順", "検索精度の改善", "メタデータ統一"]
+EN_TOPICS = ["Index tuning", "Embedding cache", "Backup strategy", "Query latency", "Schema migration"]
+JA_PHRASES = [
+    "コレクションの件数を確認してください", "埋め込みの次元数が一致しません", "バックアップを作成しました",
+    "検索結果の上位5件を表示します", "メタデータのタイムスタンプを補完します", "重複ドキュメントを削除しました",
+    "HTMLをMarkdownに変換して学習します", "設定ファイルのパスを修正しました", "インデックスの再構築が必要です",
+]
+EN_PHRASES = [
+    "please check the collection count", "the embedding dimension does not match", "backup completed successfully",
+    "showing the top five search results", "backfilling metadata timestamps", "removed duplicate documents",
+    "converting HTML to Markdown before ingest", "fixed the configuration path", "the index needs a rebuild",
+]
+SEARCH_QUERIES = ["バックアップ", "embedding dimension", "検索結果", "duplicate documents", "設定ファイル", "index rebuild"]
+
+
+class DeterministicEmbeddingFunction(EmbeddingFunction):
+    """トークンのハッシュを次元に割り当てる決定的なダミー埋め込み（モデル読み込みなし）"""
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+
+    def __call__(self, input):  # chromadbのEmbeddingFunctionプロトコル
+        vectors = []
+        for text in input:
+            vec = [0.0] * self.dim
+            tokens = str(text).split() or [str(text)]
+            # 日本語は空白区切りにならないため2文字単位でも特徴を取る
+            if len(tokens) == 1 and len(tokens[0]) > 2:
+                tokens = [tokens[0][i:i + 2] for i in range(len(tokens[0]) - 1)]
+            for token in tokens:
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                vec[digest[0] % self.dim] += 1.0 if digest[1] & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            vectors.append([v / norm for v in vec])
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark_deterministic"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "DeterministicEmbeddingFunction":
+        return DeterministicEmbeddingFunction(config.get("dim", DEFAULT_DIM))
+
+
+class ToolCapture:
+    """register_*_toolsに渡すmcp代替（登録された関数を名前で保持する）"""
+
+    def __init__(self):
+        self.tools: Dict[str, Callable] = {}
+
+    def tool(self, *args, **kwargs):
+        if args and callable(args[0]):
+            self.tools[args[0].__name__] = args[0]
+            return args[0]
+
+        def register(fn):
+            self.tools[kwargs.get("name") or fn.__name__] = fn
+            return fn
+        return register
+
+    def call(self, name: str, **kwargs):
+        result = self.tools[name](**kwargs)
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+        return result
+
+
+# ---------------------------------------------------------------------------
+# 合成コーパス
+# ---------------------------------------------------------------------------
+
+def synth_utterance(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        parts = rng.sample(JA_PHRASES, k=rng.randint(1, 3))
+        return "。".join(parts) + "。"
+    parts = rng.sample(EN_PHRASES, k=rng.randint(1, 3))
+    return ". ".join(parts).capitalize() + "."
+
+
+def synth_documents(count: int, seed: int, start: int = 0) -> Dict[str, List[Any]]:
+    """collection.add用の合成ドキュメント（startから連番のID・一部は意図的な重複本文）"""
+    rng = random.Random(seed + start)
+    base = datetime(2025, 1, 1)
+    ids, documents, metadatas = [], [], []
+    for i in range(start, start + count):
+        ja = rng.random() < 0.5
+        speaker = rng.choice(JA_SPEAKERS if ja else EN_SPEAKERS)
+        when = base + timedelta(minutes=i)
+        text = synth_utterance(rng)
+        if documents and rng.random() < 0.02:
+            text = documents[rng.randrange(len(documents))]
+        ids.append(f"bench_{i}")
+        documents.append(f"{when:%Y-%m-%d %H:%M} {speaker}: {text}")
+        metadatas.append({
+            "source": "benchmark",
+            "speaker": speaker,
+            "topic": rng.choice(JA_TOPICS if ja else EN_TOPICS),
+            "language": "ja" if ja else "en",
+            "timestamp": when.isoformat(),
+            "timestamp_epoch": when.timestamp()
+        })
+    return {"ids": ids, "documents": documents, "metadatas": metadatas}
+
+
+def synth_markdown(path: Path, utterances: int, seed: int) -> Path:
+    rng = random.Random(seed)
+    lines = []
+    for i in range(utterances):
+        if i % 25 == 0:
+            lines.append(f"## {rng.choice(JA_TOPICS + EN_TOPICS)}")
+        speaker = rng.choice(JA_SPEAKERS + EN_SPEAKERS)
+        lines.append(f"{speaker}: {synth_utterance(rng)}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def synth_html(path: Path, sections: int, seed: int) -> Path:
+    rng = random.Random(seed)
+    body = []
+    for i in range(sections):
+        body.append(f"<h2>{rng.choice(JA_TOPICS + EN_TOPICS)} {i}</h2>")
+        for _ in range(rng.randint(2, 5)):
+            body.append(f"<p>{rng.choice(JA_SPEAKERS + EN_SPEAKERS)}: {synth_utterance(rng)}</p>")
+    path.write_text(f"<html><head><title>bench</title></head><body>{''.join(body)}</body></html>", encoding="utf-8")
+    return path
+
+
+# ---------------------------------------------------------------------------
+# 計測ヘルパー
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))], 3)
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, Any]:
+    return {
+        "runs": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else None,
+        "p50_ms": percentile(samples_ms, 0.50),
+        "p95_ms": percentile(samples_ms, 0.95),
+        "p99_ms": percentile(samples_ms, 0.99),
+        "max_ms": round(max(samples_ms), 3) if samples_ms else None
+    }
+
+
+def max_rss_mb() -> Optional[float]:
+    """プロセスの最大RSS（MB。LinuxはKB単位、macOSはバイト単位で返る）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed(fn: Callable[[], Any]) -> Dict[str, Any]:
+    rss_before = max_rss_mb()
+    started = time.perf_counter()
+    error = None
+    result = None
+    try:
+        result = fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    rss_after = max_rss_mb()
+    if isinstance(result, dict) and result.get("success") is False:
+        error = str(result.get("error") or result.get("message"))
+    return {
+        "seconds": round(elapsed, 4),
+        "peak_rss_mb": round(rss_after, 2) if rss_after is not None else None,
+        "rss_growth_mb": round(rss_after - rss_before, 2) if rss_after is not None else None,
+        "error": error,
+        "result": result
+    }
+
+
+# ---------------------------------------------------------------------------
+# ベンチマーク本体
+# ---------------------------------------------------------------------------
+
+class BenchmarkSuite:
+    def __init__(self, workdir: Path, seed: int, dim: int, queries: int, ingest_utterances: int):
+        self.workdir = workdir
+        self.seed = seed
+        self.queries = queries
+        self.ingest_utterances = ingest_utterances
+        self.embedding = DeterministicEmbeddingFunction(dim)
+        from modules.core_manager import ChromaDBManager
+        from modules.collection_stats import StatsTrackingClient
+        from modules.embedding_provider import EmbeddingClient
+        self.manager = ChromaDBManager()
+        # ChromaDBManager._initialize と同じクライアント構成（統計ストア・埋め込みラッパー）で、埋め込み関数だけダミーに差し替える
+        db_path = workdir / "db"
+        self.client = StatsTrackingClient(
+            EmbeddingClient(
+                chromadb.PersistentClient(path=str(db_path), settings=Settings(anonymized_telemetry=False)),
+                self.embedding
+            ),
+            self.manager.stats
+        )
+        self.manager.chroma_client = self.client
+        self.manager.resources.db_path = str(db_path)
+        self.manager.initialized = True
+        self.mcp = ToolCapture()
+        from modules.search_tools import register_search_tools
+        from modules.storage_tools import register_storage_tools
+        from modules.backup_tools import register_backup_tools
+        from modules.integrity_tools import register_integrity_tools
+        for register in (register_search_tools, register_storage_tools, register_backup_tools, register_integrity_tools):
+            register(self.mcp, self.manager)
+
+    def reset_collection(self):
+        try:
+            self.client.delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+        collection = self.client.create_collection(COLLECTION_NAME)
+        self.manager.collections[COLLECTION_NAME] = collection
+        return collection
+
+    def seed_collection(self, collection, size: int) -> Dict[str, Any]:
+        """目標件数まで合成ドキュメントをバッチ投入（取り込み計測とは別の下準備）"""
+        batch = min(getattr(self.client, "get_max_batch_size", lambda: 5000)(), 5000)
+        started = time.perf_counter()
+        current = collection.count()
+        while current < size:
+            n = min(batch, size - current)
+            collection.add(**synth_documents(n, self.seed, start=current))
+            current += n
+        elapsed = time.perf_counter() - started
+        return {"documents": current, "seconds": round(elapsed, 3), "docs_per_sec": round(current / elapsed, 1) if elapsed else None}
+
+    def bench_ingest_md(self) -> Dict[str, Any]:
+        from modules.chroma_store_core import chroma_store_md_conversation
+        path = synth_markdown(self.workdir / "bench_conversation.md", self.ingest_utterances, self.seed)
+        run = timed(lambda: chroma_store_md_conversation(
+            file_path=str(path), collection_name=COLLECTION_NAME, project="benchmark", manager=self.manager
+        ))
+        return self._throughput(run, self.ingest_utterances)
+
+    def bench_ingest_html(self) -> Dict[str, Any]:
+        try:
+            from modules.html_learning import chroma_store_html_impl
+        except ImportError as e:
+            return {"skipped": f"html_learning unavailable: {e}"}
+        sections = max(1, self.ingest_utterances // 4)
+        path = synth_html(self.workdir / "bench_page.html", sections, self.seed)
+        run = timed(lambda: chroma_store_html_impl(
+            html_path=str(path), manager=self.manager, collection_name=COLLECTION_NAME,
+            project="benchmark", include_related_files=False
+        ))
+        chunks = None
+        if isinstance(run["result"], dict):
+            chunks = run["result"].get("total_chunks")
+        return self._throughput(run, chunks or sections)
+
+    @staticmethod
+    def _throughput(run: Dict[str, Any], units: int) -> Dict[str, Any]:
+        return {
+            "units": units,
+            "seconds": run["seconds"],
+            "units_per_sec": round(units / run["seconds"], 1) if run["seconds"] else None,
+            "peak_rss_mb": run["peak_rss_mb"],
+            "rss_growth_mb": run["rss_growth_mb"],
+            "error": run["error"]
+        }
+
+    def bench_queries(self, tool: str, make_kwargs: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        samples = []
+        errors = 0
+        for i in range(self.queries):
+            query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+            started = time.perf_counter()
+            try:
+                result = self.mcp.call(tool, **make_kwargs(query))
+                if isinstance(result, dict) and result.get("success") is False:
+                    errors += 1
+            except Exception:
+                errors += 1
+            samples.append((time.perf_counter() - started) * 1000)
+        summary = latency_summary(samples)
+        summary["errors"] = errors
+        return summary
+
+    def bench_maintenance(self, tool: str, **kwargs) -> Dict[str, Any]:
+        run = timed(lambda: self.mcp.call(tool, **kwargs))
+        return {"seconds": run["seconds"], "peak_rss_mb": run["peak_rss_mb"], "rss_growth_mb": run["rss_growth_mb"],
+                "error": run["error"]}
+
+    def run_size(self, size: int, skip: List[str]) -> Dict[str, Any]:
+        print(f"[bench] size={size}: seeding...", file=sys.stderr)
+        collection = self.reset_collection()
+        out: Dict[str, Any] = {"seed": self.seed_collection(collection, size)}
+        if "ingest" not in skip:
+            print(f"[bench] size={size}: ingest", file=sys.stderr)
+            out["ingest_md_conversation"] = self.bench_ingest_md()
+            out["ingest_html"] = self.bench_ingest_html()
+        if "search" not in skip:
+            print(f"[bench] size={size}: search", file=sys.stderr)
+            out["search_text"] = self.bench_queries(
+                "chroma_search_text", lambda q: {"query": q, "n_results": 10, "collection_name": COLLECTION_NAME})
+            out["flexible_search"] = self.bench_queries(
+                "chroma_flexible_search", lambda q: {"collection_name": COLLECTION_NAME, "query": q, "max_results": 50})
+        if "maintenance" not in skip:
+            print(f"[bench] size={size}: maintenance", file=sys.stderr)
+            out["cleanup_duplicates_dry_run"] = self.bench_maintenance(
+                "chroma_cleanup_duplicates", collection_name=COLLECTION_NAME, dry_run=True)
+            out["integrity_validate"] = self.bench_maintenance(
+                "chroma_integrity_validate_large_dataset", collection_name=COLLECTION_NAME, enable_deep_analysis=False)
+        out["final_count"] = collection.count()
+        return out
+
+
+def environment_info(dim: int, seed: int) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent.parent, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "chromadb": getattr(chromadb, "__version__", "unknown"),
+        "embedding": {"name": DeterministicEmbeddingFunction.name(), "dim": dim},
+        "seed": seed
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """同一サイズ・同一指標の比較（正の変化率は遅くなったことを示す）"""
+    keys = ("seconds", "p50_ms", "p95_ms", "p99_ms")
+    rows = []
+    for size, benches in current.get("results", {}).items():
+        base_benches = baseline.get("results", {}).get(size, {})
+        for bench, values in benches.items():
+            base_values = base_benches.get(bench)
+            if not isinstance(values, dict) or not isinstance(base_values, dict):
+                continue
+            for key in keys:
+                now, before = values.get(key), base_values.get(key)
+                if isinstance(now, (int, float)) and isinstance(before, (int, float)) and before:
+                    rows.append({"size": size, "bench": bench, "metric": key, "baseline": before, "current": now,
+                                 "change_pct": round((now - before) / before * 100, 1)})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ChromaDB MCP benchmark suite (offline, deterministic)")
+    parser.add_argument("--sizes", default="10000", help="カンマ区切りのコレクション件数（例: 10000,100000,1000000）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="ダミー埋め込みの次元数")
+    parser.add_argument("--queries", type=int, default=30, help="検索ベンチマークの試行回数")
+    parser.add_argument("--ingest-utterances", type=int, default=500, help="取り込みベンチマークの発言数")
+    parser.add_argument("--skip", default="", help="省略するグループ（ingest,search,maintenance）")
+    parser.add_argument("--workdir", default=None, help="作業ディレクトリ（省略時は一時ディレクトリを作成し終了時に削除）")
+    parser.add_argument("--output", default=None, help="結果JSONの出力先（省略時は標準出力）")
+    parser.add_argument("--compare", default=None, help="比較対象の過去の結果JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    skip = [s.strip() for s in args.skip.split(",") if s.strip()]
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="chroma_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    report: Dict[str, Any] = {"environment": environment_info(args.dim, args.seed), "results": {}}
+    try:
+        suite = BenchmarkSuite(workdir, args.seed, args.dim, args.queries, args.ingest_utterances)
+        for size in sizes:
+            report["results"][str(size)] = suite.run_size(size, skip)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"[bench] results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
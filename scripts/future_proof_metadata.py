@@ -18,15 +18,28 @@
 import chromadb
 import json
 import os
+import sys
 import hashlib
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Union
 from pathlib import Path
 import mimetypes
 
+# src/modules（バッチ・再開可能なメタデータ移行エンジン）を利用
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+from modules.metadata_migration import MetadataMigration
+from modules.content_features import ContentFeatureKernel
+
 class FutureProofMetadataManager:
     """未来対応型メタデータ管理クラス"""
     
+    # 重要度判定に使う見出しマーカー・技術キーワード（大文字小文字を区別）
+    HEADING_MARKERS = ['#', '==', '--', 'Title:', 'タイトル:']
+    TECH_KEYWORDS = ['API', 'システム', 'implementation', '実装', 'database']
+    # technicalタグを付ける語（小文字化した本文に対して判定）
+    TECHNICAL_TAG_TERMS = ['api', 'システム', 'database']
+    
     def __init__(self, collection_name: str = "mcp_production_knowledge"):
         """初期化"""
         self.client = chromadb.PersistentClient(
@@ -122,40 +135,55 @@ class FutureProofMetadataManager:
                 'multimedia', 'メディア'
             ]
         }
+        
+        # スコア計算に使う特徴量を1回の走査でまとめて抽出するカーネル
+        self.features = ContentFeatureKernel(
+            self.category_rules,
+            terms=self.TECH_KEYWORDS,
+            markers=self.HEADING_MARKERS,
+            tag_terms=self.TECHNICAL_TAG_TERMS
+        )
+
+    def __getstate__(self):
+        # 移行のプロセスプールへは変換に必要な状態だけを渡す（クライアントはpickleできない）
+        state = self.__dict__.copy()
+        state.update(client=None, collection=None)
+        return state
 
     def create_document_hash(self, content: str) -> str:
         """コンテンツのハッシュを作成"""
         return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
 
-    def analyze_content_complexity(self, content: str) -> float:
+    def analyze_content_complexity(self, content: str, features: Optional[Dict[str, Any]] = None) -> float:
         """コンテンツの複雑度を分析"""
         if not content:
             return 0.0
+        features = features or self.features.extract(content)
         
         # 基本的な複雑度指標
         factors = {
-            'length': min(len(content) / 10000, 1.0) * 0.3,
-            'lines': min(content.count('\n') / 100, 1.0) * 0.2,
-            'words': min(len(content.split()) / 1000, 1.0) * 0.2,
-            'code': (content.count('{') + content.count('def ') + content.count('class ')) / 50 * 0.3
+            'length': min(features['length'] / 10000, 1.0) * 0.3,
+            'lines': min(features['lines'] / 100, 1.0) * 0.2,
+            'words': min(features['words'] / 1000, 1.0) * 0.2,
+            'code': features['code_markers'] / 50 * 0.3
         }
         
         return min(sum(factors.values()), 1.0)
 
-    def analyze_content_importance(self, content: str, metadata: Dict) -> float:
+    def analyze_content_importance(self, content: str, metadata: Dict, features: Optional[Dict[str, Any]] = None) -> float:
         """コンテンツの重要度を分析"""
+        features = features or self.features.extract(content)
         importance = 0.0
         
         # タイトル・見出しの存在
-        if any(marker in content for marker in ['#', '==', '--', 'Title:', 'タイトル:']):
+        if features['has_marker']:
             importance += 0.2
         
         # 技術的キーワードの存在
-        tech_keywords = ['API', 'システム', 'implementation', '実装', 'database']
-        importance += min(sum(1 for kw in tech_keywords if kw in content) / 10, 0.3)
+        importance += min(features['term_hits'] / 10, 0.3)
         
         # ファイルサイズ（大きいほど重要）
-        content_length = len(content)
+        content_length = features['length']
         if content_length > 5000:
             importance += 0.2
         elif content_length > 1000:
@@ -167,33 +195,19 @@ class FutureProofMetadataManager:
         
         return min(importance, 1.0)
 
-    def classify_category(self, content: str, metadata: Dict) -> str:
-        """コンテンツのカテゴリを自動分類"""
-        content_lower = content.lower()
-        
-        # カテゴリスコア計算
-        category_scores = {}
-        for category, keywords in self.category_rules.items():
-            score = sum(1 for keyword in keywords if keyword in content_lower)
-            if score > 0:
-                category_scores[category] = score
-        
-        # 最高スコアのカテゴリを返す
-        if category_scores:
-            return max(category_scores.items(), key=lambda x: x[1])[0]
-        
-        return 'other'
+    def classify_category(self, content: str, metadata: Dict, features: Optional[Dict[str, Any]] = None) -> str:
+        """コンテンツのカテゴリを自動分類（一致キーワード数が最大のカテゴリ）"""
+        features = features or self.features.extract(content)
+        return features['top_category'] or 'other'
 
-    def detect_language(self, content: str) -> str:
+    def detect_language(self, content: str, features: Optional[Dict[str, Any]] = None) -> str:
         """言語を検出"""
         if not content:
             return 'unknown'
+        features = features or self.features.extract(content)
         
         # 日本語文字の割合
-        japanese_chars = sum(1 for char in content if '\u3040' <= char <= '\u309F' or 
-                           '\u30A0' <= char <= '\u30FF' or '\u4E00' <= char <= '\u9FAF')
-        
-        japanese_ratio = japanese_chars / len(content) if content else 0
+        japanese_ratio = features['japanese_ratio']
         
         if japanese_ratio > 0.1:
             return 'ja' if japanese_ratio > 0.3 else 'mixed'
@@ -289,18 +303,20 @@ class FutureProofMetadataManager:
         return enhanced
 
     def create_unified_metadata(self, content: str, original_metadata: Dict, 
-                              document_id: Optional[str] = None) -> Dict[str, Any]:
-        """統一メタデータを作成"""
+                              document_id: Optional[str] = None,
+                              features: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """統一メタデータを作成（featuresはContentFeatureKernelの抽出結果。省略時はここで抽出）"""
         
         if document_id is None:
             document_id = original_metadata.get('document_id', f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.create_document_hash(content)[:8]}")
         
-        # 基本分析
+        # 基本分析（特徴量は1回だけ抽出し、各スコアで共有）
+        features = features or self.features.extract(content)
         content_hash = self.create_document_hash(content)
-        complexity = self.analyze_content_complexity(content)
-        importance = self.analyze_content_importance(content, original_metadata)
-        category = self.classify_category(content, original_metadata)
-        language = self.detect_language(content)
+        complexity = self.analyze_content_complexity(content, features)
+        importance = self.analyze_content_importance(content, original_metadata, features)
+        category = self.classify_category(content, original_metadata, features)
+        language = self.detect_language(content, features)
         
         # 鮮度スコア（新しいほど高い）
         timestamp_str = original_metadata.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
@@ -366,8 +382,8 @@ class FutureProofMetadataManager:
             
             # 関連性
             'related_documents': [],
-            'tags': self._extract_tags(content, original_metadata),
-            'keywords': self._extract_keywords(content),
+            'tags': self._extract_tags(content, original_metadata, features),
+            'keywords': self._extract_keywords(content, features),
         }
         
         # 元のメタデータから有用な情報を保持
@@ -411,12 +427,13 @@ class FutureProofMetadataManager:
             }
         return {'index': 0, 'total': 1, 'size': len(content), 'overlap': 0}
 
-    def _extract_tags(self, content: str, metadata: Dict) -> List[str]:
+    def _extract_tags(self, content: str, metadata: Dict, features: Optional[Dict[str, Any]] = None) -> List[str]:
         """タグを抽出"""
+        features = features or self.features.extract(content)
         tags = []
         
         # カテゴリベースのタグ
-        category = self.classify_category(content, metadata)
+        category = self.classify_category(content, metadata, features)
         tags.append(f"category:{category}")
         
         # ファイル形式タグ
@@ -431,130 +448,106 @@ class FutureProofMetadataManager:
         # 特殊タグ
         if 'chunk_index' in metadata:
             tags.append("chunked")
-        if len(content) > 10000:
+        if features['length'] > 10000:
             tags.append("large-content")
-        if any(word in content.lower() for word in ['api', 'システム', 'database']):
+        if features['has_tag_term']:
             tags.append("technical")
         
         return list(set(tags))
 
-    def _extract_keywords(self, content: str) -> List[str]:
-        """キーワードを抽出"""
-        # 簡単なキーワード抽出（実際にはより高度な処理が必要）
-        import re
-        
-        # 大文字で始まる単語や技術用語を抽出
-        keywords = re.findall(r'\b[A-Z][a-zA-Z]{2,}\b', content)
-        
-        # 日本語の技術用語
-        jp_tech_terms = re.findall(r'[ァ-ヶー]{3,}|システム|データベース|アプリケーション|プログラム', content)
-        
-        all_keywords = keywords + jp_tech_terms
-        
-        # 頻度でソートして上位10個を返す
-        from collections import Counter
-        keyword_counts = Counter(all_keywords)
-        
-        return [kw for kw, count in keyword_counts.most_common(10)]
+    def _extract_keywords(self, content: str, features: Optional[Dict[str, Any]] = None) -> List[str]:
+        """キーワードを抽出（大文字で始まる単語・カタカナ技術用語の出現頻度上位10個）"""
+        features = features or self.features.extract(content)
+        return features['keywords']
+
+    def migrate_documents(self, items: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+        """移行エンジン用のバッチ変換関数（既に新形式の行はNone、特徴量はバッチ単位でまとめて抽出）"""
+        targets = [i for i, (_, _, metadata) in enumerate(items) if metadata.get('version') != '2.0']
+        features = self.features.extract_batch([items[i][1] for i in targets])
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        for i, feature in zip(targets, features):
+            doc_id, content, metadata = items[i]
+            results[i] = self.create_unified_metadata(content or "", metadata, doc_id, feature)
+        return results
 
-    def migrate_all_metadata(self, dry_run: bool = True) -> Dict[str, Any]:
-        """全メタデータを新形式に移行"""
+    def migrate_all_metadata(self, dry_run: bool = True, workers: Optional[int] = None, batch_size: int = 500) -> Dict[str, Any]:
+        """全メタデータを新形式に移行（ページ単位・並列変換・バッチ更新、中断時はチェックポイントから再開）"""
         print(f"🚀 統一メタデータ形式への移行開始 (dry_run={dry_run})")
         
-        all_docs = self.collection.get()
-        # Ensure all values are lists to avoid iteration errors
-        ids = all_docs.get('ids') or []
-        metadatas = all_docs.get('metadatas') or []
-        documents = all_docs.get('documents') or []
-        total_docs = len(ids)
-        
         migration_report = {
-            'total_documents': total_docs,
+            'total_documents': self.collection.count(),
             'processed': 0,
             'upgraded': 0,
+            'skipped': 0,
             'errors': [],
             'duplicate_hashes': {},
             'quality_distribution': {'high': 0, 'medium': 0, 'low': 0},
             'dry_run': dry_run
         }
         
-        new_metadatas = []
-        
-        print(f"📊 処理対象: {total_docs} ドキュメント")
-        
-        for i, (doc_id, metadata, content) in enumerate(zip(
-            ids, metadatas, documents
-        )):
-            try:
-                if metadata is None:
-                    metadata = {}
-                
-                # 既に新形式かチェック
-                if metadata.get('version') == '2.0':
-                    print(f"   スキップ: {doc_id} (既に新形式)")
-                    new_metadatas.append(metadata)
-                    continue
-                
-                # 統一メタデータを作成
-                unified_metadata = self.create_unified_metadata(content, dict(metadata), doc_id)
-                new_metadatas.append(unified_metadata)
-                
-                # 重複チェック
-                content_hash = unified_metadata['content_hash']
-                if content_hash in migration_report['duplicate_hashes']:
-                    migration_report['duplicate_hashes'][content_hash].append(doc_id)
-                else:
-                    migration_report['duplicate_hashes'][content_hash] = [doc_id]
-                
-                # 品質分布
-                quality = unified_metadata['quality_score']
-                if quality >= 0.8:
-                    migration_report['quality_distribution']['high'] += 1
-                elif quality >= 0.5:
-                    migration_report['quality_distribution']['medium'] += 1
-                else:
-                    migration_report['quality_distribution']['low'] += 1
-                
-                migration_report['processed'] += 1
-                migration_report['upgraded'] += 1
-                
-                if i % 50 == 0:
-                    print(f"   進捗: {i}/{total_docs} ({i/total_docs*100:.1f}%)")
-                    
-            except Exception as e:
-                migration_report['errors'].append({
-                    'document_id': doc_id,
-                    'error': str(e)
-                })
-                new_metadatas.append(metadata)  # エラー時は元のメタデータを保持
+        print(f"📊 処理対象: {migration_report['total_documents']} ドキュメント")
+
+        def record_result(doc_id: str, metadata: Dict[str, Any], unified_metadata: Optional[Dict[str, Any]]) -> None:
+            # 既に新形式
+            if unified_metadata is None:
+                migration_report['skipped'] += 1
+                return
+            
+            # 重複チェック
+            content_hash = unified_metadata['content_hash']
+            migration_report['duplicate_hashes'].setdefault(content_hash, []).append(doc_id)
+            
+            # 品質分布
+            quality = unified_metadata['quality_score']
+            if quality >= 0.8:
+                migration_report['quality_distribution']['high'] += 1
+            elif quality >= 0.5:
+                migration_report['quality_distribution']['medium'] += 1
+            else:
+                migration_report['quality_distribution']['low'] += 1
+            
+            migration_report['processed'] += 1
+            migration_report['upgraded'] += 1
+
+        def print_progress(report: Dict[str, Any]) -> None:
+            total = report['total_documents']
+            print(f"   進捗: {report['processed']}/{total} ({report['processed'] / total * 100 if total else 100:.1f}%)")
+
+        migration = MetadataMigration(
+            self.collection, self.migrate_documents,
+            name="future_proof_metadata",
+            batched=True,
+            batch_size=batch_size,
+            workers=workers,
+            checkpoint_path=str(Path(__file__).parent / f"future_proof_metadata_{self.collection_name}.checkpoint.json"),
+            on_result=record_result,
+            on_progress=print_progress
+        )
+        if not dry_run:
+            print("💾 メタデータ更新を実行中...")
+        result = migration.run(dry_run=dry_run)
+        migration_report['errors'] = result['errors']
+        migration_report['written'] = result['written']
+        migration_report['resumed_from'] = result['resumed_from']
+        migration_report['completed'] = result['completed']
+        if result['resumed_from']:
+            print(f"   チェックポイントから再開: {result['resumed_from']}件目から（再開前の集計は含まない）")
+        if not dry_run:
+            print("✅ メタデータ更新完了" if result['completed'] else "⚠️ メタデータ更新を中断しました（再実行でチェックポイントから再開）")
         
         # 重複の統計
         duplicates = {hash_val: ids for hash_val, ids in migration_report['duplicate_hashes'].items() if len(ids) > 1}
         migration_report['duplicates_found'] = len(duplicates)
         migration_report['duplicate_groups'] = duplicates
         
-        # 実際の更新実行
-        if not dry_run and new_metadatas:
-            print("💾 メタデータ更新を実行中...")
-            try:
-                self.collection.update(
-                    ids=all_docs['ids'],
-                    metadatas=new_metadatas
-                )
-                print("✅ メタデータ更新完了")
-            except Exception as e:
-                migration_report['errors'].append({
-                    'operation': 'bulk_update',
-                    'error': str(e)
-                })
-        
         return migration_report
 
     def analyze_collection_health(self) -> Dict[str, Any]:
         """コレクションの健全性を分析"""
         print("🔍 コレクション健全性分析中...")
         
-        all_docs = self.collection.get()
+        # 健全性分析はメタデータのみ参照する
+        all_docs = self.collection.get(include=['metadatas'])
         
         health_report = {
             'total_documents': len(all_docs['ids']),
@@ -24,10 +24,17 @@ ChromaDB メタデータ標準化スクリプト
 import chromadb
 import json
 import re
+import sys
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, List, Any, Optional
 import uuid
 
+# src/modules（バッチ・再開可能なメタデータ移行エンジン）を利用
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+from modules.metadata_migration import MetadataMigration
+
 class MetadataStandardizer:
     def __init__(self, collection_name: str = "mcp_production_knowledge"):
         # 直接ChromaDBに接続（既存のパスを使用）
@@ -56,11 +63,17 @@ class MetadataStandardizer:
             'status': str
         }
 
+    def __getstate__(self):
+        # 移行のプロセスプールへは変換に必要な状態だけを渡す（クライアントはpickleできない）
+        state = self.__dict__.copy()
+        state.update(client=None, collection=None)
+        return state
+
     def analyze_current_metadata(self) -> Dict[str, Any]:
         """現在のメタデータを分析"""
         print("📊 現在のメタデータを分析中...")
         
-        all_docs = self.collection.get()
+        all_docs = self.collection.get(include=['documents', 'metadatas'])
         total_docs = len(all_docs['ids'])
         
         # メタデータフィールドの統計
@@ -178,77 +191,52 @@ class MetadataStandardizer:
             
         return standardized
 
-    def standardize_collection(self, dry_run: bool = True) -> Dict[str, Any]:
-        """コレクション全体のメタデータを標準化"""
+    def standardize_document(self, doc_id: str, content: Optional[str], metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """移行エンジン用の変換関数（1ドキュメント分）"""
+        return self.create_standardized_metadata(metadata, content or "", doc_id)
+
+    def standardize_collection(self, dry_run: bool = True, workers: Optional[int] = None, batch_size: int = 500) -> Dict[str, Any]:
+        """コレクション全体のメタデータを標準化（ページ単位・並列変換・バッチ更新、中断時はチェックポイントから再開）"""
         print(f"🔄 メタデータ標準化開始 (dry_run={dry_run})...")
         
-        all_docs = self.collection.get()
-        total_docs = len(all_docs['ids'])
+        changes_summary: Dict[str, List[str]] = {}
+
+        def record_changes(doc_id: str, metadata: Dict[str, Any], standardized_metadata: Optional[Dict[str, Any]]) -> None:
+            # 変更点の記録
+            changes = [f"+ {field}" for field in self.required_fields
+                       if field not in metadata or metadata.get(field) != standardized_metadata[field]]
+            if changes:
+                changes_summary[doc_id] = changes
+
+        migration = MetadataMigration(
+            self.collection, self.standardize_document,
+            name="metadata_standardization",
+            batch_size=batch_size,
+            workers=workers,
+            checkpoint_path=str(Path(__file__).parent / f"metadata_standardization_{self.collection_name}.checkpoint.json"),
+            on_result=record_changes,
+            on_progress=lambda r: print(f"   処理済み: {r['processed']}/{r['total_documents']}")
+        )
+        report = migration.run(dry_run=dry_run)
+        if not dry_run:
+            print("✅ メタデータ更新完了" if report['completed'] else "⚠️ メタデータ更新を中断しました（再実行でチェックポイントから再開）")
         
-        standardization_report = {
-            'total_documents': total_docs,
-            'processed': 0,
-            'errors': [],
-            'changes_summary': {},
+        return {
+            'total_documents': report['total_documents'],
+            'processed': report['processed'] - report['error_count'],
+            'errors': report['errors'],
+            'changes_summary': changes_summary,
+            'written': report['written'],
+            'resumed_from': report['resumed_from'],
+            'completed': report['completed'],
             'dry_run': dry_run
         }
-        
-        updated_metadatas = []
-        
-        ids = list(all_docs.get('ids', []))
-        metadatas = list(all_docs.get('metadatas') or [])
-        documents = list(all_docs.get('documents') or [])
-        for i, (doc_id, metadata, content) in enumerate(zip(ids, metadatas, documents)):
-            try:
-                if metadata is None:
-                    metadata = {}
-                    
-                # 標準化されたメタデータを作成
-                standardized_metadata = self.create_standardized_metadata(dict(metadata), content, doc_id)
-                updated_metadatas.append(standardized_metadata)
-                
-                # 変更点の記録
-                changes = []
-                for field in self.required_fields:
-                    if field not in metadata or metadata.get(field) != standardized_metadata[field]:
-                        changes.append(f"+ {field}")
-                        
-                if changes:
-                    standardization_report['changes_summary'][doc_id] = changes
-                    
-                standardization_report['processed'] += 1
-                
-                if i % 50 == 0:
-                    print(f"   処理済み: {i}/{total_docs}")
-                    
-            except Exception as e:
-                standardization_report['errors'].append({
-                    'document_id': doc_id,
-                    'error': str(e)
-                })
-        
-        # 実際の更新実行
-        if not dry_run and updated_metadatas:
-            print("💾 メタデータ更新を実行中...")
-            try:
-                self.collection.update(
-                    ids=all_docs['ids'],
-                    metadatas=updated_metadatas
-                )
-                print("✅ メタデータ更新完了")
-            except Exception as e:
-                standardization_report['errors'].append({
-                    'operation': 'bulk_update',
-                    'error': str(e)
-                })
-        
-        return standardization_report
 
     def validate_standardized_metadata(self) -> Dict[str, Any]:
         """標準化後のメタデータを検証"""
         print("🔍 標準化結果を検証中...")
         
-        all_docs = self.collection.get()
+        all_docs = self.collection.get(include=['metadatas'])
         validation_report = {
             'total_documents': len(all_docs['ids']),
             'valid_documents': 0,
@@ -17,6 +17,13 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
 import re
 
+# src/modules（ページング・列指向メタデータ分析）を利用
+SRC_DIR = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+from modules.paging import CollectionPager
+from modules.metadata_analytics import analyze_metadata_pages
+from modules.metadata_migration import MetadataMigration
+
 # ChromaDB インポート
 try:
     import chromadb
@@ -85,6 +92,12 @@ class MetadataUnificationSystem:
             "chat_history": "conversation"
         }
         
+    def __getstate__(self):
+        # 移行のプロセスプールへは変換に必要な状態だけを渡す（クライアントはpickleできない）
+        state = self.__dict__.copy()
+        state.update(client=None, collection=None)
+        return state
+    
     def initialize_chromadb(self) -> bool:
         """ChromaDB接続初期化"""
         try:
@@ -145,42 +158,36 @@ class MetadataUnificationSystem:
             print(f"✗ バックアップ作成失敗: {e}")
             return ""
     def analyze_current_metadata(self) -> Dict[str, Any]:
-        """現在のメタデータ分析"""
+        """現在のメタデータ分析（全件をページ単位で読み、列指向でまとめて集計）"""
         try:
             if self.collection is None:
                 print("✗ コレクションが初期化されていません")
                 return {}
-            all_data = self.collection.get(include=['metadatas'])
-            metadatas = all_data.get('metadatas') or []
-            
-            # フィールド使用状況分析
-            field_usage = {}
-            total_docs = len(metadatas)
-            
-            for metadata in metadatas:
-                if metadata:
-                    for field in metadata.keys():
-                        if field not in field_usage:
-                            field_usage[field] = 0
-                        field_usage[field] += 1
+            schema = analyze_metadata_pages(CollectionPager(self.collection, include=['metadatas']))
+            key_details = schema["key_details"]
+            total_docs = schema["total_rows"]
             
-            # 一貫性スコア計算
-            consistency_scores = {}
-            for field, count in field_usage.items():
-                consistency_scores[field] = (count / total_docs) * 100
+            # フィールド使用状況・一貫性スコア
+            field_usage = {field: detail["frequency"] for field, detail in key_details.items()}
+            consistency_scores = {field: detail["coverage_percent"] for field, detail in key_details.items()}
             
             analysis = {
                 "total_documents": total_docs,
                 "unique_fields": len(field_usage),
                 "field_usage": field_usage,
                 "consistency_scores": consistency_scores,
-                "average_consistency": sum(consistency_scores.values()) / len(consistency_scores) if consistency_scores else 0
+                "average_consistency": sum(consistency_scores.values()) / len(consistency_scores) if consistency_scores else 0,
+                "fields_with_type_drift": schema["keys_with_type_drift"],
+                "field_types": {field: detail["type_counts"] for field, detail in key_details.items()},
+                "field_cardinality": {field: detail["cardinality"] for field, detail in key_details.items()}
             }
             
             print(f"📊 メタデータ分析完了:")
             print(f"   - 総ドキュメント数: {total_docs}")
             print(f"   - ユニークフィールド数: {len(field_usage)}")
             print(f"   - 平均一貫性: {analysis['average_consistency']:.1f}%")
+            if schema["keys_with_type_drift"]:
+                print(f"   - 型の揺れがあるフィールド: {', '.join(schema['keys_with_type_drift'])}")
             
             return analysis
             
@@ -294,62 +301,60 @@ class MetadataUnificationSystem:
         
         return unified
     
-    def execute_unification(self, dry_run: bool = True) -> Dict[str, Any]:
-        """メタデータ統一化実行"""
+    def unify_document(self, doc_id: str, content: Optional[str], old_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """移行エンジン用の変換関数（1ドキュメント分）"""
+        return self.unify_metadata(old_metadata, content or "", doc_id)
+    
+    def checkpoint_path(self) -> Path:
+        """移行チェックポイントの保存先（バックアップと同じscriptsディレクトリ）"""
+        name = self.collection.name if self.collection is not None else "collection"
+        return Path(self.chromadb_path).parent / "scripts" / f"metadata_unification_{name}.checkpoint.json"
+    
+    def execute_unification(self, dry_run: bool = True, workers: Optional[int] = None, batch_size: int = 500) -> Dict[str, Any]:
+        """メタデータ統一化実行（ページ単位・並列変換・バッチ更新、中断時はチェックポイントから再開）"""
         print(f"🔄 メタデータ統一化開始 (dry_run={dry_run})")
         
         try:
-            # 全データ取得
             if self.collection is None:
                 print("✗ コレクションが初期化されていません")
                 return {"error": "collection is not initialized"}
-            all_data = self.collection.get(include=['documents', 'metadatas'])
             
-            processed = 0
-            errors = 0
-            changes = 0
+            migration = MetadataMigration(
+                self.collection, self.unify_document,
+                name="metadata_unification_v2",
+                batch_size=batch_size,
+                workers=workers,
+                checkpoint_path=str(self.checkpoint_path()),
+                on_progress=lambda r: print(f"   処理中: {r['processed']}/{r['total_documents']}")
+            )
+            report = migration.run(dry_run=dry_run)
+            if report["resumed_from"]:
+                print(f"   チェックポイントから再開: {report['resumed_from']}件目から")
             
-            ids = all_data.get('ids') or []
-            documents = all_data.get('documents') or []
-            metadatas = all_data.get('metadatas') or []
-            for i, (doc_id, content, old_metadata) in enumerate(zip(ids, documents, metadatas)):
-                try:
-                    # 統一メタデータ生成
-                    unified_metadata = self.unify_metadata(dict(old_metadata) if old_metadata else {}, content or "", doc_id)
-                    
-                    # 変更チェック
-                    if old_metadata != unified_metadata:
-                        changes += 1
-                        
-                        if not dry_run:
-                            # 実際の更新
-                            self.collection.update(
-                                ids=[doc_id],
-                                metadatas=[unified_metadata]
-                            )
-                    
-                    processed += 1
-                    
-                    if processed % 50 == 0:
-                        print(f"   処理中: {processed}/{len(all_data['ids'])}")
-                        
-                except Exception as e:
-                    print(f"   ドキュメント処理エラー {doc_id}: {e}")
-                    errors += 1
+            processed = report["processed"]
+            errors = report["error_count"]
+            changes = report["changed"]
+            total = report["total_documents"]
+            for error in report["errors"][:10]:
+                print(f"   ドキュメント処理エラー {error.get('document_id', error.get('operation'))}: {error['error']}")
             
             result = {
-                "processed": processed,
+                "processed": processed - errors,
                 "errors": errors,
                 "changes": changes,
-                "total": len(all_data['ids']),
-                "success_rate": (processed / len(all_data['ids'])) * 100 if all_data['ids'] else 0
+                "written": report["written"],
+                "total": total,
+                "completed": report["completed"],
+                "seconds": report["seconds"],
+                "success_rate": ((processed - errors) / total) * 100 if total else 0
             }
             
-            print(f"✓ 統一化{'シミュレーション' if dry_run else '実行'}完了:")
-            print(f"   - 処理済み: {processed}")
+            print(f"✓ 統一化{'シミュレーション' if dry_run else '実行'}{'完了' if report['completed'] else '中断（再実行で再開）'}:")
+            print(f"   - 処理済み: {result['processed']}")
             print(f"   - 変更対象: {changes}")
             print(f"   - エラー: {errors}")
             print(f"   - 成功率: {result['success_rate']:.1f}%")
+            print(f"   - 所要時間: {report['seconds']:.1f}秒 ({report['docs_per_second']}件/秒)")
             
             return result
             
@@ -362,21 +367,15 @@ class MetadataUnificationSystem:
         print("🔍 統一化結果を検証中...")
         
         try:
-            analysis = self.analyze_current_metadata()
-            
-            # 必須フィールドの確認
             if self.collection is None:
                 print("✗ コレクションが初期化されていません")
                 return {"error": "collection is not initialized"}
-            all_data = self.collection.get(include=['metadatas'])
-            metadatas = all_data.get('metadatas') or []
+            # 必須フィールドの確認（分析結果のカバレッジを再利用し、コレクションの再読み込みはしない）
+            analysis = self.analyze_current_metadata()
+            consistency_scores = analysis.get("consistency_scores", {})
             
             required_fields = self.unified_schema["required_fields"].keys()
-            field_completeness = {}
-            
-            for field in required_fields:
-                count = sum(1 for metadata in metadatas if metadata and field in metadata)
-                field_completeness[field] = (count / len(metadatas)) * 100 if metadatas else 0
+            field_completeness = {field: consistency_scores.get(field, 0) for field in required_fields}
             
             avg_completeness = sum(field_completeness.values()) / len(field_completeness)
             
@@ -384,7 +383,8 @@ class MetadataUnificationSystem:
                 "field_completeness": field_completeness,
                 "average_completeness": avg_completeness,
                 "schema_compliance": avg_completeness >= 95.0,
-                "total_documents": len(metadatas)
+                "total_documents": analysis.get("total_documents", 0),
+                "fields_with_type_drift": analysis.get("fields_with_type_drift", [])
             }
             
             print(f"✓ 検証完了:")
@@ -2,59 +2,126 @@
 FastMCP Main Server - モジュール分割版
 全機能保持、ファイル分割のみ
 元905行 → メイン35行 + モジュール群
+
+起動時間の内訳（モジュールごとのimport時間・登録時間）はchroma_health_checkのstartupで確認できる。
+重い依存（chromadb・bs4・psutil等）は各ツールの初回呼び出し時に読み込む。
 """
 
 import sys
+import time
+import importlib
 from pathlib import Path
 
+_PROCESS_STARTED = time.perf_counter()
+
 # パス設定
 current_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(current_dir))
 
+# モジュールごとのimport時間（ミリ秒）
+IMPORT_TIMINGS = {}
+
+
+def _timed_import(module_name: str, attr: str):
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMINGS[module_name] = round((time.perf_counter() - started) * 1000, 2)
+    return getattr(module, attr)
+
+
 # 基本インポート
-from fastmcp import FastMCP
-from modules.core_manager import ChromaDBManager
-from modules.basic_tools import register_basic_tools
-from modules.search_tools import register_search_tools
-from modules.storage_tools import register_storage_tools
-from modules.analysis_tools import register_analysis_tools
-from modules.management_tools import register_management_tools
-from modules.data_tools import register_data_tools
-from modules.system_tools import register_system_tools
-from modules.extraction_tools import register_extraction_tools
-from modules.backup_tools import register_backup_tools
-from modules.learning_tools import register_learning_tools
-from modules.monitoring_tools import register_monitoring_tools
-from modules.inspection_tools import register_inspection_tools
-from modules.integrity_tools import register_integrity_tools
-from modules.search_and_delete_tools import register_search_and_delete_tools  # 追加
+FastMCP = _timed_import("fastmcp", "FastMCP")
+ChromaDBManager = _timed_import("modules.core_manager", "ChromaDBManager")
+setup_logging = _timed_import("modules.structured_logging", "setup_logging")
+install_tool_tracing = _timed_import("modules.structured_logging", "install_tool_tracing")
+get_logger = _timed_import("modules.structured_logging", "get_logger")
+metered_tool = _timed_import("modules.tool_metrics", "metered_tool")
+start_metrics_export = _timed_import("modules.tool_metrics", "start_metrics_export")
+profiled_tool = _timed_import("modules.tool_profiling", "profiled_tool")
+profiling_config = _timed_import("modules.tool_profiling", "config")
+deadline_tool = _timed_import("modules.deadlines", "deadline_tool")
+deadline_config = _timed_import("modules.deadlines", "config")
+ServerWarmup = _timed_import("modules.warmup", "ServerWarmup")
+get_ingest_service = _timed_import("modules.ingest_queue", "get_ingest_service")
+
+# ツールモジュール（登録順）
+TOOL_MODULES = [
+    ("modules.basic_tools", "register_basic_tools"),
+    ("modules.search_tools", "register_search_tools"),
+    ("modules.storage_tools", "register_storage_tools"),
+    ("modules.analysis_tools", "register_analysis_tools"),
+    ("modules.management_tools", "register_management_tools"),
+    ("modules.data_tools", "register_data_tools"),
+    ("modules.system_tools", "register_system_tools"),
+    ("modules.extraction_tools", "register_extraction_tools"),
+    ("modules.backup_tools", "register_backup_tools"),
+    ("modules.learning_tools", "register_learning_tools"),
+    ("modules.monitoring_tools", "register_monitoring_tools"),
+    ("modules.inspection_tools", "register_inspection_tools"),
+    ("modules.integrity_tools", "register_integrity_tools"),
+    ("modules.search_and_delete_tools", "register_search_and_delete_tools"),  # 追加
+    ("modules.ingest_tools", "register_ingest_tools"),
+    ("modules.job_tools", "register_job_tools"),
+]
 
 # メインサーバークラス
 class FastMCPChromaServer:
     def __init__(self):
+        phases = {}
+        started = time.perf_counter()
+        setup_logging()
         self.mcp = FastMCP("chroma")
+        # 全ツール呼び出しに締め切り・相関ID・所要時間ログと計測・オプトインのプロファイリングを付与
+        install_tool_tracing(self.mcp, wrappers=(deadline_tool, metered_tool, profiled_tool))
+        start_metrics_export()
+        profiling_config.load()
+        deadline_config.load()
         self.manager = ChromaDBManager()
-        self.register_all_tools()
-    
+        phases["server_setup"] = round((time.perf_counter() - started) * 1000, 2)
+        started = time.perf_counter()
+        register_timings = self.register_all_tools()
+        phases["register_tools"] = round((time.perf_counter() - started) * 1000, 2)
+        self.manager.startup_report = self.build_startup_report(phases, register_timings)
+        get_logger("startup").info("Server ready", extra=self.manager.startup_report)
+
     def register_all_tools(self):
-        """全ツールモジュールを登録 - 51ツール目標"""
-        register_basic_tools(self.mcp, self.manager)
-        register_search_tools(self.mcp, self.manager)
-        register_storage_tools(self.mcp, self.manager)
-        register_analysis_tools(self.mcp, self.manager)
-        register_management_tools(self.mcp, self.manager)
-        register_data_tools(self.mcp, self.manager)
-        register_system_tools(self.mcp, self.manager)
-        register_extraction_tools(self.mcp, self.manager)
-        register_backup_tools(self.mcp, self.manager)
-        register_learning_tools(self.mcp, self.manager)
-        register_monitoring_tools(self.mcp, self.manager)
-        register_inspection_tools(self.mcp, self.manager)
-        register_integrity_tools(self.mcp, self.manager)
-        register_search_and_delete_tools(self.mcp, self.manager)  # 追加
-    
+        """全ツールモジュールを登録（登録時はI/Oを行わない）- 51ツール目標
+        Returns: モジュールごとの{import_ms, register_ms}
+        """
+        timings = {}
+        for module_name, register_name in TOOL_MODULES:
+            started = time.perf_counter()
+            register = getattr(importlib.import_module(module_name), register_name)
+            imported = time.perf_counter()
+            register(self.mcp, self.manager)
+            timings[module_name] = {
+                "import_ms": round((imported - started) * 1000, 2),
+                "register_ms": round((time.perf_counter() - imported) * 1000, 2)
+            }
+        return timings
+
+    @staticmethod
+    def build_startup_report(phases, register_timings):
+        """起動時間の内訳（import時間の大きい順）"""
+        imports = dict(IMPORT_TIMINGS)
+        imports.update({name: t["import_ms"] for name, t in register_timings.items()})
+        return {
+            "ready_ms": round((time.perf_counter() - _PROCESS_STARTED) * 1000, 2),
+            "phases_ms": phases,
+            "imports_ms": dict(sorted(imports.items(), key=lambda item: item[1], reverse=True)),
+            "register_ms": {name: t["register_ms"] for name, t in register_timings.items()},
+            "heavy_modules_loaded": sorted(m for m in ("chromadb", "bs4", "psutil", "PyPDF2", "numpy") if m in sys.modules)
+        }
+
     def run(self):
-        """サーバー起動"""
+        """サーバー起動（モデル・インデックスのウォームアップとリソース採取・メトリクス記録はバックグラウンドで並行実行）"""
+        self.manager.warmup = ServerWarmup.from_settings(self.manager).start()
+        self.manager.resources.start()
+        self.manager.metrics_history.start()
+        # 前回のプロセスで終わらなかった取り込みジョブの自動再開（ingest_queue.resume_on_startup）
+        ingest = get_ingest_service(self.manager)
+        if ingest.resume_on_startup:
+            ingest.resume_unfinished()
         self.mcp.run()
 
 def main():
@@ -8,7 +8,10 @@ from datetime import datetime
 from config.global_settings import GlobalSettings
 
 def register_analysis_tools(mcp, manager):
-    """分析ツールを登録"""    
+    """分析ツールを登録"""
+    # 各ツールが読むフィールド（不要なdocuments/embeddingsは取得しない）
+    manager.declare_reads("chroma_analyze_collection", ["ids", "metadatas"])
+
     @mcp.tool()
     async def chroma_similarity_search(query_texts: list, collection_name: Optional[str] = None, n_results: int = 5, where: Optional[dict] = None) -> dict:
         """類似度検索"""
@@ -65,7 +68,7 @@ def register_analysis_tools(mcp, manager):
                 document_count = collection.count()
                 
                 # サンプルドキュメント取得
-                sample_results = collection.get(limit=min(10, document_count))
+                sample_results = manager.fetch(collection, tool="chroma_analyze_collection", limit=min(10, document_count))
                 
                 # メタデータ分析
                 metadata_keys = set()
@@ -79,7 +82,7 @@ def register_analysis_tools(mcp, manager):
                     "collection_name": collection_name,
                     "document_count": document_count,
                     "metadata_fields": list(metadata_keys),
-                    "sample_documents": len(sample_results.get("documents", [])),
+                    "sample_documents": len(sample_results.get("ids") or []),
                     "analysis_timestamp": datetime.now().isoformat()
                 }
             else:
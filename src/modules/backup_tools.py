@@ -6,8 +6,13 @@
 from typing import Dict, List, Optional, Any
 import json
 import os
+import shutil
+import tempfile
 from datetime import datetime
 from config.global_settings import GlobalSettings
+from modules.paging import CollectionPager
+from modules.batch_ops import write_in_batches
+from modules.job_scheduler import report_progress, checkpoint
 
 
 def register_backup_tools(mcp, manager):
@@ -17,7 +22,9 @@ def register_backup_tools(mcp, manager):
     def chroma_backup_data(
         collections: Optional[List[str]] = None,
         backup_name: Optional[str] = None,
-        include_metadata: bool = True
+        include_metadata: bool = True,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         ChromaDBデータのバックアップを作成
@@ -25,9 +32,15 @@ def register_backup_tools(mcp, manager):
             collections: バックアップ対象コレクション（None=全て）
             backup_name: バックアップ名（None=自動生成）
             include_metadata: メタデータを含めるか
-        Returns: バックアップ結果
+            background: Trueでジョブとして投入しjob_idをすぐに返す（進捗・結果はchroma_job_status / chroma_job_result）
+            priority: background時のジョブ優先度（大きいほど先に実行）
+        Returns: バックアップ結果（background時はジョブ情報）
         """
         try:
+            if background:
+                return {"success": True, "background": True, **manager.jobs.submit("backup_data", {
+                    "collections": collections, "backup_name": backup_name, "include_metadata": include_metadata
+                }, priority=priority)}
             if not manager.initialized:
                 manager.safe_initialize()
             
@@ -39,40 +52,81 @@ def register_backup_tools(mcp, manager):
             
             backup_path = os.path.join(backup_dir, f"{backup_name}.json")
             
-            backup_data = {
-                "backup_name": backup_name,
-                "timestamp": datetime.now().isoformat(),
-                "collections": {}
-            }
-            
             if collections is None:
                 all_collections = manager.chroma_client.list_collections()
                 collections = [col.name for col in all_collections]
             
-            backed_up_count = 0
-            total_documents = 0
-            
-            for col_name in collections:
-                try:
-                    collection = manager.chroma_client.get_collection(col_name)
-                    result = collection.get()
-                    
-                    backup_data["collections"][col_name] = {
-                        "documents": result.get("documents", []),
-                        "ids": result.get("ids", []),
-                        "metadatas": result.get("metadatas", []) if include_metadata else [],
-                        "embeddings": result.get("embeddings", [])
-                    }
-                    
-                    backed_up_count += 1
-                    total_documents += len(result.get("documents", []))
-                    
-                except Exception as e:
-                    backup_data["collections"][col_name] = {"error": str(e)}
-            
-            # ファイルに保存
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, ensure_ascii=False, indent=2)
+            columns = ("documents", "ids", "metadatas")
+            
+            # ページ単位で列ごとの一時ファイルに書き出し、コレクションごとに本体へ連結する
+            # （従来と同じJSON形式のまま、全件を一度にメモリに保持しない。完成するまでは.partialに書く）
+            def write_backup(path: str) -> tuple:
+                backed_up_count = 0
+                total_documents = 0
+                with tempfile.TemporaryDirectory(dir=backup_dir) as spool_dir, \
+                        open(path, 'w', encoding='utf-8') as out:
+                    out.write(json.dumps({"backup_name": backup_name, "timestamp": datetime.now().isoformat()},
+                                         ensure_ascii=False)[:-1])
+                    out.write(', "collections": {')
+                    for index, col_name in enumerate(collections):
+                        report_progress(index, len(collections), f"backing up {col_name}")
+                        if index:
+                            out.write(", ")
+                        out.write(json.dumps(col_name, ensure_ascii=False) + ": ")
+                        spools = {name: os.path.join(spool_dir, f"{index}_{name}.json") for name in columns}
+                        try:
+                            collection = manager.chroma_client.get_collection(col_name)
+                            pager = CollectionPager(collection, include=["documents", "metadatas"] if include_metadata else ["documents"])
+                            rows = 0
+                            files = {name: open(spool, 'w', encoding='utf-8') for name, spool in spools.items()}
+                            try:
+                                for page in pager:
+                                    checkpoint()
+                                    ids = page.get("ids") or []
+                                    values = {
+                                        "ids": ids,
+                                        "documents": page.get("documents") or [None] * len(ids),
+                                        "metadatas": (page.get("metadatas") or [None] * len(ids)) if include_metadata else []
+                                    }
+                                    for name in columns:
+                                        for value in values[name]:
+                                            if files[name].tell():
+                                                files[name].write(", ")
+                                            files[name].write(json.dumps(value, ensure_ascii=False))
+                                    rows += len(ids)
+                                    report_progress(index, len(collections), f"backing up {col_name} ({rows} rows)")
+                            finally:
+                                for f in files.values():
+                                    f.close()
+                            if pager.truncated:
+                                raise RuntimeError("stopped before completion (deadline); collection not backed up")
+                        except Exception as e:
+                            out.write(json.dumps({"error": str(e)}, ensure_ascii=False))
+                            continue
+                        out.write("{")
+                        for position, name in enumerate(columns):
+                            out.write(("" if position == 0 else ", ") + json.dumps(name) + ": [")
+                            with open(spools[name], 'r', encoding='utf-8') as f:
+                                shutil.copyfileobj(f, out)
+                            out.write("]")
+                        out.write(', "embeddings": null}')
+                        backed_up_count += 1
+                        total_documents += rows
+                    out.write("}}")
+                return backed_up_count, total_documents
+            
+            partial_path = backup_path + ".partial"
+            try:
+                backed_up_count, total_documents = write_backup(partial_path)
+            except BaseException:
+                # 中断（キャンセル・エラー）時は書きかけのファイルを残さない
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+            
+            # 完成したファイルを本来の名前に置き換える
+            report_progress(len(collections), len(collections), "finalizing backup file")
+            os.replace(partial_path, backup_path)
             
             return {
                 "success": True,
@@ -85,6 +139,8 @@ def register_backup_tools(mcp, manager):
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    manager.jobs.register("backup_data", chroma_backup_data)
+
     @mcp.tool()
     def chroma_restore_data(
         backup_file: str,
@@ -140,11 +196,11 @@ def register_backup_tools(mcp, manager):
                     
                     # データ復元
                     if col_data.get("documents"):
-                        collection.add(
+                        write_in_batches(
+                            collection, "add", col_data["ids"],
                             documents=col_data["documents"],
-                            ids=col_data["ids"],
-                            metadatas=col_data.get("metadatas"),
-                            embeddings=col_data.get("embeddings")
+                            metadatas=col_data.get("metadatas") or None,
+                            embeddings=col_data.get("embeddings") or None
                         )
                     
                     restored_count += 1
@@ -166,7 +222,9 @@ def register_backup_tools(mcp, manager):
     def chroma_cleanup_duplicates(
         collection_name: Optional[str] = None,
         similarity_threshold: float = 0.95,
-        dry_run: bool = True
+        dry_run: bool = True,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         重複ドキュメントのクリーンアップ
@@ -174,9 +232,15 @@ def register_backup_tools(mcp, manager):
             collection_name: 対象コレクション
             similarity_threshold: 類似度閾値
             dry_run: ドライランモード（実際の削除は行わない）
-        Returns: クリーンアップ結果
+            background: Trueでジョブとして投入しjob_idをすぐに返す
+            priority: background時のジョブ優先度
+        Returns: クリーンアップ結果（background時はジョブ情報）
         """
         try:
+            if background:
+                return {"success": True, "background": True, **manager.jobs.submit("cleanup_duplicates", {
+                    "collection_name": collection_name, "similarity_threshold": similarity_threshold, "dry_run": dry_run
+                }, priority=priority)}
             # グローバル設定からデフォルトコレクション名を取得
             if collection_name is None:
                 global_settings = GlobalSettings()
@@ -185,50 +249,44 @@ def register_backup_tools(mcp, manager):
                 manager.safe_initialize()
             
             collection = manager.chroma_client.get_collection(collection_name)
-            all_data = collection.get()
-            
-            if not all_data.get("documents"):
-                return {
-                    "success": True,
-                    "duplicates_found": 0,
-                    "cleaned_up": 0,
-                    "dry_run": dry_run
-                }
-            
-            documents = all_data["documents"]
-            ids = all_data["ids"]
             duplicates = []
             
-            # 単純な文字列比較で重複検出
-            seen_docs = {}
-            for i, doc in enumerate(documents):
-                doc_hash = hash(doc.lower().strip())
+            # 単純な文字列比較で重複検出（ページ単位で走査しハッシュのみ保持）
+            seen_docs = set()
+            for scanned, row in enumerate(CollectionPager(collection, include=["documents"]).iter_rows(), 1):
+                if scanned % 500 == 0:
+                    report_progress(scanned, message=f"scanning {collection_name}")
+                doc_hash = hash((row.get("document") or "").lower().strip())
                 if doc_hash in seen_docs:
-                    duplicates.append(i)
+                    duplicates.append(row["id"])
                 else:
-                    seen_docs[doc_hash] = i
+                    seen_docs.add(doc_hash)
             
             if not dry_run and duplicates:
                 # 重複を削除
-                duplicate_ids = [ids[i] for i in duplicates]
-                collection.delete(ids=duplicate_ids)
+                collection.delete(ids=duplicates)
             
             return {
                 "success": True,
                 "duplicates_found": len(duplicates),
                 "cleaned_up": len(duplicates) if not dry_run else 0,
                 "dry_run": dry_run,
-                "duplicate_ids": [ids[i] for i in duplicates[:10]]  # 最初の10個のみ表示
+                "duplicate_ids": duplicates[:10]  # 最初の10個のみ表示
             }
             
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    manager.jobs.register("cleanup_duplicates", chroma_cleanup_duplicates)
+
     @mcp.tool()
     def chroma_system_maintenance(
         maintenance_type: str = "comprehensive",
         auto_fix: bool = False,
-        create_backup: bool = True
+        create_backup: bool = True,
+        profile: bool = False,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         システム全体のメンテナンス
@@ -236,9 +294,16 @@ def register_backup_tools(mcp, manager):
             maintenance_type: メンテナンスタイプ ("basic", "standard", "comprehensive")
             auto_fix: 自動修復を実行するか
             create_backup: メンテナンス前にバックアップを作成するか
-        Returns: メンテナンス結果
+            profile: Trueでこの呼び出しをcProfile計測し、応答のprofileに上位関数を含める
+            background: Trueでジョブとして投入しjob_idをすぐに返す（進捗・結果はchroma_job_status / chroma_job_result）
+            priority: background時のジョブ優先度
+        Returns: メンテナンス結果（background時はジョブ情報）
         """
         try:
+            if background:
+                return {"success": True, "background": True, **manager.jobs.submit("system_maintenance", {
+                    "maintenance_type": maintenance_type, "auto_fix": auto_fix, "create_backup": create_backup
+                }, priority=priority)}
             if not manager.initialized:
                 manager.safe_initialize()
             
@@ -253,6 +318,7 @@ def register_backup_tools(mcp, manager):
             
             # バックアップ作成
             if create_backup:
+                report_progress(message="creating backup")
                 backup_result = chroma_backup_data()
                 maintenance_report["backup_created"] = backup_result.get("success", False)
                 if backup_result.get("success"):
@@ -263,7 +329,9 @@ def register_backup_tools(mcp, manager):
             maintenance_report["stats"]["total_collections"] = len(collections)
             
             total_docs = 0
+            report_progress(0, len(collections), "collecting stats")
             for collection in collections:
+                checkpoint()
                 try:
                     col = manager.chroma_client.get_collection(collection.name)
                     count = col.count()
@@ -277,6 +345,7 @@ def register_backup_tools(mcp, manager):
             if maintenance_type in ["basic", "standard", "comprehensive"]:
                 # 空のコレクションチェック
                 for collection in collections:
+                    checkpoint()
                     try:
                         col = manager.chroma_client.get_collection(collection.name)
                         if col.count() == 0:
@@ -287,7 +356,8 @@ def register_backup_tools(mcp, manager):
             # 包括的チェック
             if maintenance_type == "comprehensive":
                 # 重複チェック
-                for collection in collections:
+                for index, collection in enumerate(collections):
+                    report_progress(index, len(collections), f"checking duplicates in {collection.name}")
                     try:
                         cleanup_result = chroma_cleanup_duplicates(collection.name, dry_run=True)
                         if cleanup_result.get("duplicates_found", 0) > 0:
@@ -305,3 +375,5 @@ def register_backup_tools(mcp, manager):
             
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    manager.jobs.register("system_maintenance", chroma_system_maintenance)
@@ -14,7 +14,7 @@ def register_basic_tools(mcp, manager):
     
     @mcp.tool()
     async def chroma_stats() -> dict:
-        """ChromaDB統計情報を取得"""
+        """ChromaDB統計情報を取得（件数・最終書き込み時刻は書き込み時に更新した統計ストアから返す）"""
         if not manager.initialized:
             manager.initialize()
         
@@ -22,18 +22,17 @@ def register_basic_tools(mcp, manager):
             "server_status": "running",
             "timestamp": datetime.now().isoformat(),
             "initialized": manager.initialized,
-            "collections": {}
+            "collections": {},
+            "stats_source": "incremental"
         }
         
         if manager.chroma_client:
             try:
-                all_collections = manager.chroma_client.list_collections()
-                total_documents = 0
-                
-                for collection in all_collections:
-                    count = collection.count()
-                    stats_data["collections"][collection.name] = {"document_count": count}
-                    total_documents += count
+                counts = manager.collection_counts()
+                tracked = manager.stats.describe(counts, detail=False)
+                for name, count in counts.items():
+                    stats_data["collections"][name] = {**tracked.get(name, {}), "document_count": count}
+                total_documents = sum(counts.values())
                 
                 stats_data["total_documents"] = total_documents
                 
@@ -79,21 +78,27 @@ def register_basic_tools(mcp, manager):
     
     @mcp.tool()
     async def chroma_health_check() -> dict:
-        """システムヘルスチェック"""
-        if not manager.initialized:
+        """システムヘルスチェック（起動時ウォームアップの準備状態・起動時間の内訳を含む）"""
+        warmup = manager.warmup
+        # ウォームアップ中は初期化を待たずに現在の準備状態を返す
+        if not manager.initialized and not (warmup and warmup.running):
             manager.initialize()
         
         try:
             # 基本接続テスト
-            collections = manager.chroma_client.list_collections() if manager.chroma_client else []
-            total_documents = sum(c.count() for c in collections) if collections else 0
+            counts = manager.collection_counts() if manager.chroma_client else {}
+            total_documents = sum(counts.values())
+            ready = warmup.ready if warmup else manager.initialized
             
             health_data = {
-                "status": "✅ Healthy",
+                "status": "✅ Healthy" if ready else "🟡 Warming up",
+                "ready": ready,
+                "warmup": warmup.describe() if warmup else None,
+                "startup": manager.startup_report,
                 "timestamp": datetime.now().isoformat(),
                 "server_version": "FastMCP ChromaDB v1.0.0",
                 "database_status": "Connected" if manager.chroma_client else "Disconnected",
-                "collections_count": len(collections),
+                "collections_count": len(counts),
                 "total_documents": total_documents,
                 "components": {
                     "chromadb_client": "ok" if manager.chroma_client else "error",
@@ -45,7 +45,7 @@ def batch_learn_chat_md(docs_dir="logs/md_debug", collection_name=None):
         except Exception:
             collection = manager.chroma_client.create_collection(collection_name)
         doc_count = collection.count()
-        sample = collection.get(limit=3)
+        sample = collection.get(limit=3, include=[])
         health = {"doc_count": doc_count, "sample_ids": sample.get("ids", [])}
     except Exception as e:
         health = {"error": f"Collection health check failed: {e}"}
@@ -0,0 +1,388 @@
+"""
+一括書き込みのバッチ処理
+削除・追加をIDバッファに溜め、上限件数ごとにまとめてChromaDBへ発行する
+ツール呼び出しの締め切り（modules.deadlines）では書き込みを中断しない。読み取り側（ページャ）が止まった後、
+呼び出し元が最後にflush()してバッファ済みの分を書き切る（削除前に追加を書くbefore_flushの順序を崩さないため）。
+
+バッチ件数はAdaptiveBatchSizerが決める。上限は常にクライアントのget_max_batch_size()で、
+件数を指定しなければバッチごとの所要時間・ペイロードバイト数から自動調整する（調整結果はコレクション・操作ごとに次回へ引き継ぐ）。
+リストを一度に渡す書き込みはwrite_in_batches()で分割する。
+設定: batching.initial_size / batching.min_size / batching.max_size / batching.target_batch_seconds / batching.max_batch_mb
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Sequence
+from collections import deque
+import threading
+import time
+
+from modules.paging import estimate_page_bytes
+
+DEFAULT_BATCH_SIZE = 500
+MAX_SAMPLE_IDS = 20
+MAX_TIMING_HISTORY = 100
+DEFAULT_MIN_BATCH_SIZE = 16
+# クライアントから上限を取得できない場合の上限（SQLiteのバインド変数上限に収まる件数）
+FALLBACK_MAX_BATCH_SIZE = 5000
+# 1バッチの所要時間の目標（長すぎる書き込みで対話的な読み取りを待たせない）
+DEFAULT_TARGET_BATCH_SECONDS = 1.0
+DEFAULT_MAX_BATCH_MB = 32.0
+# バッチ件数を増やしてスループットがこの割合を下回ったら、最も速かった件数へ戻す
+THROUGHPUT_DROP_RATIO = 0.8
+WRITE_COLUMNS = ("documents", "metadatas", "embeddings", "uris")
+
+# コレクション・操作ごとの調整済み件数（次回の初期値）
+_tuned_sizes: Dict[tuple, int] = {}
+_tuned_lock = threading.Lock()
+
+
+def client_max_batch_size(target) -> Optional[int]:
+    """
+    ChromaDBの1回の書き込み件数の上限（コレクションまたはクライアントから取得。取得できなければNone）
+    """
+    for obj in (target, getattr(target, "_client", None)):
+        if obj is None:
+            continue
+        try:
+            getter = getattr(obj, "get_max_batch_size", None)
+            if callable(getter):
+                return int(getter())
+            value = getattr(obj, "max_batch_size", None)
+            if isinstance(value, int) and value > 0:
+                return value
+        except Exception:
+            continue
+    return None
+
+
+def _collection_key(collection, operation: str) -> tuple:
+    return (getattr(collection, "name", None) or id(collection), operation)
+
+
+class AdaptiveBatchSizer:
+    """
+    書き込みバッチ件数の決定（スレッドセーフではない。書き込みループごとに1つ使う）
+    adaptive=Trueのとき、1バッチがtarget_seconds程度・max_bytes以下に収まる件数へ寄せ、
+    件数を増やしてもスループット（行/秒）が伸びなくなれば最も速かった件数へ戻す。
+    Args:
+        initial: 初期件数（adaptive=Falseなら固定件数）
+        min_size: 自動調整の下限
+        max_size: 上限（クライアントのget_max_batch_size()を超えない値を渡す）
+        target_seconds: 1バッチの所要時間の目標
+        max_bytes: 1バッチのペイロード上限（バイト）
+        adaptive: Falseで件数を固定（計測のみ）
+        key: 調整結果を引き継ぐキー（コレクション名, 操作）
+    """
+
+    def __init__(self, initial: int = DEFAULT_BATCH_SIZE, min_size: int = DEFAULT_MIN_BATCH_SIZE,
+                 max_size: int = FALLBACK_MAX_BATCH_SIZE, target_seconds: float = DEFAULT_TARGET_BATCH_SECONDS,
+                 max_bytes: int = int(DEFAULT_MAX_BATCH_MB * 1024 * 1024), adaptive: bool = True,
+                 key: Optional[tuple] = None):
+        self.max_size = max(1, int(max_size))
+        self.min_size = min(max(1, int(min_size)), self.max_size)
+        self.target_seconds = max(0.01, float(target_seconds))
+        self.max_bytes = max(1, int(max_bytes))
+        self.adaptive = adaptive
+        self.key = key
+        self.size = self._clamp(initial) if adaptive else min(max(1, int(initial)), self.max_size)
+        self.observations = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self._row_seconds: Optional[float] = None
+        self._row_bytes: Optional[float] = None
+        self._best: Optional[tuple] = None
+
+    @classmethod
+    def for_collection(cls, collection, operation: str, batch_size: Optional[int] = None,
+                       initial: Optional[int] = None) -> "AdaptiveBatchSizer":
+        """
+        コレクション向けのサイザー（上限はクライアントのget_max_batch_size()と設定batching.max_sizeの小さい方）
+        Args:
+            collection: 書き込み先
+            operation: add / upsert / update / delete
+            batch_size: 指定時はその件数に固定（上限で切り詰め）
+            initial: 自動調整の初期件数（None=前回の調整結果、なければ設定batching.initial_size）
+        """
+        settings: Dict[str, Any] = {}
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings().get_setting("batching", {}) or {}
+        except Exception:
+            pass
+        limits = [client_max_batch_size(collection), settings.get("max_size")]
+        limits = [int(v) for v in limits if v]
+        max_size = min(limits) if limits else FALLBACK_MAX_BATCH_SIZE
+        key = _collection_key(collection, operation)
+        if batch_size:
+            return cls(initial=batch_size, max_size=max_size, adaptive=False, key=key)
+        if initial is None:
+            with _tuned_lock:
+                initial = _tuned_sizes.get(key)
+        return cls(
+            initial=initial or int(settings.get("initial_size") or DEFAULT_BATCH_SIZE),
+            min_size=int(settings.get("min_size") or DEFAULT_MIN_BATCH_SIZE),
+            max_size=max_size,
+            target_seconds=float(settings.get("target_batch_seconds") or DEFAULT_TARGET_BATCH_SECONDS),
+            max_bytes=int(float(settings.get("max_batch_mb") or DEFAULT_MAX_BATCH_MB) * 1024 * 1024),
+            key=key
+        )
+
+    def _clamp(self, size: float) -> int:
+        return min(max(int(size), self.min_size), self.max_size)
+
+    def observe(self, rows: int, seconds: float, payload_bytes: int = 0) -> int:
+        """
+        1バッチの実績を記録し、次のバッチ件数を返す
+        Args:
+            rows: 書き込んだ件数
+            seconds: 所要時間
+            payload_bytes: ペイロードのおおよそのバイト数
+        """
+        if rows <= 0:
+            return self.size
+        self.observations += 1
+        self.rows += rows
+        self.seconds += seconds
+        self.bytes += payload_bytes
+        if not self.adaptive:
+            return self.size
+        row_seconds = max(seconds, 1e-6) / rows
+        row_bytes = max(payload_bytes, 1) / rows
+        # 直近寄りの平均（1回の揺らぎで大きく振れないように）
+        self._row_seconds = row_seconds if self._row_seconds is None else (self._row_seconds + row_seconds) / 2
+        self._row_bytes = row_bytes if self._row_bytes is None else (self._row_bytes + row_bytes) / 2
+        candidate = min(self.target_seconds / self._row_seconds, self.max_bytes / self._row_bytes, self.size * 2)
+        throughput = rows / max(seconds, 1e-6)
+        if self._best is None or throughput > self._best[0]:
+            self._best = (throughput, rows)
+        elif rows > self._best[1] and throughput < self._best[0] * THROUGHPUT_DROP_RATIO:
+            candidate = min(candidate, self._best[1])
+        self.size = self._clamp(candidate)
+        if self.key is not None:
+            with _tuned_lock:
+                _tuned_sizes[self.key] = self.size
+        return self.size
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.size,
+            "adaptive": self.adaptive,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "target_batch_seconds": self.target_seconds,
+            "batches": self.observations,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 4),
+            "payload_mb": round(self.bytes / (1024 * 1024), 2),
+            "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds > 0 else None
+        }
+
+
+def write_in_batches(collection, operation: str, ids: Sequence[str], sizer: Optional[AdaptiveBatchSizer] = None,
+                     batch_size: Optional[int] = None, **columns) -> Dict[str, Any]:
+    """
+    リストで受け取った書き込みをバッチに分けて発行する（add / upsert / update）
+    Args:
+        collection: 書き込み先
+        operation: collectionのメソッド名
+        ids: ID列
+        sizer: 複数回の呼び出しで共有するサイザー（None=for_collectionで作成）
+        batch_size: 固定件数（sizer未指定時のみ）
+        **columns: documents / metadatas / embeddings / uris（Noneの列は渡さない）
+    Returns: {"written", "batches", "seconds", "batch_size", "rows_per_second", ...}
+    """
+    sizer = sizer or AdaptiveBatchSizer.for_collection(collection, operation, batch_size=batch_size)
+    columns = {name: values for name, values in columns.items() if values is not None and name in WRITE_COLUMNS}
+    write = getattr(collection, operation)
+    observed = sizer.observations
+    total = len(ids)
+    start = 0
+    while start < total:
+        end = min(start + sizer.size, total)
+        batch = {"ids": list(ids[start:end]), **{name: values[start:end] for name, values in columns.items()}}
+        started = time.perf_counter()
+        write(**batch)
+        sizer.observe(end - start, time.perf_counter() - started, estimate_page_bytes(batch))
+        start = end
+    return {"written": total, **sizer.describe(), "batches": sizer.observations - observed}
+
+
+class _BatchWriter:
+    """バッファリングとバッチごとの計時を行う基底クラス（件数はAdaptiveBatchSizerが決める）"""
+
+    operation = "write"
+
+    def __init__(self,
+                 collection,
+                 batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+                 dry_run: bool = False,
+                 before_flush: Optional[Callable[[], Any]] = None,
+                 on_flush: Optional[Callable[[int], None]] = None,
+                 sizer: Optional[AdaptiveBatchSizer] = None):
+        self.collection = collection
+        self.sizer = sizer or AdaptiveBatchSizer.for_collection(collection, self.operation, batch_size=batch_size)
+        self.batch_size = self.sizer.size
+        self.dry_run = dry_run
+        self.before_flush = before_flush
+        self.on_flush = on_flush
+        self.pending_ids: List[str] = []
+        self.written = 0
+        self.batches = 0
+        self.total_seconds = 0.0
+        self.batch_timings: deque = deque(maxlen=MAX_TIMING_HISTORY)
+        self.observe_timing = True
+
+    def _buffer(self, doc_id: str) -> None:
+        if self.dry_run:
+            return
+        self.pending_ids.append(doc_id)
+        if len(self.pending_ids) >= self.batch_size:
+            self.flush()
+
+    def _write(self) -> None:
+        raise NotImplementedError
+
+    def _payload(self) -> Dict[str, Any]:
+        return {"ids": self.pending_ids}
+
+    def _clear(self) -> None:
+        self.pending_ids = []
+
+    def flush(self) -> int:
+        """バッファ内容を書き込み、件数を返す"""
+        if not self.pending_ids:
+            return 0
+        if self.before_flush:
+            self.before_flush()
+        count = len(self.pending_ids)
+        # _writeが1件ずつの再試行などに切り替えた場合はFalseにして、その時間をサイザーに渡さない
+        self.observe_timing = True
+        started = time.perf_counter()
+        self._write()
+        elapsed = time.perf_counter() - started
+        if self.observe_timing:
+            self.batch_size = self.sizer.observe(count, elapsed, estimate_page_bytes(self._payload()))
+        self._clear()
+        self.batches += 1
+        self.total_seconds += elapsed
+        self.batch_timings.append({"batch": self.batches, "count": count, "seconds": round(elapsed, 4)})
+        self.written += count
+        if self.on_flush:
+            self.on_flush(count)
+        return count
+
+    def timings(self) -> Dict[str, Any]:
+        """バッチ計時の集計"""
+        return {
+            "batches": self.batches,
+            f"{self.operation}_seconds": round(self.total_seconds, 4),
+            "batch_size": self.batch_size,
+            "adaptive_batching": self.sizer.adaptive,
+            "batch_timings": list(self.batch_timings)
+        }
+
+
+class BatchDeleter(_BatchWriter):
+    """
+    削除IDをバッファし、batch_size件ごとにcollection.delete()を発行する
+    Args:
+        collection: 対象コレクション
+        batch_size: 1回のdelete件数（バッファの上限でもある。None=自動調整）
+        dry_run: Trueの場合は件数のみ数えて削除しない
+        before_flush: 削除前に呼ぶ処理（先行する追加バッファのフラッシュ等）
+        on_flush: フラッシュ後に削除件数を受け取るコールバック（ページャのoffset補正等）
+        sample_limit: 応答用に保持する削除IDサンプル数
+    """
+
+    operation = "delete"
+
+    def __init__(self,
+                 collection,
+                 batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+                 dry_run: bool = False,
+                 before_flush: Optional[Callable[[], Any]] = None,
+                 on_flush: Optional[Callable[[int], None]] = None,
+                 sample_limit: int = MAX_SAMPLE_IDS,
+                 sizer: Optional[AdaptiveBatchSizer] = None):
+        super().__init__(collection, batch_size, dry_run, before_flush, on_flush, sizer)
+        self.sample_limit = sample_limit
+        self.matched = 0
+        self.sample_ids: List[str] = []
+
+    @property
+    def deleted(self) -> int:
+        return self.written
+
+    def add(self, doc_id: str) -> None:
+        """削除対象IDを追加（上限に達したら自動フラッシュ）"""
+        self.matched += 1
+        if len(self.sample_ids) < self.sample_limit:
+            self.sample_ids.append(doc_id)
+        self._buffer(doc_id)
+
+    def _write(self) -> None:
+        self.collection.delete(ids=self.pending_ids)
+
+    def summary(self) -> Dict[str, Any]:
+        """処理結果の集計"""
+        return {
+            "matched_count": self.matched,
+            "deleted_count": self.deleted,
+            **self.timings(),
+            "sample_ids": self.sample_ids,
+            "dry_run": self.dry_run
+        }
+
+
+class BatchUpserter(_BatchWriter):
+    """
+    ドキュメントをバッファし、batch_size件ごとにcollection.upsert()を発行する
+    同じIDでの再実行は上書きになるため、中断後の再実行でも重複しない
+    batch_sizeにNoneを渡すと件数を自動調整する
+    """
+
+    operation = "upsert"
+
+    def __init__(self,
+                 collection,
+                 batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+                 dry_run: bool = False,
+                 before_flush: Optional[Callable[[], Any]] = None,
+                 on_flush: Optional[Callable[[int], None]] = None,
+                 sizer: Optional[AdaptiveBatchSizer] = None):
+        super().__init__(collection, batch_size, dry_run, before_flush, on_flush, sizer)
+        self.pending_documents: List[str] = []
+        self.pending_metadatas: List[Dict[str, Any]] = []
+
+    def add(self, doc_id: str, document: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """追加対象を登録（上限に達したら自動フラッシュ）"""
+        if not self.dry_run:
+            self.pending_documents.append(document)
+            self.pending_metadatas.append(metadata or {})
+        self._buffer(doc_id)
+
+    def _write(self) -> None:
+        # ChromaDBは空のメタデータ（{}）を受け付けないため、バッチ全体でメタデータがなければNoneで渡す
+        self.collection.upsert(
+            ids=self.pending_ids,
+            documents=self.pending_documents,
+            metadatas=self.pending_metadatas if any(self.pending_metadatas) else None
+        )
+
+    def _payload(self) -> Dict[str, Any]:
+        return {"ids": self.pending_ids, "documents": self.pending_documents, "metadatas": self.pending_metadatas}
+
+    def _clear(self) -> None:
+        super()._clear()
+        self.pending_documents = []
+        self.pending_metadatas = []
+
+
+__all__ = [
+    "AdaptiveBatchSizer",
+    "BatchDeleter",
+    "BatchUpserter",
+    "DEFAULT_BATCH_SIZE",
+    "client_max_batch_size",
+    "write_in_batches",
+]
@@ -5,6 +5,8 @@ from typing import Dict, Optional
 import os
 import hashlib
 from pathlib import Path
+from modules.query_filters import stamp_timestamp
+from modules.batch_ops import write_in_batches
 
 def chroma_store_file(
     file_path: str,
@@ -35,12 +37,12 @@ def chroma_store_file(
             content = f.read()
         doc_id = f"file_{Path(file_path).stem}_0"
         file_ext = Path(file_path).suffix.lstrip('.')
-        metadata = {
+        metadata = stamp_timestamp({
             "source": "markdown" if file_ext == "md" else "file",
             "file_path": file_path,
             "file_hash": file_hash,
             "file_type": file_ext
-        }
+        })
         try:
             if manager is None or not hasattr(manager, "chroma_client") or manager.chroma_client is None:
                 return {"success": False, "error": "ChromaDB manager is not properly initialized (chroma_client is None)."}
@@ -61,6 +63,72 @@ def chroma_store_file(
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def plan_md_conversation(file_path: str, project: Optional[str] = None) -> Dict:
+    """
+    Markdown会話ログ（議事録/チャット）を発言単位でchunk化し、addする行（ID・本文・メタデータ）を作る（書き込みはしない）
+    Returns: {"success", "file_hash", "rows": [(doc_id, document, metadata), ...]} または {"success": False, "error"}
+    """
+    import re
+    if not os.path.exists(file_path):
+        return {"success": False, "error": "File not found"}
+    def calc_file_hash(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(8192)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.hexdigest()
+    file_hash = calc_file_hash(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    # chunk化
+    topic = None
+    chunks = []
+    for idx, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        # トピック（# or ## 見出し）
+        m_topic = re.match(r'^(#+)\s*(.+)', line)
+        if m_topic:
+            topic = m_topic.group(2)
+            continue
+        # 発言者: 内容
+        m_say = re.match(r'^([\w\u3040-\u30FF\u4E00-\u9FFF\uFF66-\uFF9F\u30A0-\u30FF\uFF10-\uFF19\uFF21-\uFF3A\uFF41-\uFF5A]+)[：:](.+)', line)
+        if m_say:
+            speaker = m_say.group(1).strip()
+            content = m_say.group(2).strip()
+            if content:
+                chunks.append({
+                    "speaker": speaker,
+                    "content": content,
+                    "topic": topic,
+                    "line_index": idx
+                })
+    if not chunks:
+        return {"success": False, "error": "No conversation chunks found in file."}
+    rows = []
+    ingested_at = stamp_timestamp({})
+    for i, chunk in enumerate(chunks):
+        doc_id = f"mdconv_{Path(file_path).stem}_{i}"
+        metadata = {
+            "source": "md_conversation",
+            "file_path": file_path,
+            "file_hash": file_hash,
+            "chunk_index": i,
+            "speaker": chunk["speaker"],
+            "topic": chunk["topic"],
+            "line_index": chunk["line_index"],
+            "file_type": "md"
+        }
+        if project:
+            metadata["project"] = project
+        metadata.update(ingested_at)
+        rows.append((doc_id, chunk["content"], metadata))
+    return {"success": True, "file_hash": file_hash, "rows": rows}
+
 def chroma_store_md_conversation(
     file_path: str,
     collection_name: Optional[str] = None,
@@ -72,50 +140,10 @@ def chroma_store_md_conversation(
     発言者・トピック・順序などのメタデータを付与してChromaDBにaddする。
     manager: ChromaDB管理インスタンス必須
     """
-    import re
-    import hashlib
-    from pathlib import Path
     try:
-        if not os.path.exists(file_path):
-            return {"success": False, "error": "File not found"}
-        def calc_file_hash(path):
-            h = hashlib.sha256()
-            with open(path, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)
-                    if not chunk:
-                        break
-                    h.update(chunk)
-            return h.hexdigest()
-        file_hash = calc_file_hash(file_path)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        # chunk化
-        topic = None
-        chunks = []
-        for idx, line in enumerate(lines):
-            line = line.strip()
-            if not line:
-                continue
-            # トピック（# or ## 見出し）
-            m_topic = re.match(r'^(#+)\s*(.+)', line)
-            if m_topic:
-                topic = m_topic.group(2)
-                continue
-            # 発言者: 内容
-            m_say = re.match(r'^([\w\u3040-\u30FF\u4E00-\u9FFF\uFF66-\uFF9F\u30A0-\u30FF\uFF10-\uFF19\uFF21-\uFF3A\uFF41-\uFF5A]+)[：:](.+)', line)
-            if m_say:
-                speaker = m_say.group(1).strip()
-                content = m_say.group(2).strip()
-                if content:
-                    chunks.append({
-                        "speaker": speaker,
-                        "content": content,
-                        "topic": topic,
-                        "line_index": idx
-                    })
-        if not chunks:
-            return {"success": False, "error": "No conversation chunks found in file."}
+        plan = plan_md_conversation(file_path, project=project)
+        if not plan["success"]:
+            return plan
         # ChromaDB add
         if manager is None or not hasattr(manager, "chroma_client") or manager.chroma_client is None:
             return {"success": False, "error": "ChromaDB manager is not properly initialized (chroma_client is None)."}
@@ -123,30 +151,28 @@ def chroma_store_md_conversation(
         if collection_name not in existing_collections:
             return {"success": False, "error": f"Collection '{collection_name}' does not exist. 新規作成は禁止されています。"}
         collection = manager.chroma_client.get_collection(collection_name)
+        rows = plan["rows"]
         results = []
-        for i, chunk in enumerate(chunks):
-            doc_id = f"mdconv_{Path(file_path).stem}_{i}"
-            metadata = {
-                "source": "md_conversation",
-                "file_path": file_path,
-                "file_hash": file_hash,
-                "chunk_index": i,
-                "speaker": chunk["speaker"],
-                "topic": chunk["topic"],
-                "line_index": chunk["line_index"],
-                "file_type": "md"
-            }
-            if project:
-                metadata["project"] = project
-            try:
-                collection.add(
-                    documents=[chunk["content"]],
-                    metadatas=[metadata],
-                    ids=[doc_id]
-                )
-                results.append({"success": True, "doc_id": doc_id})
-            except Exception as e:
-                results.append({"success": False, "doc_id": doc_id, "error": str(e)})
+        try:
+            # まとめてバッチでadd（失敗した場合のみ1件ずつaddして失敗行を特定する）
+            write_in_batches(collection, "add", [r[0] for r in rows],
+                             documents=[r[1] for r in rows], metadatas=[r[2] for r in rows])
+            results = [{"success": True, "doc_id": doc_id} for doc_id, _, _ in rows]
+        except Exception:
+            existing = set(collection.get(ids=[r[0] for r in rows], include=[]).get("ids") or [])
+            for doc_id, document, metadata in rows:
+                if doc_id in existing:
+                    results.append({"success": True, "doc_id": doc_id})
+                    continue
+                try:
+                    collection.add(
+                        documents=[document],
+                        metadatas=[metadata],
+                        ids=[doc_id]
+                    )
+                    results.append({"success": True, "doc_id": doc_id})
+                except Exception as e:
+                    results.append({"success": False, "doc_id": doc_id, "error": str(e)})
         return {
             "success": all(r["success"] for r in results),
             "file_processed": file_path,
@@ -156,4 +182,4 @@ def chroma_store_md_conversation(
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-__all__ = ["chroma_store_file", "chroma_store_md_conversation"]
+__all__ = ["chroma_store_file", "chroma_store_md_conversation", "plan_md_conversation"]
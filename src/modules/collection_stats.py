@@ -0,0 +1,500 @@
+"""
+コレクション統計の差分更新ストア
+書き込み（add/upsert/update/delete）のたびに件数・ドキュメント長ヒストグラム・source/project別件数・
+メタデータキーのカバレッジ・最終書き込み時刻をメモリ上で更新し、
+状態系ツール（chroma_stats・chroma_health_check等）がコレクションを数え直さずに応答できるようにする
+
+- 件数: 初回参照時にcount()で1回だけ取得し、以後は書き込みの差分で更新
+- 分布（長さ・source・project・キー）: rebuild()で1回全件走査した後は差分で更新（起動時ウォームアップで実行）
+- 書き込み前に対象IDの既存行を取得するのは、統計がその書き込みで変わる場合だけ（件数を追跡中なら存在確認のIDのみ、
+  分布を作成済みなら書き込みで変わる列のみ）。どちらも未取得のコレクションでは書き込みを1回しか発行しない
+- 条件指定（where）の削除はIDだけをページ単位で数え、分布は古い扱いにする（次回のrebuild()で作り直す）
+
+manager.chroma_clientをStatsTrackingClientで包むため、既存の書き込みツールは変更不要。
+同じDBへ別プロセスから書き込んだ場合は反映されない（refresh()・rebuild()で取り直す）。
+"""
+
+from typing import Dict, Any, List, Optional, Iterable
+from collections import Counter
+from datetime import datetime
+import threading
+import time
+
+from modules.structured_logging import get_logger
+
+logger = get_logger("collection_stats")
+
+# source/projectとして集計するメタデータキー
+SOURCE_KEY = "source"
+PROJECT_KEY = "project"
+# 分布に保持する値の種類の上限（超えた分は"(other)"に集約）
+MAX_TALLY_VALUES = 200
+OTHER_VALUE = "(other)"
+
+
+def length_bucket(length: int) -> int:
+    """ドキュメント長の階級（0, 1, 2-3, 4-7, ... の2のべき乗区切り）"""
+    return int(length).bit_length()
+
+
+def bucket_label(bucket: int) -> str:
+    if bucket == 0:
+        return "0"
+    return f"{1 << (bucket - 1)}-{(1 << bucket) - 1}"
+
+
+# 書き込み前に取得しなかった列（書き込みで変わらないため分布を動かさない）
+UNFETCHED = object()
+
+
+class CollectionStats:
+    """1コレクション分の統計"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count: Optional[int] = None
+        self.distribution_complete = False
+        self.approximate = False
+        self.length_histogram: Counter = Counter()
+        self.total_length = 0
+        self.sources: Counter = Counter()
+        self.projects: Counter = Counter()
+        self.metadata_keys: Counter = Counter()
+        self.writes: Counter = Counter()
+        self.rows_written: Counter = Counter()
+        self.last_write_at: Optional[str] = None
+        self.last_write_op: Optional[str] = None
+        self.rebuilt_at: Optional[str] = None
+        self.rebuild_seconds: Optional[float] = None
+        self.rebuilding = False
+        self.writes_during_rebuild = 0
+
+    @staticmethod
+    def _tally(counter: Counter, value: Any, delta: int) -> None:
+        if value is None:
+            return
+        key = str(value)
+        if key not in counter and len(counter) >= MAX_TALLY_VALUES:
+            key = OTHER_VALUE
+        counter[key] += delta
+        if counter[key] <= 0:
+            del counter[key]
+
+    def apply_row(self, document: Optional[str], metadata: Optional[Dict[str, Any]], delta: int) -> None:
+        """1行分を分布に加算（delta=1）・減算（delta=-1）。UNFETCHEDの列は変化なしとして扱う"""
+        if document is not UNFETCHED:
+            length = len(document) if document else 0
+            bucket = length_bucket(length)
+            self.length_histogram[bucket] += delta
+            if self.length_histogram[bucket] <= 0:
+                del self.length_histogram[bucket]
+            self.total_length += delta * length
+        if metadata is UNFETCHED:
+            return
+        metadata = metadata or {}
+        self._tally(self.sources, metadata.get(SOURCE_KEY), delta)
+        self._tally(self.projects, metadata.get(PROJECT_KEY), delta)
+        for key in metadata:
+            self.metadata_keys[key] += delta
+            if self.metadata_keys[key] <= 0:
+                del self.metadata_keys[key]
+
+    def describe(self, detail: bool = True) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "document_count": self.count,
+            "last_write_at": self.last_write_at,
+            "last_write_op": self.last_write_op,
+            "writes": dict(self.writes),
+            "rows_written": dict(self.rows_written)
+        }
+        if not detail:
+            return info
+        count = self.count or 0
+        info["distribution"] = {
+            "complete": self.distribution_complete,
+            "approximate": self.approximate,
+            "rebuilt_at": self.rebuilt_at,
+            "rebuild_seconds": self.rebuild_seconds
+        }
+        if self.distribution_complete:
+            info["document_length"] = {
+                "mean": round(self.total_length / count, 1) if count else 0,
+                "histogram": {bucket_label(b): n for b, n in sorted(self.length_histogram.items())}
+            }
+            info["sources"] = dict(self.sources.most_common(20))
+            info["projects"] = dict(self.projects.most_common(20))
+            info["metadata_coverage"] = {
+                key: round(n / count * 100, 2) if count else 0.0 for key, n in self.metadata_keys.most_common()
+            }
+        return info
+
+
+class CollectionStatsStore:
+    """全コレクションの統計（スレッドセーフ）"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._stats: Dict[str, CollectionStats] = {}
+        self._rows_written: Counter = Counter()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_settings(cls) -> "CollectionStatsStore":
+        enabled = True
+        try:
+            from config.global_settings import GlobalSettings
+            enabled = bool(GlobalSettings().get_setting("stats.enabled", True))
+        except Exception:
+            pass
+        return cls(enabled=enabled)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._stats
+
+    def get(self, name: str) -> CollectionStats:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = CollectionStats(name)
+            return stats
+
+    def seed(self, name: str, count: int, empty: bool = False) -> None:
+        """件数を設定（新規作成した空コレクションは分布も確定済みとする）"""
+        with self._lock:
+            stats = self.get(name)
+            stats.count = int(count)
+            if empty and count == 0:
+                stats.distribution_complete = True
+
+    def tracking(self, name: str) -> tuple:
+        """(件数を追跡中か, 分布を作成済みか)。書き込み前に何を取得する必要があるかの判定用"""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                return False, False
+            return stats.count is not None, stats.distribution_complete
+
+    def invalidate(self, name: str, count: bool = False, distribution: bool = False) -> None:
+        """差分で追えなくなった統計を古い扱いにする（件数は次回counts()で取り直し、分布は次回rebuild()で作り直す）"""
+        with self._lock:
+            stats = self.get(name)
+            if count:
+                stats.count = None
+            if distribution and stats.distribution_complete:
+                stats.distribution_complete = False
+                logger.info("Stats distribution marked stale", extra={"collection": name})
+
+    def drop(self, name: str) -> None:
+        with self._lock:
+            self._stats.pop(name, None)
+
+    def rename(self, old: str, new: str) -> None:
+        with self._lock:
+            stats = self._stats.pop(old, None)
+            if stats is not None:
+                stats.name = new
+                self._stats[new] = stats
+
+    def record(self, name: str, op: str, count_delta: int,
+               removed: Iterable[tuple] = (), added: Iterable[tuple] = (), rows: Optional[int] = None) -> None:
+        """
+        書き込み1回分の差分を反映
+        Args:
+            name: コレクション名
+            op: add/upsert/update/delete
+            count_delta: 件数の増減
+            removed: 消えた旧値の(document, metadata)
+            added: 新しい値の(document, metadata)
+            rows: 書き込み行数（None=removed/addedの件数）
+        """
+        removed, added = list(removed), list(added)
+        with self._lock:
+            stats = self.get(name)
+            if stats.count is not None:
+                stats.count = max(0, stats.count + count_delta)
+            if stats.distribution_complete:
+                for document, metadata in removed:
+                    stats.apply_row(document, metadata, -1)
+                for document, metadata in added:
+                    stats.apply_row(document, metadata, 1)
+            if stats.rebuilding:
+                stats.writes_during_rebuild += 1
+            stats.writes[op] += 1
+            if rows is None:
+                rows = len(removed) if op == "delete" else len(added)
+            stats.rows_written[op] += rows
+            self._rows_written[op] += rows
+            stats.last_write_at = datetime.now().isoformat()
+            stats.last_write_op = op
+
+    def counts(self, client) -> Dict[str, int]:
+        """
+        全コレクションの件数（コレクション一覧は1回取得し、件数は記録済みの値・未記録ならcount()を1回だけ）
+        一覧にないコレクションの記録は削除する
+        """
+        listed = client.list_collections()
+        names = [getattr(c, "name", c) for c in listed]
+        with self._lock:
+            for name in list(self._stats):
+                if name not in names:
+                    del self._stats[name]
+        result = {}
+        for name in names:
+            stats = self.get(name)
+            if stats.count is None:
+                self.seed(name, client.get_collection(name).count())
+            result[name] = stats.count
+        return result
+
+    def refresh(self, name: str, collection) -> int:
+        """件数をcount()で取り直す"""
+        count = collection.count()
+        self.seed(name, count)
+        return count
+
+    def rebuild(self, name: str, collection, page_size: int = 1000) -> CollectionStats:
+        """全件をページ単位で1回走査して分布を作り直す（以後は差分で更新）"""
+        from modules.paging import CollectionPager
+        started = time.perf_counter()
+        fresh = CollectionStats(name)
+        with self._lock:
+            current = self.get(name)
+            current.rebuilding = True
+            current.writes_during_rebuild = 0
+        try:
+            rows = 0
+            for page in CollectionPager(collection, include=["documents", "metadatas"], page_size=page_size):
+                ids = page.get("ids") or []
+                documents = page.get("documents") or [None] * len(ids)
+                metadatas = page.get("metadatas") or [None] * len(ids)
+                for document, metadata in zip(documents, metadatas):
+                    fresh.apply_row(document, metadata, 1)
+                rows += len(ids)
+        finally:
+            with self._lock:
+                current = self.get(name)
+                current.rebuilding = False
+        with self._lock:
+            current = self.get(name)
+            # 走査中の書き込みは走査済み位置によって二重計上・取りこぼしがあり得るため近似扱い
+            current.approximate = current.writes_during_rebuild > 0
+            if current.approximate:
+                logger.warning("Collection written during stats rebuild, distribution is approximate",
+                               extra={"collection": name, "writes": current.writes_during_rebuild})
+            if not current.approximate or current.count is None:
+                current.count = rows
+            current.length_histogram = fresh.length_histogram
+            current.total_length = fresh.total_length
+            current.sources = fresh.sources
+            current.projects = fresh.projects
+            current.metadata_keys = fresh.metadata_keys
+            current.distribution_complete = True
+            current.rebuilt_at = datetime.now().isoformat()
+            current.rebuild_seconds = round(time.perf_counter() - started, 3)
+            return current
+
+    def rows_written(self) -> Dict[str, int]:
+        """全コレクション合計の書き込み行数（操作別・このプロセスでの累計、削除したコレクションの分も含む）"""
+        with self._lock:
+            return dict(self._rows_written)
+
+    def describe(self, names: Optional[Iterable[str]] = None, detail: bool = True) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            selected = self._stats if names is None else {n: self._stats[n] for n in names if n in self._stats}
+            return {name: stats.describe(detail) for name, stats in selected.items()}
+
+
+class StatsTrackingCollection:
+    """
+    コレクションのラッパー
+    書き込み系メソッドの成功後に統計ストアへ差分を記録する（読み取り系はそのまま委譲）
+    """
+
+    def __init__(self, collection, store: CollectionStatsStore):
+        self._collection = collection
+        self._store = store
+
+    def _existing(self, ids: List[str], include: Optional[List[str]]) -> Dict[str, tuple]:
+        """対象IDの既存行（includeがNoneなら取得しない。取得しない列はUNFETCHED）"""
+        if not ids or include is None:
+            return {}
+        found = self._collection.get(ids=list(ids), include=include)
+        found_ids = found.get("ids") or []
+        documents = found.get("documents") if "documents" in include else None
+        metadatas = found.get("metadatas") if "metadatas" in include else None
+        documents = documents or [UNFETCHED] * len(found_ids)
+        metadatas = metadatas or [UNFETCHED] * len(found_ids)
+        return {doc_id: (documents[i], metadatas[i]) for i, doc_id in enumerate(found_ids)}
+
+    def _prefetch(self, documents, metadatas, need_ids: bool = True) -> Optional[List[str]]:
+        """
+        書き込み前に取得する列（None=取得不要）
+        件数を追跡中ならIDの存在確認、分布を作成済みなら書き込みで変わる列の旧値が必要
+        """
+        count_tracked, distribution_tracked = self._store.tracking(self.name)
+        include = None
+        if need_ids and (count_tracked or distribution_tracked):
+            include = []
+        if distribution_tracked:
+            changed = [column for column, values in (("documents", documents), ("metadatas", metadatas))
+                       if values is not None]
+            if changed:
+                include = changed
+        return include
+
+    @staticmethod
+    def _rows(ids: List[str], documents, metadatas) -> List[tuple]:
+        return [(documents[i] if documents is not None else None, metadatas[i] if metadatas is not None else None)
+                for i in range(len(ids))]
+
+    @staticmethod
+    def _merge(old: tuple, document, metadata) -> tuple:
+        """update/upsertで既存行がどう変わるか（メタデータはキー単位でマージ、Noneのキーは削除）"""
+        old_document, old_metadata = old
+        if metadata is None and old_metadata is UNFETCHED:
+            return (document if document is not None else old_document, UNFETCHED)
+        merged = dict(old_metadata or {})
+        if metadata is not None:
+            for key, value in metadata.items():
+                if value is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = value
+        return (document if document is not None else old_document, merged)
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        return self._add(ids, embeddings, metadatas, documents, deduplicated=False, **kwargs)
+
+    def add_new(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        """呼び出し側で既存IDを除外済みのadd（存在確認のgetを省く）"""
+        return self._add(ids, embeddings, metadatas, documents, deduplicated=True, **kwargs)
+
+    def _add(self, ids, embeddings, metadatas, documents, deduplicated: bool, **kwargs):
+        if not self._store.enabled:
+            return self._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        count_tracked, distribution_tracked = self._store.tracking(self.name)
+        need_ids = (count_tracked or distribution_tracked) and not deduplicated
+        existing = self._existing(ids, [] if need_ids else None)
+        result = self._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        added = [row for doc_id, row in zip(ids, self._rows(ids, documents, metadatas)) if doc_id not in existing]
+        self._store.record(self.name, "add", len(added), added=added)
+        return result
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        if not self._store.enabled:
+            return self._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        existing = self._existing(ids, self._prefetch(documents, metadatas))
+        result = self._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        removed, added = [], []
+        for doc_id, (document, metadata) in zip(ids, self._rows(ids, documents, metadatas)):
+            if doc_id in existing:
+                removed.append(existing[doc_id])
+                added.append(self._merge(existing[doc_id], document, metadata))
+            else:
+                added.append((document, metadata))
+        self._store.record(self.name, "upsert", len(added) - len(removed), removed=removed, added=added)
+        return result
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        if not self._store.enabled:
+            return self._collection.update(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        # updateは件数を変えないため、分布を作成済みで変わる列がある場合だけ旧値を取得する
+        include = self._prefetch(documents, metadatas, need_ids=False)
+        existing = self._existing(ids, include)
+        result = self._collection.update(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs)
+        removed, added = [], []
+        for doc_id, (document, metadata) in zip(ids, self._rows(ids, documents, metadatas)):
+            if doc_id in existing:
+                removed.append(existing[doc_id])
+                added.append(self._merge(existing[doc_id], document, metadata))
+        self._store.record(self.name, "update", 0, removed=removed, added=added,
+                           rows=None if include is not None else len(ids))
+        return result
+
+    def delete(self, ids=None, where=None, where_document=None, **kwargs):
+        if not self._store.enabled:
+            return self._collection.delete(ids=ids, where=where, where_document=where_document, **kwargs)
+        count_tracked, distribution_tracked = self._store.tracking(self.name)
+        id_list = None if ids is None else ([ids] if isinstance(ids, str) else list(ids))
+        if id_list is not None and not where and not where_document:
+            include = ["documents", "metadatas"] if distribution_tracked else ([] if count_tracked else None)
+            existing = self._existing(id_list, include)
+            result = self._collection.delete(ids=ids, where=where, where_document=where_document, **kwargs)
+            removed = list(existing.values())
+            self._store.record(self.name, "delete", -len(removed), removed=removed,
+                               rows=None if include is not None else len(id_list))
+            return result
+        # 条件指定の削除: 対象をIDだけ数え（件数を追跡中のみ）、分布は旧値を読まずに古い扱いにする
+        matched = 0
+        count_known = count_tracked
+        if count_tracked and id_list is not None:
+            found = self._collection.get(ids=id_list, where=where, where_document=where_document, include=[])
+            matched = len(found.get("ids") or [])
+        elif count_tracked:
+            from modules.paging import CollectionPager
+            pager = CollectionPager(self._collection, include=[], where=where, where_document=where_document)
+            for page in pager:
+                matched += len(page.get("ids") or [])
+            count_known = not pager.truncated
+        result = self._collection.delete(ids=ids, where=where, where_document=where_document, **kwargs)
+        if distribution_tracked or (count_tracked and not count_known):
+            self._store.invalidate(self.name, count=count_tracked and not count_known, distribution=distribution_tracked)
+        self._store.record(self.name, "delete", -matched if count_known else 0, rows=matched)
+        return result
+
+    def modify(self, name=None, **kwargs):
+        old_name = self.name
+        result = self._collection.modify(name=name, **kwargs)
+        if name and name != old_name:
+            self._store.rename(old_name, name)
+        return result
+
+    def __getattr__(self, item):
+        return getattr(self._collection, item)
+
+
+class StatsTrackingClient:
+    """
+    ChromaDBクライアントのラッパー
+    取得・作成したコレクションをStatsTrackingCollectionで包み、コレクションの作成・削除を統計ストアへ反映する
+    """
+
+    def __init__(self, client, store: CollectionStatsStore):
+        self._client = client
+        self.stats_store = store
+
+    def get_collection(self, name, **kwargs):
+        return StatsTrackingCollection(self._client.get_collection(name, **kwargs), self.stats_store)
+
+    def create_collection(self, name, **kwargs):
+        collection = self._client.create_collection(name, **kwargs)
+        self.stats_store.seed(name, 0, empty=True)
+        return StatsTrackingCollection(collection, self.stats_store)
+
+    def get_or_create_collection(self, name, **kwargs):
+        collection = self._client.get_or_create_collection(name, **kwargs)
+        if name not in self.stats_store:
+            count = collection.count()
+            self.stats_store.seed(name, count, empty=count == 0)
+        return StatsTrackingCollection(collection, self.stats_store)
+
+    def delete_collection(self, name, **kwargs):
+        result = self._client.delete_collection(name, **kwargs)
+        self.stats_store.drop(name)
+        return result
+
+    def __getattr__(self, item):
+        return getattr(self._client, item)
+
+
+__all__ = [
+    "CollectionStats",
+    "CollectionStatsStore",
+    "StatsTrackingCollection",
+    "StatsTrackingClient",
+    "length_bucket",
+]
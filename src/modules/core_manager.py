@@ -4,11 +4,12 @@ ChromaDB コアマネージャー
 """
 
 import sys
+import logging
+import threading
+import importlib.util
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Optional, Any
-import chromadb
-from chromadb.config import Settings
+from typing import Dict, Optional, Any, Iterable, List
 
 # Global Settings統合設定の導入
 try:
@@ -18,25 +19,88 @@ except ImportError:
     print("Global Settings not available, using fallback configuration", file=sys.stderr)
     GLOBAL_CONFIG_AVAILABLE = False
 
-# ChromaDBインポート
-try:
-    import chromadb
-    from chromadb.config import Settings
-    CHROMADB_AVAILABLE = True
-except ImportError as e:
-    print(f"ChromaDB import error: {e}", file=sys.stderr)
-    CHROMADB_AVAILABLE = False
-
-# ログ設定
-log_dir = Path(__file__).parent.parent.parent / "logs"
-log_dir.mkdir(exist_ok=True)
-log_file = log_dir / f"fastmcp_server_{datetime.now().strftime('%Y%m%d')}.log"
-
-def log_to_file(message: str, level: str = "INFO"):
-    """ファイルログ関数"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"[{timestamp}] {level}: {message}\n")
+# ChromaDBの読み込みは初回のinitialize()まで遅延する（起動時間の大半を占めるため、ここでは存在確認のみ）
+CHROMADB_AVAILABLE = importlib.util.find_spec("chromadb") is not None
+if not CHROMADB_AVAILABLE:
+    print("ChromaDB import error: chromadb is not installed", file=sys.stderr)
+
+# ログ設定（構造化ロギングへ集約）
+from modules.structured_logging import get_logger
+from modules.collection_stats import CollectionStatsStore, StatsTrackingClient
+from modules.resource_sampler import ResourceSampler
+from modules.metrics_history import MetricsHistoryRecorder
+from modules.job_scheduler import JobScheduler
+
+logger = get_logger("core")
+
+def log_to_file(message: str, level: str = "INFO", **fields):
+    """ファイルログ関数（互換用: 構造化ロガーへ委譲し、ファイル書き込みはバックグラウンドで行う）"""
+    levelno = logging.getLevelName(level.upper())
+    if not isinstance(levelno, int):
+        levelno = logging.INFO
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, message, extra=fields or None)
+
+# 読み取りフィールド名 → ChromaDBのinclude名（idsは常に返るためNone）
+PROJECTION_FIELDS = {
+    "id": None,
+    "ids": None,
+    "document": "documents",
+    "documents": "documents",
+    "metadata": "metadatas",
+    "metadatas": "metadatas",
+    "embedding": "embeddings",
+    "embeddings": "embeddings",
+    "distance": "distances",
+    "distances": "distances",
+}
+
+
+class ProjectionPlanner:
+    """
+    ツールごとの読み取りフィールド宣言からget/queryのincludeを決定する
+    宣言がないツールは従来どおりdocuments+metadatasを取得する
+    """
+
+    DEFAULT_INCLUDE = ("documents", "metadatas")
+
+    def __init__(self):
+        self.declarations: Dict[str, List[str]] = {}
+        self.fetch_counts: Dict[str, int] = {}
+
+    @staticmethod
+    def to_include(reads: Iterable[str]) -> List[str]:
+        """読み取りフィールド名をinclude配列へ変換（未知のフィールドはValueError）"""
+        include: List[str] = []
+        for field in reads:
+            if field not in PROJECTION_FIELDS:
+                raise ValueError(f"Unknown projection field: {field}")
+            mapped = PROJECTION_FIELDS[field]
+            if mapped and mapped not in include:
+                include.append(mapped)
+        return include
+
+    def declare(self, tool_name: str, reads: Iterable[str]) -> List[str]:
+        """ツールが読むフィールドを登録し、対応するincludeを返す"""
+        include = self.to_include(reads)
+        self.declarations[tool_name] = include
+        return include
+
+    def plan(self, tool_name: Optional[str] = None, reads: Optional[Iterable[str]] = None) -> List[str]:
+        """明示のreads > ツール宣言 > 既定値の順でincludeを決定"""
+        if reads is not None:
+            return self.to_include(reads)
+        if tool_name and tool_name in self.declarations:
+            return list(self.declarations[tool_name])
+        return list(self.DEFAULT_INCLUDE)
+
+    def record(self, include: List[str]) -> None:
+        key = ",".join(include) or "ids"
+        self.fetch_counts[key] = self.fetch_counts.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {"declarations": dict(self.declarations), "fetch_counts": dict(self.fetch_counts)}
+
 
 class ChromaDBManager:
     """ChromaDBマネージャークラス"""
@@ -45,9 +109,57 @@ class ChromaDBManager:
         self.chroma_client = None
         self.collections = {}
         self.initialized = False
+        self.projections = ProjectionPlanner()
+        self.embedding_provider = None
+        self.warmup = None
+        self.startup_report = None
+        self.stats = CollectionStatsStore.from_settings()
+        self.resources = ResourceSampler.from_settings()
+        self.metrics_history = MetricsHistoryRecorder.from_settings(self)
+        self.jobs = JobScheduler.from_settings()
+        self._init_lock = threading.Lock()
+
+    def declare_reads(self, tool_name: str, reads: Iterable[str]) -> List[str]:
+        """ツールの読み取りフィールドを宣言する（登録時に呼ぶ）"""
+        return self.projections.declare(tool_name, reads)
+
+    def fetch(self, collection, tool: Optional[str] = None, reads: Optional[Iterable[str]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        射影を適用したcollection.get()
+        Args:
+            collection: 対象コレクション
+            tool: 読み取り宣言済みのツール名
+            reads: 読み取りフィールド（指定時は宣言より優先）
+            **kwargs: ids/where/where_document/limit/offset等はそのままget()へ渡す
+        """
+        include = self.projections.plan(tool, reads)
+        self.projections.record(include)
+        return collection.get(include=include, **kwargs)
+
+    def pager(self, collection, tool: Optional[str] = None, reads: Optional[Iterable[str]] = None, **kwargs):
+        """射影を適用したCollectionPager"""
+        from modules.paging import CollectionPager
+        include = self.projections.plan(tool, reads)
+        self.projections.record(include)
+        return CollectionPager(collection, include=include, **kwargs)
+
+    def result_set(self, collection, tool: Optional[str] = None, reads: Optional[Iterable[str]] = None, **kwargs):
+        """射影を適用して全ページを読み込み、列指向のResultSet（float32埋め込み・Arrow文字列列）で返す"""
+        from modules.result_set import ResultSet
+        return ResultSet.from_pager(self.pager(collection, tool, reads, **kwargs))
+
+    def collection_counts(self) -> Dict[str, int]:
+        """全コレクションの件数（書き込み時に更新した統計ストアから返し、コレクションごとのcount()は行わない）"""
+        return self.stats.counts(self.chroma_client)
 
     def initialize(self):
-        """ChromaDB初期化（同期版）"""
+        """ChromaDB初期化（同期版・起動時ウォームアップとツール呼び出しが重なっても1回のみ実行）"""
+        with self._init_lock:
+            if self.initialized:
+                return True
+            return self._initialize()
+
+    def _initialize(self):
         if not CHROMADB_AVAILABLE:
             log_to_file("ChromaDB is not available", "ERROR")
             return False
@@ -117,11 +229,22 @@ class ChromaDBManager:
             
             chromadb_path.mkdir(parents=True, exist_ok=True)
             log_to_file(f"Using ChromaDB path: {chromadb_path}")
+            self.resources.db_path = str(chromadb_path)
             
-            # ChromaDBクライアント初期化
-            self.chroma_client = chromadb.PersistentClient(
-                path=str(chromadb_path),
-                settings=Settings(anonymized_telemetry=False)
+            # ChromaDBクライアント初期化（全コレクションで共有埋め込みプロバイダーを使用し、書き込みを統計ストアへ反映）
+            import chromadb
+            from chromadb.config import Settings
+            from modules.embedding_provider import EmbeddingClient, get_embedding_provider
+            self.embedding_provider = get_embedding_provider()
+            self.chroma_client = StatsTrackingClient(
+                EmbeddingClient(
+                    chromadb.PersistentClient(
+                        path=str(chromadb_path),
+                        settings=Settings(anonymized_telemetry=False)
+                    ),
+                    self.embedding_provider
+                ),
+                self.stats
             )            # 既存コレクションを動的に読み込み（問題調査強化）
             existing_collections = self.chroma_client.list_collections()
             log_to_file(f"Found {len(existing_collections)} existing collections")
@@ -132,15 +255,17 @@ class ChromaDBManager:
                 self.collections[collection.name] = refreshed_collection
                 
                 actual_count = refreshed_collection.count()
-                log_to_file(f"Loaded existing collection: {collection.name} ({actual_count} documents)")
+                self.stats.seed(collection.name, actual_count, empty=True)
+                log_to_file("Loaded existing collection", collection=collection.name, count=actual_count)
                 
-                # デバッグ: 実際のドキュメント取得テスト
+                # デバッグ: 実際のドキュメント取得テスト（DEBUGレベル時のみ実行）
+                if not logger.isEnabledFor(logging.DEBUG):
+                    continue
                 try:
-                    test_docs = refreshed_collection.get(limit=5)
+                    test_docs = refreshed_collection.get(limit=5, include=[])
                     has_docs = len(test_docs['ids']) > 0 if test_docs['ids'] else False
-                    log_to_file(f"Collection {collection.name} - count(): {actual_count}, actual docs: {has_docs}")
-                    if has_docs:
-                        log_to_file(f"Sample IDs: {test_docs['ids'][:3] if test_docs['ids'] else 'None'}")
+                    log_to_file("Collection document test", "DEBUG", collection=collection.name, count=actual_count, has_docs=has_docs,
+                                sample_ids=test_docs['ids'][:3] if has_docs else None)
                 except Exception as e:
                     log_to_file(f"Collection {collection.name} - document test failed: {e}", "ERROR")
               # グローバル設定から基本コレクション設定を取得
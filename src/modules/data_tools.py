@@ -7,12 +7,35 @@ from typing import Dict, Optional, Any
 from datetime import datetime
 from config.global_settings import GlobalSettings
 from modules.learning_logger import log_learning_error
+from modules.query_filters import ensure_epoch
+from modules.batch_ops import write_in_batches
+from modules.streaming_import import StreamingImporter, resolve_format
+from modules.tool_profiling import to_thread
 
 def register_data_tools(mcp, manager):
     """データツールを登録"""    
     @mcp.tool()
-    async def chroma_import_data(file_path: str, collection_name: Optional[str] = None, format: str = "json") -> dict:
-        """データインポート"""
+    async def chroma_import_data(
+        file_path: str,
+        collection_name: Optional[str] = None,
+        format: str = "auto",
+        batch_size: Optional[int] = None,
+        start_index: int = 0,
+        rejected_path: Optional[str] = None,
+        timeout_seconds: Optional[float] = None
+    ) -> dict:
+        """
+        データインポート（JSON配列・JSONLをストリーミングで読み、検証・正規化してバッチupsert）
+        Args:
+            file_path: 入力ファイル（JSON配列、chroma_export_dataの出力、またはJSONL）
+            collection_name: 取り込み先（Noneで既定コレクション）
+            format: auto（拡張子で判定）/ json / jsonl
+            batch_size: 1回のupsertの件数（Noneで自動調整）
+            start_index: この通し番号から取り込む（途中で止まった取り込みは応答のnext_indexを指定して再開）
+            rejected_path: 拒否した行の出力先JSONL（Noneでログディレクトリのimports/配下）
+            timeout_seconds: 呼び出しの予算秒数（既定は無制限。指定時は途中で止まるとnext_indexから再開）
+        Returns: 取り込み件数・rows/sec・拒否件数と拒否ファイル
+        """
         if not manager.initialized:
             await manager.initialize()
           # グローバル設定からデフォルトコレクション名を取得
@@ -27,53 +50,41 @@ def register_data_tools(mcp, manager):
             if not file_path_obj.exists():
                 return {"success": False, "message": f"File not found: {file_path}"}
             
-            if format.lower() == "json":
-                import json
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # コレクション取得または作成
-                if manager.chroma_client:
-                    try:
-                        collection = manager.chroma_client.get_collection(collection_name)
-                    except:
-                        collection = manager.chroma_client.create_collection(collection_name)
-                        manager.collections[collection_name] = collection
-                else:
-                    return {"success": False, "message": "ChromaDB client not initialized"}
-                
-                # データフォーマット処理
-                if isinstance(data, list):
-                    documents = []
-                    metadatas = []
-                    ids = []
-                    
-                    for i, item in enumerate(data):
-                        if isinstance(item, str):
-                            documents.append(item)
-                            metadatas.append({})
-                            ids.append(f"import_{i}")
-                        elif isinstance(item, dict):
-                            documents.append(item.get("text", str(item)))
-                            metadatas.append(item.get("metadata", {}))
-                            ids.append(item.get("id", f"import_{i}"))
-                    
-                    collection.add(
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
-                    
-                    return {
-                        "success": True,
-                        "message": f"Imported {len(documents)} documents to '{collection_name}'",
-                        "imported_count": len(documents),
-                        "file_path": file_path
-                    }
-                else:
-                    return {"success": False, "message": "Invalid JSON format. Expected list of documents"}
+            try:
+                resolve_format(file_path, format)
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+            
+            # コレクション取得または作成
+            if manager.chroma_client:
+                try:
+                    collection = manager.chroma_client.get_collection(collection_name)
+                except:
+                    collection = manager.chroma_client.create_collection(collection_name)
+                    manager.collections[collection_name] = collection
             else:
-                return {"success": False, "message": f"Unsupported format: {format}"}
+                return {"success": False, "message": "ChromaDB client not initialized"}
+            importer = StreamingImporter(
+                collection, file_path, format=format, batch_size=batch_size,
+                start_index=start_index, rejected_path=rejected_path
+            )
+            
+            # 読み込み・upsertは同期I/Oなのでワーカースレッドで実行（締め切りの文脈は引き継がれる）
+            report = await to_thread(importer.run)
+            
+            message = f"Imported {report['imported']} documents to '{collection_name}'"
+            if report["rejected"]:
+                message += f" ({report['rejected']} rejected, see {report['rejected_path']})"
+            if not report["completed"]:
+                message += f"; stopped at index {report['next_index']}"
+            return {
+                "success": report["error"] is None,
+                "message": message,
+                "imported_count": report["imported"],
+                "file_path": file_path,
+                "collection_name": collection_name,
+                **report
+            }
                 
         except Exception as e:
             log_learning_error({
@@ -98,8 +109,8 @@ def register_data_tools(mcp, manager):
                 except:
                     return {"success": False, "message": f"Collection '{collection_name}' not found"}
                 
-                # 全ドキュメント取得
-                results = collection.get()
+                # 全ドキュメント取得（エクスポート対象のフィールドのみ）
+                results = manager.fetch(collection, reads=["ids", "documents", "metadatas"])
                 
                 if output_format.lower() == "json":
                     import json
@@ -216,17 +227,15 @@ def register_data_tools(mcp, manager):
                 except:
                     return {"success": False, "message": f"Collection '{collection_name}' not found"}
                 
-                collection.upsert(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                batching = write_in_batches(collection, "upsert", ids, documents=documents,
+                                            metadatas=[ensure_epoch(m) for m in metadatas])
                 
                 return {
                     "success": True,
                     "message": f"Upserted {len(documents)} documents in '{collection_name}'",
                     "collection_name": collection_name,
-                    "document_count": len(documents)
+                    "document_count": len(documents),
+                    "batching": batching
                 }
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
@@ -0,0 +1,231 @@
+"""
+ツール呼び出しの締め切り（deadline）と協調的キャンセル
+ツール呼び出しごとに予算秒数のDeadlineを文脈（contextvars）へ置き、ページング・走査・バッチ処理の
+ヘルパーがページ/バッチの境界でstop_requested()を確認して打ち切る。打ち切ったヘルパーは記録を残し、
+ツールの応答には部分結果のまま"truncated": Trueと"deadline"（予算・経過・打ち切った箇所）が付く。
+
+書き込みは途中のバッチを中断しない（読み取り側が止まり、バッファ済みの分を書き切って終わる）。
+同期ツールはイベントループ上で実行されるため、締め切りを過ぎた後も現在のページ/バッチの処理は完了まで続く。
+設定: deadlines.enabled / deadlines.default_seconds / deadlines.tools（ツール名→秒数。0で無制限）
+ツール引数 timeout_seconds（引数を持つツールのみ）で呼び出しごとに上書きできる。
+
+バックアップ・エクスポート・統合・クリーンアップなど全件を処理しきる必要のあるツール（deadlines.unbounded_tools）には
+既定の締め切りを掛けない（deadlines.toolsかtimeout_secondsで明示した場合のみ）。明示した締め切りで
+打ち切られた場合、これらのツールの応答はsuccess: Falseになる。
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Iterator
+from contextlib import contextmanager
+import contextvars
+import functools
+import inspect
+import time
+
+DEFAULT_SECONDS = 60.0
+# 既定の締め切りを掛けないツール（途中で止まった結果を成功として返してはいけない処理）
+UNBOUNDED_TOOLS = (
+    "chroma_backup_data",
+    "chroma_backup_collection",
+    "chroma_export_data",
+    "chroma_import_data",
+    "chroma_restore_data",
+    "chroma_restore_collection",
+    "chroma_merge_collections",
+    "chroma_cleanup_documents",
+    "chroma_cleanup_large_documents",
+    "chroma_cleanup_duplicates",
+    "chroma_cleanup_non_str_ids",
+    "chroma_search_and_delete_by_keyword",
+    "chroma_system_maintenance",
+    "chroma_integrity_validate_large_dataset",
+    "chroma_backfill_timestamp_epoch",
+)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("chroma_deadline", default=None)
+
+
+class Deadline:
+    """
+    締め切りとキャンセル状態（親のDeadlineの締め切り・キャンセルも引き継ぐ）
+    Args:
+        seconds: 予算秒数（None/0以下で時間制限なし。キャンセルのみ）
+        parent: 外側のDeadline
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        self.started = time.monotonic()
+        self.seconds = float(seconds) if seconds and seconds > 0 else None
+        self.parent = parent
+        self.expires_at = self.started + self.seconds if self.seconds is not None else None
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None else min(self.expires_at, parent.expires_at)
+        self.cancel_reason: Optional[str] = None
+        self.truncated_by: List[str] = []
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """協調的キャンセル（次のページ/バッチ境界で各ヘルパーが止まる）"""
+        self.cancel_reason = reason
+
+    @property
+    def reason(self) -> Optional[str]:
+        """止める理由（止める必要がなければNone）"""
+        if self.cancel_reason:
+            return self.cancel_reason
+        if self.parent is not None and self.parent.reason:
+            return self.parent.reason
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            return "deadline exceeded"
+        return None
+
+    def expired(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        """残り秒数（時間制限なしならNone）"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def note_truncated(self, where: str) -> None:
+        """ヘルパーが締め切りで処理を打ち切ったことを記録（外側のDeadlineにも伝える）"""
+        if where not in self.truncated_by:
+            self.truncated_by.append(where)
+        if self.parent is not None:
+            self.parent.note_truncated(where)
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.truncated_by)
+
+    def describe(self) -> Dict[str, Any]:
+        remaining = self.remaining()
+        return {
+            "budget_seconds": self.seconds,
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "remaining_seconds": round(remaining, 3) if remaining is not None else None,
+            "reason": self.reason,
+            "truncated_by": list(self.truncated_by)
+        }
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None) -> Iterator[Deadline]:
+    """
+    締め切りの文脈を開く（外側より長い予算を指定しても外側の締め切りが優先される）
+    Args:
+        seconds: 予算秒数（None/0以下で時間制限なし）
+    """
+    deadline = Deadline(seconds, parent=_current.get())
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def stop_requested(where: str) -> bool:
+    """
+    ループの境界で呼ぶ: 締め切り・キャンセル済みならTrueを返し、打ち切り箇所を記録する（文脈外では常にFalse）
+    Args:
+        where: 打ち切り箇所の名前（応答のdeadline.truncated_byに出る）
+    """
+    deadline = _current.get()
+    if deadline is None or not deadline.expired():
+        return False
+    deadline.note_truncated(where)
+    return True
+
+
+def remaining_seconds(default: Optional[float] = None) -> Optional[float]:
+    """現在の締め切りまでの残り秒数（時間制限がなければdefault）"""
+    deadline = _current.get()
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return default
+    return remaining if default is None else min(remaining, default)
+
+
+class DeadlineConfig:
+    """ツールごとの予算秒数（設定ファイル値で初期化）"""
+
+    def __init__(self):
+        self.enabled = True
+        self.default_seconds: Optional[float] = DEFAULT_SECONDS
+        self.tools: Dict[str, float] = {}
+        self.unbounded_tools = set(UNBOUNDED_TOOLS)
+
+    def load(self) -> "DeadlineConfig":
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            self.enabled = bool(settings.get_setting("deadlines.enabled", True))
+            self.default_seconds = settings.get_setting("deadlines.default_seconds", DEFAULT_SECONDS)
+            self.tools = dict(settings.get_setting("deadlines.tools", {}) or {})
+            unbounded = settings.get_setting("deadlines.unbounded_tools", None)
+            if unbounded is not None:
+                self.unbounded_tools = set(unbounded)
+        except Exception:
+            pass
+        return self
+
+    def budget(self, tool_name: str, override: Optional[float] = None) -> Optional[float]:
+        """呼び出しの予算秒数（引数timeout_seconds > ツール別設定 > 既定値。0以下で無制限。unbounded_toolsは既定値なし）"""
+        if override is not None:
+            seconds = override
+        elif not self.enabled:
+            return None
+        elif tool_name in self.unbounded_tools:
+            seconds = self.tools.get(tool_name)
+        else:
+            seconds = self.tools.get(tool_name, self.default_seconds)
+        return float(seconds) if seconds and float(seconds) > 0 else None
+
+
+config = DeadlineConfig()
+
+
+def _attach(result: Any, deadline: Deadline, must_complete: bool = False) -> Any:
+    if deadline.truncated and isinstance(result, dict):
+        result = dict(result)
+        result["truncated"] = True
+        result["deadline"] = deadline.describe()
+        if must_complete:
+            # 処理しきれなかった結果を成功として返さない
+            result["success"] = False
+            result.setdefault("error", f"Stopped before completion ({deadline.reason}); the result is incomplete")
+    return result
+
+
+def deadline_tool(fn: Callable, name: Optional[str] = None) -> Callable:
+    """ツール関数を締め切りの文脈で包み、打ち切りがあれば応答にtruncatedを付ける（同期/非同期両対応・シグネチャ保持）"""
+    tool_name = name or fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with deadline_scope(config.budget(tool_name, kwargs.get("timeout_seconds"))) as deadline:
+                return _attach(await fn(*args, **kwargs), deadline, tool_name in config.unbounded_tools)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        with deadline_scope(config.budget(tool_name, kwargs.get("timeout_seconds"))) as deadline:
+            return _attach(fn(*args, **kwargs), deadline, tool_name in config.unbounded_tools)
+    return sync_wrapper
+
+
+__all__ = [
+    "Deadline",
+    "DeadlineConfig",
+    "UNBOUNDED_TOOLS",
+    "config",
+    "current_deadline",
+    "deadline_scope",
+    "deadline_tool",
+    "remaining_seconds",
+    "stop_requested",
+]
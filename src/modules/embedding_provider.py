@@ -0,0 +1,387 @@
+"""
+埋め込みプロバイダー
+全コレクションで共有する埋め込み関数を1回だけ読み込み、バッチ・スレッド数・量子化を設定で制御する
+
+- backend: "onnx"（ChromaDB既定と同じall-MiniLM-L6-v2のONNX版）/ "sentence_transformers"
+- トークン数の見積りでバッチを組み（max_batch_tokens / max_batch_size）、長さ順に並べてパディングを削減
+- intra_op_threadsでONNX Runtime / torchのスレッド数を固定
+- quantize_int8でCPU向けにint8量子化した重みを使用（ONNXは量子化済みモデルをキャッシュ）
+- 同一テキストの再埋め込みを避けるLRUキャッシュ（cache_size）
+
+ONNXバックエンドは既定の埋め込み関数と同じベクトル空間のため既存コレクションにもそのまま適用できる。
+sentence_transformersで別モデルを指定した場合は、既存コレクションは保存時の埋め込み関数のまま開く。
+"""
+
+from typing import Dict, Any, List, Optional, Sequence
+from collections import OrderedDict
+from functools import cached_property
+from pathlib import Path
+import hashlib
+import os
+import threading
+import time
+
+from modules.structured_logging import get_logger
+
+try:
+    from chromadb.api.types import EmbeddingFunction
+except ImportError:
+    EmbeddingFunction = object
+
+logger = get_logger("embedding")
+
+DEFAULT_BACKEND = "onnx"
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_MAX_BATCH_TOKENS = 8192
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_CACHE_SIZE = 4096
+# MiniLMの最大系列長（これを超える分はトークナイザーで切り詰められる）
+MAX_SEQUENCE_TOKENS = 256
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    サブワードトークン数の概算（トークナイザーを呼ばずにバッチを組むため）
+    ASCIIは約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとして数える
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    estimate = non_ascii + (len(text) - non_ascii) // 4 + 2
+    return min(MAX_SEQUENCE_TOKENS, max(1, estimate))
+
+
+def plan_batches(texts: Sequence[str], max_batch_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """
+    トークン予算でバッチを組む（インデックスのリストを返す）
+    長さ順に並べ、バッチ内の最大長×件数（パディング込みの実コスト）が予算を超えない範囲で詰める
+    """
+    order = sorted(range(len(texts)), key=lambda i: estimate_tokens(texts[i]))
+    batches: List[List[int]] = []
+    current: List[int] = []
+    longest = 0
+    for index in order:
+        tokens = estimate_tokens(texts[index])
+        width = max(longest, tokens)
+        if current and (len(current) >= max_batch_size or width * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current, width = [], tokens
+        current.append(index)
+        longest = width
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _resolve_threads(threads: int) -> int:
+    if threads and threads > 0:
+        return threads
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _quantized_onnx_path(model_path: Path) -> Path:
+    """int8動的量子化したONNXモデルのパス（未作成なら作成、失敗時は元のモデル）"""
+    quantized = model_path.with_name("model.int8.onnx")
+    if quantized.exists():
+        return quantized
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(str(model_path), str(quantized), weight_type=QuantType.QInt8)
+        logger.info("Quantized ONNX embedding model", extra={"path": str(quantized)})
+        return quantized
+    except Exception as e:
+        logger.warning("ONNX int8 quantization unavailable, using float model: %s", e)
+        return model_path
+
+
+def _build_onnx_backend(threads: int, quantize: bool, providers: Optional[List[str]]):
+    """ChromaDB既定のMiniLM（ONNX）をスレッド数固定・任意でint8量子化して読み込む"""
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    class PinnedONNXMiniLM(ONNXMiniLM_L6_V2):
+        @cached_property
+        def model(self):
+            import onnxruntime as ort
+            so = ort.SessionOptions()
+            so.log_severity_level = 3
+            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            so.intra_op_num_threads = threads
+            so.inter_op_num_threads = 1
+            model_path = Path(self.DOWNLOAD_PATH) / self.EXTRACTED_FOLDER_NAME / "model.onnx"
+            if quantize:
+                model_path = _quantized_onnx_path(model_path)
+            available = ort.get_available_providers()
+            chosen = [p for p in (providers or ["CPUExecutionProvider"]) if p in available] or available
+            return ort.InferenceSession(str(model_path), providers=chosen, sess_options=so)
+
+        def embed(self, texts: List[str]):
+            self._download_model_if_not_exists()
+            # 呼び出し側でバッチ済みのため内部の分割は行わない
+            return self._forward(texts, batch_size=max(1, len(texts)))
+
+    function = PinnedONNXMiniLM(preferred_providers=providers)
+    function._download_model_if_not_exists()
+    function.model  # セッション生成（モデル読み込み）をここで済ませる
+    return function.embed
+
+
+def _build_sentence_transformers_backend(model_name: str, device: str, threads: int, quantize: bool, normalize: bool):
+    """sentence-transformersのモデルを読み込む（CPUではint8動的量子化に対応）"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device=device)
+    if quantize and device == "cpu":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def embed(texts: List[str]):
+        return model.encode(texts, batch_size=max(1, len(texts)), convert_to_numpy=True,
+                            normalize_embeddings=normalize, show_progress_bar=False)
+    return embed
+
+
+class EmbeddingProvider(EmbeddingFunction):
+    """
+    共有埋め込み関数（ChromaDBのEmbeddingFunctionとしてコレクションへ渡す）
+    Args:
+        backend: "onnx" / "sentence_transformers"
+        model_name: sentence_transformersのモデル名
+        device: 実行デバイス（cpu/cuda）
+        intra_op_threads: 推論スレッド数（0で自動: CPU数と4の小さい方）
+        max_batch_tokens: 1バッチのトークン予算（パディング込み）
+        max_batch_size: 1バッチの最大件数
+        quantize_int8: int8量子化した重みを使用（CPUのみ）
+        cache_size: テキスト→ベクトルのLRUキャッシュ件数（0で無効）
+        normalize: ベクトルを正規化する（sentence_transformersのみ）
+        providers: ONNX Runtimeの実行プロバイダー
+    """
+
+    def __init__(self,
+                 backend: str = DEFAULT_BACKEND,
+                 model_name: str = DEFAULT_MODEL_NAME,
+                 device: str = "cpu",
+                 intra_op_threads: int = 0,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 quantize_int8: bool = False,
+                 cache_size: int = DEFAULT_CACHE_SIZE,
+                 normalize: bool = True,
+                 providers: Optional[List[str]] = None):
+        self.backend = backend
+        self.model_name = model_name
+        self.device = device
+        self.threads = _resolve_threads(intra_op_threads)
+        self.max_batch_tokens = max(MAX_SEQUENCE_TOKENS, max_batch_tokens)
+        self.max_batch_size = max(1, max_batch_size)
+        self.quantize_int8 = quantize_int8
+        self.cache_size = max(0, cache_size)
+        self.normalize = normalize
+        self.providers = providers
+        self._embed = None
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.calls = 0
+        self.texts = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.estimated_tokens = 0
+        self.embed_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "EmbeddingProvider":
+        """設定embedding.*から生成（設定が読めない場合は既定値）"""
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            section = settings.get_setting("embedding", {}) or {}
+        except Exception:
+            section = {}
+        return cls(
+            backend=str(section.get("backend", DEFAULT_BACKEND)),
+            model_name=str(section.get("model_name", DEFAULT_MODEL_NAME)),
+            device=str(section.get("device", "cpu")),
+            intra_op_threads=int(section.get("intra_op_threads", 0) or 0),
+            max_batch_tokens=int(section.get("max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS)),
+            max_batch_size=int(section.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)),
+            quantize_int8=bool(section.get("quantize_int8", False)),
+            cache_size=int(section.get("cache_size", DEFAULT_CACHE_SIZE)),
+            normalize=bool(section.get("normalize", True)),
+            providers=section.get("providers") or None
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._embed is not None
+
+    def load(self) -> None:
+        """モデルを読み込む（読み込み済みなら何もしない・複数スレッドから呼ばれても1回のみ）"""
+        if self._embed is not None:
+            return
+        with self._load_lock:
+            if self._embed is not None:
+                return
+            # 環境変数はライブラリの初期化前のみ有効なため、未設定の場合だけ補う
+            os.environ.setdefault("OMP_NUM_THREADS", str(self.threads))
+            started = time.perf_counter()
+            if self.backend == "sentence_transformers":
+                embed = _build_sentence_transformers_backend(
+                    self.model_name, self.device, self.threads, self.quantize_int8, self.normalize)
+            elif self.backend == "onnx":
+                embed = _build_onnx_backend(self.threads, self.quantize_int8, self.providers)
+            else:
+                raise ValueError(f"Unknown embedding backend: {self.backend}")
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            self._embed = embed
+            logger.info("Embedding model loaded", extra={
+                "backend": self.backend, "model": self.model_name, "threads": self.threads,
+                "quantize_int8": self.quantize_int8, "load_seconds": self.load_seconds
+            })
+
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8", errors="ignore"), digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _cache_put(self, key: str, vector: List[float]) -> None:
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def __call__(self, input):
+        """ChromaDBのEmbeddingFunctionプロトコル（入力順のベクトルのリストを返す）"""
+        self.load()
+        texts = [str(t) for t in input]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        keys: List[Optional[str]] = [None] * len(texts)
+        # 同一呼び出し内の重複テキストは1回だけ埋め込む
+        pending: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, text in enumerate(texts):
+            if self.cache_size:
+                keys[i] = self._cache_key(text)
+                cached = self._cache_get(keys[i])
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.setdefault(text, []).append(i)
+
+        started = time.perf_counter()
+        pending_texts = list(pending)
+        batches = plan_batches(pending_texts, self.max_batch_tokens, self.max_batch_size)
+        for batch in batches:
+            vectors = self._embed([pending_texts[j] for j in batch])
+            for j, vector in zip(batch, vectors):
+                vector = vector.tolist() if hasattr(vector, "tolist") else list(vector)
+                indices = pending[pending_texts[j]]
+                for index in indices:
+                    results[index] = vector
+                if self.cache_size:
+                    self._cache_put(keys[indices[0]], vector)
+        elapsed = time.perf_counter() - started
+
+        self.calls += 1
+        self.texts += len(texts)
+        self.cache_hits += len(texts) - len(pending_texts)
+        self.batches += len(batches)
+        self.estimated_tokens += sum(estimate_tokens(t) for t in pending_texts)
+        self.embed_seconds += elapsed
+        return results
+
+    def name(self) -> str:
+        # ONNXは既定の埋め込み関数と同一モデルのため、既存コレクションの設定と一致させる
+        return "default" if self.backend == "onnx" else "sentence_transformer"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "device": self.device, "normalize_embeddings": self.normalize}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "EmbeddingProvider":
+        return get_embedding_provider()
+
+    def stats(self) -> Dict[str, Any]:
+        """稼働統計"""
+        return {
+            "backend": self.backend,
+            "model_name": self.model_name if self.backend != "onnx" else DEFAULT_MODEL_NAME,
+            "device": self.device,
+            "threads": self.threads,
+            "quantize_int8": self.quantize_int8,
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "calls": self.calls,
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+            "batches": self.batches,
+            "estimated_tokens": self.estimated_tokens,
+            "embed_seconds": round(self.embed_seconds, 3),
+            "texts_per_sec": round((self.texts - self.cache_hits) / self.embed_seconds, 1) if self.embed_seconds else None
+        }
+
+
+class EmbeddingClient:
+    """
+    ChromaDBクライアントのラッパー
+    コレクションの取得・作成時に共有埋め込み関数を渡す（既存の呼び出し側は変更不要）
+    """
+
+    def __init__(self, client, provider: EmbeddingProvider):
+        self._client = client
+        self.embedding_provider = provider
+
+    def _with_provider(self, method: str, name: str, kwargs: Dict[str, Any]):
+        call = getattr(self._client, method)
+        if kwargs.get("embedding_function") is not None:
+            return call(name, **kwargs)
+        try:
+            return call(name, embedding_function=self.embedding_provider, **kwargs)
+        except ValueError as e:
+            if "embedding" not in str(e).lower():
+                raise
+            # 保存済みの埋め込み関数と異なる場合は、そのコレクションの設定で開く
+            logger.warning("Collection uses a different embedding function, opening with its own",
+                           extra={"collection": name, "error": str(e)})
+            return call(name, **kwargs)
+
+    def get_collection(self, name, **kwargs):
+        return self._with_provider("get_collection", name, kwargs)
+
+    def create_collection(self, name, **kwargs):
+        return self._with_provider("create_collection", name, kwargs)
+
+    def get_or_create_collection(self, name, **kwargs):
+        return self._with_provider("get_or_create_collection", name, kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self._client, item)
+
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """プロセス共有の埋め込みプロバイダー（モデルは初回の埋め込み時またはload()で読み込む）"""
+    global _provider
+    if _provider is not None:
+        return _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = EmbeddingProvider.from_settings()
+    return _provider
+
+
+__all__ = [
+    "EmbeddingProvider",
+    "EmbeddingClient",
+    "get_embedding_provider",
+    "estimate_tokens",
+    "plan_batches",
+]
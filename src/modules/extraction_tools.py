@@ -5,10 +5,56 @@
 
 from typing import Dict, Optional, Any, List
 from datetime import datetime
+from modules.query_filters import (
+    compile_where, rewrite_date_predicates, backfill_epoch_fields, missing_epoch_count, filter_date_range, epoch_field
+)
 
 def register_extraction_tools(mcp, manager):
     """データ抽出ツールを登録"""
     
+    def _write_extraction(collection_name, filter_applied, results, output_format) -> Dict[str, Any]:
+        """抽出結果をextracted_data/へ書き出して応答を作る"""
+        extracted_count = len(results.get("documents", []))
+        
+        # 出力ファイル作成
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_file = f"extracted_data/filtered_data_{collection_name}_{timestamp}.{output_format}"
+        
+        # ディレクトリ作成
+        import os
+        os.makedirs("extracted_data", exist_ok=True)
+        
+        if output_format.lower() == "json":
+            import json
+            output_data = {
+                "collection": collection_name,
+                "filter_applied": filter_applied,
+                "extracted_count": extracted_count,
+                "extraction_timestamp": datetime.now().isoformat(),
+                "documents": results.get("documents", []),
+                "metadatas": results.get("metadatas", []),
+                "ids": results.get("ids", [])
+            }
+            
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, ensure_ascii=False, indent=2)
+        
+        file_stats = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+        
+        return {
+            "success": True,
+            "message": f"データ抽出完了: {extracted_count}件",
+            "output_file": output_file,
+            "collection": collection_name,
+            "filter_applied": filter_applied,
+            "extracted_count": extracted_count,
+            "extraction_details": {
+                "format": output_format,
+                "file_size_bytes": file_stats,
+                "extraction_timestamp": datetime.now().isoformat()
+            }
+        }
+    
     @mcp.tool()
     def chroma_extract_by_filter(collection_name: Optional[str] = None, filter: Dict[str, Any] = {}, output_format: str = "json") -> Dict[str, Any]:
         """メタデータフィルターによるデータ抽出"""
@@ -19,49 +65,10 @@ def register_extraction_tools(mcp, manager):
                 except:
                     return {"success": False, "message": f"Collection '{collection_name}' not found"}
                 
-                # フィルター適用してデータ取得
-                results = collection.get(where=filter if filter else None)
-                
-                extracted_count = len(results.get("documents", []))
-                
-                # 出力ファイル作成
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_file = f"extracted_data/filtered_data_{collection_name}_{timestamp}.{output_format}"
-                
-                # ディレクトリ作成
-                import os
-                os.makedirs("extracted_data", exist_ok=True)
-                
-                if output_format.lower() == "json":
-                    import json
-                    output_data = {
-                        "collection": collection_name,
-                        "filter_applied": filter,
-                        "extracted_count": extracted_count,
-                        "extraction_timestamp": datetime.now().isoformat(),
-                        "documents": results.get("documents", []),
-                        "metadatas": results.get("metadatas", []),
-                        "ids": results.get("ids", [])
-                    }
-                    
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(output_data, f, ensure_ascii=False, indent=2)
-                
-                file_stats = os.path.getsize(output_file) if os.path.exists(output_file) else 0
-                
-                return {
-                    "success": True,
-                    "message": f"データ抽出完了: {extracted_count}件",
-                    "output_file": output_file,
-                    "collection": collection_name,
-                    "filter_applied": filter,
-                    "extracted_count": extracted_count,
-                    "extraction_details": {
-                        "format": output_format,
-                        "file_size_bytes": file_stats,
-                        "extraction_timestamp": datetime.now().isoformat()
-                    }
-                }
+                # 日付範囲はエポック秒フィールドへ書き換えてストア側で評価
+                where = rewrite_date_predicates(filter)
+                results = collection.get(where=where)
+                return _write_extraction(collection_name, filter, results, output_format)
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
                 
@@ -69,8 +76,8 @@ def register_extraction_tools(mcp, manager):
             return {"success": False, "message": f"Data extraction error: {str(e)}"}
     
     @mcp.tool()
-    def chroma_extract_by_date_range(collection_name: Optional[str] = None, start_date: str = "", end_date: str = "", date_field: str = "timestamp") -> Dict[str, Any]:
-        """日付範囲によるデータ抽出"""
+    def chroma_extract_by_date_range(collection_name: Optional[str] = None, start_date: str = "", end_date: str = "", date_field: str = "timestamp", project: Optional[str] = None, source: Optional[str] = None) -> Dict[str, Any]:
+        """日付範囲によるデータ抽出（<date_field>_epochの数値範囲でストア側フィルタ。未補完のドキュメントがあれば日付文字列で絞り込み、backfill_requiredを返す）"""
         try:
             if not start_date or not end_date:
                 # デフォルト：過去7日間
@@ -80,16 +87,64 @@ def register_extraction_tools(mcp, manager):
                 start_date = start_dt.strftime('%Y-%m-%d')
                 end_date = end_dt.strftime('%Y-%m-%d')
             
-            # 日付フィルター作成
-            date_filter = {
-                "$and": [
-                    {date_field: {"$gte": start_date}},
-                    {date_field: {"$lte": end_date}}
-                ]
-            }
+            # 日付・プロジェクト・ソース条件をネイティブwhere句へ変換
+            date_filter = compile_where(
+                start=start_date,
+                end=end_date,
+                project=project,
+                source=source,
+                date_field=date_field
+            )
+            if date_filter is None:
+                return {"success": False, "message": f"Invalid date range: {start_date} - {end_date}"}
+            
+            # エポック秒を補完していないドキュメントがあれば、日付文字列を読んで絞り込む（ストア側の範囲条件では漏れるため）
+            if manager.chroma_client:
+                try:
+                    collection = manager.chroma_client.get_collection(collection_name)
+                except:
+                    return {"success": False, "message": f"Collection '{collection_name}' not found"}
+                stats = manager.stats.get(collection_name) if collection_name in manager.stats else None
+                missing = missing_epoch_count(collection, date_field, stats)
+                if missing:
+                    results = filter_date_range(collection, start_date, end_date, date_field,
+                                                where=compile_where(project=project, source=source))
+                    response = _write_extraction(collection_name, date_filter, results, "json")
+                    response["backfill_required"] = {
+                        "documents_without_epoch": missing,
+                        "epoch_field": epoch_field(date_field),
+                        "message": "Some documents lack the epoch field; filtered by date string instead. "
+                                   "Run chroma_backfill_timestamp_epoch to restore store-side date filtering."
+                    }
+                    return response
             
             # フィルター抽出の呼び出し
             return chroma_extract_by_filter(collection_name, date_filter, "json")
             
         except Exception as e:
             return {"success": False, "message": f"Date range extraction error: {str(e)}"}
+    
+    @mcp.tool()
+    def chroma_backfill_timestamp_epoch(collection_name: Optional[str] = None, date_field: str = "timestamp", batch_size: int = 500) -> Dict[str, Any]:
+        """既存ドキュメントに<date_field>_epochフィールドを補完（日付範囲抽出の前提となる一回限りの移行）"""
+        try:
+            if not manager.initialized:
+                manager.initialize()
+            if not manager.chroma_client:
+                return {"success": False, "message": "ChromaDB client not initialized"}
+            if collection_name is None:
+                from config.global_settings import GlobalSettings
+                collection_name = str(GlobalSettings().get_setting("default_collection.name"))
+            try:
+                collection = manager.chroma_client.get_collection(collection_name)
+            except:
+                return {"success": False, "message": f"Collection '{collection_name}' not found"}
+            result = backfill_epoch_fields(collection, date_field=date_field, batch_size=max(1, batch_size))
+            return {
+                "success": True,
+                "message": f"エポック秒補完完了: {result['updated']}件",
+                "collection": collection_name,
+                **result
+            }
+        except Exception as e:
+            return {"success": False, "message": f"Timestamp backfill error: {str(e)}"}
@@ -11,16 +11,18 @@ from config.global_settings import GlobalSettings
 import re
 import hashlib
 import tempfile
-from modules.chroma_store_core import chroma_store_file
+from modules.chroma_store_core import chroma_store_file, plan_md_conversation
+from modules.ingest_queue import get_ingest_service
+from modules.query_filters import stamp_timestamp
 import traceback
 import subprocess
 import threading
 import time
 import sys
-log_dir = os.path.join(os.path.dirname(__file__), '../../logs')
-os.makedirs(log_dir, exist_ok=True)
-log_file = open(os.path.join(log_dir, 'learning_stdout.log'), 'a', encoding='utf-8')
-# sys.stdout = sys.stderr = Tee()  # ← 完全にコメントアウト
+import logging
+from modules.structured_logging import get_logger
+
+logger = get_logger("html_learning")
 
 def chroma_store_html_impl(
     html_path: str,
@@ -106,59 +108,64 @@ def chroma_store_html_impl(
                             chunked.append((sub_para, meta))
                 else:
                     chunked.append((para, meta))
-        # --- バッチ学習: 1000件ごとに分割して保存 ---
+        # --- 取り込みキューに全チャンクを計画してからバッチ単位で保存（中断時はchroma_ingest_resumeで再開） ---
+        # 保存時のバッチ件数は自動調整される。batch_indexは既存データとの互換のため1000件単位の区切りのまま
         batch_size = 1000
+        rows = []
+        ingested_at = stamp_timestamp({})
+        for i, (chunk, meta) in enumerate(chunked):
+            doc_id = f"html_{Path(html_path).stem}_{i}"
+            metadata = dict(meta)
+            metadata.update({
+                "source": "html",
+                "file_hash": file_hash,
+                "batch_index": i//batch_size,
+                "doc_index": i
+            })
+            metadata.update(ingested_at)
+            # None値を除去
+            metadata = {k: v for k, v in metadata.items() if v is not None}
+            rows.append((doc_id, chunk, metadata))
+        service = get_ingest_service(manager)
+        job_id = service.queue.create_job("html", collection_name, {"file": html_path, "project": project})
+        service.queue.add_source(job_id, html_path, rows)
+        service.queue.finish_planning(job_id)
+        run = service.run(job_id)
+        job = run.get("job") or {}
+        failed = {e["doc_id"]: e["error"] for e in service.queue.failed_chunks(job_id)}
+        for doc_id, error in failed.items():
+            log_learning_error({
+                "error": f"ChromaDB add failed: {error}",
+                "doc_id": doc_id,
+                "file": html_path,
+                "collection": collection_name
+            })
+        # 締め切りで止まった場合、キューはseq順に処理するため先頭から処理済み件数より後ろが未処理
+        processed = job.get("committed_chunks", 0) + job.get("failed_chunks", 0)
         results = []
-        for i in range(0, len(chunked), batch_size):
-            batch = chunked[i:i+batch_size]
-            for idx, (chunk, meta) in enumerate(batch):
-                doc_id = f"html_{Path(html_path).stem}_{i+idx}"
-                metadata = dict(meta)
-                metadata.update({
-                    "source": "html",
-                    "file_hash": file_hash,
-                    "batch_index": i//batch_size,
-                    "doc_index": i+idx
-                })
-                # None値を除去
-                metadata = {k: v for k, v in metadata.items() if v is not None}
-                # --- 保存 ---
-                try:
-                    print(f"[ChromaDB add直前] doc_id={doc_id} idx={i+idx}", flush=True)
-                    res = manager.chroma_client.get_collection(collection_name).add(
-                        documents=[chunk],
-                        metadatas=[metadata],
-                        ids=[doc_id]
-                    )
-                    print(f"[ChromaDB add直後] doc_id={doc_id} idx={i+idx} OK", flush=True)
-                    results.append({"success": True, "doc_id": doc_id})
-                    # 進捗表示を追加
-                    total_chunks = len(chunked)
-                    current_idx = i + idx + 1
-                    if current_idx % 100 == 0 or current_idx == total_chunks:
-                        print(f"[ChromaDB学習進捗] {current_idx}/{total_chunks} 件完了", flush=True)
-                except Exception as e:
-                    print(f"[ChromaDB add例外] doc_id={doc_id} idx={i+idx} error={e}", flush=True)
-                    log_learning_error({
-                        "error": f"ChromaDB add failed: {e}",
-                        "doc_id": doc_id,
-                        "file": html_path,
-                        "collection": collection_name
-                    })
-                    results.append({"success": False, "doc_id": doc_id, "error": str(e)})
+        for i, (doc_id, _, _) in enumerate(rows):
+            if doc_id in failed:
+                results.append({"success": False, "doc_id": doc_id, "error": failed[doc_id]})
+            elif i >= processed:
+                results.append({"success": False, "doc_id": doc_id, "pending": True})
+            else:
+                results.append({"success": True, "doc_id": doc_id})
         # --- 学習後のコレクション健全性チェック ---
         try:
             collection = manager.chroma_client.get_collection(collection_name)
             doc_count = collection.count()
-            sample = collection.get(limit=3)
+            sample = collection.get(limit=3, include=[])
             health = {"doc_count": doc_count, "sample_ids": sample.get("ids", [])}
         except Exception as e:
             health = {"error": f"Collection health check failed: {e}"}
         return {
-            "success": all(r["success"] for r in results),
+            "success": job.get("status") == "completed",
+            "resumable": run.get("resumable", False),
             "file_processed": html_path,
             "total_chunks": len(chunked),
             "results": results,
+            "job_id": job_id,
+            "job_status": job.get("status"),
             "collection_health": health
         }
         # 3. メタデータ拡充（metaタグ等）
@@ -215,7 +222,6 @@ def chroma_store_html_impl(
                     "reason": exclusion_reason_jp.get(reason, reason)
                 }
                 log_learning_error({"function": "_chroma_store_html_impl", "reason": reason, "value": str(text)[:200], "file": html_path, "section_head": meta.get("heading", "")})
-                print("log_learning_error called", flush=True)
                 exclusion_summary[reason] = exclusion_summary.get(reason, 0) + 1
                 if reason not in exclusion_samples:
                     exclusion_samples[reason] = [sample]
@@ -281,7 +287,6 @@ def chroma_store_html_impl(
             # add直前に型チェックを追加
             for k, v in metadata.items():
                 if not (isinstance(v, (str, int, float, bool)) or v is None):
-                    print(f"metadata型エラー: key={k}, value={v}, type={type(v)}", flush=True)
                     log_learning_error({
                         "function": "chroma_store_html_impl/add",
                         "error": f"metadata型エラー: key={k}, value={v}, type={type(v)}",
@@ -292,10 +297,8 @@ def chroma_store_html_impl(
                     })
                     break
             # --- add直前の全データをdump ---
-            print(f"[DUMP] add直前: index={i}")
-            print(f"[DUMP] doc_id={doc_id}")
-            print(f"[DUMP] document={chunk[:200]}... (len={len(chunk)})")
-            print(f"[DUMP] metadata={json.dumps(metadata, ensure_ascii=False)[:300]}... (keys={list(metadata.keys())})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("add dump", extra={"index": i, "doc_id": doc_id, "document": chunk[:200], "length": len(chunk), "metadata_keys": list(metadata.keys())})
             # --- タイムアウト付きadd ---
             def add_with_timeout(collection, documents, metadatas, ids, timeout=30):
                 import threading
@@ -312,10 +315,9 @@ def chroma_store_html_impl(
                 if t.is_alive():
                     return {'timeout': True}
                 return result
-            print(f"--- add index {i} ---", flush=True)
             add_result = add_with_timeout(collection, [chunk], [metadata], [doc_id], timeout=30)
             if add_result.get('timeout'):
-                print(f"index {i} でタイムアウト: 30秒経過", flush=True)
+                logger.warning("add timeout (30s)", extra={"index": i, "doc_id": doc_id})
                 log_learning_error({
                     "function": "chroma_store_html_impl/add",
                     "error": "ChromaDB add timeout (30秒)",
@@ -324,14 +326,9 @@ def chroma_store_html_impl(
                     "metadata": metadata,
                     "id": doc_id
                 })
-                print(f"[BREAK] addタイムアウトで中断 index={i}", flush=True)
                 break
             elif 'error' in add_result:
-                print(f"index {i} でエラー: {add_result['error']}", flush=True)
-                print("document:", chunk, flush=True)
-                print("metadata:", metadata, flush=True)
-                print("id:", doc_id, flush=True)
-                print("log_learning_error called", flush=True)
+                logger.warning("add failed", extra={"index": i, "doc_id": doc_id, "error": add_result['error']})
                 log_learning_error({
                     "function": "chroma_store_html_impl/add",
                     "error": add_result['error'],
@@ -340,9 +337,7 @@ def chroma_store_html_impl(
                     "metadata": metadata,
                     "id": doc_id
                 })
-                print(f"[BREAK] addエラーで中断 index={i}", flush=True)
                 break
-            print("OK", flush=True)
         # --- ここまで ---
         # --- ここから追加: 文脈抽出キーワードもグローバル設定から取得 ---
         context_keywords = get_context_keywords()
@@ -389,6 +384,33 @@ def chroma_store_html_impl(
         })
         return {"success": False, "error": str(e)}
 
+def plan_html_ingest_job(service, html_files, collection_name: str, project: Optional[str] = None,
+                         kind: str = "html_folder", log=None) -> str:
+    """
+    HTMLファイル群をMarkdown化→md会話chunkerでチャンク化し、取り込みキューのジョブとして計画する（ChromaDBへは書き込まない）
+    Returns: ジョブID
+    """
+    queue = service.queue
+    job_id = queue.create_job(kind, collection_name, {"files": len(html_files), "project": project})
+    for html_path in html_files:
+        try:
+            md_path = html_to_md_unconditional(str(html_path))
+            if log:
+                log(f'生成md: {md_path}')
+            plan = plan_md_conversation(md_path, project=project)
+            queue.add_source(job_id, str(html_path), plan.get("rows", []), error=None if plan["success"] else plan.get("error"))
+        except Exception as e:
+            log_learning_error({
+                "function": "plan_html_ingest_job",
+                "file": str(html_path),
+                "collection": collection_name,
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            })
+            queue.add_source(job_id, str(html_path), [], error=str(e))
+    queue.finish_planning(job_id)
+    return job_id
+
 def extract_context_from_html(html_path, keyword, context_window=1):
     """
     HTMLからキーワード関連文脈を抽出しMarkdownファイルとしてlogs/md_debug/に保存し、そのパスを返す
@@ -0,0 +1,565 @@
+"""
+先行書き込み（write-ahead）型の取り込みキュー
+取り込むチャンク（ID・本文・メタデータ）をジョブ単位で先にSQLite（WALモード）へ記録し、
+ChromaDBへのaddが成功したバッチごとにcommittedへ更新する
+
+MCPプロセスが落ちても、どのチャンクまでコミット済みかがキューに残るため、
+chroma_ingest_resumeで続きから再開でき、コミット済みの分を再度埋め込まない。
+（コミット直後・キュー更新前に落ちた場合も、再開時にコレクションに既にあるIDは追加せずcommitted扱いにする）
+
+- ジョブの状態: planning → pending → running → completed / completed_with_errors / cancelled / interrupted
+- チャンクの状態: planned → committed / failed（失敗したチャンクは再開時にretry_failedで再試行）
+- 1バッチの失敗は1件ずつ再試行して失敗行を特定し、残りの取り込みは続ける
+- ジョブが終わったら、コミット済みチャンク（キャンセル時は全チャンク）の本文・メタデータを消して件数と状態だけ残し、
+  終了したジョブはingest_queue.keep_completed_jobs件を超えた古いものから削除する（キューがコーパスの複製にならないように）
+設定: ingest_queue.path / ingest_queue.batch_size / ingest_queue.resume_on_startup / ingest_queue.keep_completed_jobs
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Callable
+from datetime import datetime
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from modules.structured_logging import get_logger, LOG_DIR
+from modules.deadlines import stop_requested
+from modules.batch_ops import AdaptiveBatchSizer
+from modules.paging import estimate_page_bytes
+
+logger = get_logger("ingest_queue")
+
+DEFAULT_QUEUE_PATH = LOG_DIR / "ingest_queue.sqlite3"
+# 応答に含めるエラーの最大件数
+MAX_REPORTED_ERRORS = 20
+
+FINISHED_STATUSES = ("completed", "completed_with_errors", "cancelled")
+# 記録を残す終了済みジョブの件数
+DEFAULT_KEEP_COMPLETED_JOBS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    params TEXT,
+    status TEXT NOT NULL,
+    total_chunks INTEGER NOT NULL DEFAULT 0,
+    committed_chunks INTEGER NOT NULL DEFAULT 0,
+    skipped_chunks INTEGER NOT NULL DEFAULT 0,
+    failed_chunks INTEGER NOT NULL DEFAULT 0,
+    batches INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    source TEXT,
+    doc_id TEXT NOT NULL,
+    document TEXT,
+    metadata TEXT,
+    status TEXT NOT NULL DEFAULT 'planned',
+    batch INTEGER,
+    error TEXT,
+    committed_at TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS chunks_status ON chunks (job_id, status, seq);
+CREATE TABLE IF NOT EXISTS sources (
+    job_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, source)
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class IngestQueue:
+    """
+    SQLite WALの取り込みキュー（スレッドセーフ・ファイルは最初の操作時に開く）
+    Args:
+        path: SQLiteファイルのパス
+    """
+
+    def __init__(self, path: str = str(DEFAULT_QUEUE_PATH)):
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_settings(cls) -> "IngestQueue":
+        path = DEFAULT_QUEUE_PATH
+        try:
+            from config.global_settings import GlobalSettings
+            path = GlobalSettings().get_setting("ingest_queue.path", None) or path
+        except Exception:
+            pass
+        return cls(str(path))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connection().execute(sql, tuple(params)).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- ジョブの計画 ---
+
+    def create_job(self, kind: str, collection: str, params: Optional[Dict[str, Any]] = None) -> str:
+        job_id = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        now = _now()
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO jobs (job_id, kind, collection, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, 'planning', ?, ?)",
+            (job_id, kind, collection, json.dumps(params or {}, ensure_ascii=False), now, now)
+        ))
+        return job_id
+
+    def add_source(self, job_id: str, source: str, rows: List[Tuple[str, Optional[str], Dict[str, Any]]],
+                   error: Optional[str] = None) -> int:
+        """1ソース（ファイル）分の計画済みチャンクを追加（ソース単位で1トランザクション）"""
+        def statements(conn):
+            start = conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM chunks WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO chunks (job_id, seq, source, doc_id, document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, start + i, source, doc_id, document, json.dumps(metadata, ensure_ascii=False))
+                 for i, (doc_id, document, metadata) in enumerate(rows)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (job_id, source, status, chunks, error) VALUES (?, ?, ?, ?, ?)",
+                (job_id, source, "failed" if error else "planned", len(rows), error)
+            )
+            conn.execute("UPDATE jobs SET total_chunks = total_chunks + ?, updated_at = ? WHERE job_id = ?",
+                         (len(rows), _now(), job_id))
+            return len(rows)
+        return self._transaction(statements)
+
+    def planned_sources(self, job_id: str) -> List[str]:
+        return [row["source"] for row in self._query("SELECT source FROM sources WHERE job_id = ?", (job_id,))]
+
+    def finish_planning(self, job_id: str) -> None:
+        self.set_status(job_id, "pending")
+
+    # --- 実行 ---
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        now = _now()
+        started = now if status == "running" else None
+        finished = now if status in FINISHED_STATUSES or status == "interrupted" else None
+
+        def statements(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(?, error), updated_at = ?, "
+                "started_at = COALESCE(started_at, ?), finished_at = ? WHERE job_id = ?",
+                (status, error, now, started, finished, job_id)
+            )
+            if status in FINISHED_STATUSES:
+                # 本文はもう使わない（失敗チャンクはretry_failedで再試行できるよう残す。キャンセルしたジョブは再開できない）
+                condition = "" if status == "cancelled" else " AND status = 'committed'"
+                conn.execute(
+                    "UPDATE chunks SET document = NULL, metadata = NULL WHERE job_id = ? AND document IS NOT NULL" + condition,
+                    (job_id,)
+                )
+        self._transaction(statements)
+
+    def status(self, job_id: str) -> Optional[str]:
+        rows = self._query("SELECT status FROM jobs WHERE job_id = ?", (job_id,))
+        return rows[0]["status"] if rows else None
+
+    def next_batch(self, job_id: str, size: int) -> List[Dict[str, Any]]:
+        """未コミットのチャンクを順番に最大size件（キャンセルで本文を消したチャンクは返さない）"""
+        rows = self._query(
+            "SELECT seq, doc_id, document, metadata FROM chunks "
+            "WHERE job_id = ? AND status = 'planned' AND document IS NOT NULL ORDER BY seq LIMIT ?",
+            (job_id, size)
+        )
+        return [{"seq": r["seq"], "doc_id": r["doc_id"], "document": r["document"], "metadata": json.loads(r["metadata"] or "{}")}
+                for r in rows]
+
+    def mark_committed(self, job_id: str, seqs: List[int], skipped: int = 0) -> int:
+        """バッチ1回分をcommittedへ（skipped: コレクションに既にあったため追加しなかった件数）"""
+        def statements(conn):
+            batch = conn.execute("SELECT batches FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0] + 1
+            now = _now()
+            conn.executemany(
+                "UPDATE chunks SET status = 'committed', batch = ?, committed_at = ?, error = NULL WHERE job_id = ? AND seq = ?",
+                [(batch, now, job_id, seq) for seq in seqs]
+            )
+            conn.execute(
+                "UPDATE jobs SET committed_chunks = committed_chunks + ?, skipped_chunks = skipped_chunks + ?, "
+                "batches = ?, updated_at = ? WHERE job_id = ?",
+                (len(seqs), skipped, batch, now, job_id)
+            )
+            return batch
+        return self._transaction(statements)
+
+    def mark_failed(self, job_id: str, failures: List[Tuple[int, str]]) -> None:
+        def statements(conn):
+            conn.executemany("UPDATE chunks SET status = 'failed', error = ? WHERE job_id = ? AND seq = ?",
+                             [(error[:1000], job_id, seq) for seq, error in failures])
+            conn.execute("UPDATE jobs SET failed_chunks = failed_chunks + ?, updated_at = ? WHERE job_id = ?",
+                         (len(failures), _now(), job_id))
+        self._transaction(statements)
+
+    def retry_failed(self, job_id: str) -> int:
+        """失敗したチャンクを未コミットに戻す"""
+        def statements(conn):
+            count = conn.execute("UPDATE chunks SET status = 'planned' WHERE job_id = ? AND status = 'failed'", (job_id,)).rowcount
+            conn.execute("UPDATE jobs SET failed_chunks = failed_chunks - ?, updated_at = ? WHERE job_id = ?",
+                         (count, _now(), job_id))
+            return count
+        return self._transaction(statements)
+
+    def failed_chunks(self, job_id: str) -> List[Dict[str, Any]]:
+        """失敗したチャンクすべての(seq, doc_id, error)（jobのerrorsは件数を絞っている）"""
+        return [dict(r) for r in self._query(
+            "SELECT seq, doc_id, error FROM chunks WHERE job_id = ? AND status = 'failed' ORDER BY seq", (job_id,))]
+
+    # --- 参照・管理 ---
+
+    def job(self, job_id: str, detail: bool = True) -> Optional[Dict[str, Any]]:
+        """ジョブの状態（detail時はソースごとの進捗と直近のエラーも含む）"""
+        rows = self._query("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        if not rows:
+            return None
+        info = dict(rows[0])
+        info["params"] = json.loads(info["params"] or "{}")
+        pending = info["total_chunks"] - info["committed_chunks"] - info["failed_chunks"]
+        info["pending_chunks"] = pending
+        info["progress_percent"] = round(info["committed_chunks"] / info["total_chunks"] * 100, 2) if info["total_chunks"] else 0.0
+        if not detail:
+            return info
+        per_source = {r["source"]: dict(r) for r in self._query(
+            "SELECT source, status, chunks, error FROM sources WHERE job_id = ? ORDER BY source", (job_id,))}
+        for r in self._query(
+                "SELECT source, status, COUNT(*) AS n FROM chunks WHERE job_id = ? GROUP BY source, status", (job_id,)):
+            per_source.setdefault(r["source"], {"source": r["source"], "chunks": 0}).setdefault("chunk_status", {})[r["status"]] = r["n"]
+        info["sources"] = [{k: v for k, v in s.items() if k != "job_id"} for s in per_source.values()]
+        info["errors"] = [dict(r) for r in self._query(
+            "SELECT seq, doc_id, source, error FROM chunks WHERE job_id = ? AND status = 'failed' ORDER BY seq LIMIT ?",
+            (job_id, MAX_REPORTED_ERRORS))]
+        return info
+
+    def jobs(self, status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        sql = "SELECT job_id FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY created_at DESC LIMIT ?"
+        params = (status, limit) if status else (limit,)
+        return [self.job(r["job_id"], detail=False) for r in self._query(sql, params)]
+
+    def unfinished_jobs(self) -> List[str]:
+        """完了・キャンセル以外のジョブ（計画中に落ちたジョブは再計画できないため含めない）"""
+        return [r["job_id"] for r in self._query(
+            "SELECT job_id FROM jobs WHERE status IN ('pending', 'running', 'interrupted') ORDER BY created_at")]
+
+    def cancel(self, job_id: str) -> bool:
+        """キャンセル（実行中のジョブは現在のバッチの後で止まる）"""
+        status = self.status(job_id)
+        if status is None or status in FINISHED_STATUSES:
+            return False
+        self.set_status(job_id, "cancelled")
+        return True
+
+    def purge(self, job_id: str) -> bool:
+        """終了したジョブの記録（チャンク本文を含む）を削除"""
+        if self.status(job_id) not in FINISHED_STATUSES:
+            return False
+        def statements(conn):
+            for table in ("chunks", "sources", "jobs"):
+                conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+        self._transaction(statements)
+        return True
+
+
+    def prune(self, keep: int = DEFAULT_KEEP_COMPLETED_JOBS) -> int:
+        """終了したジョブの記録を新しい順にkeep件だけ残して削除し、削除件数を返す"""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        rows = self._query(
+            f"SELECT job_id FROM jobs WHERE status IN ({placeholders}) ORDER BY finished_at DESC, created_at DESC LIMIT -1 OFFSET ?",
+            (*FINISHED_STATUSES, max(0, keep))
+        )
+        for row in rows:
+            self.purge(row["job_id"])
+        if rows:
+            logger.info("Pruned finished ingest jobs", extra={"purged": len(rows), "kept": keep})
+        return len(rows)
+
+
+def source_results(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """ジョブのソース（ファイル）ごとの結果 [{"file", "success", "chunks", "committed", "error"}]"""
+    results = []
+    for source in job.get("sources", []):
+        chunk_status = source.get("chunk_status", {})
+        failed = chunk_status.get("failed", 0)
+        pending = chunk_status.get("planned", 0)
+        error = source.get("error") or (f"{failed} chunks failed" if failed else None) or (f"{pending} chunks pending" if pending else None)
+        results.append({
+            "file": source["source"],
+            "success": error is None,
+            "chunks": source.get("chunks", 0),
+            "committed": chunk_status.get("committed", 0),
+            "error": error
+        })
+    return results
+
+
+class IngestJobRunner:
+    """
+    キューのジョブをChromaDBへ取り込む
+    Args:
+        queue: 取り込みキュー
+        manager: ChromaDBManager
+        batch_size: 1回のaddの件数（Noneで所要時間に合わせて自動調整）
+    """
+
+    def __init__(self, queue: IngestQueue, manager, batch_size: Optional[int] = None):
+        self.queue = queue
+        self.manager = manager
+        self.batch_size = max(1, batch_size) if batch_size else None
+
+    def _existing_ids(self, collection, ids: List[str]) -> set:
+        found = collection.get(ids=ids, include=[])
+        return set(found.get("ids") or [])
+
+    def _commit(self, job_id: str, collection, rows: List[Dict[str, Any]],
+                sizer: Optional[AdaptiveBatchSizer] = None) -> List[Tuple[int, str]]:
+        """
+        1バッチをaddしてcommittedにする（既にコレクションにあるIDは追加しない）
+        Returns: 失敗した(seq, error)
+        """
+        existing = self._existing_ids(collection, [r["doc_id"] for r in rows])
+        todo = [r for r in rows if r["doc_id"] not in existing]
+        try:
+            if todo:
+                payload = {"ids": [r["doc_id"] for r in todo], "documents": [r["document"] for r in todo],
+                           "metadatas": [r["metadata"] for r in todo]}
+                started = time.perf_counter()
+                # 既存IDは上で除外済みのため、統計ラッパーの存在確認を重ねない
+                getattr(collection, "add_new", collection.add)(**payload)
+                if sizer is not None:
+                    sizer.observe(len(todo), time.perf_counter() - started, estimate_page_bytes(payload))
+        except Exception as e:
+            if len(todo) <= 1:
+                failures = [(r["seq"], f"{type(e).__name__}: {e}") for r in todo]
+                self.queue.mark_failed(job_id, failures)
+                skipped = [r["seq"] for r in rows if r["doc_id"] in existing]
+                if skipped:
+                    self.queue.mark_committed(job_id, skipped, skipped=len(skipped))
+                return failures
+            # 失敗したバッチは1件ずつ再試行して失敗行を特定する
+            failures = []
+            skipped = [r for r in rows if r["doc_id"] in existing]
+            if skipped:
+                self.queue.mark_committed(job_id, [r["seq"] for r in skipped], skipped=len(skipped))
+            for row in todo:
+                failures += self._commit(job_id, collection, [row])
+            return failures
+        self.queue.mark_committed(job_id, [r["seq"] for r in rows], skipped=len(existing))
+        return []
+
+    def run(self, job_id: str, retry_failed: bool = False) -> Dict[str, Any]:
+        """
+        ジョブを最後（またはキャンセル・呼び出しの締め切り）まで実行
+        締め切りで止めた場合はinterruptedのまま返し、chroma_ingest_resumeで続きから再開できる
+        Returns: 実行後のジョブ状態と今回の処理件数・速度
+        """
+        status = self.queue.status(job_id)
+        if status is None:
+            return {"success": False, "error": f"Job not found: {job_id}"}
+        if status in ("completed", "cancelled"):
+            return {"success": True, "job": self.queue.job(job_id), "committed_now": 0}
+        if status == "planning":
+            return {"success": False, "error": f"Job {job_id} was interrupted while planning; start a new ingest"}
+        if retry_failed:
+            self.queue.retry_failed(job_id)
+        job = self.queue.job(job_id, detail=False)
+        if not self.manager.initialized:
+            self.manager.initialize()
+        collection = self.manager.chroma_client.get_collection(job["collection"])
+        sizer = AdaptiveBatchSizer.for_collection(collection, "add", batch_size=self.batch_size)
+
+        self.queue.set_status(job_id, "running")
+        started = time.perf_counter()
+        committed_now = failed_now = 0
+        stopped = False
+        try:
+            while True:
+                if self.queue.status(job_id) == "cancelled":
+                    logger.info("Ingest job cancelled", extra={"job_id": job_id})
+                    break
+                if stop_requested("ingest"):
+                    stopped = True
+                    self.queue.set_status(job_id, "interrupted", error="deadline exceeded (resume with chroma_ingest_resume)")
+                    logger.info("Ingest job stopped at deadline", extra={"job_id": job_id, "committed": committed_now})
+                    break
+                rows = self.queue.next_batch(job_id, sizer.size)
+                if not rows:
+                    break
+                failures = self._commit(job_id, collection, rows, sizer)
+                failed_now += len(failures)
+                committed_now += len(rows) - len(failures)
+                if failures:
+                    logger.warning("Ingest batch had failures", extra={"job_id": job_id, "failed": len(failures), "error": failures[0][1]})
+            if not stopped and self.queue.status(job_id) != "cancelled":
+                job = self.queue.job(job_id, detail=False)
+                self.queue.set_status(job_id, "completed_with_errors" if job["failed_chunks"] else "completed")
+        except BaseException as e:
+            self.queue.set_status(job_id, "interrupted", error=f"{type(e).__name__}: {e}")
+            logger.error("Ingest job interrupted", extra={"job_id": job_id, "error": str(e)})
+            if not isinstance(e, Exception):
+                raise
+        seconds = time.perf_counter() - started
+        logger.info("Ingest job finished", extra={"job_id": job_id, "committed": committed_now, "failed": failed_now,
+                                                  "seconds": round(seconds, 3)})
+        return {
+            "success": stopped or self.queue.status(job_id) in ("completed", "cancelled"),
+            "resumable": stopped,
+            "job": self.queue.job(job_id),
+            "committed_now": committed_now,
+            "failed_now": failed_now,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(committed_now / seconds, 1) if seconds > 0 else None,
+            "batching": sizer.describe()
+        }
+
+
+class IngestService:
+    """
+    取り込みキューとジョブ実行スレッドの管理（ツールから利用）
+    Args:
+        manager: ChromaDBManager
+        queue: 取り込みキュー（Noneで設定値から作成）
+        batch_size: 1回のaddの件数（Noneで自動調整）
+    """
+
+    def __init__(self, manager, queue: Optional[IngestQueue] = None, batch_size: Optional[int] = None):
+        self.manager = manager
+        self.queue = queue or IngestQueue.from_settings()
+        self.batch_size = batch_size
+        self.resume_on_startup = False
+        self.keep_completed_jobs = DEFAULT_KEEP_COMPLETED_JOBS
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, manager) -> "IngestService":
+        service = cls(manager)
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            batch_size = settings.get_setting("ingest_queue.batch_size", None)
+            service.batch_size = max(1, int(batch_size)) if batch_size else None
+            service.resume_on_startup = bool(settings.get_setting("ingest_queue.resume_on_startup", False))
+            service.keep_completed_jobs = max(1, int(settings.get_setting("ingest_queue.keep_completed_jobs", DEFAULT_KEEP_COMPLETED_JOBS)))
+        except Exception:
+            pass
+        return service
+
+    def runner(self, batch_size: Optional[int] = None) -> IngestJobRunner:
+        return IngestJobRunner(self.queue, self.manager, batch_size or self.batch_size)
+
+    def _run_and_prune(self, runner: IngestJobRunner, job_id: str, retry_failed: bool) -> Dict[str, Any]:
+        try:
+            return runner.run(job_id, retry_failed)
+        finally:
+            try:
+                self.queue.prune(self.keep_completed_jobs)
+            except Exception as e:
+                logger.warning("Failed to prune ingest queue", extra={"error": str(e)})
+
+    def is_running(self, job_id: str) -> bool:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def start(self, job_id: str, retry_failed: bool = False, batch_size: Optional[int] = None) -> bool:
+        """バックグラウンドスレッドでジョブを実行（同じジョブが実行中ならFalse）"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return False
+            runner = self.runner(batch_size)
+            thread = threading.Thread(target=self._run_and_prune, args=(runner, job_id, retry_failed),
+                                      name=f"ingest-{job_id}", daemon=True)
+            self._threads[job_id] = thread
+            thread.start()
+            return True
+
+    def run(self, job_id: str, retry_failed: bool = False, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """呼び出し元のスレッドでジョブを実行"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return {"success": False, "error": f"Job {job_id} is already running"}
+            self._threads[job_id] = threading.current_thread()
+        try:
+            return self._run_and_prune(self.runner(batch_size), job_id, retry_failed)
+        finally:
+            with self._lock:
+                self._threads.pop(job_id, None)
+
+    def resume_unfinished(self) -> List[str]:
+        """前回のプロセスで終わらなかったジョブをバックグラウンドで再開"""
+        resumed = [job_id for job_id in self.queue.unfinished_jobs() if self.start(job_id)]
+        if resumed:
+            logger.info("Resuming unfinished ingest jobs", extra={"jobs": resumed})
+        return resumed
+
+
+_service: Optional[IngestService] = None
+_service_lock = threading.Lock()
+
+
+def get_ingest_service(manager) -> IngestService:
+    """プロセス共有の取り込みサービス（キューのファイルは最初の操作時に開く）"""
+    global _service
+    if _service is not None:
+        return _service
+    with _service_lock:
+        if _service is None:
+            _service = IngestService.from_settings(manager)
+    return _service
+
+
+__all__ = [
+    "IngestQueue",
+    "IngestJobRunner",
+    "IngestService",
+    "get_ingest_service",
+    "source_results",
+]
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+取り込みキュー（中断・再開可能な大量取り込み）関連ツール
+"""
+
+from typing import Dict, Optional, Any
+import os
+from config.global_settings import GlobalSettings
+from modules.ingest_queue import get_ingest_service, source_results
+
+
+def register_ingest_tools(mcp, manager):
+    """取り込みキュー関連ツールを登録"""
+
+    @mcp.tool()
+    def chroma_ingest_html_folder(
+        folder_path: str,
+        collection_name: Optional[str] = None,
+        project: Optional[str] = None,
+        recursive: bool = False,
+        background: bool = True,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        フォルダ内のHTMLをMarkdown化・チャンク化して取り込みキューに計画し、バッチ単位で学習する
+        （プロセスが落ちてもchroma_ingest_resumeでコミット済みの続きから再開できる）
+        Args:
+            folder_path: HTMLファイルのフォルダ
+            collection_name: 保存先コレクション名（None=グローバル設定値）
+            project: プロジェクト名（メタデータ用）
+            recursive: サブフォルダも対象にする
+            background: Trueで計画後すぐに返し、取り込みはバックグラウンドで実行（進捗はchroma_ingest_jobs）
+            batch_size: 1回のaddの件数（None=設定値ingest_queue.batch_size、未設定なら自動調整）
+        Returns: ジョブIDと計画結果（background=Falseなら実行結果）
+        """
+        from modules.html_learning import plan_html_ingest_job
+        try:
+            if not manager.initialized:
+                manager.initialize()
+            if not collection_name or collection_name == "None":
+                collection_name = str(GlobalSettings().get_setting("default_collection.name"))
+            if collection_name not in manager.collection_counts():
+                return {"success": False, "error": f"Collection '{collection_name}' does not exist. 新規作成は禁止されています。"}
+            abs_folder_path = os.path.abspath(folder_path)
+            if not os.path.isdir(abs_folder_path):
+                return {"success": False, "error": f"Folder not found: {abs_folder_path}"}
+            if recursive:
+                html_files = [os.path.join(root, f) for root, _, files in os.walk(abs_folder_path)
+                              for f in files if f.lower().endswith(('.html', '.htm'))]
+            else:
+                html_files = [os.path.join(abs_folder_path, f) for f in os.listdir(abs_folder_path)
+                              if f.lower().endswith(('.html', '.htm'))]
+            if not html_files:
+                return {"success": False, "error": f"No HTML files found in folder: {abs_folder_path}"}
+
+            service = get_ingest_service(manager)
+            job_id = plan_html_ingest_job(service, sorted(html_files), collection_name, project=project)
+            if background:
+                service.start(job_id, batch_size=batch_size)
+                return {"success": True, "job_id": job_id, "background": True, "job": service.queue.job(job_id, detail=False)}
+            run = service.run(job_id, batch_size=batch_size)
+            run["results"] = source_results(run.get("job") or {})
+            return {"job_id": job_id, **run}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_ingest_jobs(
+        job_id: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        取り込みジョブの一覧・詳細（ファイルごとの進捗・失敗チャンク）
+        Args:
+            job_id: 指定時はそのジョブの詳細
+            status: 一覧の絞り込み（pending, running, completed, completed_with_errors, cancelled, interrupted）
+            limit: 一覧の件数
+        Returns: ジョブ情報
+        """
+        try:
+            service = get_ingest_service(manager)
+            if job_id:
+                job = service.queue.job(job_id)
+                if job is None:
+                    return {"success": False, "error": f"Job not found: {job_id}"}
+                job["running_in_this_process"] = service.is_running(job_id)
+                job["results"] = source_results(job)
+                return {"success": True, "job": job}
+            jobs = service.queue.jobs(status=status, limit=limit)
+            for job in jobs:
+                job["running_in_this_process"] = service.is_running(job["job_id"])
+            return {"success": True, "jobs": jobs, "queue_path": str(service.queue.path)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_ingest_resume(
+        job_id: Optional[str] = None,
+        retry_failed: bool = False,
+        background: bool = True,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        中断した取り込みジョブをコミット済みの続きから再開（コミット済みのチャンクは再度埋め込まない）
+        Args:
+            job_id: 再開するジョブ（Noneで未完了のジョブをすべてバックグラウンドで再開）
+            retry_failed: 失敗したチャンクも再試行する
+            background: Trueでバックグラウンド実行（進捗はchroma_ingest_jobs）
+            batch_size: 1回のaddの件数（None=設定値、未設定なら自動調整）
+        Returns: 再開したジョブ（background=Falseなら実行結果）
+        """
+        try:
+            service = get_ingest_service(manager)
+            if job_id is None:
+                return {"success": True, "resumed": service.resume_unfinished()}
+            if service.queue.status(job_id) is None:
+                return {"success": False, "error": f"Job not found: {job_id}"}
+            if background:
+                started = service.start(job_id, retry_failed=retry_failed, batch_size=batch_size)
+                return {"success": True, "job_id": job_id, "started": started,
+                        "message": None if started else "Job is already running in this process",
+                        "job": service.queue.job(job_id, detail=False)}
+            return {"job_id": job_id, **service.run(job_id, retry_failed=retry_failed, batch_size=batch_size)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_ingest_cancel(job_id: str, purge: bool = False) -> Dict[str, Any]:
+        """
+        取り込みジョブをキャンセル（実行中のジョブは現在のバッチの後で止まる。コミット済みのチャンクは残る）
+        Args:
+            job_id: キャンセルするジョブ
+            purge: キャンセル済み・完了済みのジョブの記録（チャンク本文を含む）をキューから削除
+        Returns: キャンセル結果
+        """
+        try:
+            service = get_ingest_service(manager)
+            status = service.queue.status(job_id)
+            if status is None:
+                return {"success": False, "error": f"Job not found: {job_id}"}
+            cancelled = service.queue.cancel(job_id)
+            purged = service.queue.purge(job_id) if purge and not service.is_running(job_id) else False
+            return {"success": True, "job_id": job_id, "previous_status": status, "cancelled": cancelled, "purged": purged}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
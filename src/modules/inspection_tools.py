@@ -5,9 +5,9 @@
 
 from typing import Dict, List, Optional, Any
 import json
-import statistics
 from datetime import datetime
 from config.global_settings import GlobalSettings
+from modules.paging import CollectionPager
 
 
 def register_inspection_tools(mcp, manager):
@@ -19,7 +19,8 @@ def register_inspection_tools(mcp, manager):
         inspection_level: str = "full",
         include_vectors: bool = True,
         include_embeddings: bool = True,
-        check_integrity: bool = True
+        check_integrity: bool = True,
+        profile: bool = False
     ) -> Dict[str, Any]:
         """
         コレクションの包括的精査
@@ -27,7 +28,9 @@ def register_inspection_tools(mcp, manager):
             collection_name: 精査対象コレクション名
             inspection_level: 精査レベル (basic, standard, full, deep)
             include_vectors: ベクトル情報を含める
-            include_embeddings: エンベディング詳細を含める            check_integrity: 整合性チェックを実行
+            include_embeddings: エンベディング詳細を含める（deep時に全ベクトルのノルム分布等を集計）
+            check_integrity: 整合性チェックを実行
+            profile: Trueでこの呼び出しをcProfile計測し、応答のprofileに上位関数を含める
         Returns: 包括的精査結果
         """
         try:
@@ -50,95 +53,144 @@ def register_inspection_tools(mcp, manager):
                 "integrity_check": {}
             }
             
-            # 基本情報
+            # 基本情報（件数とサンプル1件のみ取得）
             try:
                 count = collection.count()
-                all_data = collection.get()
+                sample = collection.get(limit=1, include=["metadatas", "embeddings"])
+                sample_metadatas = sample.get("metadatas") or []
+                sample_embeddings = sample.get("embeddings")
                 
                 inspection_result["basic_info"] = {
                     "total_documents": count,
                     "has_documents": count > 0,
-                    "has_metadata": bool(all_data.get("metadatas")),
-                    "has_embeddings": bool(all_data.get("embeddings"))
+                    "has_metadata": bool(sample_metadatas and sample_metadatas[0]),
+                    "has_embeddings": sample_embeddings is not None and len(sample_embeddings) > 0
                 }
             except Exception as e:
                 inspection_result["basic_info"] = {"error": str(e)}
             
+            # ページ単位で1回だけ走査し、各分析の集計値を積み上げる（本文長・語数はページごとのNumPy配列）
+            # 列指向のResultSetに溜めるのは全ベクトルが必要なdeepのエンベディング分析だけ
+            import numpy as np
+            from modules.result_set import ResultSetBuilder
+            analyze_metadata = inspection_level in ["standard", "full", "deep"]
+            analyze_documents = inspection_level in ["full", "deep"]
+            analyze_words = analyze_documents and inspection_level == "deep"
+            analyze_embeddings = inspection_level == "deep" and include_embeddings
+            reads = ["ids"]
+            if analyze_metadata:
+                reads.append("metadatas")
+            if analyze_documents:
+                reads.append("documents")
+            if analyze_embeddings:
+                reads.append("embeddings")
+            
+            scanned_rows = 0
+            metadata_entries = 0
+            key_frequency = {}
+            length_pages = []
+            word_pages = []
+            empty_documents = 0
+            seen_ids = set()
+            duplicate_ids = 0
+            length_mismatch = False
+            embedding_builder = ResultSetBuilder() if analyze_embeddings else None
+            pager = None
+            scan_error = None
+            try:
+                pager = manager.pager(collection, reads=reads)
+                for page in pager:
+                    ids = page.get("ids") or []
+                    scanned_rows += len(ids)
+                    if check_integrity:
+                        for doc_id in ids:
+                            if doc_id in seen_ids:
+                                duplicate_ids += 1
+                            else:
+                                seen_ids.add(doc_id)
+                    metadatas = page.get("metadatas") or []
+                    documents = page.get("documents") or []
+                    if any(len(col) not in (0, len(ids)) for col in (metadatas, documents)):
+                        length_mismatch = True
+                    for metadata in metadatas:
+                        if metadata:
+                            metadata_entries += 1
+                            for key in metadata.keys():
+                                key_frequency[key] = key_frequency.get(key, 0) + 1
+                    if documents:
+                        length_pages.append(np.fromiter((len(doc or "") for doc in documents), dtype=np.int64, count=len(documents)))
+                        empty_documents += sum(1 for doc in documents if not (doc or "").strip())
+                        if analyze_words:
+                            word_pages.append(np.fromiter((len((doc or "").split()) for doc in documents), dtype=np.int64, count=len(documents)))
+                    if embedding_builder is not None:
+                        embedding_builder.add_page({"ids": ids, "embeddings": page.get("embeddings")})
+            except Exception as e:
+                scan_error = str(e)
+            
             # メタデータ分析
-            if inspection_level in ["standard", "full", "deep"]:
-                try:
-                    metadatas = all_data.get("metadatas", [])
-                    if metadatas:
-                        # メタデータキーの分析
-                        all_keys = set()
-                        for metadata in metadatas:
-                            if metadata:
-                                all_keys.update(metadata.keys())
-                        
-                        key_frequency = {}
-                        for metadata in metadatas:
-                            if metadata:
-                                for key in all_keys:
-                                    key_frequency[key] = key_frequency.get(key, 0) + (1 if key in metadata else 0)
-                        
-                        inspection_result["metadata_analysis"] = {
-                            "total_metadata_entries": len([m for m in metadatas if m]),
-                            "unique_keys": list(all_keys),
-                            "key_frequency": key_frequency,
-                            "metadata_coverage": round(len([m for m in metadatas if m]) / len(metadatas) * 100, 2) if metadatas else 0
-                        }
-                    else:
-                        inspection_result["metadata_analysis"] = {"no_metadata": True}
-                except Exception as e:
-                    inspection_result["metadata_analysis"] = {"error": str(e)}
+            if analyze_metadata:
+                if scan_error:
+                    inspection_result["metadata_analysis"] = {"error": scan_error}
+                elif scanned_rows:
+                    inspection_result["metadata_analysis"] = {
+                        "total_metadata_entries": metadata_entries,
+                        "unique_keys": list(key_frequency.keys()),
+                        "key_frequency": key_frequency,
+                        "metadata_coverage": round(metadata_entries / scanned_rows * 100, 2)
+                    }
+                else:
+                    inspection_result["metadata_analysis"] = {"no_metadata": True}
             
             # ドキュメント分析
-            if inspection_level in ["full", "deep"]:
-                try:
-                    documents = all_data.get("documents", [])
-                    if documents:
-                        doc_lengths = [len(doc) for doc in documents]
-                        
-                        inspection_result["document_analysis"] = {
-                            "total_documents": len(documents),
-                            "average_length": round(statistics.mean(doc_lengths), 2),
-                            "median_length": statistics.median(doc_lengths),
-                            "min_length": min(doc_lengths),
-                            "max_length": max(doc_lengths),
-                            "empty_documents": len([doc for doc in documents if not doc.strip()])
+            if analyze_documents:
+                if scan_error:
+                    inspection_result["document_analysis"] = {"error": scan_error}
+                elif length_pages:
+                    doc_lengths = np.concatenate(length_pages)
+                    inspection_result["document_analysis"] = {
+                        "total_documents": int(doc_lengths.size),
+                        "average_length": round(float(doc_lengths.mean()), 2),
+                        "median_length": float(np.median(doc_lengths)),
+                        "min_length": int(doc_lengths.min()),
+                        "max_length": int(doc_lengths.max()),
+                        "empty_documents": empty_documents
+                    }
+                    
+                    if analyze_words:
+                        # 詳細分析
+                        word_counts = np.concatenate(word_pages)
+                        inspection_result["document_analysis"]["word_analysis"] = {
+                            "average_word_count": round(float(word_counts.mean()), 2),
+                            "median_word_count": float(np.median(word_counts)),
+                            "min_word_count": int(word_counts.min()),
+                            "max_word_count": int(word_counts.max())
                         }
-                        
-                        if inspection_level == "deep":
-                            # 詳細分析
-                            word_counts = [len(doc.split()) for doc in documents]
-                            inspection_result["document_analysis"]["word_analysis"] = {
-                                "average_word_count": round(statistics.mean(word_counts), 2),
-                                "median_word_count": statistics.median(word_counts),
-                                "min_word_count": min(word_counts),
-                                "max_word_count": max(word_counts)
-                            }
-                    else:
-                        inspection_result["document_analysis"] = {"no_documents": True}
-                except Exception as e:
-                    inspection_result["document_analysis"] = {"error": str(e)}
+                else:
+                    inspection_result["document_analysis"] = {"no_documents": True}
+            
+            # エンベディング分析（deepかつinclude_embeddings時のみ・float32配列で集計）
+            result_set = None
+            if analyze_embeddings:
+                if scan_error:
+                    inspection_result["embedding_analysis"] = {"error": scan_error}
+                else:
+                    result_set = embedding_builder.build()
+                    result_set.truncated = pager.truncated
+                    inspection_result["embedding_analysis"] = result_set.embedding_stats()
             
             # 整合性チェック
             if check_integrity:
-                try:
+                if scan_error:
+                    inspection_result["integrity_check"] = {"error": scan_error}
+                else:
                     integrity_issues = []
                     
                     # ID重複チェック
-                    ids = all_data.get("ids", [])
-                    if len(ids) != len(set(ids)):
+                    if duplicate_ids:
                         integrity_issues.append("Duplicate IDs detected")
                     
                     # データ長の整合性
-                    documents = all_data.get("documents", [])
-                    metadatas = all_data.get("metadatas", [])
-                    embeddings = all_data.get("embeddings", [])
-                    
-                    lengths = [len(documents), len(metadatas), len(embeddings), len(ids)]
-                    if len(set([l for l in lengths if l > 0])) > 1:
+                    if length_mismatch or (result_set is not None and result_set.length_mismatch):
                         integrity_issues.append("Inconsistent data array lengths")
                     
                     inspection_result["integrity_check"] = {
@@ -146,8 +198,11 @@ def register_inspection_tools(mcp, manager):
                         "issues": integrity_issues,
                         "status": "healthy" if not integrity_issues else "issues_detected"
                     }
-                except Exception as e:
-                    inspection_result["integrity_check"] = {"error": str(e)}
+            
+            if pager is not None:
+                inspection_result["scan"] = pager.stats()
+            if result_set is not None:
+                inspection_result["result_set"] = result_set.describe()
             
             return {
                 "success": True,
@@ -225,15 +280,17 @@ def register_inspection_tools(mcp, manager):
     @mcp.tool()
     def chroma_inspect_metadata_schema(
         collection_name: Optional[str] = None,
-        sample_size: int = 100
+        sample_size: int = 0
     ) -> Dict[str, Any]:
         """
-        メタデータスキーマの精査と分析
+        メタデータスキーマの精査と分析（カバレッジ・型の揺れ・カーディナリティ・値の分布）
         Args:
             collection_name: 対象コレクション名
-            sample_size: サンプリングサイズ        Returns: メタデータスキーマ分析結果
+            sample_size: 分析件数（0で全件）
+        Returns: メタデータスキーマ分析結果
         """
         try:
+            from modules.metadata_analytics import MetadataSchemaAnalyzer
             # グローバル設定からデフォルトコレクション名を取得
             if collection_name is None:
                 global_settings = GlobalSettings()
@@ -243,59 +300,31 @@ def register_inspection_tools(mcp, manager):
                 manager.safe_initialize()
             
             collection = manager.chroma_client.get_collection(collection_name)
-            result = collection.get(limit=sample_size, include=["metadatas"])
             
-            metadatas = result.get("metadatas", [])
+            # ページ単位で列指向フレームに積み上げ、最後にキー単位でまとめて集計
+            analyzer = MetadataSchemaAnalyzer()
+            pager = manager.pager(collection, reads=["metadatas"], max_rows=sample_size if sample_size > 0 else None)
+            for page in pager:
+                analyzer.add_page(page.get("metadatas") or [])
             
-            if not metadatas:
+            if not analyzer.rows_with_metadata:
                 return {
                     "success": True,
                     "collection_name": collection_name,
                     "schema_analysis": {"no_metadata": True}
                 }
             
-            # スキーマ分析
-            all_keys = set()
-            key_types = {}
-            key_frequency = {}
-            sample_values = {}
-            
-            for metadata in metadatas:
-                if metadata:
-                    for key, value in metadata.items():
-                        all_keys.add(key)
-                        
-                        # 頻度カウント
-                        key_frequency[key] = key_frequency.get(key, 0) + 1
-                        
-                        # 型分析
-                        value_type = type(value).__name__
-                        if key not in key_types:
-                            key_types[key] = set()
-                        key_types[key].add(value_type)
-                        
-                        # サンプル値
-                        if key not in sample_values:
-                            sample_values[key] = []
-                        if len(sample_values[key]) < 3:
-                            sample_values[key].append(value)
-            
-            # 結果整理
+            analysis = analyzer.result()
             schema_analysis = {
-                "total_metadata_entries": len([m for m in metadatas if m]),
-                "sample_size": len(metadatas),
-                "total_unique_keys": len(all_keys),
-                "key_details": {}
+                "total_metadata_entries": analysis["total_metadata_entries"],
+                "sample_size": analysis["total_rows"],
+                "full_scan": sample_size <= 0,
+                "total_unique_keys": analysis["total_unique_keys"],
+                "keys_with_type_drift": analysis["keys_with_type_drift"],
+                "backend": analysis["backend"],
+                "key_details": analysis["key_details"]
             }
             
-            for key in all_keys:
-                schema_analysis["key_details"][key] = {
-                    "frequency": key_frequency.get(key, 0),
-                    "coverage_percent": round((key_frequency.get(key, 0) / len(metadatas)) * 100, 2),
-                    "data_types": list(key_types.get(key, [])),
-                    "sample_values": sample_values.get(key, [])
-                }
-            
             return {
                 "success": True,
                 "collection_name": collection_name,
@@ -394,13 +423,16 @@ def register_inspection_tools(mcp, manager):
     @mcp.tool()
     def chroma_inspect_data_integrity(
         collection_name: Optional[str] = None,
-        check_level: str = "standard"
+        check_level: str = "standard",
+        timeout_seconds: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         データ整合性の包括的チェック
         Args:
             collection_name: 対象コレクション名
-            check_level: チェックレベル (basic, standard, thorough)        Returns: 整合性チェック結果
+            check_level: チェックレベル (basic, standard, thorough)
+            timeout_seconds: 走査の締め切り秒数（未指定時は設定deadlines。超過時は走査済み範囲の結果をtruncated=Trueで返す）
+        Returns: 整合性チェック結果
         """
         try:
             # グローバル設定からデフォルトコレクション名を取得
@@ -412,7 +444,6 @@ def register_inspection_tools(mcp, manager):
                 manager.safe_initialize()
             
             collection = manager.chroma_client.get_collection(collection_name)
-            all_data = collection.get()
             
             integrity_report = {
                 "collection_name": collection_name,
@@ -423,61 +454,95 @@ def register_inspection_tools(mcp, manager):
                 "recommendations": []
             }
             
-            documents = all_data.get("documents", [])
-            metadatas = all_data.get("metadatas", [])
-            ids = all_data.get("ids", [])
-            embeddings = all_data.get("embeddings", [])
+            # ページ単位で走査して集計（全件を一度に保持しない）
+            include = ["documents", "metadatas"]
+            if check_level == "thorough":
+                include.append("embeddings")
+            
+            total_documents = 0
+            total_metadatas = 0
+            total_ids = 0
+            total_embeddings = 0
+            seen_ids = set()
+            duplicate_count = 0
+            empty_docs = 0
+            meta_keys = set()
+            embedding_dims = set()
+            
+            pager = CollectionPager(collection, include=include)
+            for page in pager:
+                documents = page.get("documents") or []
+                metadatas = page.get("metadatas") or []
+                ids = page.get("ids") or []
+                embeddings = page.get("embeddings")
+                embeddings = embeddings if embeddings is not None else []
+                
+                total_documents += len(documents)
+                total_metadatas += len(metadatas)
+                total_ids += len(ids)
+                total_embeddings += len(embeddings)
+                
+                for doc_id in ids:
+                    if doc_id in seen_ids:
+                        duplicate_count += 1
+                    else:
+                        seen_ids.add(doc_id)
+                
+                empty_docs += len([doc for doc in documents if not doc or not doc.strip()])
+                
+                if check_level in ["standard", "thorough"]:
+                    for meta in metadatas:
+                        if meta:
+                            meta_keys.update(meta.keys())
+                
+                for emb in embeddings:
+                    embedding_dims.add(len(emb) if emb is not None else 0)
             
             # 基本統計
             integrity_report["statistics"] = {
-                "total_documents": len(documents),
-                "total_metadatas": len(metadatas),
-                "total_ids": len(ids),
-                "total_embeddings": len(embeddings)
+                "total_documents": total_documents,
+                "total_metadatas": total_metadatas,
+                "total_ids": total_ids,
+                "total_embeddings": total_embeddings,
+                "scan_complete": not pager.truncated
             }
             
             # 基本チェック
-            if len(set([len(documents), len(metadatas), len(ids)])) > 1:
+            if len(set([total_documents, total_metadatas, total_ids])) > 1:
                 integrity_report["issues"].append("Inconsistent array lengths between documents, metadata, and IDs")
             
             # ID重複チェック
-            if len(ids) != len(set(ids)):
-                duplicate_count = len(ids) - len(set(ids))
+            if duplicate_count:
                 integrity_report["issues"].append(f"Duplicate IDs found: {duplicate_count} duplicates")
             
             # 空ドキュメントチェック
-            empty_docs = len([doc for doc in documents if not doc or not doc.strip()])
             if empty_docs > 0:
                 integrity_report["issues"].append(f"Empty documents found: {empty_docs}")
             
             # 標準レベル以上のチェック
             if check_level in ["standard", "thorough"]:
                 # メタデータ一貫性チェック
-                if metadatas:
-                    meta_keys = set()
-                    for meta in metadatas:
-                        if meta:
-                            meta_keys.update(meta.keys())
-                    
-                    if len(meta_keys) > 20:
-                        integrity_report["issues"].append(f"High metadata key diversity: {len(meta_keys)} unique keys")
+                if len(meta_keys) > 20:
+                    integrity_report["issues"].append(f"High metadata key diversity: {len(meta_keys)} unique keys")
             
             # 徹底チェック
             if check_level == "thorough":
                 # エンベディング整合性
-                if embeddings:
-                    embedding_dims = [len(emb) if emb else 0 for emb in embeddings]
-                    if len(set(embedding_dims)) > 1:
-                        integrity_report["issues"].append("Inconsistent embedding dimensions")
+                if len(embedding_dims) > 1:
+                    integrity_report["issues"].append("Inconsistent embedding dimensions")
             
             # 推奨事項
             if empty_docs > 0:
                 integrity_report["recommendations"].append("Consider removing empty documents")
             
-            if len(integrity_report["issues"]) == 0:
+            if len(integrity_report["issues"]) == 0 and not pager.truncated:
                 integrity_report["recommendations"].append("Data integrity looks good")
             
-            integrity_report["overall_status"] = "healthy" if len(integrity_report["issues"]) == 0 else "issues_found"
+            if integrity_report["issues"]:
+                integrity_report["overall_status"] = "issues_found"
+            else:
+                # 締め切りで走査を打ち切った場合は未走査範囲があるためhealthyとは判定しない
+                integrity_report["overall_status"] = "incomplete" if pager.truncated else "healthy"
             
             return {
                 "success": True,
@@ -8,6 +8,7 @@ import json
 import time
 from datetime import datetime
 from config.global_settings import GlobalSettings
+from modules.job_scheduler import report_progress
 
 
 def register_integrity_tools(mcp, manager):
@@ -19,10 +20,14 @@ def register_integrity_tools(mcp, manager):
         batch_size: int = 0,
         quality_threshold: float = 0.9,
         enable_deep_analysis: bool = True,
-        parallel_workers: int = 0
+        parallel_workers: int = 0,
+        max_batches: int = 10,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         大規模データセットの効率的バリデーション（安全版）
+        対象範囲を列指向のResultSetに読み込み、バッチごとの検証は列のスライスで行う
 
         Args:
             collection_name: 対象コレクション名
@@ -30,11 +35,20 @@ def register_integrity_tools(mcp, manager):
             quality_threshold: 品質閾値 (0.0-1.0)
             enable_deep_analysis: 深度分析有効化
             parallel_workers: 並列ワーカー数 (0=自動検出)
+            max_batches: 検証するバッチ数の上限 (0=全件)
+            background: Trueでジョブとして投入しjob_idをすぐに返す（進捗・結果はchroma_job_status / chroma_job_result）
+            priority: background時のジョブ優先度（大きいほど先に実行）
             
         Returns:
-            バリデーション結果とパフォーマンス指標
+            バリデーション結果とパフォーマンス指標（background時はジョブ情報）
         """
         try:
+            if background:
+                return {"success": True, "background": True, **manager.jobs.submit("integrity_validate_large_dataset", {
+                    "collection_name": collection_name, "batch_size": batch_size, "quality_threshold": quality_threshold,
+                    "enable_deep_analysis": enable_deep_analysis, "parallel_workers": parallel_workers,
+                    "max_batches": max_batches
+                }, priority=priority)}
             if not manager.initialized:
                 manager.safe_initialize()
             
@@ -66,69 +80,67 @@ def register_integrity_tools(mcp, manager):
                 validation_result["validation_summary"] = {"empty_collection": True}
                 return {"success": True, "validation_result": validation_result}
             
-            # バッチ処理でデータを検証
+            # 検証範囲を1回の走査で列指向に読み込む（行ごとのdictを保持しない）
+            max_rows = batch_size * max_batches if max_batches > 0 else None
+            reads = ["ids", "documents", "metadatas"] if enable_deep_analysis else ["ids", "documents"]
+            report_progress(0, min(total_count, max_rows or total_count), f"loading {collection_name}")
+            result_set = manager.result_set(collection, reads=reads, page_size=batch_size, max_rows=max_rows)
+            loaded = len(result_set)
+            stripped_lengths = result_set.document_lengths(strip=True)
+            metadata_present = result_set.metadata_present() if enable_deep_analysis else None
+            
+            # バッチ単位で検証
             processed_batches = 0
             total_issues = 0
             
-            for offset in range(0, total_count, batch_size):
-                batch_data = collection.get(
-                    limit=min(batch_size, total_count - offset),
-                    offset=offset,
-                    include=["documents", "metadatas", "ids"]
-                )
-                
-                # バッチ内検証
+            for offset in range(0, loaded, batch_size):
+                end = min(offset + batch_size, loaded)
+                report_progress(offset, loaded, "validating batches")
                 batch_issues = []
                 
-                documents = batch_data.get("documents", [])
-                metadatas = batch_data.get("metadatas", [])
-                ids = batch_data.get("ids", [])
-                
                 # 基本整合性チェック
-                if len(documents) != len(ids):
+                if result_set.length_mismatch and processed_batches == 0:
                     batch_issues.append("Document-ID count mismatch")
                 
                 # 空ドキュメントチェック
-                empty_docs = len([doc for doc in documents if not doc or not doc.strip()])
+                empty_docs = sum(1 for n in stripped_lengths[offset:end] if n == 0)
                 if empty_docs > 0:
                     batch_issues.append(f"Empty documents: {empty_docs}")
                 
                 # 重複IDチェック
-                if len(ids) != len(set(ids)):
+                if result_set.unique_id_count(offset, end) != end - offset:
                     batch_issues.append("Duplicate IDs in batch")
                 
                 # 深度分析
-                if enable_deep_analysis:
+                if enable_deep_analysis and result_set.has_metadatas:
                     # メタデータ品質分析
-                    if metadatas:
-                        valid_metadata_count = len([m for m in metadatas if m])
-                        metadata_quality = valid_metadata_count / len(metadatas)
-                        
-                        if metadata_quality < quality_threshold:
-                            batch_issues.append(f"Low metadata quality: {metadata_quality:.2f}")
+                    valid_metadata_count = int(sum(metadata_present[offset:end]))
+                    metadata_quality = valid_metadata_count / (end - offset)
+                    
+                    if metadata_quality < quality_threshold:
+                        batch_issues.append(f"Low metadata quality: {metadata_quality:.2f}")
                 
                 total_issues += len(batch_issues)
                 processed_batches += 1
-                
-                # 進行状況制限（大量データ対応）
-                if processed_batches >= 10:  # 最大10バッチまで
-                    validation_result["validation_summary"]["partial_validation"] = True
-                    break
             
             # 結果サマリー
             validation_result["validation_summary"] = {
                 "processed_batches": processed_batches,
+                "validated_documents": loaded,
                 "total_issues_found": total_issues,
-                "validation_coverage": min(processed_batches * batch_size / total_count, 1.0),
+                "validation_coverage": min(loaded / total_count, 1.0),
                 "overall_quality": 1.0 - (total_issues / max(processed_batches * batch_size, 1))
             }
+            if loaded < total_count:
+                validation_result["validation_summary"]["partial_validation"] = True
             
             # パフォーマンス指標
             execution_time = time.time() - start_time
             validation_result["performance_metrics"] = {
                 "execution_time_seconds": round(execution_time, 2),
-                "documents_per_second": round((processed_batches * batch_size) / execution_time, 2),
-                "memory_efficient": True
+                "documents_per_second": round(loaded / execution_time, 2) if execution_time else None,
+                "memory_efficient": True,
+                "result_set": result_set.describe()
             }
             
             # 推奨事項
@@ -147,7 +159,10 @@ def register_integrity_tools(mcp, manager):
             }
             
         except Exception as e:
-            return {"success": False, "error": str(e)}    
+            return {"success": False, "error": str(e)}
+
+    manager.jobs.register("integrity_validate_large_dataset", chroma_integrity_validate_large_dataset)
+
     @mcp.tool()
     def chroma_analyze_embeddings_safe(
         collection_name: Optional[str] = None,
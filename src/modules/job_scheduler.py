@@ -0,0 +1,406 @@
+"""
+長時間かかるメンテナンス処理のバックグラウンドジョブ実行
+投入（submit）はジョブIDを即座に返し、処理はワーカースレッドのプールで優先度順に実行する。
+状態・進捗・結果はchroma_job_status / chroma_job_resultでポーリングする。
+
+対話的な検索の遅延を守るため、ジョブは低優先度で動かす:
+- ワーカースレッドのOSスケジューリング優先度を下げる（Linuxのみ。スレッド単位のnice値）
+- 処理ループのcheckpoint()で定期的にGILを手放し、対話的なツール呼び出しが実行中なら長めに待つ
+同時実行数は全体（jobs.max_workers）と種類ごと（jobs.kind_limits）に制限する。
+ジョブ記録はメモリ上のみ（プロセス再起動で消える。再開が必要な取り込みはingest_queueを使う）。
+設定: jobs.max_workers / jobs.kind_limits / jobs.nice / jobs.slice_ms / jobs.busy_yield_ms / jobs.history
+"""
+
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime
+import inspect
+import os
+import threading
+import time
+import uuid
+
+from modules.structured_logging import get_logger
+from modules.deadlines import deadline_scope
+
+logger = get_logger("job_scheduler")
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_NICE = 10
+# この時間（ミリ秒）処理を続けたらcheckpoint()で1回譲る
+DEFAULT_SLICE_MS = 20.0
+# 対話的なツール呼び出しが実行中のときに譲る時間（ミリ秒）
+DEFAULT_BUSY_YIELD_MS = 20.0
+# 保持する終了済みジョブ数
+DEFAULT_HISTORY = 200
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+_local = threading.local()
+
+
+class JobCancelled(BaseException):
+    """
+    キャンセル要求を受けたジョブをcheckpoint()で中断するための例外
+    ツール本体の`except Exception`で失敗結果に変換されないようBaseExceptionを継承する（asyncio.CancelledErrorと同じ）
+    """
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _lower_thread_priority(nice: int) -> bool:
+    """呼び出したスレッドのOS優先度を下げる（スレッド単位で設定できるLinuxのみ）"""
+    if nice <= 0 or not hasattr(os, "setpriority") or not hasattr(threading, "get_native_id"):
+        return False
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        return True
+    except Exception:
+        return False
+
+
+def _interactive_in_flight() -> int:
+    """実行中の対話的なツール呼び出し数（ジョブは計測ラッパーを通さずに実行するので含まれない）"""
+    try:
+        from modules.tool_metrics import registry
+        return registry.in_flight_total()
+    except Exception:
+        return 0
+
+
+def checkpoint() -> None:
+    """
+    ジョブの処理ループから定期的に呼ぶ（ジョブ外では何もしない）
+    キャンセル要求があればJobCancelledを送出し、一定時間ごとに対話的な処理へCPUを譲る
+    """
+    job = getattr(_local, "job", None)
+    if job is None:
+        return
+    job.scheduler._checkpoint(job)
+
+
+def report_progress(done: Optional[int] = None, total: Optional[int] = None, message: Optional[str] = None) -> None:
+    """
+    実行中ジョブの進捗を更新してcheckpoint()する（ジョブ外では何もしない）
+    Args:
+        done: 処理済み件数
+        total: 全体件数（不明ならNone）
+        message: 現在の処理内容
+    """
+    job = getattr(_local, "job", None)
+    if job is None:
+        return
+    progress = job.progress
+    if done is not None:
+        progress["done"] = done
+    if total is not None:
+        progress["total"] = total
+    if message is not None:
+        progress["message"] = message
+    progress["updated_at"] = _now()
+    job.scheduler._checkpoint(job)
+
+
+class _Job:
+    def __init__(self, scheduler: "JobScheduler", kind: str, params: Dict[str, Any], priority: int, seq: int):
+        self.scheduler = scheduler
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.seq = seq
+        self.status = "queued"
+        self.progress: Dict[str, Any] = {"done": 0, "total": None, "message": None, "updated_at": None}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.run_seconds: Optional[float] = None
+        self.yielded_seconds = 0.0
+        self.cancel_requested = False
+        self.deadline = None
+        self.done = threading.Event()
+        self._last_yield = 0.0
+
+    def snapshot(self, include_result: bool = False) -> Dict[str, Any]:
+        progress = dict(self.progress)
+        if progress.get("total"):
+            progress["percent"] = round(min(progress["done"] / progress["total"], 1.0) * 100, 1)
+        snapshot = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "params": self.params,
+            "progress": progress,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "run_seconds": self.run_seconds,
+            "yielded_seconds": round(self.yielded_seconds, 3),
+            "cancel_requested": self.cancel_requested,
+            "error": self.error
+        }
+        if include_result:
+            snapshot["result"] = self.result
+        return snapshot
+
+
+class JobScheduler:
+    """
+    優先度付きキューとワーカースレッドのプール（スレッドセーフ）
+    ワーカーは最初の投入時に起動する。priorityは大きいほど先に実行される。
+    Args:
+        max_workers: 同時に実行するジョブ数の上限
+        kind_limits: 種類ごとの同時実行数の上限（register時のconcurrencyより優先）
+        nice: ワーカースレッドに設定するnice値（0で変更しない）
+        slice_ms: checkpoint()で譲るまでの処理時間
+        busy_yield_ms: 対話的なツール呼び出しが実行中のときに譲る時間
+        history: 保持する終了済みジョブ数
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, kind_limits: Optional[Dict[str, int]] = None,
+                 nice: int = DEFAULT_NICE, slice_ms: float = DEFAULT_SLICE_MS,
+                 busy_yield_ms: float = DEFAULT_BUSY_YIELD_MS, history: int = DEFAULT_HISTORY):
+        self.max_workers = max(1, int(max_workers))
+        self.kind_limits = dict(kind_limits or {})
+        self.nice = int(nice)
+        self.slice_seconds = max(0.0, float(slice_ms)) / 1000
+        self.busy_yield_seconds = max(0.0, float(busy_yield_ms)) / 1000
+        self.history = max(1, int(history))
+        self._kinds: Dict[str, Dict[str, Any]] = {}
+        self._jobs: Dict[str, _Job] = {}
+        self._pending: List[_Job] = []
+        self._running_by_kind: Dict[str, int] = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._priority_lowered: Optional[bool] = None
+
+    @classmethod
+    def from_settings(cls) -> "JobScheduler":
+        scheduler = cls()
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            scheduler.max_workers = max(1, int(settings.get_setting("jobs.max_workers", DEFAULT_MAX_WORKERS)))
+            scheduler.kind_limits = dict(settings.get_setting("jobs.kind_limits", {}) or {})
+            scheduler.nice = int(settings.get_setting("jobs.nice", DEFAULT_NICE))
+            scheduler.slice_seconds = max(0.0, float(settings.get_setting("jobs.slice_ms", DEFAULT_SLICE_MS))) / 1000
+            scheduler.busy_yield_seconds = max(0.0, float(settings.get_setting("jobs.busy_yield_ms", DEFAULT_BUSY_YIELD_MS))) / 1000
+            scheduler.history = max(1, int(settings.get_setting("jobs.history", DEFAULT_HISTORY)))
+        except Exception:
+            pass
+        return scheduler
+
+    def register(self, kind: str, func: Callable[..., Any], concurrency: int = 1, description: Optional[str] = None) -> None:
+        """
+        ジョブの種類を登録（ツール関数を渡すと計測・トレースのラッパーを外した本体を実行する）
+        Args:
+            kind: 種類名（chroma_job_submitのkind）
+            func: キーワード引数で呼ぶ処理本体
+            concurrency: この種類の同時実行数の上限
+            description: 一覧表示用の説明（None=関数のdocstring先頭行）
+        """
+        func = inspect.unwrap(getattr(func, "fn", func))
+        if description is None:
+            doc = (inspect.getdoc(func) or "").strip()
+            description = doc.splitlines()[0] if doc else ""
+        with self._cond:
+            self._kinds[kind] = {"func": func, "concurrency": max(1, int(concurrency)), "description": description}
+
+    def kinds(self) -> Dict[str, Dict[str, Any]]:
+        """登録済みの種類（説明・同時実行上限・引数）"""
+        with self._cond:
+            kinds = dict(self._kinds)
+        return {
+            kind: {
+                "description": spec["description"],
+                "concurrency": self._limit(kind, spec),
+                "parameters": [p for p in inspect.signature(spec["func"]).parameters if p != "background"]
+            }
+            for kind, spec in sorted(kinds.items())
+        }
+
+    def _limit(self, kind: str, spec: Dict[str, Any]) -> int:
+        return max(1, int(self.kind_limits.get(kind, spec["concurrency"])))
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None, priority: int = 0) -> Dict[str, Any]:
+        """
+        ジョブを投入してすぐに返す
+        Args:
+            kind: 登録済みの種類名
+            params: 処理本体へのキーワード引数
+            priority: 優先度（大きいほど先に実行）
+        Returns: ジョブのスナップショット（job_id, status="queued", ...）
+        """
+        params = {k: v for k, v in (params or {}).items() if k != "background"}
+        with self._cond:
+            spec = self._kinds.get(kind)
+            if spec is None:
+                raise ValueError(f"Unknown job kind: {kind} (available: {', '.join(sorted(self._kinds))})")
+            inspect.signature(spec["func"]).bind(**params)
+            self._seq += 1
+            job = _Job(self, kind, params, int(priority), self._seq)
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+        logger.info("Job submitted", extra={"job_id": job.job_id, "kind": kind, "priority": job.priority})
+        return job.snapshot()
+
+    def _ensure_workers(self) -> None:
+        self._workers = [t for t in self._workers if t.is_alive()]
+        while len(self._workers) < self.max_workers:
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{len(self._workers) + 1}", daemon=True)
+            self._workers.append(thread)
+            thread.start()
+
+    def _next_job(self) -> Optional[_Job]:
+        """実行可能なうち優先度が最も高いジョブ（種類ごとの上限に達している種類は飛ばす）"""
+        for job in sorted(self._pending, key=lambda j: (-j.priority, j.seq)):
+            if self._running_by_kind.get(job.kind, 0) < self._limit(job.kind, self._kinds[job.kind]):
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _worker(self) -> None:
+        lowered = _lower_thread_priority(self.nice)
+        if self._priority_lowered is None or lowered:
+            self._priority_lowered = lowered
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running_by_kind[job.kind] = self._running_by_kind.get(job.kind, 0) + 1
+                job.status = "running"
+                job.started_at = _now()
+                func = self._kinds[job.kind]["func"]
+            self._run(job, func)
+            with self._cond:
+                self._running_by_kind[job.kind] -= 1
+                self._prune()
+                self._cond.notify_all()
+
+    def _run(self, job: _Job, func: Callable[..., Any]) -> None:
+        _local.job = job
+        started = time.perf_counter()
+        job._last_yield = time.monotonic()
+        try:
+            # キャンセル要求はDeadline経由でも伝え、checkpoint()のない走査（ページャ等）も次のページ境界で止める
+            with deadline_scope(None) as deadline:
+                job.deadline = deadline
+                job.result = func(**job.params)
+            if job.cancel_requested:
+                # 素のexcept:で握りつぶされても、キャンセル要求後の終了はキャンセル扱い
+                job.status = "cancelled"
+            elif isinstance(job.result, dict) and job.result.get("success") is False:
+                job.status = "failed"
+                job.error = job.result.get("error")
+            else:
+                job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.warning("Job failed", extra={"job_id": job.job_id, "kind": job.kind, "error": str(e)})
+        finally:
+            _local.job = None
+            job.run_seconds = round(time.perf_counter() - started, 3)
+            job.finished_at = _now()
+            job.done.set()
+        logger.info("Job finished", extra={"job_id": job.job_id, "kind": job.kind, "status": job.status,
+                                           "run_seconds": job.run_seconds})
+
+    def _checkpoint(self, job: _Job) -> None:
+        if job.cancel_requested:
+            raise JobCancelled(job.job_id)
+        now = time.monotonic()
+        if now - job._last_yield < self.slice_seconds:
+            return
+        # GILを手放して他スレッド（イベントループ）を進める。対話的な呼び出しがあれば長めに待つ
+        pause = self.busy_yield_seconds if _interactive_in_flight() else 0.0
+        time.sleep(pause)
+        job.yielded_seconds += pause
+        job._last_yield = time.monotonic()
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATUSES]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.job_id]
+
+    def job(self, job_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = job.snapshot(include_result)
+            if job.status == "queued":
+                snapshot["queue_position"] = sorted(self._pending, key=lambda j: (-j.priority, j.seq)).index(job) + 1
+            return snapshot
+
+    def jobs(self, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """ジョブ一覧（新しい順、結果本体は含めない）"""
+        with self._cond:
+            jobs = [j for j in self._jobs.values()
+                    if (status is None or j.status == status) and (kind is None or j.kind == kind)]
+            return [j.snapshot() for j in sorted(jobs, key=lambda j: j.seq, reverse=True)[:max(1, int(limit))]]
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """ジョブの終了を最大timeout秒待って結果込みのスナップショットを返す"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.done.wait(max(0.0, timeout))
+        return self.job(job_id, include_result=True)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        ジョブをキャンセル（待機中は即時、実行中は次のcheckpoint()で中断）
+        Returns: キャンセル前の状態（ジョブがなければNone）
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            previous = job.status
+            if job.status == "queued":
+                self._pending.remove(job)
+                job.status = "cancelled"
+                job.finished_at = _now()
+                job.done.set()
+            elif job.status == "running":
+                job.cancel_requested = True
+                if job.deadline is not None:
+                    job.deadline.cancel("job cancelled")
+            return previous
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "workers_alive": sum(1 for t in self._workers if t.is_alive()),
+                "kind_limits": {kind: self._limit(kind, spec) for kind, spec in sorted(self._kinds.items())},
+                "nice": self.nice,
+                "thread_priority_lowered": self._priority_lowered,
+                "slice_ms": self.slice_seconds * 1000,
+                "busy_yield_ms": self.busy_yield_seconds * 1000,
+                "interactive_in_flight": _interactive_in_flight(),
+                "jobs": counts
+            }
+
+
+__all__ = [
+    "JobScheduler",
+    "JobCancelled",
+    "checkpoint",
+    "report_progress",
+]
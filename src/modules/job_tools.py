@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+バックグラウンドジョブ（長時間のメンテナンス処理）関連ツール
+"""
+
+from typing import Dict, Optional, Any
+
+# chroma_job_resultで待てる最大秒数（クライアントのタイムアウトを超えないように）
+MAX_WAIT_SECONDS = 30.0
+
+
+def register_job_tools(mcp, manager):
+    """バックグラウンドジョブ関連ツールを登録"""
+
+    @mcp.tool()
+    def chroma_job_submit(
+        kind: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        priority: int = 0
+    ) -> Dict[str, Any]:
+        """
+        長時間かかる処理をバックグラウンドジョブとして投入し、job_idをすぐに返す
+        （backup_data, system_maintenance, cleanup_duplicates, cleanup_documents, cleanup_large_documents,
+        integrity_validate_large_dataset。kind=""で一覧と引数を返す）
+        Args:
+            kind: ジョブの種類
+            arguments: 対応するツールの引数（例: {"collection_name": "xxx", "dry_run": true}）
+            priority: 優先度（大きいほど先に実行）
+        Returns: ジョブ情報（進捗・結果はchroma_job_status / chroma_job_result）
+        """
+        try:
+            if not kind:
+                return {"success": True, "kinds": manager.jobs.kinds()}
+            return {"success": True, **manager.jobs.submit(kind, arguments or {}, priority=priority)}
+        except Exception as e:
+            return {"success": False, "error": str(e), "kinds": sorted(manager.jobs.kinds())}
+
+    @mcp.tool()
+    def chroma_job_status(
+        job_id: Optional[str] = None,
+        status: Optional[str] = None,
+        kind: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        バックグラウンドジョブの状態・進捗（job_id指定で1件、省略で一覧とワーカーの状態）
+        Args:
+            job_id: 対象ジョブ
+            status: 一覧の絞り込み（queued, running, completed, failed, cancelled）
+            kind: 一覧の種類での絞り込み
+            limit: 一覧の件数
+        Returns: ジョブの状態（結果本体はchroma_job_result）
+        """
+        try:
+            if job_id:
+                job = manager.jobs.job(job_id)
+                if job is None:
+                    return {"success": False, "error": f"Job not found: {job_id}"}
+                return {"success": True, "job": job}
+            return {
+                "success": True,
+                "jobs": manager.jobs.jobs(status=status, kind=kind, limit=limit),
+                "scheduler": manager.jobs.status()
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_job_result(job_id: str, wait_seconds: float = 0.0) -> Dict[str, Any]:
+        """
+        バックグラウンドジョブの結果（終了していなければ状態・進捗のみ）
+        Args:
+            job_id: 対象ジョブ
+            wait_seconds: 終了を待つ秒数（最大30秒。0で待たない）
+        Returns: ジョブの状態とresult（処理本体の戻り値）
+        """
+        try:
+            job = manager.jobs.wait(job_id, min(max(0.0, wait_seconds), MAX_WAIT_SECONDS))
+            if job is None:
+                return {"success": False, "error": f"Job not found: {job_id}"}
+            return {"success": True, "finished": job["finished_at"] is not None, "job": job}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_job_cancel(job_id: str) -> Dict[str, Any]:
+        """
+        バックグラウンドジョブをキャンセル（待機中は即時、実行中は次の進捗更新の時点で中断）
+        Args:
+            job_id: 対象ジョブ
+        Returns: キャンセル結果
+        """
+        try:
+            previous = manager.jobs.cancel(job_id)
+            if previous is None:
+                return {"success": False, "error": f"Job not found: {job_id}"}
+            return {"success": True, "job_id": job_id, "previous_status": previous, "job": manager.jobs.job(job_id)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
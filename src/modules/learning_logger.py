@@ -1,30 +1,317 @@
 """
 learning_logger.py
 学習エラーログ出力・管理モジュール
+
+log_learning_error()は呼び出し元ではキュー投入のみを行い、
+ファイル書き込み・ローテーション・通知出力はバックグラウンドの書き込みスレッドがまとめて処理する。
+エラーが大量発生してもingest処理の所要時間を支配しないようにするため。
 """
-import os
+import sys
 import json
+import gzip
+import queue
+import atexit
+import threading
+import time
+from collections import Counter, deque
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator
 from config.global_settings import GlobalSettings
 
+LOG_FILE_NAME = "learning_error.log"
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_PRINTS_PER_FLUSH = 5
+
+
+class LearningErrorLogger:
+    """
+    学習エラーのバッファ付き非同期ロガー
+    Args:
+        log_dir: ログディレクトリ
+        queue_size: キュー上限（超過分は破棄して件数のみ記録）
+        flush_interval: 書き込みスレッドのフラッシュ間隔（秒）
+        max_bytes: ローテーション閾値（0でローテーションなし）
+        backup_count: 保持するgzip圧縮済み世代数
+        prints_per_flush: フラッシュ1回あたりの通知出力上限（超過分はまとめて件数表示）
+    """
+
+    def __init__(self,
+                 log_dir: str,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT,
+                 prints_per_flush: int = DEFAULT_PRINTS_PER_FLUSH):
+        self.log_dir = Path(log_dir)
+        self.log_path = self.log_dir / LOG_FILE_NAME
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.prints_per_flush = prints_per_flush
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.write_errors = 0
+
+    def start(self) -> None:
+        """書き込みスレッドを起動（起動済みなら何もしない）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="learning-error-writer", daemon=True)
+            self._thread.start()
+
+    def log(self, error_dict: Dict[str, Any]) -> bool:
+        """エラーをキューへ投入（満杯時は破棄してFalse）"""
+        entry = dict(error_dict)
+        entry.setdefault("timestamp", datetime.now().isoformat())
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _drain(self, first: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        batch = [first] if first is not None else []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if item is None:
+                self._stop_event.set()
+                continue
+            batch.append(item)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            if first is None:
+                self._stop_event.set()
+            else:
+                # 最初の1件から flush_interval の間に溜まった分をまとめて書き込む
+                self._stop_event.wait(self.flush_interval)
+            batch = self._drain(first)
+            if batch:
+                self._write_batch(batch)
+            with self._flushed:
+                self._flushed.notify_all()
+            if self._stop_event.is_set() and self._queue.empty():
+                return
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                for entry in batch:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            with self._lock:
+                self.written += len(batch)
+            self._maybe_rotate()
+        except Exception as e:
+            with self._lock:
+                self.write_errors += 1
+                self.failed += len(batch)
+            print(f"[学習エラーログ] 書き込み失敗: {e}", file=sys.stderr)
+        # Copilotチャット通知用（大量発生時は先頭数件のみ表示し残りは件数表示）
+        # stdoutはMCPのJSON-RPCチャネルのため、書き込みスレッドからはstderrにのみ出す
+        for entry in batch[:self.prints_per_flush]:
+            print(f"[学習エラーログ] {entry.get('function', '')} | {entry.get('file', '')} | {entry.get('error', entry.get('reason', ''))}",
+                  file=sys.stderr)
+        if len(batch) > self.prints_per_flush:
+            print(f"[学習エラーログ] ... 他 {len(batch) - self.prints_per_flush} 件（{self.log_path}）", file=sys.stderr)
+
+    def _maybe_rotate(self) -> None:
+        if not self.max_bytes or not self.log_path.exists():
+            return
+        if self.log_path.stat().st_size < self.max_bytes:
+            return
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        rotated = self.log_dir / f"{LOG_FILE_NAME}.{stamp}.gz"
+        with open(self.log_path, "rb") as src, gzip.open(rotated, "wb") as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b""):
+                dst.write(block)
+        self.log_path.unlink()
+        self.rotations += 1
+        for old in rotated_logs(self.log_dir)[self.backup_count:]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """キュー内のエラーが書き込まれるまで待機"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            target = self.enqueued
+            while self.written + self.failed < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(min(remaining, self.flush_interval))
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """残りを書き込んでスレッドを停止"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            self._stop_event.set()
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """ロガーの稼働統計"""
+        with self._lock:
+            return {
+                "log_path": str(self.log_path),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "pending": self._queue.qsize(),
+                "rotations": self.rotations,
+                "write_errors": self.write_errors
+            }
+
+
+_logger: Optional[LearningErrorLogger] = None
+_logger_lock = threading.Lock()
+
+
+def get_learning_logger() -> LearningErrorLogger:
+    """プロセス共有のロガーを取得（設定の読み込みは初回のみ）"""
+    global _logger
+    if _logger is not None:
+        return _logger
+    with _logger_lock:
+        if _logger is None:
+            settings = GlobalSettings()
+            _logger = LearningErrorLogger(
+                log_dir=settings.get_learning_error_log_dir(),
+                queue_size=int(settings.get_setting("learning_error_log.queue_size", DEFAULT_QUEUE_SIZE)),
+                flush_interval=float(settings.get_setting("learning_error_log.flush_interval", DEFAULT_FLUSH_INTERVAL)),
+                max_bytes=int(settings.get_setting("learning_error_log.max_bytes", DEFAULT_MAX_BYTES)),
+                backup_count=int(settings.get_setting("learning_error_log.backup_count", DEFAULT_BACKUP_COUNT)),
+                prints_per_flush=int(settings.get_setting("learning_error_log.prints_per_flush", DEFAULT_PRINTS_PER_FLUSH))
+            )
+            _logger.start()
+            atexit.register(_logger.stop)
+    return _logger
+
 
 def log_learning_error(error_dict: dict):
     """
     学習系機能のエラーをグローバルなエラーログディレクトリにjsonl形式で追記保存する
+    呼び出し元ではタイムスタンプ付与とキュー投入のみ行い、書き込みはバックグラウンドで実行する
     Args:
         error_dict: エラー情報（タイムスタンプ・関数名・ファイル名・コレクション名・エラー内容等を含むdict）
     """
-    # ログディレクトリ取得（グローバル設定から）
-    log_dir = GlobalSettings.get_learning_error_log_dir_cls()
-    Path(log_dir).mkdir(parents=True, exist_ok=True)
-    log_path = Path(log_dir) / "learning_error.log"
-    # タイムスタンプ付与
-    error_dict = dict(error_dict)  # コピー
-    error_dict["timestamp"] = datetime.now().isoformat()
-    # jsonlで追記
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(error_dict, ensure_ascii=False) + "\n")
-
-    # Copilotチャット通知用（printで即時出力）
-    print(f"[学習エラーログ] {error_dict.get('function', '')} | {error_dict.get('file', '')} | {error_dict.get('error', '')}")
+    get_learning_logger().log(error_dict)
+
+
+def flush_learning_errors(timeout: float = 5.0) -> bool:
+    """未書き込みの学習エラーをファイルへ書き出すまで待機"""
+    if _logger is None:
+        return True
+    return _logger.flush(timeout)
+
+
+def rotated_logs(log_dir: Path) -> List[Path]:
+    """ローテーション済みログ（新しい順）"""
+    return sorted(Path(log_dir).glob(f"{LOG_FILE_NAME}.*.gz"), reverse=True)
+
+
+def iter_learning_errors(log_path: Optional[str] = None, include_rotated: bool = False) -> Iterator[Dict[str, Any]]:
+    """ログを1行ずつ読み出す（ローテーション済みは古い順、現行ファイルは最後）"""
+    path = Path(log_path) if log_path else get_learning_logger().log_path
+    files: List[Path] = list(reversed(rotated_logs(path.parent))) if include_rotated else []
+    if path.exists():
+        files.append(path)
+    for file in files:
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield {"raw": line}
+
+
+def summarize_learning_errors(log_path: Optional[str] = None,
+                              recent: int = 10,
+                              include_rotated: bool = False,
+                              since: Optional[str] = None) -> Dict[str, Any]:
+    """
+    学習エラーログをストリーミングで集計する（全行をメモリに読み込まない）
+    Args:
+        log_path: ログファイルパス（Noneで設定値）
+        recent: 返す最新エントリ数
+        include_rotated: ローテーション済みgzipも集計する
+        since: この時刻（ISO形式）以降のみ集計
+    Returns: 件数・関数別/理由別の内訳・最新エントリ
+    """
+    flush_learning_errors()
+    total = 0
+    by_function: Counter = Counter()
+    by_reason: Counter = Counter()
+    latest: deque = deque(maxlen=max(recent, 0))
+    first_ts = None
+    last_ts = None
+    for entry in iter_learning_errors(log_path, include_rotated):
+        ts = entry.get("timestamp")
+        if since and ts and ts < since:
+            continue
+        total += 1
+        by_function[entry.get("function", "unknown")] += 1
+        by_reason[str(entry.get("reason") or entry.get("error") or "unknown")[:120]] += 1
+        first_ts = first_ts or ts
+        last_ts = ts or last_ts
+        latest.append(entry)
+    return {
+        "total_errors": total,
+        "first_timestamp": first_ts,
+        "last_timestamp": last_ts,
+        "by_function": dict(by_function.most_common(20)),
+        "by_reason": dict(by_reason.most_common(20)),
+        "recent": list(latest)
+    }
+
+
+__all__ = [
+    "LearningErrorLogger",
+    "get_learning_logger",
+    "log_learning_error",
+    "flush_learning_errors",
+    "iter_learning_errors",
+    "summarize_learning_errors",
+]
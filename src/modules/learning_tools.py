@@ -9,10 +9,11 @@ import json
 from pathlib import Path
 from datetime import datetime
 from config.global_settings import GlobalSettings
-from modules.learning_logger import log_learning_error
-from bs4 import BeautifulSoup, Tag
+from modules.learning_logger import log_learning_error, summarize_learning_errors, get_learning_logger
+from modules.structured_logging import get_logger, file_sink
+from modules.query_filters import compile_where, stamp_timestamp, missing_epoch_count, filter_date_range
+from modules.batch_ops import write_in_batches
 import re
-from modules.html_learning import chroma_store_html_impl
 import hashlib
 from modules.chroma_store_core import chroma_store_file
 
@@ -20,6 +21,20 @@ from modules.chroma_store_core import chroma_store_file
 def register_learning_tools(mcp, manager):
     """学習・インポート関連ツールを登録"""
 
+    # 登録時はI/Oを行わない（初期化と学習前のエラーログ表示は最初の学習ツール呼び出し時に1回だけ行う）
+    learning_errors_shown = []
+
+    def prepare_learning():
+        if not manager.initialized:
+            manager.initialize()
+        if learning_errors_shown:
+            return
+        learning_errors_shown.append(True)
+        print_latest_learning_errors(
+            os.path.join('logs', 'learning_error_logs', 'learning_error.log'),
+            max_lines=10
+        )
+
     @mcp.tool()
     def chroma_store_html(
         html_path: str,
@@ -36,6 +51,7 @@ def register_learning_tools(mcp, manager):
         from modules.chroma_store_core import chroma_store_md_conversation
         from pathlib import Path
         import traceback
+        prepare_learning()
         # --- グローバル設定値のcollection_nameを優先 ---
         if not collection_name or collection_name == "None":
             global_settings = GlobalSettings()
@@ -72,12 +88,12 @@ def register_learning_tools(mcp, manager):
     ) -> Dict[str, Any]:
         """
         フォルダ内のHTMLファイルを一括でMarkdown化し、mdを議事録chunkerパイプラインでChromaDBに学習させる（新ロジック）。
+        全チャンクを取り込みキューに計画してからバッチ単位で保存する（中断時はchroma_ingest_resumeで続きから再開）。
         """
-        from modules.html_learning import html_to_md_unconditional
-        from modules.chroma_store_core import chroma_store_md_conversation
-        from pathlib import Path
+        from modules.html_learning import plan_html_ingest_job
+        from modules.ingest_queue import get_ingest_service, source_results
         import os
-        import traceback
+        prepare_learning()
         # --- グローバル設定値のcollection_nameを優先 ---
         if not collection_name or collection_name == "None":
             global_settings = GlobalSettings()
@@ -97,27 +113,12 @@ def register_learning_tools(mcp, manager):
                     html_files.append(os.path.join(abs_folder_path, file))
         if not html_files:
             return {"success": False, "error": f"No HTML files found in folder: {abs_folder_path}"}
-        results = []
-        for html_path in html_files:
-            try:
-                md_path = html_to_md_unconditional(str(html_path))
-                result = chroma_store_md_conversation(
-                    file_path=md_path,
-                    collection_name=collection_name,
-                    project=project,
-                    manager=manager
-                )
-                results.append({"file": str(html_path), "md_path": md_path, "success": result.get("success", False), "error": result.get("error")})
-            except Exception as e:
-                tb = traceback.format_exc()
-                log_learning_error({
-                    "function": "chroma_store_html_folder",
-                    "file": html_path,
-                    "collection": collection_name,
-                    "error": str(e),
-                    "traceback": tb
-                })
-                results.append({"file": str(html_path), "success": False, "error": str(e)})
+        if collection_name not in manager.collection_counts():
+            return {"success": False, "error": f"Collection '{collection_name}' does not exist. 新規作成は禁止されています。"}
+        service = get_ingest_service(manager)
+        job_id = plan_html_ingest_job(service, html_files, collection_name, project=project)
+        run = service.run(job_id)
+        results = source_results(run.get("job") or service.queue.job(job_id))
         n_success = sum(1 for r in results if r["success"])
         n_fail = len(results) - n_success
         return {
@@ -126,7 +127,9 @@ def register_learning_tools(mcp, manager):
             "success_count": n_success,
             "fail_count": n_fail,
             "results": results,
-            "collection_name": collection_name
+            "collection_name": collection_name,
+            "job_id": job_id,
+            "job_status": service.queue.status(job_id)
         }
     @mcp.tool()
     def chroma_store_file_tool(
@@ -146,6 +149,7 @@ def register_learning_tools(mcp, manager):
             project: プロジェクト名（メタデータ用）
         Returns: 学習結果
         """
+        prepare_learning()
         # --- グローバル設定値のcollection_nameを優先 ---
         if not collection_name or collection_name == "None":
             global_settings = GlobalSettings()
@@ -206,7 +210,8 @@ def register_learning_tools(mcp, manager):
             ids = []
             
             from datetime import datetime
-            timestamp = datetime.now().isoformat()
+            captured_at = datetime.now()
+            timestamp = captured_at.isoformat()
             
             for i, conv_entry in enumerate(conversation):
                 doc_id = f"conv_{timestamp}_{i}"
@@ -220,24 +225,19 @@ def register_learning_tools(mcp, manager):
                     content = str(conv_entry)
                 # --- 会話エントリのハッシュ値を追加 ---
                 entry_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
-                metadata = {
+                metadata = stamp_timestamp({
                     "source": "conversation",
-                    "timestamp": timestamp,
                     "entry_index": i,
                     "type": "chat_history",
                     "entry_hash": entry_hash
-                }
+                }, captured_at)
                 if context:
                     metadata.update(context)
                 documents.append(content)
                 metadatas.append(metadata)
                 ids.append(doc_id)
             
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            write_in_batches(collection, "add", ids, documents=documents, metadatas=metadatas)
             
             return {
                 "success": True,
@@ -286,14 +286,18 @@ def register_learning_tools(mcp, manager):
             
             try:
                 collection = manager.chroma_client.get_collection(collection_name)
-                  # 日付フィルターで検索
-                where_filter = {"timestamp": {"$gte": start_date.isoformat()}}
-                if project:
-                    where_filter["project"] = {"$eq": project}
-                
-                results = collection.get(where=where_filter)
+                  # 日付フィルターで検索（エポック秒の数値範囲でストア側評価）
+                where_filter = compile_where(start=start_date, project=project)
+                include = ["documents"] if deep_analysis else []
+                # エポック秒を補完していないドキュメントがあれば、日付文字列を読んで絞り込む
+                stats = manager.stats.get(collection_name) if collection_name in manager.stats else None
+                missing = missing_epoch_count(collection, stats=stats)
+                if missing:
+                    results = filter_date_range(collection, start=start_date, where=compile_where(project=project), include=include)
+                else:
+                    results = collection.get(where=where_filter, include=include)
                 
-                discovered_entries = len(results.get("documents", []))
+                discovered_entries = len(results.get("ids", []))
                 
                 analysis_results = {
                     "period_analyzed": f"{days} days",
@@ -301,6 +305,12 @@ def register_learning_tools(mcp, manager):
                     "project_filter": project,
                     "deep_analysis_enabled": deep_analysis
                 }
+                if missing:
+                    analysis_results["backfill_required"] = {
+                        "documents_without_epoch": missing,
+                        "message": "Some documents lack timestamp_epoch; filtered by date string instead. "
+                                   "Run chroma_backfill_timestamp_epoch to restore store-side date filtering."
+                    }
                 
                 if deep_analysis and discovered_entries > 0:
                     # 簡易分析
@@ -356,6 +366,7 @@ def register_learning_tools(mcp, manager):
         Returns: 重要キーワード・重要文脈リスト
         """
         try:
+            from bs4 import BeautifulSoup, Tag
             if not os.path.exists(html_path):
                 return {"success": False, "error": "HTML file not found"}
             with open(html_path, 'r', encoding='utf-8') as f:
@@ -443,6 +454,7 @@ def register_learning_tools(mcp, manager):
         Returns: 重要キーワード・重要文脈リスト
         """
         try:
+            prepare_learning()
             # 1. 標準検索
             results = manager.chroma_client.get_collection(collection_name).get(query_texts=[query], n_results=n_results)
             docs = results.get("documents", [])
@@ -492,24 +504,40 @@ def register_learning_tools(mcp, manager):
         min_length: Optional[int] = None,
         max_length: Optional[int] = None,
         split_large: bool = True,
-        delete_large: bool = False
+        delete_large: bool = False,
+        batch_size: Optional[int] = None,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         コレクション内の空ドキュメント削除・極端に大きいドキュメントの分割/削除
+        1回のページ走査で処理し、削除・分割チャンクの追加はバッチ単位でまとめて実行する
         Args:
             collection_name: 対象コレクション名（None=グローバル設定値を自動利用）
             min_length: 空判定の最小長さ（設定値優先、なければ1）
             max_length: 分割/削除判定の最大長さ（設定値優先、なければ10000）
             split_large: Trueなら大きいドキュメントを分割して再追加、Falseなら削除
             delete_large: Trueなら大きいドキュメントを削除（split_largeより優先）
-        Returns: 処理結果
+            batch_size: 1回のupsert/delete件数（設定値cleanup.batch_size優先、どちらもなければ自動調整）
+            background: Trueでジョブとして投入しjob_idをすぐに返す（進捗・結果はchroma_job_status / chroma_job_result）
+            priority: background時のジョブ優先度（大きいほど先に実行）
+        Returns: 処理結果（バッチごとの所要時間を含む。background時はジョブ情報）
         """
+        if background:
+            try:
+                return {"success": True, "background": True, **manager.jobs.submit("cleanup_documents", {
+                    "collection_name": collection_name, "min_length": min_length, "max_length": max_length,
+                    "split_large": split_large, "delete_large": delete_large, "batch_size": batch_size
+                }, priority=priority)}
+            except Exception as e:
+                return {"success": False, "error": str(e)}
         # --- グローバル設定値のcollection_name・min_length・max_lengthを優先 ---
         global_settings = GlobalSettings()
         if not collection_name or collection_name == "None":
             collection_name = str(global_settings.get_setting("default_collection.name"))
         min_length_val = min_length if min_length is not None else global_settings.get_setting("cleanup.min_length", 1)
         max_length_val = max_length if max_length is not None else global_settings.get_setting("cleanup.max_length", 10000)
+        batch_size_val = batch_size if batch_size is not None else global_settings.get_setting("cleanup.batch_size", None)
         min_length_val = int(min_length_val)
         max_length_val = int(max_length_val)
         return chroma_cleanup_documents_impl(
@@ -518,15 +546,20 @@ def register_learning_tools(mcp, manager):
             min_length=min_length_val,
             max_length=max_length_val,
             split_large=split_large,
-            delete_large=delete_large
+            delete_large=delete_large,
+            batch_size=int(batch_size_val) if batch_size_val else None
         )
+    manager.jobs.register("cleanup_documents", chroma_cleanup_documents)
     from utils.cleanup_tools_large import chroma_cleanup_large_documents_impl
     @mcp.tool()
     def chroma_cleanup_large_documents(
         collection_name: Optional[str] = None,
         max_length: Optional[int] = None,
         split_large: bool = True,
-        delete_large: bool = False
+        delete_large: bool = False,
+        batch_size: Optional[int] = None,
+        background: bool = False,
+        priority: int = 0
     ) -> Dict[str, Any]:
         """
         極端に大きいドキュメントの特定・分割/削除
@@ -535,57 +568,81 @@ def register_learning_tools(mcp, manager):
             max_length: 分割/削除判定の最大長さ（設定値優先、なければ10000）
             split_large: Trueなら分割、Falseなら削除
             delete_large: Trueなら大きいドキュメントを削除
-        Returns: 処理結果
+            batch_size: 1回のupsert/delete件数（設定値cleanup.batch_size優先、どちらもなければ自動調整）
+            background: Trueでジョブとして投入しjob_idをすぐに返す
+            priority: background時のジョブ優先度
+        Returns: 処理結果（background時はジョブ情報）
         """
+        if background:
+            try:
+                return {"success": True, "background": True, **manager.jobs.submit("cleanup_large_documents", {
+                    "collection_name": collection_name, "max_length": max_length,
+                    "split_large": split_large, "delete_large": delete_large, "batch_size": batch_size
+                }, priority=priority)}
+            except Exception as e:
+                return {"success": False, "error": str(e)}
         global_settings = GlobalSettings()
         if not collection_name or collection_name == "None":
             collection_name = str(global_settings.get_setting("default_collection.name"))
         max_length_val = max_length if max_length is not None else global_settings.get_setting("cleanup.max_length", 10000)
+        batch_size_val = batch_size if batch_size is not None else global_settings.get_setting("cleanup.batch_size", None)
         max_length_val = int(max_length_val)
         return chroma_cleanup_large_documents_impl(
             manager=manager,
             collection_name=collection_name,
             max_length=max_length_val,
             split_large=split_large,
-            delete_large=delete_large
+            delete_large=delete_large,
+            batch_size=int(batch_size_val) if batch_size_val else None
         )
+    manager.jobs.register("cleanup_large_documents", chroma_cleanup_large_documents)
     # --- エラーログ自動確認・サマリー出力機能を追加 ---
     def print_latest_learning_errors(log_path:str, max_lines:int=10):
         try:
             if not os.path.exists(log_path):
                 print(f"[log] learning_error.log not found: {log_path}")
                 return
-            with open(log_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()[-max_lines:]
+            # 末尾max_lines件のみ保持しながら1行ずつ読む（readlines()で全行を読み込まない）
+            summary = summarize_learning_errors(log_path, recent=max_lines)
             print("\n[learning_error.log 最新エラーサマリー]")
-            for line in lines:
-                try:
-                    entry = json.loads(line)
-                    ts = entry.get('timestamp', '')
-                    reason = entry.get('reason') or entry.get('error')
-                    value = entry.get('value', '')
-                    print(f"- {ts} | {reason} | {str(value)[:60]}")
-                except Exception:
-                    print(line.strip())
+            for entry in summary["recent"]:
+                if "raw" in entry:
+                    print(entry["raw"])
+                    continue
+                ts = entry.get('timestamp', '')
+                reason = entry.get('reason') or entry.get('error')
+                value = entry.get('value', '')
+                print(f"- {ts} | {reason} | {str(value)[:60]}")
         except Exception as e:
             print(f"[log] learning_error.log 読み込み失敗: {e}")
 
-    # 学習処理
-    if not manager.initialized:
-        manager.initialize()
-
-    # 学習前に最新エラーログを自動表示
-    print_latest_learning_errors(
-        os.path.join('logs', 'learning_error_logs', 'learning_error.log'),
-        max_lines=10
-    )
+    @mcp.tool()
+    def chroma_learning_error_summary(
+        recent: int = 10,
+        include_rotated: bool = False,
+        since: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        学習エラーログの集計（ストリーミング読み込み）
+        Args:
+            recent: 返す最新エントリ数
+            include_rotated: ローテーション済み（gzip圧縮）のログも集計する
+            since: この時刻（ISO形式）以降のエラーのみ集計
+        Returns: 件数・関数別/理由別の内訳・最新エントリ・ロガー統計
+        """
+        try:
+            summary = summarize_learning_errors(recent=recent, include_rotated=include_rotated, since=since)
+            return {"success": True, **summary, "logger": get_learning_logger().stats()}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
     @mcp.tool()
     def chroma_store_html_md_unified(
         docs_dir: Optional[str] = None,
         collection_name: Optional[str] = None,
         project: Optional[str] = None,
-        log_path: Optional[str] = None
+        log_path: Optional[str] = None,
+        profile: bool = False
     ) -> Dict[str, Any]:
         """
         docsディレクトリ内のHTMLを一括でMarkdown化し、md会話chunkerでChromaDBにaddする統一パイプライン。
@@ -595,13 +652,11 @@ def register_learning_tools(mcp, manager):
             collection_name: 保存先コレクション名（None=グローバル設定値）
             project: プロジェクト名（メタデータ用）
             log_path: ログファイルパス（Noneならlogs/learning_stdout.log）
+            profile: Trueでこの呼び出しをcProfile計測し、応答のprofileに上位関数を含める
         Returns: 学習結果サマリー
         """
-        from modules.html_learning import html_to_md_unconditional
-        from modules.chroma_store_core import chroma_store_md_conversation
         from pathlib import Path
         import os
-        import traceback
         # ディレクトリ設定
         if docs_dir is None:
             docs_dir = str(Path(__file__).parent.parent.parent / 'docs')
@@ -614,36 +669,32 @@ def register_learning_tools(mcp, manager):
             collection_name = str(global_settings.get_setting("default_collection.name"))
         if not collection_name or collection_name == "None":
             return {"success": False, "error": "Default collection name not configured."}
-        # ログ
+        # ログ（構造化ログへ出力し、実行中はlog_pathにもプレーンテキストで書き出す）
         if log_path is None:
             log_path = str(Path(__file__).parent.parent.parent / 'logs' / 'learning_stdout.log')
-        def log(msg):
-            with open(log_path, 'a', encoding='utf-8') as f:
-                f.write(msg + '\n')
-            print(msg, flush=True)
+        prepare_learning()
+        with file_sink(get_logger("learning.html_md_unified"), log_path) as unified_logger:
+            return _store_html_md_unified(docs_dir, collection_name, project, unified_logger.info)
+
+    def _store_html_md_unified(docs_dir: str, collection_name: str, project: Optional[str], log) -> Dict[str, Any]:
+        from modules.html_learning import plan_html_ingest_job
+        from modules.ingest_queue import get_ingest_service, source_results
+        from pathlib import Path
         html_files = list(Path(docs_dir).glob('*.html'))
         if not html_files:
             log('No HTML files found.')
             return {"success": False, "error": "No HTML files found in docs_dir.", "docs_dir": docs_dir}
-        results = []
-        for html_path in html_files:
-            try:
-                log(f'--- HTML→md変換: {html_path} ---')
-                md_path = html_to_md_unconditional(str(html_path))
-                log(f'生成md: {md_path}')
-                log(f'--- md会話chunker学習: {md_path} ---')
-                result = chroma_store_md_conversation(
-                    file_path=md_path,
-                    collection_name=collection_name,
-                    project=project,
-                    manager=manager
-                )
-                log(f'学習結果: {result}')
-                results.append({"file": str(html_path), "success": result.get("success", False), "error": result.get("error")})
-            except Exception as e:
-                tb = traceback.format_exc()
-                log(f'Error processing {html_path}: {e}\n{tb}')
-                results.append({"file": str(html_path), "success": False, "error": str(e)})
+        if collection_name not in manager.collection_counts():
+            return {"success": False, "error": f"Collection '{collection_name}' does not exist. 新規作成は禁止されています。"}
+        # 全ファイルのチャンクを取り込みキューに計画してからバッチ単位で学習（中断時はchroma_ingest_resumeで再開）
+        log(f'--- HTML→md変換・チャンク計画: {len(html_files)}ファイル ---')
+        service = get_ingest_service(manager)
+        job_id = plan_html_ingest_job(service, html_files, collection_name, project=project, kind="html_md_unified", log=log)
+        log(f'--- md会話chunker学習: job_id={job_id} ---')
+        run = service.run(job_id)
+        results = source_results(run.get("job") or service.queue.job(job_id))
+        for result in results:
+            log(f'学習結果: {result}')
         n_success = sum(1 for r in results if r["success"])
         n_fail = len(results) - n_success
         return {
@@ -652,7 +703,9 @@ def register_learning_tools(mcp, manager):
             "success_count": n_success,
             "fail_count": n_fail,
             "results": results,
-            "collection_name": collection_name
+            "collection_name": collection_name,
+            "job_id": job_id,
+            "job_status": service.queue.status(job_id)
         }
 
     # 旧chroma_store_html/chroma_store_html_folderは非推奨: HTML直接addは廃止、chroma_store_html_md_unifiedを推奨
@@ -6,9 +6,14 @@
 from typing import Dict, Optional, Any
 from datetime import datetime
 from config.global_settings import GlobalSettings
+from modules.query_filters import stamp_timestamp
+from modules.paging import CollectionPager, decode_cursor
+from modules.batch_ops import AdaptiveBatchSizer, write_in_batches
 
 def register_management_tools(mcp, manager):
     """管理ツールを登録"""
+    # 各ツールが読むフィールド（不要なdocuments/embeddingsは取得しない）
+    manager.declare_reads("chroma_collection_stats", ["ids", "metadatas"])
     
     @mcp.tool()
     async def chroma_create_collection(name: str, metadata: Optional[dict] = None) -> dict:
@@ -126,26 +131,24 @@ def register_management_tools(mcp, manager):
                     ids = [f"doc_{timestamp}_{i}" for i in range(len(documents))]
                 
                 # メタデータが指定されていない場合は空のdictを使用
+                added_at = datetime.now()
                 if metadatas is None:
-                    metadatas = [{"timestamp": datetime.now().isoformat()} for _ in documents]
+                    metadatas = [stamp_timestamp({}, added_at) for _ in documents]
                 else:
-                    # タイムスタンプを追加
+                    # タイムスタンプを追加（ISO文字列＋エポック秒）
                     for metadata in metadatas:
                         if isinstance(metadata, dict):
-                            metadata["timestamp"] = datetime.now().isoformat()
+                            stamp_timestamp(metadata, added_at)
                 
-                # ドキュメント追加
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                # ドキュメント追加（クライアントの上限件数以内のバッチに分割）
+                batching = write_in_batches(collection, "add", ids, documents=documents, metadatas=metadatas)
                 
                 return {
                     "success": True,
                     "message": f"Added {len(documents)} documents to '{collection_name}'",
                     "document_count": len(documents),
-                    "collection_name": collection_name
+                    "collection_name": collection_name,
+                    "batching": batching
                 }
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
@@ -154,8 +157,8 @@ def register_management_tools(mcp, manager):
             return {"success": False, "message": f"Error adding documents: {str(e)}"}
     
     @mcp.tool()
-    async def chroma_get_documents(collection_name: str, limit: int = 100, offset: int = 0) -> dict:
-        """ドキュメント取得（async/await・エラーハンドリング強化版）"""
+    async def chroma_get_documents(collection_name: str, limit: int = 100, offset: int = 0, cursor: Optional[str] = None, include: Optional[list] = None) -> dict:
+        """ドキュメント取得（カーソルページング対応: 応答のnext_cursorを次回のcursorに渡す）"""
         import traceback
         if not manager.initialized:
             try:
@@ -168,16 +171,37 @@ def register_management_tools(mcp, manager):
                     collection = manager.chroma_client.get_collection(collection_name)
                 except Exception as e:
                     return {"success": False, "message": f"Collection '{collection_name}' not found: {str(e)}", "traceback": traceback.format_exc()}
-                import asyncio
-                results = await asyncio.to_thread(collection.get, limit=limit, offset=offset)
-                documents = results.get("documents", [])
+                from modules.tool_profiling import to_thread
+                try:
+                    start_offset, expected_last_id = decode_cursor(cursor) if cursor else (offset, None)
+                except ValueError as e:
+                    return {"success": False, "message": str(e)}
+                # カーソル直前の行が変わっていれば走査中に削除等で位置がずれている
+                cursor_consistent = True
+                if expected_last_id is not None and start_offset > 0:
+                    prev = await to_thread(collection.get, limit=1, offset=start_offset - 1, include=[])
+                    cursor_consistent = (prev.get("ids") or [None])[0] == expected_last_id
+                pager = CollectionPager(
+                    collection,
+                    include=include or ["documents", "metadatas"],
+                    page_size=limit,
+                    target_page_bytes=0,
+                    min_page_size=1,
+                    offset=start_offset,
+                    max_rows=limit
+                )
+                results = await to_thread(pager.fetch_page) or {}
+                documents = results.get("documents") or []
+                ids = results.get("ids") or []
                 return {
                     "success": True,
                     "collection_name": collection_name,
                     "documents": documents,
-                    "metadatas": results.get("metadatas", []),
-                    "ids": results.get("ids", []),
-                    "total_returned": len(documents) if documents is not None else 0
+                    "metadatas": results.get("metadatas") or [],
+                    "ids": ids,
+                    "total_returned": len(ids),
+                    "next_cursor": pager.cursor(),
+                    "cursor_consistent": cursor_consistent
                 }
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
@@ -198,9 +222,11 @@ def register_management_tools(mcp, manager):
                 return {"success": False, "message": "ChromaDB client not initialized"}
             try:
                 collection = manager.chroma_client.get_collection(collection_name)
-                import asyncio
-                document_count = await asyncio.to_thread(collection.count)
-                sample_results = await asyncio.to_thread(collection.get, min(5, document_count))
+                from modules.tool_profiling import to_thread
+                document_count = await to_thread(collection.count)
+                sample_results = await to_thread(
+                    manager.fetch, collection, tool="chroma_collection_stats", limit=min(5, document_count)
+                )
                 metadata_keys = set()
                 if sample_results.get("metadatas"):
                     for metadata in sample_results["metadatas"]:
@@ -211,7 +237,7 @@ def register_management_tools(mcp, manager):
                     "collection_name": collection_name,
                     "document_count": document_count,
                     "metadata_fields": list(metadata_keys),
-                    "sample_documents_count": len(sample_results.get("documents", [])),
+                    "sample_documents_count": len(sample_results.get("ids") or []),
                     "analysis_timestamp": datetime.now().isoformat()
                 }
             except Exception as e:
@@ -233,19 +259,32 @@ def register_management_tools(mcp, manager):
                 except:
                     target_coll = manager.chroma_client.create_collection(target_collection)
                     manager.collections[target_collection] = target_coll
-                    merged_count = 0
+                merged_count = 0
+                truncated_source = None
+                # 全ソースで1つのサイザーを共有し、ページをまたいでバッチ件数を調整する
+                sizer = AdaptiveBatchSizer.for_collection(target_coll, "add")
                 for source_name in source_collections:
                     try:
                         source_coll = manager.chroma_client.get_collection(source_name)
-                        results = source_coll.get()
-                        
-                        if results.get("documents"):
-                            target_coll.add(
-                                documents=results["documents"],
-                                metadatas=results.get("metadatas", []),
-                                ids=[f"{source_name}_{i}" for i in range(len(results["documents"]))]
-                            )
-                            merged_count += len(results["documents"])
+                        # ページ単位でコピー（ソース全件を一度に保持しない）
+                        copied = 0
+                        pager = CollectionPager(source_coll, include=["documents", "metadatas"])
+                        for page in pager:
+                            documents = page.get("documents") or []
+                            if documents:
+                                write_in_batches(
+                                    target_coll, "add",
+                                    [f"{source_name}_{copied + i}" for i in range(len(documents))],
+                                    sizer=sizer,
+                                    documents=documents,
+                                    metadatas=page.get("metadatas") or None
+                                )
+                                copied += len(documents)
+                        merged_count += copied
+                        if pager.truncated:
+                            # 締め切りで途中まで: コピーしきれていないソースは削除せず、残りのソースも処理しない
+                            truncated_source = source_name
+                            break
                         
                         if delete_sources:
                             manager.chroma_client.delete_collection(source_name)
@@ -255,12 +294,23 @@ def register_management_tools(mcp, manager):
                     except Exception as e:
                         continue
                 
+                if truncated_source is not None:
+                    return {
+                        "success": False,
+                        "truncated": True,
+                        "message": f"Stopped while copying '{truncated_source}'; it and the remaining sources were not deleted",
+                        "merged_documents": merged_count,
+                        "target_collection": target_collection,
+                        "sources_deleted": False,
+                        "batching": sizer.describe()
+                    }
                 return {
                     "success": True,
                     "message": f"Merged {len(source_collections)} collections into '{target_collection}'",
                     "merged_documents": merged_count,
                     "target_collection": target_collection,
-                    "sources_deleted": delete_sources
+                    "sources_deleted": delete_sources,
+                    "batching": sizer.describe()
                 }
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
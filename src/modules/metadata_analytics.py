@@ -0,0 +1,291 @@
+"""
+メタデータスキーマ分析（列指向）
+メタデータの1ページをそのままPolarsのフレームにし（キーごとの列）、ページ単位で
+キーごとの件数・型と(キー, 型, 値)ごとの出現数へ集計してから元の行は捨てる。
+積み上げるのは値の出現数だけで、キーごとのカバレッジ・型の揺れ（type drift）・カーディナリティ・
+値の分布は最後にその出現数から計算する
+
+コレクション全件でもPythonのdictを値ごとのループで走査せず、メモリも行数ではなく値の種類数に比例させるため。
+型は各ページの列の型で数える（1ページ内で型が混在した値はPolarsが共通の型にまとめるため、型の揺れはページ間の違いとして現れる）。
+Polarsがない環境では同じ結果形式を純Pythonで集計する（大規模コレクションでは低速）。
+"""
+
+from typing import Dict, Any, List, Optional, Iterable
+from collections import Counter, defaultdict
+
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    pl = None
+    POLARS_AVAILABLE = False
+
+DEFAULT_TOP_VALUES = 5
+DEFAULT_HISTOGRAM_BINS = 10
+DEFAULT_SAMPLE_VALUES = 3
+# カーディナリティ・頻出値の集計に使う値の最大文字数（長文メタデータでメモリを使い過ぎないため）
+MAX_VALUE_CHARS = 200
+# ページごとの値の出現数をこの行数まで溜めたら、それまでの合計と1つにまとめ直す
+FLUSH_ROWS = 200_000
+
+NUMERIC_TYPES = ("int", "float")
+
+
+def _value_type(value: Any) -> str:
+    return type(value).__name__
+
+
+def _polars_type(dtype) -> str:
+    """Polarsの列の型をPythonの型名へ"""
+    if dtype.is_integer():
+        return "int"
+    if dtype.is_float():
+        return "float"
+    if dtype == pl.Boolean:
+        return "bool"
+    if dtype == pl.String:
+        return "str"
+    return str(dtype)
+
+
+def _polars_text(name: str, dtype, limit: int):
+    """値の比較に使う文字列（純Python集計のstr(value)[:limit]と同じ表記）"""
+    column = pl.col(name)
+    if dtype == pl.Boolean:
+        text = pl.when(column.is_null()).then(None).when(column).then(pl.lit("True")).otherwise(pl.lit("False"))
+    else:
+        text = column.cast(pl.String)
+    return text.str.slice(0, limit).alias(name)
+
+
+class MetadataSchemaAnalyzer:
+    """
+    メタデータスキーマ分析器（add_page()でページを投入し、result()で集計）
+    Args:
+        top_values: キーごとに返す頻出値の件数
+        histogram_bins: 数値キーのヒストグラムの階級数
+        sample_values: キーごとのサンプル値の件数
+        max_value_chars: 値の比較に使う最大文字数
+        use_polars: Polarsで集計する（Falseまたは未インストール時は純Python）
+    """
+
+    def __init__(self,
+                 top_values: int = DEFAULT_TOP_VALUES,
+                 histogram_bins: int = DEFAULT_HISTOGRAM_BINS,
+                 sample_values: int = DEFAULT_SAMPLE_VALUES,
+                 max_value_chars: int = MAX_VALUE_CHARS,
+                 use_polars: bool = True):
+        self.top_values = top_values
+        self.histogram_bins = max(1, histogram_bins)
+        self.sample_values = sample_values
+        self.max_value_chars = max_value_chars
+        self.backend = "polars" if use_polars and POLARS_AVAILABLE else "python"
+        self.total_rows = 0
+        self.rows_with_metadata = 0
+        self.samples: Dict[str, List[Any]] = defaultdict(list)
+        self._key_rows: Counter = Counter()
+        self._type_counts: Dict[str, Counter] = defaultdict(Counter)
+        # Polars集計用（ページごとの(key, type, value, count)と、前回まとめてから溜めた行数）
+        self._value_frames: List[Any] = []
+        self._value_rows = 0
+        # 純Python集計用
+        self._value_counts: Dict[str, Counter] = defaultdict(Counter)
+        self._numeric: Dict[str, List[float]] = defaultdict(list)
+
+    def add_page(self, metadatas: Iterable[Optional[Dict[str, Any]]]) -> None:
+        """メタデータ1ページ分を投入"""
+        metadatas = list(metadatas)
+        if self.backend == "polars":
+            self._add_page_polars(metadatas)
+            return
+        limit = self.max_value_chars
+        for metadata in metadatas:
+            self.total_rows += 1
+            if not metadata:
+                continue
+            self.rows_with_metadata += 1
+            for key, value in metadata.items():
+                if len(self.samples[key]) < self.sample_values:
+                    self.samples[key].append(value)
+                value_type = _value_type(value)
+                self._key_rows[key] += 1
+                self._type_counts[key][value_type] += 1
+                self._value_counts[key][None if value is None else str(value)[:limit]] += 1
+                if value_type in NUMERIC_TYPES:
+                    self._numeric[key].append(float(value))
+
+    def _add_page_polars(self, metadatas: List[Optional[Dict[str, Any]]]) -> None:
+        self.total_rows += len(metadatas)
+        frame = pl.from_dicts([m or {} for m in metadatas], infer_schema_length=None, strict=False)
+        schema = {name: dtype for name, dtype in frame.schema.items() if dtype != pl.Null}
+        if not schema:
+            return
+        frame = frame.select(list(schema))
+        present = frame.select(pl.all().is_not_null().sum()).row(0, named=True)
+        self.rows_with_metadata += frame.select(pl.any_horizontal(pl.all().is_not_null()).sum()).item()
+        for name, dtype in schema.items():
+            if present[name]:
+                self._key_rows[name] += present[name]
+                self._type_counts[name][_polars_type(dtype)] += present[name]
+        self._collect_samples(metadatas, schema)
+
+        # 値の出現数（スカラー型の列のみ。ページの行はここで捨てる）
+        scalar = {name: dtype for name, dtype in schema.items() if dtype.is_numeric() or dtype in (pl.Boolean, pl.String)}
+        if not scalar:
+            return
+        counts = (
+            frame.select([_polars_text(name, dtype, self.max_value_chars) for name, dtype in scalar.items()])
+            .unpivot(variable_name="key", value_name="value")
+            .drop_nulls("value")
+            .group_by(["key", "value"]).agg(pl.len().cast(pl.Int64).alias("count"))
+            .join(pl.DataFrame({"key": list(scalar), "type": [_polars_type(d) for d in scalar.values()]}), on="key")
+            .select(["key", "type", "value", "count"])
+        )
+        self._value_frames.append(counts)
+        self._value_rows += counts.height
+        if self._value_rows >= FLUSH_ROWS:
+            self._compact()
+
+    def _collect_samples(self, metadatas: List[Optional[Dict[str, Any]]], keys: Iterable[str]) -> None:
+        """サンプル値が足りないキーだけ、元の値を先頭の行から拾う"""
+        needed = {key for key in keys if len(self.samples[key]) < self.sample_values}
+        for metadata in metadatas:
+            if not needed:
+                break
+            for key in needed.intersection(metadata or ()):
+                self.samples[key].append(metadata[key])
+                if len(self.samples[key]) >= self.sample_values:
+                    needed.discard(key)
+
+    def _compact(self) -> Any:
+        """ページごとの出現数を(key, type, value)ごとの合計1つにまとめる"""
+        if not self._value_frames:
+            return None
+        if len(self._value_frames) > 1:
+            merged = pl.concat(self._value_frames).group_by(["key", "type", "value"]).agg(pl.col("count").sum())
+            self._value_frames = [merged]
+        self._value_rows = 0
+        return self._value_frames[0]
+
+    def result(self) -> Dict[str, Any]:
+        """スキーマ分析結果（キーごとのfrequency/coverage_percent/data_types/type_counts/cardinality/top_values/numeric等）"""
+        key_details = self._polars_details() if self.backend == "polars" else self._python_details()
+        for key, detail in key_details.items():
+            detail["sample_values"] = self.samples.get(key, [])
+            detail["coverage_percent"] = round(detail["frequency"] / self.total_rows * 100, 2) if self.total_rows else 0.0
+            detail["type_drift"] = len(detail["type_counts"]) > 1
+            detail["dominant_type"] = max(detail["type_counts"], key=detail["type_counts"].get) if detail["type_counts"] else None
+            detail["data_types"] = list(detail["type_counts"])
+        drifting = sorted(key for key, detail in key_details.items() if detail["type_drift"])
+        return {
+            "backend": self.backend,
+            "total_rows": self.total_rows,
+            "total_metadata_entries": self.rows_with_metadata,
+            "total_unique_keys": len(key_details),
+            "keys_with_type_drift": drifting,
+            "key_details": dict(sorted(key_details.items(), key=lambda item: -item[1]["frequency"]))
+        }
+
+    def _histogram(self, values: List[float], low: float, high: float) -> List[Dict[str, Any]]:
+        bins = self.histogram_bins
+        width = (high - low) / bins if high > low else 0
+        counts = [0] * bins
+        for value in values:
+            index = int((value - low) / width) if width else 0
+            counts[min(max(index, 0), bins - 1)] += 1
+        return [{"lower": low + i * width, "upper": low + (i + 1) * width, "count": c} for i, c in enumerate(counts)]
+
+    def _python_details(self) -> Dict[str, Dict[str, Any]]:
+        details = {}
+        for key, frequency in self._key_rows.items():
+            values = self._value_counts[key]
+            detail: Dict[str, Any] = {
+                "frequency": frequency,
+                "type_counts": dict(self._type_counts[key].most_common()),
+                "cardinality": len(values),
+                "top_values": [{"value": v, "count": c} for v, c in values.most_common(self.top_values)]
+            }
+            numbers = self._numeric.get(key)
+            if numbers:
+                low, high = min(numbers), max(numbers)
+                detail["numeric"] = {
+                    "min": low, "max": high, "mean": round(sum(numbers) / len(numbers), 6),
+                    "histogram": self._histogram(numbers, low, high)
+                }
+            details[key] = detail
+        return details
+
+    def _polars_details(self) -> Dict[str, Dict[str, Any]]:
+        details: Dict[str, Dict[str, Any]] = {
+            key: {"frequency": frequency, "type_counts": dict(self._type_counts[key].most_common()),
+                  "cardinality": 0, "top_values": []}
+            for key, frequency in self._key_rows.items()
+        }
+        counts = self._compact()
+        if counts is None or not counts.height:
+            return details
+        per_value = counts.group_by(["key", "value"]).agg(pl.col("count").sum())
+
+        for row in per_value.group_by("key").agg(pl.len().alias("cardinality")).iter_rows(named=True):
+            details[row["key"]]["cardinality"] = row["cardinality"]
+
+        top = (
+            per_value.sort(["key", "count", "value"], descending=[False, True, False])
+            .group_by("key", maintain_order=True).head(self.top_values)
+        )
+        for row in top.iter_rows(named=True):
+            details[row["key"]]["top_values"].append({"value": row["value"], "count": row["count"]})
+
+        # 数値は値ごとの出現数で重み付けして集計する
+        numeric = (
+            counts.filter(pl.col("type").is_in(list(NUMERIC_TYPES)))
+            .with_columns(pl.col("value").cast(pl.Float64, strict=False).alias("num"))
+            .drop_nulls("num")
+        )
+        if numeric.height:
+            bins = self.histogram_bins
+            stats = numeric.group_by("key").agg(
+                pl.col("num").min().alias("min"), pl.col("num").max().alias("max"),
+                ((pl.col("num") * pl.col("count")).sum() / pl.col("count").sum()).alias("mean")
+            )
+            for row in stats.iter_rows(named=True):
+                details[row["key"]]["numeric"] = {
+                    "min": row["min"], "max": row["max"], "mean": round(row["mean"], 6),
+                    "histogram": [{"lower": row["min"] + i * (row["max"] - row["min"]) / bins,
+                                   "upper": row["min"] + (i + 1) * (row["max"] - row["min"]) / bins,
+                                   "count": 0} for i in range(bins)]
+                }
+            # 等幅階級への割り当てをキー単位でまとめて計算
+            binned = (
+                numeric.join(stats, on="key")
+                .with_columns(
+                    pl.when(pl.col("max") > pl.col("min"))
+                    .then(((pl.col("num") - pl.col("min")) / (pl.col("max") - pl.col("min")) * bins).floor().clip(0, bins - 1))
+                    .otherwise(0).cast(pl.Int64).alias("bin")
+                )
+                .group_by(["key", "bin"]).agg(pl.col("count").sum())
+            )
+            for row in binned.iter_rows(named=True):
+                details[row["key"]]["numeric"]["histogram"][row["bin"]]["count"] = row["count"]
+        return details
+
+
+def analyze_metadata_pages(pages: Iterable[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    """
+    collection.get()形式のページ列（CollectionPager等）からスキーマ分析
+    Args:
+        pages: "metadatas"を含むページのイテラブル
+        **kwargs: MetadataSchemaAnalyzerの引数
+    Returns: MetadataSchemaAnalyzer.result()
+    """
+    analyzer = MetadataSchemaAnalyzer(**kwargs)
+    for page in pages:
+        analyzer.add_page(page.get("metadatas") or [])
+    return analyzer.result()
+
+
+__all__ = [
+    "MetadataSchemaAnalyzer",
+    "analyze_metadata_pages",
+    "POLARS_AVAILABLE",
+]
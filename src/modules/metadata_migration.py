@@ -0,0 +1,283 @@
+"""
+メタデータ移行エンジン
+コレクションをページ単位で読み、ドキュメントごとの純粋な変換関数をプロセスプールで並列実行し、
+変更のあった行だけを上限件数つきのupdateバッチで書き戻す
+
+ページを書き終えるたびにチェックポイントファイルへ位置を記録するため、
+途中で落ちた移行は同じチェックポイントを指定して再実行すれば続きから再開できる。
+（get(limit, offset)は挿入順で並び、メタデータ更新では位置がずれないため、offsetで再開できる）
+
+変換関数の形式: transform(doc_id, document, metadata) -> 新しいメタデータ（変更なしはNone）
+batched=Trueの場合は transform([(doc_id, document, metadata), ...]) -> [新しいメタデータ, ...] をチャンク単位で呼ぶ
+（特徴量抽出などをドキュメント間でまとめて処理する変換向け）。
+プロセスプールで実行するため、変換関数はpickle可能であること（モジュール関数・pickle可能なオブジェクトのメソッド）。
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import time
+
+from modules.paging import CollectionPager
+from modules.batch_ops import AdaptiveBatchSizer, write_in_batches
+from modules.structured_logging import get_logger
+
+logger = get_logger("metadata_migration")
+
+DEFAULT_PAGE_SIZE = 1000
+# レポートに残すエラーの最大件数
+MAX_REPORTED_ERRORS = 100
+
+Transform = Callable[..., Any]
+Item = Tuple[str, Optional[str], Dict[str, Any]]
+Outcome = Tuple[str, Optional[Dict[str, Any]], Optional[str]]
+
+# ワーカープロセス側の変換関数（initializerで1回だけ受け取り、行ごとにpickleし直さない）
+_worker_transform: Optional[Transform] = None
+_worker_batched = False
+
+
+def _init_worker(transform: Transform, batched: bool) -> None:
+    global _worker_transform, _worker_batched
+    _worker_transform = transform
+    _worker_batched = batched
+
+
+def _apply(transform: Transform, item: Item) -> Outcome:
+    doc_id, document, metadata = item
+    try:
+        return doc_id, transform(doc_id, document, metadata), None
+    except Exception as e:
+        return doc_id, None, f"{type(e).__name__}: {e}"
+
+
+def _apply_chunk(transform: Transform, batched: bool, items: List[Item]) -> List[Outcome]:
+    if not batched:
+        return [_apply(transform, item) for item in items]
+    try:
+        results = transform(items)
+        return [(doc_id, result, None) for (doc_id, _, _), result in zip(items, results)]
+    except Exception as e:
+        if len(items) == 1:
+            return [(items[0][0], None, f"{type(e).__name__}: {e}")]
+        # 失敗したチャンクは1件ずつ再実行してエラーの行を特定する
+        return [outcome for item in items for outcome in _apply_chunk(transform, True, [item])]
+
+
+def _apply_chunk_in_worker(items: List[Item]) -> List[Outcome]:
+    return _apply_chunk(_worker_transform, _worker_batched, items)
+
+
+class MigrationCheckpoint:
+    """
+    移行の再開位置（JSONファイル）
+    Args:
+        path: チェックポイントファイルのパス
+        name: 移行名（別の移行のチェックポイントを誤って再利用しないための照合用）
+        collection_name: 対象コレクション名
+    """
+
+    def __init__(self, path: str, name: str, collection_name: str):
+        self.path = Path(path)
+        self.name = name
+        self.collection_name = collection_name
+        self.state: Dict[str, Any] = {}
+
+    def load(self) -> Dict[str, Any]:
+        """保存済みの状態（なし・別移行のものは空dict）"""
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("name") != self.name or state.get("collection") != self.collection_name:
+            logger.warning("Ignoring checkpoint for another migration", extra={
+                "path": str(self.path), "name": state.get("name"), "collection": state.get("collection")
+            })
+            return {}
+        self.state = state
+        return state
+
+    def save(self, **fields) -> None:
+        """状態を更新して書き込み（一時ファイル経由で置き換え、書き込み途中で落ちても壊さない）"""
+        self.state.update(fields, name=self.name, collection=self.collection_name, updated_at=datetime.now().isoformat())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+
+class MetadataMigration:
+    """
+    バッチ・再開可能なメタデータ移行
+    Args:
+        collection: 対象コレクション
+        transform: ドキュメントごとの変換関数（pickle可能な純粋関数）
+        name: 移行名（チェックポイントの照合・ログ用）
+        batch_size: 1回のupdateの件数（None=自動調整。いずれもクライアントの上限件数以内）
+        page_size: 読み込みページの初期件数
+        workers: 変換のプロセス数（0・1でプロセスプールを使わず同一プロセスで実行）
+        checkpoint_path: チェックポイントファイル（Noneで再開なし）
+        on_result: 親プロセスで行ごとに呼ぶ集計用コールバック(doc_id, old_metadata, new_metadata)
+        on_progress: ページ処理ごとに呼ぶ進捗コールバック(report)
+        batched: transformがアイテムのリストを受け取り、結果のリストを返す
+        chunk_size: 1回の変換呼び出し（ワーカーへの受け渡し）の件数（Noneでページとワーカー数から決定）
+    """
+
+    def __init__(self, collection, transform: Transform,
+                 name: str = "metadata_migration",
+                 batch_size: Optional[int] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 workers: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None,
+                 on_result: Optional[Callable[[str, Dict[str, Any], Optional[Dict[str, Any]]], None]] = None,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 batched: bool = False,
+                 chunk_size: Optional[int] = None):
+        self.collection = collection
+        self.transform = transform
+        self.name = name
+        self.batch_size = max(1, batch_size) if batch_size else None
+        self.sizer: Optional[AdaptiveBatchSizer] = None
+        self.page_size = max(1, page_size)
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else max(0, workers)
+        self.checkpoint_path = checkpoint_path
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.batched = batched
+        self.chunk_size = chunk_size
+
+    def _collection_name(self) -> str:
+        return str(getattr(self.collection, "name", "collection"))
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 1:
+            return None
+        try:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=(self.transform, self.batched))
+        except Exception as e:
+            logger.warning("Process pool unavailable, transforming in-process", extra={"error": str(e)})
+            return None
+
+    def _transform_page(self, executor, items: List[Item]) -> List[Outcome]:
+        size = self.chunk_size or (len(items) if executor is None else max(1, len(items) // (self.workers * 4)))
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        if executor is None:
+            results = [_apply_chunk(self.transform, self.batched, chunk) for chunk in chunks]
+        else:
+            results = executor.map(_apply_chunk_in_worker, chunks)
+        return [outcome for chunk in results for outcome in chunk]
+
+    def _write(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        if self.sizer is None:
+            self.sizer = AdaptiveBatchSizer.for_collection(self.collection, "update", batch_size=self.batch_size)
+        return write_in_batches(self.collection, "update", ids, sizer=self.sizer, metadatas=metadatas)["written"]
+
+    def run(self, dry_run: bool = True) -> Dict[str, Any]:
+        """
+        移行を実行（dry_run時は書き込み・チェックポイント記録を行わない）
+        Returns: 移行レポート（processed/changed/written/errors/resumed_from/completed等）
+        """
+        started = time.perf_counter()
+        checkpoint = None
+        state: Dict[str, Any] = {}
+        if self.checkpoint_path and not dry_run:
+            checkpoint = MigrationCheckpoint(self.checkpoint_path, self.name, self._collection_name())
+            state = checkpoint.load()
+        resumed_from = int(state.get("offset", 0))
+        resumed_processed = int(state.get("processed", 0))
+
+        report: Dict[str, Any] = {
+            "name": self.name,
+            "dry_run": dry_run,
+            "total_documents": self.collection.count(),
+            "resumed_from": resumed_from,
+            "processed": resumed_processed,
+            "changed": int(state.get("changed", 0)),
+            "written": int(state.get("written", 0)),
+            "error_count": int(state.get("error_count", 0)),
+            "errors": [],
+            "completed": False,
+            "workers": self.workers
+        }
+        if resumed_from:
+            logger.info("Resuming migration from checkpoint", extra={"migration": self.name, "offset": resumed_from})
+
+        # ページ＝チェックポイントの単位なので、自動調整でページを大きくしすぎない
+        pager = CollectionPager(self.collection, include=["documents", "metadatas"],
+                                page_size=self.page_size, max_page_size=self.page_size, offset=resumed_from)
+        executor = self._executor()
+        try:
+            for page in pager:
+                ids = page.get("ids") or []
+                documents = page.get("documents") or [None] * len(ids)
+                metadatas = page.get("metadatas") or [None] * len(ids)
+                items = [(doc_id, documents[i], dict(metadatas[i]) if metadatas[i] else {}) for i, doc_id in enumerate(ids)]
+
+                changed_ids: List[str] = []
+                changed_metadatas: List[Dict[str, Any]] = []
+                for (doc_id, new_metadata, error), (_, _, old_metadata) in zip(self._transform_page(executor, items), items):
+                    report["processed"] += 1
+                    if error:
+                        report["error_count"] += 1
+                        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                            report["errors"].append({"document_id": doc_id, "error": error})
+                        continue
+                    if self.on_result is not None:
+                        self.on_result(doc_id, old_metadata, new_metadata)
+                    if new_metadata is not None and new_metadata != old_metadata:
+                        changed_ids.append(doc_id)
+                        changed_metadatas.append(new_metadata)
+                report["changed"] += len(changed_ids)
+
+                if not dry_run and changed_ids:
+                    try:
+                        report["written"] += self._write(changed_ids, changed_metadatas)
+                    except Exception as e:
+                        # このページの位置は記録しない（再実行時にこのページから再開）
+                        report["errors"].append({"operation": "update", "offset": pager.offset - len(ids), "error": str(e)})
+                        report["error_count"] += 1
+                        logger.error("Migration write failed", extra={"migration": self.name, "error": str(e)})
+                        return report
+                if checkpoint is not None:
+                    checkpoint.save(offset=pager.offset, processed=report["processed"], changed=report["changed"],
+                                    written=report["written"], error_count=report["error_count"])
+                if self.on_progress is not None:
+                    self.on_progress(report)
+            report["completed"] = True
+            if checkpoint is not None:
+                checkpoint.clear()
+            return report
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            seconds = time.perf_counter() - started
+            processed_now = report["processed"] - resumed_processed
+            report["seconds"] = round(seconds, 3)
+            report["docs_per_second"] = round(processed_now / seconds, 1) if seconds > 0 else None
+            if self.sizer is not None:
+                report["batching"] = self.sizer.describe()
+            logger.info("Migration finished", extra={
+                "migration": self.name, "dry_run": dry_run, "completed": report["completed"],
+                "processed": report["processed"], "written": report["written"], "seconds": report["seconds"]
+            })
+
+
+def run_migration(collection, transform: Transform, dry_run: bool = True, **kwargs) -> Dict[str, Any]:
+    """MetadataMigrationを作成して実行する簡易関数"""
+    return MetadataMigration(collection, transform, **kwargs).run(dry_run=dry_run)
+
+
+__all__ = [
+    "MetadataMigration",
+    "MigrationCheckpoint",
+    "run_migration",
+]
@@ -0,0 +1,471 @@
+"""
+運用メトリクスの時系列ストア
+ツールのレイテンシ・取り込み行数・コレクション件数・メモリ・ディスク使用量を一定間隔で記録し、
+外部の監視基盤なしでChromaDBディレクトリの容量計画ができるようにする（chroma_metrics_queryで参照）
+
+- raw/YYYY-MM-DD.jsonl: 記録ごとの1行（追記のみ）。metrics.history_raw_retention_days日を過ぎた日は削除
+- hourly.jsonl: 完了した1時間ごとのロールアップ（メトリクスごとに[件数, 合計, 最小, 最大, 最後の値]、追記のみ・無期限）
+
+ロールアップは「hourly.jsonlの最終時刻より後で、現在の時間より前」のrawを集計して追記するため、
+プロセスが途中で落ちても次回起動後の最初の記録で取りこぼさずに作り直される。
+設定: metrics.history_enabled / metrics.history_interval（秒）/ metrics.history_dir / metrics.history_raw_retention_days
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+from modules.structured_logging import get_logger, LOG_DIR
+
+logger = get_logger("metrics_history")
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_RAW_RETENTION_DAYS = 7
+HOUR = 3600
+DAY = 86400
+# 1回の問い合わせで返す時間窓の上限
+MAX_WINDOWS = 500
+# [件数, 合計, 最小, 最大, 最後の値]
+Aggregate = List[float]
+
+
+def _merge(target: Optional[Aggregate], source: Aggregate) -> Aggregate:
+    """集計値を時刻順にマージ（sourceの方が新しい）"""
+    if target is None:
+        return list(source)
+    return [target[0] + source[0], target[1] + source[1], min(target[2], source[2]), max(target[3], source[3]), source[4]]
+
+
+def _point(value: float) -> Aggregate:
+    return [1, value, value, value, value]
+
+
+def _last_line(path: Path) -> Optional[str]:
+    """ファイル末尾の1行（全体を読まずに後ろから探す）"""
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        chunk = 8192
+        while True:
+            start = max(0, end - chunk)
+            f.seek(start)
+            lines = f.read(end - start).rstrip(b"\n").split(b"\n")
+            if len(lines) > 1 or start == 0:
+                return lines[-1].decode("utf-8") if lines[-1] else None
+            chunk *= 4
+
+
+class MetricsHistoryStore:
+    """
+    追記型の時系列ストア（スレッドセーフ・ディレクトリは最初の書き込み/読み込み時に作成）
+    Args:
+        directory: 保存先ディレクトリ
+        raw_retention_days: rawを保持する日数
+    """
+
+    def __init__(self, directory: str, raw_retention_days: int = DEFAULT_RAW_RETENTION_DAYS):
+        self.directory = Path(directory)
+        self.raw_retention_days = max(1, int(raw_retention_days))
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_rolled_hour: Optional[int] = None
+        self._current_hour: Optional[int] = None
+
+    @property
+    def raw_dir(self) -> Path:
+        return self.directory / "raw"
+
+    @property
+    def hourly_path(self) -> Path:
+        return self.directory / "hourly.jsonl"
+
+    def _raw_path(self, timestamp: float) -> Path:
+        return self.raw_dir / f"{datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')}.jsonl"
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        line = _last_line(self.hourly_path)
+        if line:
+            try:
+                self._last_rolled_hour = int(json.loads(line)["t"])
+            except (ValueError, KeyError):
+                logger.warning("Unreadable last hourly rollup line", extra={"path": str(self.hourly_path)})
+        self._loaded = True
+
+    @staticmethod
+    def _read_lines(path: Path) -> Iterable[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最終行など
+                        continue
+        except FileNotFoundError:
+            return
+
+    def _raw_records(self, start: float, end: float) -> Iterable[Dict[str, Any]]:
+        """[start, end)のraw記録（日付ファイルを古い順に）"""
+        day = datetime.fromtimestamp(start).date()
+        last_day = datetime.fromtimestamp(end).date()
+        while day <= last_day:
+            for record in self._read_lines(self.raw_dir / f"{day.isoformat()}.jsonl"):
+                if start <= record.get("t", 0) < end:
+                    yield record
+            day += timedelta(days=1)
+
+    def _earliest_raw(self) -> Optional[float]:
+        files = sorted(self.raw_dir.glob("*.jsonl"))
+        for path in files:
+            for record in self._read_lines(path):
+                return float(record["t"])
+        return None
+
+    def _rollup(self, now: float) -> int:
+        """完了した時間のうち未ロールアップの分を集計してhourly.jsonlへ追記（追記した時間数）"""
+        current_hour = int(now // HOUR * HOUR)
+        start = self._last_rolled_hour + HOUR if self._last_rolled_hour is not None else self._earliest_raw()
+        if start is None or start >= current_hour:
+            return 0
+        hours: Dict[int, Dict[str, Aggregate]] = {}
+        for record in self._raw_records(start, current_hour):
+            hour = hours.setdefault(int(record["t"] // HOUR * HOUR), {})
+            for name, value in record.get("v", {}).items():
+                hour[name] = _merge(hour.get(name), _point(value))
+        if hours:
+            with open(self.hourly_path, "a", encoding="utf-8") as f:
+                for hour in sorted(hours):
+                    f.write(json.dumps({"t": hour, "v": hours[hour]}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._last_rolled_hour = current_hour - HOUR
+        return len(hours)
+
+    def _prune(self, now: float) -> None:
+        cutoff = (datetime.fromtimestamp(now) - timedelta(days=self.raw_retention_days)).strftime("%Y-%m-%d")
+        for path in self.raw_dir.glob("*.jsonl"):
+            if path.stem < cutoff:
+                path.unlink()
+
+    def append(self, values: Dict[str, float], timestamp: Optional[float] = None) -> None:
+        """1回分のメトリクスを追記（時間が変わったらロールアップと古いrawの削除も行う）"""
+        now = timestamp if timestamp is not None else time.time()
+        values = {name: float(value) for name, value in values.items() if isinstance(value, (int, float))}
+        with self._lock:
+            self._load()
+            hour = int(now // HOUR * HOUR)
+            if hour != self._current_hour:
+                self._rollup(now)
+                self._prune(now)
+                self._current_hour = hour
+            if values:
+                with open(self._raw_path(now), "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"t": round(now, 3), "v": values}, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def query(self, metrics: Optional[List[str]] = None, since_seconds: float = DAY,
+              window_seconds: float = HOUR, until: Optional[float] = None) -> Dict[str, Any]:
+        """
+        時間窓ごとの集計
+        Args:
+            metrics: メトリクス名のパターン（fnmatch、Noneで全て）
+            since_seconds: 何秒前からを対象にするか
+            window_seconds: 集計する時間窓の秒数（1時間以上、またはrawの保持期間より前を含む場合は時間ロールアップを使う）
+            until: 終了時刻（epoch秒、Noneで現在）
+        Returns: {"source", "start", "end", "window_seconds",
+                  "metrics": {名前: {"windows": [...], "first_window_mean", "last_window_mean", "last", "change", "change_per_day"}}}
+        """
+        end = until if until is not None else time.time()
+        raw_limit = end - self.raw_retention_days * DAY
+        use_hourly = window_seconds >= HOUR or end - since_seconds < raw_limit
+        window_seconds = max(1, window_seconds, -(-since_seconds // MAX_WINDOWS))
+        if use_hourly:
+            window_seconds = -(-window_seconds // HOUR) * HOUR
+        # 窓の境界をwindow_secondsの倍数にそろえる（時間ロールアップが窓をまたがないように）
+        start = (end - since_seconds) // window_seconds * window_seconds
+
+        def matches(name: str) -> bool:
+            return metrics is None or any(fnmatch(name, pattern) for pattern in metrics)
+
+        windows: Dict[str, Dict[int, Aggregate]] = {}
+
+        def add(name: str, timestamp: float, aggregate: Aggregate) -> None:
+            index = int((timestamp - start) // window_seconds)
+            series = windows.setdefault(name, {})
+            series[index] = _merge(series.get(index), aggregate)
+
+        with self._lock:
+            self._load()
+            raw_from = start
+            if use_hourly:
+                for record in self._read_lines(self.hourly_path):
+                    if start <= record["t"] < end:
+                        for name, aggregate in record["v"].items():
+                            if matches(name):
+                                add(name, record["t"], aggregate)
+                # ロールアップ済みでない直近の時間はrawから補う
+                if self._last_rolled_hour is not None:
+                    raw_from = max(start, self._last_rolled_hour + HOUR)
+            for record in self._raw_records(raw_from, end):
+                for name, value in record.get("v", {}).items():
+                    if matches(name):
+                        add(name, record["t"], _point(value))
+
+        result: Dict[str, Any] = {}
+        for name in sorted(windows):
+            series = windows[name]
+            rows = [{
+                "start": datetime.fromtimestamp(start + index * window_seconds).isoformat(),
+                "count": int(agg[0]),
+                "mean": round(agg[1] / agg[0], 4) if agg[0] else None,
+                "min": agg[2],
+                "max": agg[3],
+                "sum": round(agg[1], 4),
+                "last": agg[4]
+            } for index, agg in sorted(series.items())]
+            first, last = series[min(series)], series[max(series)]
+            span_days = (max(series) - min(series)) * window_seconds / DAY
+            # 最初と最後の窓の平均の差（件数・サイズ等のゲージの増加量）
+            change = round(last[1] / last[0] - first[1] / first[0], 4) if first[0] and last[0] else None
+            result[name] = {
+                "windows": rows,
+                "first_window_mean": rows[0]["mean"],
+                "last_window_mean": rows[-1]["mean"],
+                "last": last[4],
+                "change": change,
+                "change_per_day": round(change / span_days, 4) if change is not None and span_days > 0 else None
+            }
+        return {
+            "source": "hourly" if use_hourly else "raw",
+            "start": datetime.fromtimestamp(start).isoformat(),
+            "end": datetime.fromtimestamp(end).isoformat(),
+            "window_seconds": window_seconds,
+            "metrics": result
+        }
+
+    def metric_names(self) -> List[str]:
+        """直近の記録に含まれるメトリクス名"""
+        with self._lock:
+            self._load()
+            for path in sorted(self.raw_dir.glob("*.jsonl"), reverse=True):
+                line = _last_line(path)
+                if line:
+                    try:
+                        return sorted(json.loads(line).get("v", {}))
+                    except ValueError:
+                        continue
+        return []
+
+    def disk_usage(self) -> Dict[str, Any]:
+        files = list(self.raw_dir.glob("*.jsonl")) + ([self.hourly_path] if self.hourly_path.exists() else [])
+        return {"directory": str(self.directory), "files": len(files), "bytes": sum(p.stat().st_size for p in files)}
+
+
+def directory_size(path: Optional[str]) -> Optional[int]:
+    """ディレクトリ配下のファイルサイズ合計"""
+    if not path or not os.path.isdir(path):
+        return None
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+    return total
+
+
+class MetricsHistoryRecorder:
+    """
+    managerの計測値を一定間隔でストアへ記録するバックグラウンドスレッド
+    記録するメトリクス:
+        tool.<名前>.calls / .mean_ms / .errors（区間内の呼び出しがあったツールのみ）、tools.calls / tools.mean_ms / tools.errors
+        collection.<名前>.count / collections.total_documents
+        ingest.<操作>_rows / ingest.rows_per_sec（このプロセスで書き込んだ行数）
+        resources.*（リソースサンプラーの直近値。サンプラー無効時は記録しない）/ storage.dir_bytes（ChromaDBディレクトリの合計サイズ）
+    Args:
+        manager: ChromaDBManager
+        store: 記録先
+        interval: 記録間隔（秒）
+    """
+
+    def __init__(self, manager, store: MetricsHistoryStore, interval: float = DEFAULT_INTERVAL):
+        self.manager = manager
+        self.store = store
+        self.interval = max(1.0, float(interval))
+        self.enabled = True
+        self.records = 0
+        self.last_error: Optional[str] = None
+        self._previous_tools: Dict[str, Tuple[int, float, int]] = {}
+        self._previous_rows: Dict[str, int] = {}
+        self._previous_time: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, manager) -> "MetricsHistoryRecorder":
+        directory = LOG_DIR / "metrics"
+        retention = DEFAULT_RAW_RETENTION_DAYS
+        interval = DEFAULT_INTERVAL
+        enabled = True
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            enabled = bool(settings.get_setting("metrics.history_enabled", True))
+            interval = float(settings.get_setting("metrics.history_interval", DEFAULT_INTERVAL))
+            retention = int(settings.get_setting("metrics.history_raw_retention_days", DEFAULT_RAW_RETENTION_DAYS))
+            directory = Path(settings.get_setting("metrics.history_dir", None) or directory)
+        except Exception:
+            pass
+        recorder = cls(manager, MetricsHistoryStore(str(directory), retention), interval)
+        recorder.enabled = enabled
+        return recorder
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "MetricsHistoryRecorder":
+        """バックグラウンドスレッドで記録を開始（無効設定時・起動済みなら何もしない）"""
+        if not self.enabled or self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-history", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.record()
+
+    @staticmethod
+    def _delta(current: float, previous: float) -> float:
+        # リセット（chroma_performance_stats(reset=True)等）で累計が減った場合は現在値を区間分とする
+        return current - previous if current >= previous else current
+
+    def _tool_values(self) -> Dict[str, float]:
+        from modules.tool_metrics import registry
+        values: Dict[str, float] = {}
+        calls_total, ms_total, errors_total = 0, 0.0, 0
+        current = {}
+        for row in registry.snapshot(sort_by="calls")["tools"]:
+            name = row["tool"]
+            current[name] = (row["calls"], row["total_ms"], row["errors"])
+            previous = self._previous_tools.get(name, (0, 0.0, 0))
+            calls = self._delta(row["calls"], previous[0])
+            if not calls:
+                continue
+            total_ms = self._delta(row["total_ms"], previous[1])
+            errors = self._delta(row["errors"], previous[2])
+            values[f"tool.{name}.calls"] = calls
+            values[f"tool.{name}.mean_ms"] = round(total_ms / calls, 3)
+            if errors:
+                values[f"tool.{name}.errors"] = errors
+            calls_total += calls
+            ms_total += total_ms
+            errors_total += errors
+        self._previous_tools = current
+        values["tools.calls"] = calls_total
+        values["tools.errors"] = errors_total
+        if calls_total:
+            values["tools.mean_ms"] = round(ms_total / calls_total, 3)
+        return values
+
+    def _collection_values(self, elapsed: Optional[float]) -> Dict[str, float]:
+        manager = self.manager
+        values: Dict[str, float] = {}
+        if manager.initialized and manager.chroma_client is not None:
+            counts = manager.collection_counts()
+            for name, count in counts.items():
+                values[f"collection.{name}.count"] = count
+            values["collections.total_documents"] = sum(counts.values())
+        rows = manager.stats.rows_written()
+        written = 0
+        for op, total in rows.items():
+            delta = self._delta(total, self._previous_rows.get(op, 0))
+            values[f"ingest.{op}_rows"] = delta
+            if op in ("add", "upsert"):
+                written += delta
+        self._previous_rows = rows
+        if elapsed:
+            values["ingest.rows_per_sec"] = round(written / elapsed, 3)
+        return values
+
+    def _resource_values(self) -> Dict[str, float]:
+        resources = getattr(self.manager, "resources", None)
+        if resources is None:
+            return {}
+        values = {}
+        # サンプラーを無効にしている場合は resources.* を記録しない（storage.dir_bytes は記録する）
+        if resources.enabled:
+            latest = resources.latest()
+            values = {f"resources.{field}": latest[field] for field in (
+                "cpu_percent", "process_cpu_percent", "memory_percent", "rss_mb", "open_handles",
+                "disk_used_gb", "disk_percent", "sqlite_bytes"
+            ) if isinstance(latest.get(field), (int, float))}
+        dir_bytes = directory_size(resources.db_path)
+        if dir_bytes is not None:
+            values["storage.dir_bytes"] = dir_bytes
+        return values
+
+    def collect(self) -> Dict[str, float]:
+        """1回分のメトリクスを集める（記録はしない）"""
+        now = time.time()
+        elapsed = now - self._previous_time if self._previous_time is not None else None
+        self._previous_time = now
+        values: Dict[str, float] = {}
+        for collector in (self._tool_values, lambda: self._collection_values(elapsed), self._resource_values):
+            try:
+                values.update(collector())
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("Metrics collection failed", extra={"error": str(e)})
+        return values
+
+    def record(self) -> Dict[str, float]:
+        """集めてストアへ追記"""
+        values = self.collect()
+        try:
+            self.store.append(values)
+            self.records += 1
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning("Metrics history write failed", extra={"error": str(e), "directory": str(self.store.directory)})
+        return values
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "records_this_process": self.records,
+            "raw_retention_days": self.store.raw_retention_days,
+            "last_error": self.last_error
+        }
+
+
+__all__ = [
+    "MetricsHistoryStore",
+    "MetricsHistoryRecorder",
+    "directory_size",
+]
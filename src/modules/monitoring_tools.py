@@ -5,19 +5,21 @@
 
 from typing import Dict, List, Optional, Any
 import os
-import platform
-import psutil
 from datetime import datetime
 from config.global_settings import GlobalSettings
+from modules.tool_metrics import registry as metrics_registry
+from modules.tool_profiling import config as profiling_config
 
 
 def register_monitoring_tools(mcp, manager):
     """監視・診断関連ツールを登録"""
     
     @mcp.tool()
-    def chroma_system_diagnostics() -> Dict[str, Any]:
+    def chroma_system_diagnostics(trend_seconds: int = 0) -> Dict[str, Any]:
         """
         システム診断とトラブルシューティング情報
+        Args:
+            trend_seconds: 直近この秒数分のリソース推移も返す（0で現在値のみ）
         Returns: 診断結果
         """
         try:
@@ -29,7 +31,8 @@ def register_monitoring_tools(mcp, manager):
                 "health_checks": {}
             }
             
-            # システム情報
+            # システム情報（platformは呼び出し時に読み込む）
+            import platform
             diagnostics["system_info"] = {
                 "platform": platform.platform(),
                 "python_version": platform.python_version(),
@@ -38,41 +41,26 @@ def register_monitoring_tools(mcp, manager):
                 "hostname": platform.node()
             }
             
-            # リソース使用状況
+            # リソース使用状況（バックグラウンド採取済みの直近値を読むだけでブロックしない）
             try:
-                cpu_percent = psutil.cpu_percent(interval=1)
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                
-                diagnostics["resource_usage"] = {
-                    "cpu_percent": cpu_percent,
-                    "memory_total_gb": round(memory.total / (1024**3), 2),
-                    "memory_used_gb": round(memory.used / (1024**3), 2),
-                    "memory_percent": memory.percent,
-                    "disk_total_gb": round(disk.total / (1024**3), 2),
-                    "disk_used_gb": round(disk.used / (1024**3), 2),
-                    "disk_percent": round((disk.used / disk.total) * 100, 2)
-                }
-            except:
-                diagnostics["resource_usage"] = {"error": "Could not retrieve resource information"}
+                resources = manager.resources
+                diagnostics["resource_usage"] = resources.latest()
+                diagnostics["resource_sampler"] = resources.status()
+                if trend_seconds > 0:
+                    diagnostics["resource_trends"] = resources.trends(trend_seconds)
+            except Exception as e:
+                diagnostics["resource_usage"] = {"error": f"Could not retrieve resource information: {e}"}
             
             # ChromaDB状態
             if manager.initialized:
                 try:
-                    collections = manager.chroma_client.list_collections()
-                    total_docs = 0
-                    
-                    for collection in collections:
-                        try:
-                            col = manager.chroma_client.get_collection(collection.name)
-                            total_docs += col.count()
-                        except:
-                            pass
+                    # 件数は統計ストアから（コレクションごとのcount()は行わない）
+                    counts = manager.collection_counts()
                     
                     diagnostics["chromadb_status"] = {
                         "initialized": True,
-                        "total_collections": len(collections),
-                        "total_documents": total_docs,
+                        "total_collections": len(counts),
+                        "total_documents": sum(counts.values()),
                         "connection_healthy": True
                     }
                 except Exception as e:
@@ -122,9 +110,11 @@ def register_monitoring_tools(mcp, manager):
             return {"success": False, "error": str(e)}
     
     @mcp.tool()
-    def chroma_process_status() -> Dict[str, Any]:
+    def chroma_process_status(trend_seconds: int = 0) -> Dict[str, Any]:
         """
         ChromaDBプロセス状況確認（環境問わず安全）
+        Args:
+            trend_seconds: 直近この秒数分のプロセスリソース推移も返す（0で現在値のみ）
         """
         try:
             status_info = {
@@ -145,17 +135,26 @@ def register_monitoring_tools(mcp, manager):
                 except Exception as e:
                     status_info["connection_error"] = str(e)
             
-            # プロセス情報（安全な方法）
+            # プロセス情報（バックグラウンド採取済みの直近値）
             try:
-                current_process = psutil.Process()
+                latest = manager.resources.latest()
                 status_info["process_info"] = {
-                    "pid": current_process.pid,
-                    "memory_mb": round(current_process.memory_info().rss / (1024*1024), 2),
-                    "cpu_percent": current_process.cpu_percent(),
-                    "create_time": datetime.fromtimestamp(current_process.create_time()).isoformat()
+                    "pid": os.getpid(),
+                    "memory_mb": latest.get("rss_mb"),
+                    "cpu_percent": latest.get("process_cpu_percent"),
+                    "open_handles": latest.get("open_handles"),
+                    "read_bytes_per_sec": latest.get("read_bytes_per_sec"),
+                    "write_bytes_per_sec": latest.get("write_bytes_per_sec"),
+                    "sqlite_files": latest.get("sqlite_files", {}),
+                    "create_time": manager.resources.process_started_at,
+                    "sampled_at": latest.get("timestamp")
                 }
-            except:
-                status_info["process_info"] = {"error": "Could not retrieve process information"}
+                if trend_seconds > 0:
+                    status_info["trends"] = manager.resources.trends(trend_seconds, fields=(
+                        "process_cpu_percent", "rss_mb", "read_bytes_per_sec", "write_bytes_per_sec", "open_handles", "sqlite_bytes"
+                    ))
+            except Exception as e:
+                status_info["process_info"] = {"error": f"Could not retrieve process information: {e}"}
             
             return {
                 "success": True,
@@ -223,42 +222,32 @@ def register_monitoring_tools(mcp, manager):
             if not manager.initialized:
                 manager.safe_initialize()
             
-            collections = manager.chroma_client.list_collections()
+            # 件数は統計ストアから（コレクションごとのcount()は行わない）
+            counts = manager.collection_counts()
             collection_info = []
             
-            total_collections = len(collections)
+            total_collections = len(counts)
             total_documents = 0
             empty_collections = 0
             small_collections = 0
             
-            for collection in collections:
-                try:
-                    col = manager.chroma_client.get_collection(collection.name)
-                    doc_count = col.count()
-                    total_documents += doc_count
-                    
-                    col_info = {
-                        "name": collection.name,
-                        "document_count": doc_count,
-                        "status": "normal"
-                    }
-                    
-                    if doc_count == 0:
-                        empty_collections += 1
-                        col_info["status"] = "empty"
-                    elif doc_count < 10:
-                        small_collections += 1
-                        col_info["status"] = "small"
-                    
-                    collection_info.append(col_info)
-                    
-                except Exception as e:
-                    collection_info.append({
-                        "name": collection.name,
-                        "document_count": 0,
-                        "status": "error",
-                        "error": str(e)
-                    })
+            for name, doc_count in counts.items():
+                total_documents += doc_count
+                
+                col_info = {
+                    "name": name,
+                    "document_count": doc_count,
+                    "status": "normal"
+                }
+                
+                if doc_count == 0:
+                    empty_collections += 1
+                    col_info["status"] = "empty"
+                elif doc_count < 10:
+                    small_collections += 1
+                    col_info["status"] = "small"
+                
+                collection_info.append(col_info)
             
             # 分析と推奨事項
             recommendations = []
@@ -317,6 +306,7 @@ def register_monitoring_tools(mcp, manager):
                     "backup_directory": manager.config_manager.config.get('backup_directory', './backups')
                 }
             
+            import platform
             settings["environment_info"] = {
                 "manager_initialized": manager.initialized,
                 "python_version": platform.python_version(),
@@ -330,3 +320,84 @@ def register_monitoring_tools(mcp, manager):
             
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_performance_stats(
+        tool_name: Optional[str] = None,
+        sort_by: str = "total_ms",
+        top: int = 20,
+        include_idle: bool = False,
+        reset: bool = False,
+        prometheus_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ツールごとの呼び出し回数・エラー数・レイテンシ(p50/p95/p99)・ペイロードサイズ・同時実行数
+        （埋め込みプロバイダーの処理件数・キャッシュヒット・スループットも併記）
+        Args:
+            tool_name: 特定ツールのみ表示
+            sort_by: 並べ替えキー（total_ms, p95_ms, calls, errors, avg_response_bytes等）
+            top: 表示件数
+            include_idle: 未呼び出しのツールも表示
+            reset: 表示後に集計値をリセット
+            prometheus_path: 指定時はPrometheusテキスト形式でも書き出す
+        Returns: 計測結果
+        """
+        try:
+            stats = metrics_registry.snapshot(tool_name=tool_name, sort_by=sort_by, top=top, include_idle=include_idle)
+            if manager.embedding_provider is not None:
+                stats["embedding"] = manager.embedding_provider.stats()
+            if prometheus_path:
+                stats["prometheus_file"] = metrics_registry.write_prometheus(prometheus_path)
+            if reset:
+                metrics_registry.reset()
+            return {"success": True, **stats}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_metrics_query(
+        metrics: Optional[List[str]] = None,
+        since_hours: float = 24.0,
+        window_minutes: float = 60.0,
+        list_metrics: bool = False
+    ) -> Dict[str, Any]:
+        """
+        運用メトリクスの時系列を時間窓ごとに集計（ツールレイテンシ・取り込み行数・コレクション件数・メモリ・ディスク増加）
+        Args:
+            metrics: メトリクス名のパターン（例: ["storage.dir_bytes", "tool.*.mean_ms"]、省略で全て）
+            since_hours: 何時間前からを対象にするか
+            window_minutes: 集計する時間窓（60分以上・rawの保持期間より前を含む場合は時間ロールアップから集計）
+            list_metrics: 記録されているメトリクス名の一覧も返す
+        Returns: 窓ごとの{count, mean, min, max, sum, last}と、メトリクスごとの増加量(change, change_per_day)
+        """
+        try:
+            recorder = manager.metrics_history
+            result = recorder.store.query(metrics, since_seconds=since_hours * 3600, window_seconds=window_minutes * 60)
+            result["recorder"] = recorder.status()
+            result["store"] = recorder.store.disk_usage()
+            if list_metrics:
+                result["available_metrics"] = recorder.store.metric_names()
+            return {"success": True, **result}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @mcp.tool()
+    def chroma_profiling_config(
+        enabled: Optional[bool] = None,
+        tools: Optional[List[str]] = None,
+        top_n: Optional[int] = None,
+        sort_by: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ツール呼び出しのcProfile計測を実行中に切り替える（引数省略時は現在の設定を表示）
+        Args:
+            enabled: 計測の有効/無効
+            tools: 計測対象のツール名リスト（"*"で全ツール）
+            top_n: 応答に含める上位関数の件数
+            sort_by: 並べ替えキー（cumulative, tottime, calls）
+        Returns: 現在のプロファイリング設定（プロファイルはlogs/profiles/に保存）
+        """
+        try:
+            return {"success": True, **profiling_config.update(enabled, tools, top_n, sort_by)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
@@ -0,0 +1,193 @@
+"""
+コレクションのページング取得
+collection.get()を全件で呼ばず、limit/offsetのページ単位で順次取得する共通イテレータ
+
+ChromaDBのget(limit, offset)は内部の挿入順(seq_id)で並ぶため、
+走査中に追加された行は末尾に付き、既走査範囲の位置はずれない。
+走査中に既走査範囲の行を削除した場合はnote_deleted()で件数を通知すること。
+ツール呼び出しの締め切り（modules.deadlines）を過ぎるとページ境界で走査を打ち切り、truncatedを立てる
+（cursor()は打ち切った位置から再開できる値を返す）。
+"""
+
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+import base64
+import json
+
+from modules.deadlines import stop_requested
+
+DEFAULT_PAGE_SIZE = 500
+MIN_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 5000
+TARGET_PAGE_BYTES = 8 * 1024 * 1024
+
+ROW_FIELDS = ("documents", "metadatas", "embeddings")
+
+
+def estimate_page_bytes(page: Dict[str, Any]) -> int:
+    """ページのおおよそのペイロードサイズ（バイト）を見積もる"""
+    total = sum(len(str(i)) for i in (page.get("ids") or []))
+    for doc in page.get("documents") or []:
+        if doc:
+            total += len(doc.encode("utf-8"))
+    for meta in page.get("metadatas") or []:
+        if meta:
+            total += sum(len(str(k)) + len(str(v)) for k, v in meta.items())
+    embeddings = page.get("embeddings")
+    if embeddings is not None:
+        for emb in embeddings:
+            if emb is not None:
+                total += len(emb) * 4
+    return total
+
+
+def encode_cursor(offset: int, last_id: Optional[str] = None) -> str:
+    """ページ位置を不透明なカーソル文字列に変換"""
+    raw = json.dumps({"offset": offset, "last_id": last_id}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[int, Optional[str]]:
+    """カーソル文字列から(offset, last_id)を復元（不正値はValueError）"""
+    if not cursor:
+        return 0, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return int(data.get("offset", 0)), data.get("last_id")
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class CollectionPager:
+    """
+    コレクションをページ単位で走査するイテレータ
+    Args:
+        collection: 対象コレクション
+        include: 取得フィールド（ids以外。例: ["metadatas"]）
+        where: メタデータフィルター
+        where_document: ドキュメント本文フィルター
+        page_size: 初期ページサイズ
+        target_page_bytes: ページサイズ自動調整の目標バイト数（0で調整無効）
+        offset: 開始位置
+        max_rows: 取得上限件数（Noneで無制限）
+    """
+
+    def __init__(self,
+                 collection,
+                 include: Optional[List[str]] = None,
+                 where: Optional[Dict[str, Any]] = None,
+                 where_document: Optional[Dict[str, Any]] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 target_page_bytes: int = TARGET_PAGE_BYTES,
+                 min_page_size: int = MIN_PAGE_SIZE,
+                 max_page_size: int = MAX_PAGE_SIZE,
+                 offset: int = 0,
+                 max_rows: Optional[int] = None):
+        self.collection = collection
+        self.include = list(include) if include is not None else ["documents", "metadatas"]
+        self.where = where
+        self.where_document = where_document
+        self.min_page_size = max(1, min_page_size)
+        self.max_page_size = max(self.min_page_size, max_page_size)
+        self.page_size = min(max(page_size, self.min_page_size), self.max_page_size)
+        self.target_page_bytes = target_page_bytes
+        self.offset = offset
+        self.max_rows = max_rows
+        self.rows_fetched = 0
+        self.pages_fetched = 0
+        self.bytes_fetched = 0
+        self.last_id: Optional[str] = None
+        self.exhausted = False
+        self.truncated = False
+
+    def note_deleted(self, count: int) -> None:
+        """走査済み範囲の行を削除したことを通知し、次ページのoffsetを補正する"""
+        self.offset = max(0, self.offset - count)
+
+    def _tune(self, page_bytes: int, rows: int) -> None:
+        if not self.target_page_bytes or rows == 0:
+            return
+        per_row = max(page_bytes / rows, 1)
+        tuned = int(self.target_page_bytes / per_row)
+        self.page_size = min(max(tuned, self.min_page_size), self.max_page_size)
+
+    def fetch_page(self) -> Optional[Dict[str, Any]]:
+        """次の1ページを取得（終端・締め切り超過ならNone）"""
+        if self.exhausted or self.truncated:
+            return None
+        limit = self.page_size
+        if self.max_rows is not None:
+            limit = min(limit, self.max_rows - self.rows_fetched)
+            if limit <= 0:
+                self.exhausted = True
+                return None
+        if stop_requested("pager"):
+            self.truncated = True
+            return None
+        kwargs: Dict[str, Any] = {"limit": limit, "offset": self.offset, "include": self.include}
+        if self.where:
+            kwargs["where"] = self.where
+        if self.where_document:
+            kwargs["where_document"] = self.where_document
+        page = self.collection.get(**kwargs)
+        ids = page.get("ids") or []
+        if not ids:
+            self.exhausted = True
+            return None
+        page_bytes = estimate_page_bytes(page)
+        self.offset += len(ids)
+        self.rows_fetched += len(ids)
+        self.pages_fetched += 1
+        self.bytes_fetched += page_bytes
+        self.last_id = ids[-1]
+        if len(ids) < limit:
+            self.exhausted = True
+        self._tune(page_bytes, len(ids))
+        return page
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            page = self.fetch_page()
+            if page is None:
+                return
+            yield page
+
+    def iter_rows(self) -> Iterator[Dict[str, Any]]:
+        """1行ずつ{"id", "document", "metadata", "embedding"}形式で返す"""
+        for page in self:
+            ids = page.get("ids") or []
+            columns = {field: page.get(field) for field in ROW_FIELDS if field in self.include}
+            for i, doc_id in enumerate(ids):
+                row = {"id": doc_id}
+                for field, values in columns.items():
+                    row[field[:-1]] = values[i] if values is not None and i < len(values) else None
+                yield row
+
+    def cursor(self) -> Optional[str]:
+        """次ページのカーソル（終端ならNone）"""
+        if self.exhausted:
+            return None
+        return encode_cursor(self.offset, self.last_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """取得統計"""
+        return {
+            "rows_fetched": self.rows_fetched,
+            "pages_fetched": self.pages_fetched,
+            "bytes_fetched": self.bytes_fetched,
+            "final_page_size": self.page_size,
+            "truncated": self.truncated
+        }
+
+
+def iter_pages(collection, **kwargs) -> Iterator[Dict[str, Any]]:
+    """CollectionPagerのページを順に返す簡易関数"""
+    return iter(CollectionPager(collection, **kwargs))
+
+
+__all__ = [
+    "CollectionPager",
+    "iter_pages",
+    "estimate_page_bytes",
+    "encode_cursor",
+    "decode_cursor",
+]
@@ -0,0 +1,284 @@
+"""
+メタデータフィルターコンパイラ
+日付・プロジェクト・ソース条件をChromaDBネイティブのwhere句へ変換する
+
+ChromaDBの範囲演算子($gt/$gte/$lt/$lte)は数値にしか適用できないため、
+日付はISO文字列と並べて数値のエポック秒フィールド（<field>_epoch）にも保存し、
+範囲条件はそちらへ書き換えてストア側で評価させる。
+エポック秒を補完していない古いドキュメントはストア側の範囲条件から漏れるため、
+missing_epoch_countで検出した場合はfilter_date_rangeで日付文字列を読んで絞り込む。
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Union
+from datetime import datetime, date, time as dt_time
+from modules.paging import CollectionPager
+from modules.batch_ops import AdaptiveBatchSizer, write_in_batches
+
+EPOCH_SUFFIX = "_epoch"
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+DEFAULT_DATE_FIELDS = ("timestamp",)
+# 統計の分布がない場合に、エポック秒の欠けを調べる先頭の件数（古いドキュメントほど先頭にある）
+EPOCH_PROBE_ROWS = 200
+
+_FALLBACK_FORMATS = (
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%Y%m%d_%H%M%S",
+    "%Y%m%d",
+)
+
+
+def epoch_field(date_field: str = "timestamp") -> str:
+    """日付フィールド名に対応するエポック秒フィールド名"""
+    return f"{date_field}{EPOCH_SUFFIX}"
+
+
+def to_epoch(value: Any, end_of_day: bool = False) -> Optional[float]:
+    """
+    ISO文字列・datetime・date・数値をエポック秒(float)に変換
+    Args:
+        value: 変換対象
+        end_of_day: 日付のみの値を当日の終端(23:59:59.999999)として扱う
+    Returns: エポック秒（変換不能ならNone）
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime.combine(value, dt_time.max if end_of_day else dt_time.min).timestamp()
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        if len(text) == 10:
+            return to_epoch(date.fromisoformat(text), end_of_day)
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        pass
+    for fmt in _FALLBACK_FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if end_of_day and "%H" not in fmt:
+            parsed = datetime.combine(parsed.date(), dt_time.max)
+        return parsed.timestamp()
+    return None
+
+
+def stamp_timestamp(metadata: Optional[Dict[str, Any]] = None,
+                    when: Optional[datetime] = None,
+                    date_field: str = "timestamp") -> Dict[str, Any]:
+    """メタデータにISO文字列とエポック秒の両方のタイムスタンプを付与する"""
+    if metadata is None:
+        metadata = {}
+    when = when or datetime.now()
+    metadata[date_field] = when.isoformat()
+    metadata[epoch_field(date_field)] = when.timestamp()
+    return metadata
+
+
+def ensure_epoch(metadata: Optional[Dict[str, Any]],
+                 date_fields: Iterable[str] = DEFAULT_DATE_FIELDS) -> Optional[Dict[str, Any]]:
+    """既存の日付文字列からエポック秒フィールドを補完する（既存値は上書きしない）"""
+    if not isinstance(metadata, dict):
+        return metadata
+    for field in date_fields:
+        target = epoch_field(field)
+        if target in metadata or field not in metadata:
+            continue
+        epoch = to_epoch(metadata[field])
+        if epoch is not None:
+            metadata[target] = epoch
+    return metadata
+
+
+def _value_clause(field: str, value: Union[str, List[str]]) -> Dict[str, Any]:
+    if isinstance(value, (list, tuple, set)):
+        values = [v for v in value if v is not None]
+        return {field: {"$in": values}} if len(values) != 1 else {field: {"$eq": values[0]}}
+    return {field: {"$eq": value}}
+
+
+def _combine(clauses: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    clauses = [c for c in clauses if c]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def rewrite_date_predicates(where: Optional[Dict[str, Any]],
+                            date_fields: Iterable[str] = DEFAULT_DATE_FIELDS) -> Optional[Dict[str, Any]]:
+    """
+    where句中の日付フィールドへの文字列範囲条件をエポック秒フィールドへの数値条件に書き換える
+    複数キーを並べたトップレベル条件は$andへ正規化する
+    """
+    if not where:
+        return None
+    date_fields = tuple(date_fields)
+    clauses = []
+    for key, cond in where.items():
+        if key in ("$and", "$or") and isinstance(cond, list):
+            rewritten = [rewrite_date_predicates(c, date_fields) for c in cond]
+            clauses.append({key: [c for c in rewritten if c]})
+            continue
+        if key in date_fields and isinstance(cond, dict):
+            numeric = {}
+            remaining = {}
+            for op, operand in cond.items():
+                epoch = to_epoch(operand, end_of_day=op in ("$lte", "$gt")) if op in RANGE_OPERATORS else None
+                if epoch is not None:
+                    numeric[op] = epoch
+                else:
+                    remaining[op] = operand
+            for op, epoch in numeric.items():
+                clauses.append({epoch_field(key): {op: epoch}})
+            for op, operand in remaining.items():
+                clauses.append({key: {op: operand}})
+            continue
+        clauses.append({key: cond})
+    return _combine(clauses)
+
+
+def compile_where(start: Any = None,
+                  end: Any = None,
+                  project: Optional[Union[str, List[str]]] = None,
+                  source: Optional[Union[str, List[str]]] = None,
+                  date_field: str = "timestamp",
+                  where: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    日付範囲・プロジェクト・ソース条件からChromaDBネイティブのwhere句を生成
+    Args:
+        start: 開始日時（この日時を含む）
+        end: 終了日時（日付のみ指定時は当日終端まで含む）
+        project: プロジェクト名（リスト指定で$in）
+        source: ソース名（リスト指定で$in）
+        date_field: 日付フィールド名（<date_field>_epochで範囲評価）
+        where: 追加の任意条件（日付範囲は同様に書き換える）
+    Returns: where句（条件なしの場合はNone）
+    """
+    clauses = []
+    start_epoch = to_epoch(start)
+    end_epoch = to_epoch(end, end_of_day=True)
+    if start_epoch is not None:
+        clauses.append({epoch_field(date_field): {"$gte": start_epoch}})
+    if end_epoch is not None:
+        clauses.append({epoch_field(date_field): {"$lte": end_epoch}})
+    if project:
+        clauses.append(_value_clause("project", project))
+    if source:
+        clauses.append(_value_clause("source", source))
+    extra = rewrite_date_predicates(where, (date_field,) + tuple(f for f in DEFAULT_DATE_FIELDS if f != date_field))
+    if extra:
+        clauses.extend(extra["$and"] if set(extra) == {"$and"} else [extra])
+    return _combine(clauses)
+
+
+def missing_epoch_count(collection, date_field: str = "timestamp", stats=None) -> int:
+    """
+    日付文字列はあるがエポック秒フィールドのないドキュメント数
+    Args:
+        collection: 対象コレクション
+        date_field: 日付フィールド名
+        stats: コレクションの統計（CollectionStats。分布を作成済みならキーの出現数の差を返す）
+    Returns: 件数（分布がない場合は先頭EPOCH_PROBE_ROWS件の中で見つかった件数）
+    """
+    target = epoch_field(date_field)
+    if stats is not None and stats.distribution_complete:
+        return max(0, stats.metadata_keys.get(date_field, 0) - stats.metadata_keys.get(target, 0))
+    probe = collection.get(limit=EPOCH_PROBE_ROWS, include=["metadatas"])
+    return sum(1 for meta in probe.get("metadatas") or [] if meta and date_field in meta and target not in meta)
+
+
+def filter_date_range(collection, start: Any = None, end: Any = None, date_field: str = "timestamp",
+                      where: Optional[Dict[str, Any]] = None,
+                      include: Iterable[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+    """
+    エポック秒のないドキュメントも含めて日付範囲で絞り込む
+    日付以外の条件（where）はストア側で評価し、日付はエポック秒があればそれを、なければ日付文字列を変換して比較する
+    Args:
+        collection: 対象コレクション
+        start: 開始日時（この日時を含む）
+        end: 終了日時（日付のみ指定時は当日終端まで含む）
+        date_field: 日付フィールド名
+        where: 日付以外の条件
+        include: 返す列（比較のためmetadatasは常に読む）
+    Returns: collection.get()形式の結果（scan: 走査の統計）
+    """
+    include = list(include)
+    target = epoch_field(date_field)
+    start_epoch = to_epoch(start)
+    end_epoch = to_epoch(end, end_of_day=True)
+    pager = CollectionPager(collection, include=sorted(set(include) | {"metadatas"}), where=where)
+    results: Dict[str, List[Any]] = {"ids": [], **{column: [] for column in include}}
+    for page in pager:
+        ids = page.get("ids") or []
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        for i, meta in enumerate(metadatas):
+            meta = meta or {}
+            epoch = meta.get(target)
+            epoch = to_epoch(meta.get(date_field)) if epoch is None else float(epoch)
+            if epoch is None or (start_epoch is not None and epoch < start_epoch) or (end_epoch is not None and epoch > end_epoch):
+                continue
+            results["ids"].append(ids[i])
+            for column in include:
+                values = page.get(column)
+                results[column].append(values[i] if values is not None else None)
+    results["scan"] = pager.stats()
+    return results
+
+
+def backfill_epoch_fields(collection, date_field: str = "timestamp", batch_size: int = 500) -> Dict[str, Any]:
+    """
+    既存ドキュメントの日付文字列からエポック秒フィールドを一括補完する
+    Args:
+        collection: 対象コレクション
+        date_field: 日付フィールド名
+        batch_size: 1回のget/update件数（updateはクライアントの上限件数で切り詰め）
+    Returns: 処理件数
+    """
+    target = epoch_field(date_field)
+    sizer = AdaptiveBatchSizer.for_collection(collection, "update", batch_size=batch_size)
+    scanned = 0
+    updated = 0
+    unparsable = 0
+    for page in CollectionPager(collection, include=["metadatas"], page_size=batch_size, target_page_bytes=0):
+        ids = page.get("ids") or []
+        metadatas = page.get("metadatas") or []
+        update_ids = []
+        update_metas = []
+        for doc_id, meta in zip(ids, metadatas):
+            if not meta or target in meta or date_field not in meta:
+                continue
+            epoch = to_epoch(meta[date_field])
+            if epoch is None:
+                unparsable += 1
+                continue
+            new_meta = dict(meta)
+            new_meta[target] = epoch
+            update_ids.append(doc_id)
+            update_metas.append(new_meta)
+        if update_ids:
+            write_in_batches(collection, "update", update_ids, sizer=sizer, metadatas=update_metas)
+            updated += len(update_ids)
+        scanned += len(ids)
+    return {"scanned": scanned, "updated": updated, "unparsable": unparsable, "epoch_field": target,
+            "batching": sizer.describe()}
+
+
+__all__ = [
+    "epoch_field",
+    "to_epoch",
+    "stamp_timestamp",
+    "ensure_epoch",
+    "rewrite_date_predicates",
+    "compile_where",
+    "missing_epoch_count",
+    "filter_date_range",
+    "backfill_epoch_fields",
+]
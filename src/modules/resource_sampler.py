@@ -0,0 +1,247 @@
+"""
+リソース使用状況のバックグラウンドサンプリング
+一定間隔でCPU・RSS・ディスクI/O・オープンハンドル数・SQLiteファイルサイズを採取し、リングバッファに保持する
+
+診断ツールは採取済みの値を即座に読むだけにし、psutil.cpu_percent(interval=1)のように
+ツール呼び出し（イベントループ）を1秒止めないようにするため。
+CPU使用率は前回サンプルからの区間平均（interval=Noneの差分計測）。psutilがない環境ではSQLiteファイルサイズのみ採取する。
+設定: resources.enabled / resources.interval（秒）/ resources.capacity（保持サンプル数）
+"""
+
+from typing import Dict, Any, List, Optional
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import os
+import threading
+import time
+
+from modules.structured_logging import get_logger
+
+logger = get_logger("resource_sampler")
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_CAPACITY = 720
+# トレンドとして返す時系列の最大点数（超える場合は間引く）
+DEFAULT_MAX_POINTS = 60
+SQLITE_FILES = ("chroma.sqlite3", "chroma.sqlite3-wal", "chroma.sqlite3-shm")
+# トレンド集計の対象（数値フィールド）
+TREND_FIELDS = (
+    "cpu_percent", "process_cpu_percent", "memory_percent", "rss_mb",
+    "read_bytes_per_sec", "write_bytes_per_sec", "open_handles", "sqlite_bytes"
+)
+
+
+def _open_handles(process) -> Optional[int]:
+    """オープンしているファイルハンドル数（Windowsはハンドル数、POSIXはfd数）"""
+    for method in ("num_handles", "num_fds"):
+        if hasattr(process, method):
+            try:
+                return getattr(process, method)()
+            except Exception:
+                return None
+    return None
+
+
+class ResourceSampler:
+    """
+    リソース使用状況のサンプラー（スレッドセーフ）
+    Args:
+        interval: 採取間隔（秒）
+        capacity: リングバッファに保持するサンプル数
+        db_path: SQLiteファイルを探すChromaDBのディレクトリ（manager初期化時に設定）
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, capacity: int = DEFAULT_CAPACITY,
+                 db_path: Optional[str] = None):
+        self.enabled = True
+        self.interval = max(0.1, float(interval))
+        self.capacity = max(1, int(capacity))
+        self.db_path = db_path
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._samples: deque = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = None
+        self._psutil = None
+        self._psutil_checked = False
+        self.process_started_at: Optional[str] = None
+        self._previous_io: Optional[tuple] = None
+        self._cpu_primed = False
+
+    @classmethod
+    def from_settings(cls) -> "ResourceSampler":
+        sampler = cls()
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            sampler.enabled = bool(settings.get_setting("resources.enabled", True))
+            sampler.interval = max(0.1, float(settings.get_setting("resources.interval", DEFAULT_INTERVAL)))
+            sampler.capacity = max(1, int(settings.get_setting("resources.capacity", DEFAULT_CAPACITY)))
+            sampler._samples = deque(maxlen=sampler.capacity)
+        except Exception:
+            pass
+        return sampler
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ResourceSampler":
+        """バックグラウンドスレッドで採取を開始（無効設定時・起動済みなら何もしない）"""
+        if not self.enabled or self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def _load_psutil(self):
+        if not self._psutil_checked:
+            self._psutil_checked = True
+            try:
+                import psutil
+                self._psutil = psutil
+                self._process = psutil.Process()
+                self.process_started_at = datetime.fromtimestamp(self._process.create_time()).isoformat()
+            except Exception as e:
+                self.last_error = f"psutil unavailable: {e}"
+        return self._psutil
+
+    def _sqlite_sizes(self) -> Dict[str, int]:
+        if not self.db_path:
+            return {}
+        sizes = {}
+        for name in SQLITE_FILES:
+            try:
+                sizes[name] = os.path.getsize(Path(self.db_path) / name)
+            except OSError:
+                continue
+        return sizes
+
+    def sample(self) -> Dict[str, Any]:
+        """1回採取してバッファへ追加（ブロックしない）"""
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self) -> Dict[str, Any]:
+        now = time.time()
+        sample: Dict[str, Any] = {"timestamp": datetime.fromtimestamp(now).isoformat(), "time": now}
+        try:
+            psutil = self._load_psutil()
+            if psutil is not None:
+                process = self._process
+                memory = psutil.virtual_memory()
+                # 前回呼び出しからの区間平均（初回は基準点を作るだけなので値を返さない）
+                cpu_percent = psutil.cpu_percent(interval=None)
+                process_cpu_percent = process.cpu_percent(interval=None)
+                if not self._cpu_primed:
+                    self._cpu_primed = True
+                    cpu_percent = process_cpu_percent = None
+                sample.update({
+                    "cpu_percent": cpu_percent,
+                    "process_cpu_percent": process_cpu_percent,
+                    "memory_percent": memory.percent,
+                    "memory_total_gb": round(memory.total / (1024**3), 2),
+                    "memory_used_gb": round(memory.used / (1024**3), 2),
+                    "rss_mb": round(process.memory_info().rss / (1024*1024), 2),
+                    "open_handles": _open_handles(process)
+                })
+                if hasattr(process, "io_counters"):
+                    io = process.io_counters()
+                    sample["read_bytes"] = io.read_bytes
+                    sample["write_bytes"] = io.write_bytes
+                    if self._previous_io is not None:
+                        elapsed = now - self._previous_io[0]
+                        if elapsed > 0:
+                            sample["read_bytes_per_sec"] = round(max(0, io.read_bytes - self._previous_io[1]) / elapsed, 1)
+                            sample["write_bytes_per_sec"] = round(max(0, io.write_bytes - self._previous_io[2]) / elapsed, 1)
+                    self._previous_io = (now, io.read_bytes, io.write_bytes)
+                disk = psutil.disk_usage(str(self.db_path) if self.db_path and Path(self.db_path).exists() else "/")
+                sample.update({
+                    "disk_total_gb": round(disk.total / (1024**3), 2),
+                    "disk_used_gb": round(disk.used / (1024**3), 2),
+                    "disk_percent": round((disk.used / disk.total) * 100, 2) if disk.total else 0.0
+                })
+            sqlite_sizes = self._sqlite_sizes()
+            if sqlite_sizes:
+                sample["sqlite_files"] = sqlite_sizes
+                sample["sqlite_bytes"] = sum(sqlite_sizes.values())
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.warning("Resource sampling failed", extra={"error": str(e)})
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def latest(self) -> Dict[str, Any]:
+        """
+        直近のサンプル
+        採取スレッドが動いていない（無効設定など）場合は、直近のサンプルが採取間隔より古ければその場で採り直す
+        """
+        with self._lock:
+            if self._samples and (self.running or time.time() - self._samples[-1]["time"] < self.interval):
+                return dict(self._samples[-1])
+        return dict(self.sample())
+
+    def samples(self, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """保持中のサンプル（secondsを指定すると直近その秒数分）"""
+        with self._lock:
+            samples = list(self._samples)
+        if seconds:
+            since = time.time() - seconds
+            samples = [s for s in samples if s["time"] >= since]
+        return samples
+
+    def trends(self, seconds: float, fields=TREND_FIELDS, max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        """
+        直近seconds秒のトレンド
+        Returns: {"window_seconds", "sample_count", "fields": {名前: {min, max, mean, first, last, delta}}, "series": [...]}
+        """
+        samples = self.samples(seconds)
+        summary = {}
+        for field in fields:
+            values = [s[field] for s in samples if isinstance(s.get(field), (int, float))]
+            if not values:
+                continue
+            summary[field] = {
+                "min": min(values), "max": max(values), "mean": round(sum(values) / len(values), 2),
+                "first": values[0], "last": values[-1], "delta": round(values[-1] - values[0], 2)
+            }
+        step = max(1, -(-len(samples) // max(1, max_points)))
+        series = [{"timestamp": s["timestamp"], **{f: s[f] for f in fields if f in s}} for s in samples[::step]]
+        return {"window_seconds": seconds, "sample_count": len(samples), "fields": summary, "series": series}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            count = len(self._samples)
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "capacity": self.capacity,
+            "samples": count,
+            "psutil_available": self._psutil is not None if self._psutil_checked else None,
+            "process_started_at": self.process_started_at,
+            "errors": self.errors,
+            "last_error": self.last_error
+        }
+
+
+__all__ = [
+    "ResourceSampler",
+    "TREND_FIELDS",
+]
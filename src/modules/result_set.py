@@ -0,0 +1,438 @@
+"""
+列指向の結果セット
+collection.get()の結果（ids/documents/metadatas/embeddings）をページ単位で受け取り、
+Pythonのdict/listの行配列ではなく列ごとのコンパクトな配列として保持する
+
+- embeddings: NumPyのfloat32二次元配列（NumPyがない場合はarray('f')）
+- ids/documents: Arrowの文字列配列（pyarrowがない場合はlist）
+- metadatas: キーごとの列（Arrow配列、欠損はnull）。行単位ではMetadataViewで遅延参照
+
+大規模コレクションの分析（数十万行）で行ごとのdict・floatオブジェクトを作らないための共通コンテナ。
+"""
+
+from typing import Dict, Any, List, Optional, Iterator, Iterable, Mapping, Sequence
+from array import array
+import sys
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pc = None
+    ARROW_AVAILABLE = False
+
+
+def _string_column(values: Sequence[Optional[str]]):
+    if ARROW_AVAILABLE:
+        return pa.array(values, type=pa.string())
+    return list(values)
+
+
+def _value_column(values: List[Any]):
+    """メタデータ値の列（型が混在する場合は文字列化）"""
+    if not ARROW_AVAILABLE:
+        return values
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _concat(chunks: List[Any], lengths: List[int]):
+    """ページ単位の列を1列に結合（欠損ページはnull埋め・型不一致は数値→float64、それ以外→文字列）"""
+    if not ARROW_AVAILABLE:
+        column: List[Any] = []
+        for chunk, length in zip(chunks, lengths):
+            column.extend(chunk if chunk is not None else [None] * length)
+        return column
+    types = {chunk.type for chunk in chunks if chunk is not None and chunk.type != pa.null()}
+    if not types:
+        target = pa.null()
+    elif len(types) == 1:
+        target = types.pop()
+    elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        target = pa.float64()
+    else:
+        target = pa.string()
+    arrays = []
+    for chunk, length in zip(chunks, lengths):
+        if chunk is None:
+            arrays.append(pa.nulls(length, type=target))
+        elif chunk.type != target:
+            arrays.append(pc.cast(chunk, target) if chunk.type != pa.null() else pa.nulls(length, type=target))
+        else:
+            arrays.append(chunk)
+    return pa.chunked_array(arrays, type=target)
+
+
+def _get(column, index: int) -> Any:
+    if ARROW_AVAILABLE and not isinstance(column, list):
+        return column[index].as_py()
+    return column[index]
+
+
+def _to_list(column) -> List[Any]:
+    if column is None:
+        return []
+    if ARROW_AVAILABLE and not isinstance(column, list):
+        return column.to_pylist()
+    return list(column)
+
+
+def _valid_counts(column) -> int:
+    if ARROW_AVAILABLE and not isinstance(column, list):
+        return len(column) - column.null_count
+    return sum(1 for v in column if v is not None)
+
+
+def _nbytes(column) -> int:
+    if column is None:
+        return 0
+    if hasattr(column, "nbytes"):
+        return int(column.nbytes)
+    if isinstance(column, array):
+        return column.itemsize * len(column)
+    # list: 要素の概算（文字列本体 + ポインタ）
+    return sys.getsizeof(column) + sum(sys.getsizeof(v) for v in column[:1000]) * max(1, len(column) // 1000)
+
+
+class MetadataView(Mapping):
+    """1行分のメタデータの遅延ビュー（アクセス時に列から値を取り出す・値がnullのキーは含まない）"""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result: "ResultSet", index: int):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        column = self._result.metadata_columns.get(key)
+        value = _get(column, self._index) if column is not None else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for key, column in self._result.metadata_columns.items():
+            if _get(column, self._index) is not None:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self}
+
+    def __repr__(self) -> str:
+        return f"MetadataView({self.to_dict()!r})"
+
+
+class ResultSetBuilder:
+    """ページ単位で列を積み上げ、build()でResultSetを生成する"""
+
+    def __init__(self):
+        self.rows = 0
+        self.page_lengths: List[int] = []
+        self.id_chunks: List[Any] = []
+        self.document_chunks: List[Any] = []
+        self.embedding_chunks: List[Any] = []
+        self.metadata_chunks: Dict[str, List[Any]] = {}
+        self.value_types: Dict[str, set] = {}
+        self.has_documents = False
+        self.has_metadatas = False
+        self.dimension: Optional[int] = None
+        self.length_mismatch = False
+
+    def add_page(self, page: Dict[str, Any]) -> None:
+        ids = page.get("ids") or []
+        n = len(ids)
+        if not n:
+            return
+        documents = page.get("documents")
+        metadatas = page.get("metadatas")
+        embeddings = page.get("embeddings")
+        for column in (documents, metadatas, embeddings):
+            if column is not None and len(column) not in (0, n):
+                self.length_mismatch = True
+        page_index = len(self.page_lengths)
+        self.page_lengths.append(n)
+        self.rows += n
+        self.id_chunks.append(_string_column([str(i) for i in ids]))
+
+        if documents is not None:
+            self.has_documents = True
+            self.document_chunks.append(_string_column(list(documents[:n]) + [None] * (n - len(documents))))
+
+        if metadatas is not None:
+            self.has_metadatas = True
+            metadatas = list(metadatas[:n]) + [None] * (n - len(metadatas))
+            page_keys: Dict[str, None] = {}
+            for metadata in metadatas:
+                if metadata:
+                    page_keys.update(dict.fromkeys(metadata))
+            for key in page_keys:
+                values = [m.get(key) if m else None for m in metadatas]
+                types = self.value_types.setdefault(key, set())
+                types.update(type(v).__name__ for v in values if v is not None)
+                chunks = self.metadata_chunks.setdefault(key, [])
+                chunks.extend([None] * (page_index - len(chunks)))
+                chunks.append(_value_column(values))
+
+        if embeddings is not None and len(embeddings):
+            if NUMPY_AVAILABLE:
+                block = np.asarray(embeddings, dtype=np.float32)
+                if block.ndim == 2:
+                    self.dimension = block.shape[1]
+                    self.embedding_chunks.append(block)
+            else:
+                block = array("f")
+                for vector in embeddings:
+                    if vector is not None:
+                        self.dimension = self.dimension or len(vector)
+                        block.extend(float(v) for v in vector)
+                self.embedding_chunks.append(block)
+
+    def build(self) -> "ResultSet":
+        ids = self._join_strings(self.id_chunks)
+        documents = self._join_strings(self.document_chunks) if self.has_documents else None
+        metadata_columns = {}
+        for key, chunks in self.metadata_chunks.items():
+            chunks = chunks + [None] * (len(self.page_lengths) - len(chunks))
+            metadata_columns[key] = _concat(chunks, self.page_lengths)
+        embeddings = None
+        if self.embedding_chunks:
+            if NUMPY_AVAILABLE:
+                embeddings = np.concatenate(self.embedding_chunks) if len(self.embedding_chunks) > 1 else self.embedding_chunks[0]
+            else:
+                embeddings = array("f")
+                for block in self.embedding_chunks:
+                    embeddings.extend(block)
+        return ResultSet(
+            ids=ids,
+            documents=documents,
+            metadata_columns=metadata_columns if self.has_metadatas else {},
+            embeddings=embeddings,
+            dimension=self.dimension,
+            value_types={k: sorted(v) for k, v in self.value_types.items()},
+            has_metadatas=self.has_metadatas,
+            length_mismatch=self.length_mismatch
+        )
+
+    @staticmethod
+    def _join_strings(chunks: List[Any]):
+        if ARROW_AVAILABLE:
+            return pa.chunked_array(chunks, type=pa.string()) if chunks else pa.chunked_array([], type=pa.string())
+        joined: List[Any] = []
+        for chunk in chunks:
+            joined.extend(chunk)
+        return joined
+
+
+class ResultSet:
+    """
+    列指向の結果セット（ResultSet.from_pages / from_pager / ChromaDBManager.result_set で生成）
+    Args:
+        ids: ID列
+        documents: 本文列（取得していなければNone）
+        metadata_columns: メタデータのキー→列
+        embeddings: float32の(行数, 次元)配列（NumPyなしの場合は平坦なarray('f')）
+        dimension: 埋め込みの次元数
+        value_types: メタデータのキー→観測されたPython型名
+        has_metadatas: メタデータを取得したか
+        length_mismatch: ページ内で列の長さが不一致だったか
+    """
+
+    def __init__(self, ids, documents=None, metadata_columns: Optional[Dict[str, Any]] = None,
+                 embeddings=None, dimension: Optional[int] = None,
+                 value_types: Optional[Dict[str, List[str]]] = None,
+                 has_metadatas: bool = False, length_mismatch: bool = False):
+        self.ids = ids
+        self.documents = documents
+        self.metadata_columns = metadata_columns or {}
+        self.embeddings = embeddings
+        self.dimension = dimension
+        self.value_types = value_types or {}
+        self.has_metadatas = has_metadatas
+        self.length_mismatch = length_mismatch
+        # 読み込みが締め切りで打ち切られた（部分結果）か
+        self.truncated = False
+
+    @classmethod
+    def from_pages(cls, pages: Iterable[Dict[str, Any]]) -> "ResultSet":
+        builder = ResultSetBuilder()
+        for page in pages:
+            builder.add_page(page)
+        result_set = builder.build()
+        result_set.truncated = bool(getattr(pages, "truncated", False))
+        return result_set
+
+    @classmethod
+    def from_pager(cls, pager) -> "ResultSet":
+        return cls.from_pages(pager)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def metadata_keys(self) -> List[str]:
+        return list(self.metadata_columns)
+
+    def id(self, index: int) -> str:
+        return _get(self.ids, index)
+
+    def document(self, index: int) -> Optional[str]:
+        return _get(self.documents, index) if self.documents is not None else None
+
+    def embedding(self, index: int):
+        if self.embeddings is None or not self.dimension:
+            return None
+        if NUMPY_AVAILABLE:
+            return self.embeddings[index]
+        return self.embeddings[index * self.dimension:(index + 1) * self.dimension]
+
+    def metadata(self, index: int) -> Optional[MetadataView]:
+        return MetadataView(self, index) if self.has_metadatas else None
+
+    def column(self, key: str) -> List[Any]:
+        """メタデータ1キー分の値（Pythonのlist・欠損はNone）"""
+        return _to_list(self.metadata_columns.get(key)) or [None] * len(self)
+
+    def row(self, index: int) -> Dict[str, Any]:
+        return {
+            "id": self.id(index),
+            "document": self.document(index),
+            "metadata": self.metadata(index),
+            "embedding": self.embedding(index)
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def id_list(self) -> List[str]:
+        return _to_list(self.ids)
+
+    def unique_id_count(self, start: int = 0, stop: Optional[int] = None) -> int:
+        """ID列（start:stopの範囲）の異なり数"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if stop <= start:
+            return 0
+        if ARROW_AVAILABLE and not isinstance(self.ids, list):
+            return pc.count_distinct(self.ids.slice(start, stop - start)).as_py()
+        return len(set(self.ids[start:stop]))
+
+    def key_counts(self) -> Dict[str, int]:
+        """キーごとの値あり行数"""
+        return {key: _valid_counts(column) for key, column in self.metadata_columns.items()}
+
+    def metadata_present(self) -> List[bool]:
+        """行ごとにメタデータ（値ありのキー）を1つ以上持つか"""
+        if NUMPY_AVAILABLE:
+            mask = np.zeros(len(self), dtype=bool)
+            for column in self.metadata_columns.values():
+                if ARROW_AVAILABLE and not isinstance(column, list):
+                    mask |= ~np.asarray(column.is_null().to_numpy(zero_copy_only=False), dtype=bool)
+                else:
+                    mask |= np.fromiter((v is not None for v in column), dtype=bool, count=len(column))
+            return mask
+        mask = [False] * len(self)
+        for column in self.metadata_columns.values():
+            for i, value in enumerate(_to_list(column)):
+                if value is not None:
+                    mask[i] = True
+        return mask
+
+    def document_lengths(self, strip: bool = False):
+        """本文の文字数（strip=Trueで前後の空白を除いた長さ・本文なしは0）"""
+        if self.documents is None:
+            return []
+        if ARROW_AVAILABLE and not isinstance(self.documents, list):
+            docs = pc.utf8_trim_whitespace(self.documents) if strip else self.documents
+            lengths = pc.fill_null(pc.utf8_length(docs), 0)
+            return lengths.to_numpy() if NUMPY_AVAILABLE else lengths.to_pylist()
+        values = [len((doc or "").strip() if strip else (doc or "")) for doc in self.documents]
+        return np.asarray(values, dtype=np.int64) if NUMPY_AVAILABLE else values
+
+    def word_counts(self):
+        """本文の空白区切りの語数"""
+        if self.documents is None:
+            return []
+        if ARROW_AVAILABLE and not isinstance(self.documents, list):
+            counts = pc.fill_null(pc.count_substring_regex(self.documents, r"\S+"), 0)
+            return counts.to_numpy() if NUMPY_AVAILABLE else counts.to_pylist()
+        values = [len((doc or "").split()) for doc in self.documents]
+        return np.asarray(values, dtype=np.int64) if NUMPY_AVAILABLE else values
+
+    def embedding_stats(self) -> Dict[str, Any]:
+        """埋め込みの次元・ノルム分布・ゼロ/非有限ベクトル数"""
+        if self.embeddings is None or not self.dimension:
+            return {"has_embeddings": False}
+        if NUMPY_AVAILABLE:
+            matrix = self.embeddings
+            finite = np.isfinite(matrix).all(axis=1)
+            norms = np.linalg.norm(np.where(np.isfinite(matrix), matrix, 0), axis=1)
+            return {
+                "has_embeddings": True,
+                "vectors": int(matrix.shape[0]),
+                "dimension": int(self.dimension),
+                "norm_mean": round(float(norms.mean()), 6),
+                "norm_min": round(float(norms.min()), 6),
+                "norm_max": round(float(norms.max()), 6),
+                "zero_vectors": int((norms == 0).sum()),
+                "non_finite_vectors": int((~finite).sum()),
+                "bytes": int(matrix.nbytes)
+            }
+        vectors = len(self.embeddings) // self.dimension
+        norms = []
+        for i in range(vectors):
+            vector = self.embeddings[i * self.dimension:(i + 1) * self.dimension]
+            norms.append(sum(v * v for v in vector) ** 0.5)
+        return {
+            "has_embeddings": True,
+            "vectors": vectors,
+            "dimension": self.dimension,
+            "norm_mean": round(sum(norms) / len(norms), 6) if norms else None,
+            "norm_min": round(min(norms), 6) if norms else None,
+            "norm_max": round(max(norms), 6) if norms else None,
+            "zero_vectors": sum(1 for n in norms if n == 0),
+            "bytes": _nbytes(self.embeddings)
+        }
+
+    def nbytes(self) -> Dict[str, int]:
+        """列ごとのおおよそのメモリ使用量（バイト）"""
+        sizes = {
+            "ids": _nbytes(self.ids),
+            "documents": _nbytes(self.documents),
+            "metadatas": sum(_nbytes(column) for column in self.metadata_columns.values()),
+            "embeddings": _nbytes(self.embeddings)
+        }
+        sizes["total"] = sum(sizes.values())
+        return sizes
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self),
+            "metadata_keys": len(self.metadata_columns),
+            "dimension": self.dimension,
+            "backend": {"arrow": ARROW_AVAILABLE, "numpy": NUMPY_AVAILABLE},
+            "memory_mb": round(self.nbytes()["total"] / (1024 * 1024), 2),
+            "truncated": self.truncated
+        }
+
+
+__all__ = [
+    "ResultSet",
+    "ResultSetBuilder",
+    "MetadataView",
+    "ARROW_AVAILABLE",
+    "NUMPY_AVAILABLE",
+]
@@ -4,6 +4,8 @@
 
 from typing import Optional
 from datetime import datetime
+from modules.paging import CollectionPager
+from modules.batch_ops import BatchDeleter, DEFAULT_BATCH_SIZE
 
 def register_search_and_delete_tools(mcp, manager):
     """部分一致検索＋一括削除ツールを登録"""
@@ -12,48 +14,72 @@ def register_search_and_delete_tools(mcp, manager):
     async def chroma_search_and_delete_by_keyword(
         collection_name: str,
         keyword: str,
-        field: str = "documents"
+        field: str = "documents",
+        dry_run: bool = False,
+        batch_size: Optional[int] = None,
+        page_target_mb: int = 64
     ) -> dict:
         """
         指定コレクション内で部分一致キーワード検索し、該当ドキュメントを一括削除。
         field: "documents"（本文）または"metadatas"（メタデータ）を指定可能。
-        先頭でID型不整合クリーニングも自動実行。
+        本文検索はwhere_documentの$containsでストア側に絞り込ませ、IDのみをページ取得する。
+        削除はbatch_size件ごと（None=自動調整）に発行し、dry_run=Trueでは該当件数のみ返す。
+        page_target_mb: メタデータ検索時の1ページの目安データ量（MB）。ページ件数を決めるヒントでメモリ使用量の上限ではない
+        dry_run=Trueの応答では該当IDのサンプルをmatched_idsで返す（削除した場合はdeleted_ids）
         """
-        import asyncio
+        from modules.tool_profiling import to_thread
         if not manager.initialized:
             manager.initialize()
-        # 先にID型不整合クリーニングを自動実行
-        try:
-            cleanup_func = globals().get("chroma_cleanup_non_str_ids")
-            if cleanup_func:
-                await cleanup_func(collection_name)
-        except Exception:
-            pass  # 失敗しても続行
+        if field not in ("documents", "metadatas"):
+            return {"success": False, "message": f"Invalid field '{field}'. Use 'documents' or 'metadatas'"}
+        if not keyword:
+            return {"success": False, "message": "keyword must not be empty"}
         try:
             if manager.chroma_client:
                 collection = manager.chroma_client.get_collection(collection_name)
-                # 全件取得（大規模の場合は分割取得推奨）
-                results = await asyncio.to_thread(collection.get)
-                docs = results.get("documents", [])
-                ids = results.get("ids", [])
-                metadatas = results.get("metadatas", [])
-                matched_ids = []
-                for i, doc in enumerate(docs):
-                    if field == "documents" and keyword in doc:
-                        matched_ids.append(str(ids[i]))
-                    elif field == "metadatas":
-                        meta = metadatas[i] if i < len(metadatas) else None
-                        if meta and any(keyword in str(v) for v in meta.values()):
-                            matched_ids.append(str(ids[i]))
-                if not matched_ids:
-                    return {"success": True, "message": f"No documents matched keyword '{keyword}'", "deleted_count": 0}
-                # 一括削除
-                await asyncio.to_thread(collection.delete, ids=matched_ids)
+                page_bytes = max(1, page_target_mb) * 1024 * 1024
+
+                # ページ単位で走査しながらバッチ削除（全件・全該当IDを同時に保持しない）
+                def stream_delete():
+                    if field == "documents":
+                        pager = CollectionPager(
+                            collection,
+                            include=[],
+                            where_document={"$contains": keyword},
+                            page_size=batch_size or DEFAULT_BATCH_SIZE,
+                            target_page_bytes=0
+                        )
+                    else:
+                        pager = CollectionPager(collection, include=["metadatas"], target_page_bytes=page_bytes)
+                    deleter = BatchDeleter(
+                        collection,
+                        batch_size=batch_size,
+                        dry_run=dry_run,
+                        on_flush=pager.note_deleted
+                    )
+                    for row in pager.iter_rows():
+                        if field == "metadatas":
+                            meta = row.get("metadata")
+                            if not meta or not any(keyword in str(v) for v in meta.values()):
+                                continue
+                        deleter.add(str(row["id"]))
+                    deleter.flush()
+                    result = deleter.summary()
+                    result["scan"] = pager.stats()
+                    return result
+
+                summary = await to_thread(stream_delete)
+                if not summary["matched_count"]:
+                    return {"success": True, "message": f"No documents matched keyword '{keyword}'", "deleted_count": 0, "dry_run": dry_run}
+                if dry_run:
+                    message = f"{summary['matched_count']} documents containing '{keyword}' would be deleted from '{collection_name}'"
+                else:
+                    message = f"Deleted {summary['deleted_count']} documents containing '{keyword}' in '{collection_name}'"
                 return {
                     "success": True,
-                    "message": f"Deleted {len(matched_ids)} documents containing '{keyword}' in '{collection_name}'",
-                    "deleted_count": len(matched_ids),
-                    "deleted_ids": matched_ids
+                    "message": message,
+                    **summary,
+                    ("matched_ids" if dry_run else "deleted_ids"): summary["sample_ids"]
                 }
             else:
                 return {"success": False, "message": "ChromaDB client not initialized"}
@@ -65,24 +91,27 @@ def register_search_and_delete_tools(mcp, manager):
         """
         指定コレクション内でIDがstr型でないドキュメントを検出し、一括削除する。
         """
-        import asyncio
+        from modules.tool_profiling import to_thread
         if not manager.initialized:
             manager.initialize()
         try:
             if manager.chroma_client:
                 collection = manager.chroma_client.get_collection(collection_name)
-                # まず全件取得を試みる（エラー時は分割取得も検討）
+                # IDのみをページ単位で走査
+                def scan_non_str_ids():
+                    found = []
+                    for page in CollectionPager(collection, include=[]):
+                        found.extend(i for i in (page.get("ids") or []) if not isinstance(i, str))
+                    return found
                 try:
-                    results = await asyncio.to_thread(collection.get, None, None, ["ids"])
+                    non_str_ids = await to_thread(scan_non_str_ids)
                 except Exception as e:
                     return {"success": False, "message": f"Error getting IDs: {str(e)}"}
-                ids = results.get("ids", [])
-                non_str_ids = [i for i in ids if not isinstance(i, str)]
                 if not non_str_ids:
                     return {"success": True, "message": "No non-str IDs found.", "deleted_count": 0}
                 # 一括削除
                 try:
-                    await asyncio.to_thread(collection.delete, ids=non_str_ids)
+                    await to_thread(collection.delete, ids=non_str_ids)
                 except Exception as e:
                     return {"success": False, "message": f"Error deleting non-str IDs: {str(e)}", "ids": non_str_ids}
                 return {
@@ -13,7 +13,7 @@ def register_search_tools(mcp, manager):
     async def chroma_search_text(query: str, n_results: int = 5, collection_name: Optional[str] = None) -> dict:
         """テキスト検索（async/await・エラーハンドリング強化版）"""
         import traceback
-        import asyncio
+        from modules.tool_profiling import to_thread
         if not manager.initialized:
             try:
                 await manager.initialize()
@@ -27,8 +27,8 @@ def register_search_tools(mcp, manager):
             if collection_name not in manager.collections:
                 return {"success": False, "message": f"Collection '{collection_name}' not found"}
             collection = manager.collections[collection_name]
-            # collection.queryは同期I/Oなのでasyncio.to_threadでラップ
-            results = await asyncio.to_thread(collection.query, query_texts=[query], n_results=n_results)
+            # collection.queryは同期I/Oなのでワーカースレッドで実行
+            results = await to_thread(collection.query, query_texts=[query], n_results=n_results)
             return {
                 "success": True,
                 "query": query,
@@ -10,6 +10,8 @@ import re
 import unicodedata
 import sys
 from modules.learning_logger import log_learning_error
+from modules.query_filters import stamp_timestamp
+from modules.paging import CollectionPager
 
 # コレクション作成確認機能
 async def confirm_collection_creation(collection_name: str, reason: str = "データ保存") -> dict:
@@ -37,9 +39,7 @@ def register_storage_tools(mcp, manager):
             if collection_name not in manager.collections:
                 return await confirm_collection_creation(collection_name, "テキストデータ保存")
             collection = manager.collections[collection_name]
-            if metadata is None:
-                metadata = {}
-            metadata["timestamp"] = datetime.now().isoformat()
+            metadata = stamp_timestamp(metadata)
             doc_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
             collection.add(
                 documents=[text],
@@ -95,9 +95,9 @@ def register_storage_tools(mcp, manager):
             metadata.update({
                 "source_type": "pdf",
                 "file_path": str(pdf_path),
-                "timestamp": datetime.now().isoformat(),
                 "pages": len(reader.pages)
             })
+            stamp_timestamp(metadata)
             doc_id = f"pdf_{pdf_path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
             collection.add(
                 documents=[text_content],
@@ -285,7 +285,8 @@ def register_storage_tools(mcp, manager):
         user_pattern: Optional[str] = None,
         regex: Optional[str] = None,
         max_results: int = 50,
-        extract_user_names: Optional[bool] = None
+        extract_user_names: Optional[bool] = None,
+        timeout_seconds: Optional[float] = None
     ) -> dict:
         """柔軟な条件でChromaDBからドキュメントを検索（AND条件可）
         - collection_name: コレクション名（省略時はデフォルト）
@@ -296,6 +297,7 @@ def register_storage_tools(mcp, manager):
         - regex: 任意の正規表現
         - max_results: 最大件数
         - extract_user_names: Trueで利用者名リストを返す（未指定時、dateとtime両方指定なら自動で有効）
+        - timeout_seconds: 走査の締め切り秒数（未指定時は設定deadlines。超過時はそこまでのヒットをtruncated=Trueで返す）
         """
         if not manager.initialized:
             await manager.initialize()
@@ -313,11 +315,11 @@ def register_storage_tools(mcp, manager):
             conditions.append(date)
         if time:
             conditions.append(time)
-        # ドキュメント取得
-        docs = collection.get()["documents"]
+        # ドキュメントをページ単位で走査（max_resultsに達したら打ち切り）
         results = []
         import re as _re
-        for doc in docs:
+        for row in CollectionPager(collection, include=["documents"]).iter_rows():
+            doc = row.get("document") or ""
             hit = True
             for cond in conditions:
                 if cond and cond not in doc:
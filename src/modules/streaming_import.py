@@ -0,0 +1,452 @@
+"""
+JSON / JSON Lines のストリーミングインポート
+ファイル全体を読み込まず、1行（1要素）ずつ取り出して検証・正規化し、BatchUpserterでバッチupsertする。
+メモリ使用量はバッチ1つ分とパーサーのバッファ程度に収まる。
+
+- JSONL: 1行1レコード。壊れた行は拒否して次の行へ進む
+- JSON: トップレベルの配列を要素ごとに読み出す（chroma_export_dataの出力 {"documents": [...]} も可）。
+  ijsonがあれば使い、なければ標準jsonのraw_decodeによる逐次パーサーを使う
+- レコード: 文字列、または {"id", "text"（または"document"）, "metadata"}。sourceのない行には"source": "import"を付ける
+- 検証に失敗した行・upsertに失敗した行は拒否ファイル（JSONL）に理由つきで書き出し、残りの取り込みは続ける
+- 同じIDでの再実行は上書きになるため、途中で止まった取り込みはstart_indexを指定して続きから再開できる
+"""
+
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Callable
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import json
+import math
+import re
+import time
+
+from modules.batch_ops import BatchUpserter
+from modules.deadlines import stop_requested
+from modules.query_filters import ensure_epoch
+from modules.structured_logging import get_logger, LOG_DIR
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = get_logger("streaming_import")
+
+DEFAULT_REJECTED_DIR = LOG_DIR / "imports"
+# 逐次パーサーが1回に読み込む文字数
+READ_CHUNK_CHARS = 1 << 16
+# 1要素の最大文字数（これを超えて読み足しても値が閉じなければ不正とみなす）
+MAX_ELEMENT_CHARS = 16 * 1024 * 1024
+# デコードエラーの位置がバッファ末尾からこの文字数以内なら、値が途中で切れているとみなして読み足す
+# （"tru"・"\u12"・"1e" など末尾で切れたリテラルやエスケープの長さ）
+TRUNCATION_MARGIN = 8
+# 応答に含める拒否行の最大件数
+MAX_REJECTED_SAMPLE = 20
+DEFAULT_ID_PREFIX = "import_"
+# sourceのないレコードに付ける値（ChromaDBは空のメタデータを受け付けないため、全行に必ず1つはキーを持たせる）
+IMPORT_SOURCE = "import"
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_DECODER = json.JSONDecoder()
+
+
+class _JsonStreamReader:
+    """
+    テキストストリームからJSON値を1つずつ取り出す逐次パーサー
+    値の末尾がバッファの端にかかる場合（途中で切れた文字列・数値）は追加で読み込んでからデコードし直す。
+    末尾にかかっていない構文エラーはすぐに、max_element_charsを超える値はその時点でValueErrorにする
+    """
+
+    def __init__(self, stream, chunk_chars: int = READ_CHUNK_CHARS, max_element_chars: int = MAX_ELEMENT_CHARS):
+        self.stream = stream
+        self.chunk_chars = chunk_chars
+        self.max_element_chars = max_element_chars
+        self.buffer = ""
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos:
+            self.consumed += self.pos
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        # 大きな値は読み込み量を倍々に増やし、デコードのやり直し回数を抑える
+        data = self.stream.read(max(self.chunk_chars, len(self.buffer)))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer += data
+        return True
+
+    def _error(self, message: str, pos: Optional[int] = None) -> ValueError:
+        return ValueError(f"{message} at char {self.consumed + (self.pos if pos is None else pos)}")
+
+    def peek(self) -> str:
+        """空白を読み飛ばして次の文字を返す（終端なら空文字）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self._error(f"Expected '{char}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """次のJSON値を1つデコードする"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                cut_off = e.msg.startswith("Unterminated string") or e.pos >= len(self.buffer) - TRUNCATION_MARGIN
+                if self.eof or not cut_off:
+                    raise self._error(f"Invalid JSON: {e.msg}", e.pos)
+            if len(self.buffer) - self.pos >= self.max_element_chars:
+                raise self._error(f"JSON value exceeds {self.max_element_chars} chars")
+            self._fill()
+
+    def array_items(self) -> Iterator[Any]:
+        """配列の要素を順に返す（'['の位置から）"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            if char == "]":
+                self.pos += 1
+                return
+            if char != ",":
+                raise self._error("Expected ',' or ']'")
+            self.pos += 1
+
+    def records(self) -> Iterator[Any]:
+        """トップレベルの配列、またはオブジェクトの"documents"配列の要素を返す"""
+        char = self.peek()
+        if char == "[":
+            yield from self.array_items()
+            return
+        if char != "{":
+            raise self._error("Expected a JSON array of documents")
+        self.pos += 1
+        while self.peek() != "}":
+            key = self.value()
+            self.expect(":")
+            if key == "documents" and self.peek() == "[":
+                yield from self.array_items()
+                return
+            self.value()
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char != "}":
+                raise self._error("Expected ',' or '}'")
+        raise ValueError('JSON object has no "documents" array')
+
+
+def resolve_format(path: str, format: str = "auto") -> str:
+    """ファイル形式を決める（auto: 拡張子が.jsonl/.ndjsonならjsonl、それ以外はjson）"""
+    fmt = (format or "auto").lower()
+    if fmt == "auto":
+        return "jsonl" if Path(path).suffix.lower() in JSONL_SUFFIXES else "json"
+    if fmt in ("jsonl", "ndjson"):
+        return "jsonl"
+    if fmt == "json":
+        return "json"
+    raise ValueError(f"Unsupported format: {format}")
+
+
+class RecordReader:
+    """
+    ファイルからレコードを1件ずつ返す（(record, error)。JSONLの壊れた行はrecordに元の行、errorに理由）
+    Args:
+        path: 入力ファイル
+        format: auto / json / jsonl
+    """
+
+    def __init__(self, path: str, format: str = "auto"):
+        self.path = path
+        self.format = resolve_format(path, format)
+        if self.format == "jsonl":
+            self.parser = "jsonl"
+        else:
+            self.parser = "ijson" if ijson is not None else "builtin"
+
+    def _jsonl(self) -> Iterator[Tuple[Any, Optional[str]]]:
+        with open(self.path, "r", encoding="utf-8-sig") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line), None
+                except json.JSONDecodeError as e:
+                    yield line, f"invalid JSON on line {line_no}: {e.msg}"
+
+    def _ijson(self) -> Iterator[Tuple[Any, Optional[str]]]:
+        with open(self.path, "rb") as f:
+            head = f.read(4096).lstrip(b"\xef\xbb\xbf \t\r\n")
+            f.seek(0)
+            prefix = "documents.item" if head.startswith(b"{") else "item"
+            try:
+                for record in ijson.items(f, prefix):
+                    yield record, None
+            except ijson.JSONError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+
+    def _builtin(self) -> Iterator[Tuple[Any, Optional[str]]]:
+        with open(self.path, "r", encoding="utf-8-sig") as f:
+            for record in _JsonStreamReader(f).records():
+                yield record, None
+
+    def __iter__(self) -> Iterator[Tuple[Any, Optional[str]]]:
+        if self.parser == "jsonl":
+            return self._jsonl()
+        if self.parser == "ijson":
+            return self._ijson()
+        return self._builtin()
+
+
+def normalize_metadata(metadata: Any) -> Dict[str, Any]:
+    """
+    メタデータをChromaDBが受け付ける形に正規化する（不正な値はValueError）
+    Noneの値は除外、リストは空白区切りの文字列、入れ子のオブジェクトはJSON文字列にし、日付からエポック秒を補完する
+    """
+    if metadata is None:
+        return {}
+    if not isinstance(metadata, dict):
+        raise ValueError(f"metadata must be an object, not {type(metadata).__name__}")
+    normalized: Dict[str, Any] = {}
+    for key, value in metadata.items():
+        if not isinstance(key, str) or not key:
+            raise ValueError(f"invalid metadata key: {key!r}")
+        if value is None:
+            continue
+        if isinstance(value, Decimal):
+            value = float(value)
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f"metadata '{key}' is not a finite number")
+        if isinstance(value, (str, int, float, bool)):
+            normalized[key] = value
+        elif isinstance(value, (list, tuple)):
+            normalized[key] = " ".join(str(v) for v in value if v is not None)
+        elif isinstance(value, dict):
+            normalized[key] = json.dumps(value, ensure_ascii=False, default=str)
+        else:
+            raise ValueError(f"unsupported metadata value for '{key}': {type(value).__name__}")
+    return ensure_epoch(normalized)
+
+
+def normalize_record(record: Any, index: int, id_prefix: str = DEFAULT_ID_PREFIX) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    1レコードを検証して(doc_id, document, metadata)にする（不正なレコードはValueError）
+    Args:
+        record: 文字列、または {"id", "text"（または"document"）, "metadata"}
+        index: ファイル内の通し番号（IDがない場合の既定ID）
+        id_prefix: 既定IDの接頭辞
+    """
+    doc_id = f"{id_prefix}{index}"
+    if isinstance(record, str):
+        document, metadata = record, {}
+    elif isinstance(record, dict):
+        document = record.get("text", record.get("document"))
+        if not isinstance(document, str):
+            raise ValueError('missing "text" string')
+        raw_id = record.get("id")
+        if raw_id is not None:
+            if isinstance(raw_id, bool) or not isinstance(raw_id, (str, int)) or raw_id == "":
+                raise ValueError(f"invalid id: {raw_id!r}")
+            doc_id = str(raw_id)
+        metadata = normalize_metadata(record.get("metadata"))
+    else:
+        raise ValueError(f"unsupported row type: {type(record).__name__}")
+    if not document.strip():
+        raise ValueError("empty document")
+    metadata.setdefault("source", IMPORT_SOURCE)
+    return doc_id, document, metadata
+
+
+class RejectedRows:
+    """
+    拒否した行をJSONLファイルへ書き出す（最初の拒否でファイルを作る）
+    各行: {"index", "id", "reason", "row"}（rowは元のレコード。修正してそのまま再インポートできる）
+    """
+
+    def __init__(self, path: Path, sample_limit: int = MAX_REJECTED_SAMPLE):
+        self.path = Path(path)
+        self.sample_limit = sample_limit
+        self.count = 0
+        self.samples: List[Dict[str, Any]] = []
+        self._file = None
+
+    def add(self, index: int, doc_id: Optional[str], reason: str, row: Any) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")
+        entry = {"index": index, "id": doc_id, "reason": reason}
+        self._file.write(json.dumps({**entry, "row": row}, ensure_ascii=False, default=str) + "\n")
+        self.count += 1
+        if len(self.samples) < self.sample_limit:
+            self.samples.append(entry)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _ImportUpserter(BatchUpserter):
+    """
+    失敗したバッチを1件ずつ再試行し、失敗した行だけを拒否するBatchUpserter
+    バッファ内に同じIDが来たら先にフラッシュする（後の行で上書きされる順序を保つ）
+    """
+
+    def __init__(self, collection, batch_size: Optional[int], on_reject: Callable[[int, str, str, Any], None]):
+        super().__init__(collection, batch_size=batch_size)
+        self.on_reject = on_reject
+        self.failed = 0
+        self.pending_indexes: List[int] = []
+        self._pending_set: set = set()
+
+    def add_row(self, index: int, doc_id: str, document: str, metadata: Dict[str, Any]) -> None:
+        if doc_id in self._pending_set:
+            self.flush()
+        self._pending_set.add(doc_id)
+        self.pending_indexes.append(index)
+        self.add(doc_id, document, metadata)
+
+    def _reject(self, index: int, doc_id: str, document: str, metadata: Dict[str, Any], error: Exception) -> None:
+        self.failed += 1
+        self.on_reject(index, doc_id, f"upsert failed: {type(error).__name__}: {error}",
+                       {"id": doc_id, "text": document, "metadata": metadata})
+
+    def _write(self) -> None:
+        try:
+            super()._write()
+            return
+        except Exception as e:
+            batch_error = e
+        rows = list(zip(self.pending_indexes, self.pending_ids, self.pending_documents, self.pending_metadatas))
+        if len(rows) == 1:
+            self._reject(*rows[0], batch_error)
+            return
+        # 1件ずつの再試行の所要時間はバッチの実績ではないため、サイザーに渡さない
+        self.observe_timing = False
+        for index, doc_id, document, metadata in rows:
+            try:
+                self.collection.upsert(ids=[doc_id], documents=[document], metadatas=[metadata] if metadata else None)
+            except Exception as e:
+                self._reject(index, doc_id, document, metadata, e)
+
+    def _clear(self) -> None:
+        super()._clear()
+        self.pending_indexes = []
+        self._pending_set = set()
+
+
+class StreamingImporter:
+    """
+    ファイルをストリーミングで読み、検証・正規化してコレクションへバッチupsertする
+    Args:
+        collection: 取り込み先
+        path: 入力ファイル
+        format: auto / json / jsonl
+        batch_size: 1回のupsertの件数（Noneで自動調整）
+        start_index: この通し番号より前のレコードは読み飛ばす（中断した取り込みの再開用）
+        rejected_path: 拒否ファイルの出力先（Noneでログディレクトリのimports/配下）
+        id_prefix: IDのないレコードの既定IDの接頭辞
+    """
+
+    def __init__(self, collection, path: str, format: str = "auto", batch_size: Optional[int] = None,
+                 start_index: int = 0, rejected_path: Optional[str] = None, id_prefix: str = DEFAULT_ID_PREFIX):
+        self.collection = collection
+        self.path = path
+        self.reader = RecordReader(path, format)
+        self.batch_size = batch_size
+        self.start_index = max(0, start_index)
+        if rejected_path is None:
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            rejected_path = str(DEFAULT_REJECTED_DIR / f"{Path(path).stem}_rejected_{stamp}.jsonl")
+        self.rejected = RejectedRows(Path(rejected_path))
+        self.id_prefix = id_prefix
+
+    def run(self) -> Dict[str, Any]:
+        """
+        最後（または呼び出しの締め切り）まで取り込む
+        Returns: 件数・rows/sec・拒否ファイル・バッチの統計（途中で止まった場合はnext_indexから再開できる）
+        """
+        started = time.perf_counter()
+        upserter = _ImportUpserter(self.collection, self.batch_size, self.rejected.add)
+        rows_read = 0
+        next_index: Optional[int] = None
+        error: Optional[str] = None
+        try:
+            for index, (record, problem) in enumerate(self.reader):
+                if index >= self.start_index and stop_requested("import"):
+                    next_index = index
+                    break
+                rows_read = index + 1
+                if index < self.start_index:
+                    continue
+                if problem:
+                    self.rejected.add(index, None, problem, record)
+                    continue
+                try:
+                    doc_id, document, metadata = normalize_record(record, index, self.id_prefix)
+                except ValueError as e:
+                    self.rejected.add(index, None, str(e), record)
+                    continue
+                upserter.add_row(index, doc_id, document, metadata)
+        except ValueError as e:
+            # 配列の構文エラーからは再同期できないため、そこまでの分を書いて止める
+            error = str(e)
+            next_index = rows_read
+        finally:
+            upserter.flush()
+            self.rejected.close()
+        seconds = time.perf_counter() - started
+        imported = upserter.written - upserter.failed
+        report = {
+            "completed": next_index is None,
+            "format": self.reader.format,
+            "parser": self.reader.parser,
+            "rows_read": rows_read,
+            "skipped": min(rows_read, self.start_index),
+            "imported": imported,
+            "rejected": self.rejected.count,
+            "rejected_path": str(self.rejected.path) if self.rejected.count else None,
+            "rejected_sample": self.rejected.samples,
+            "next_index": next_index,
+            "error": error,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(imported / seconds, 1) if seconds > 0 else None,
+            "batching": upserter.sizer.describe()
+        }
+        logger.info("Import finished", extra={
+            "path": self.path, "imported": imported, "rejected": self.rejected.count,
+            "completed": report["completed"], "seconds": report["seconds"],
+            "rows_per_second": report["rows_per_second"]
+        })
+        return report
+
+
+__all__ = [
+    "RecordReader",
+    "RejectedRows",
+    "StreamingImporter",
+    "normalize_metadata",
+    "normalize_record",
+    "resolve_format",
+]
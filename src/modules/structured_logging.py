@@ -0,0 +1,248 @@
+"""
+構造化ロギング
+サーバー全体のログをJSON Lines形式で1つのキュー経由の書き込みスレッドに集約する
+
+- 呼び出し側はQueueHandlerへの投入のみ（ファイルの開閉・書き込みはQueueListenerのスレッドで実行）
+- ログレベルは設定ファイルのlogging.levelで制御し、閾値未満のメッセージは整形せず破棄
+- ツール呼び出しごとに相関ID（correlation_id）を払い出し、その呼び出し中のログに自動付与
+"""
+
+from typing import Dict, Any, Optional, Iterator, Callable, Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from pathlib import Path
+import atexit
+import functools
+import inspect
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import uuid
+
+LOGGER_NAME = "chromadb_mcp"
+LOG_DIR = Path(__file__).parent.parent.parent / "logs"
+LOG_FILE_NAME = "fastmcp_server.jsonl"
+
+correlation_id_var: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+tool_name_var: ContextVar[Optional[str]] = ContextVar("tool_name", default=None)
+
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class JsonLineFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに整形する"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_") and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class CorrelationFilter(logging.Filter):
+    """実行中のツール呼び出しの相関ID・ツール名をレコードへ付与する"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "correlation_id", None) is None:
+            record.correlation_id = correlation_id_var.get()
+        if getattr(record, "tool", None) is None:
+            record.tool = tool_name_var.get()
+        return True
+
+
+def _resolve_level(level: Any) -> int:
+    if isinstance(level, int):
+        return level
+    resolved = logging.getLevelName(str(level).upper())
+    return resolved if isinstance(resolved, int) else logging.INFO
+
+
+def setup_logging(level: Optional[Any] = None,
+                  log_dir: Optional[Path] = None,
+                  console: Optional[bool] = None) -> logging.Logger:
+    """
+    構造化ロギングを初期化（2回目以降は何もしない）
+    Args:
+        level: ログレベル（Noneで設定値logging.level）
+        log_dir: 出力ディレクトリ（Noneでプロジェクトのlogs/）
+        console: stderrへも出力するか（Noneで設定値logging.console_enabled）
+    Returns: ルートロガー（chromadb_mcp）
+    """
+    global _listener
+    root = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return root
+    with _setup_lock:
+        if _listener is not None:
+            return root
+        file_enabled = True
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            if level is None:
+                level = settings.get_setting("logging.level", "INFO")
+            if console is None:
+                console = bool(settings.get_setting("logging.console_enabled", False))
+            file_enabled = bool(settings.get_setting("logging.file_enabled", True))
+        except Exception:
+            level = level or "INFO"
+        target_dir = Path(log_dir) if log_dir else LOG_DIR
+        handlers = []
+        formatter = JsonLineFormatter()
+        if file_enabled:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            file_handler = TimedRotatingFileHandler(
+                target_dir / LOG_FILE_NAME, when="midnight", backupCount=14, encoding="utf-8"
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        if console:
+            # stdoutはMCPのstdio通信に使われるためstderrへ出力
+            console_handler = logging.StreamHandler(sys.stderr)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(CorrelationFilter())
+        root.handlers = [queue_handler]
+        root.setLevel(_resolve_level(level))
+        root.propagate = False
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出して書き込みスレッドを停止"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logger(name: str = "") -> logging.Logger:
+    """chromadb_mcp配下のロガーを取得（初回に初期化）"""
+    setup_logging()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def tool_call_context(tool_name: str, correlation_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    ツール呼び出し1回分のログ文脈
+    相関IDを払い出し、終了時に所要時間（duration_ms）と成否を1行記録する
+    """
+    logger = get_logger("tools")
+    cid = correlation_id or new_correlation_id()
+    cid_token = correlation_id_var.set(cid)
+    tool_token = tool_name_var.set(tool_name)
+    started = time.perf_counter()
+    call: Dict[str, Any] = {"correlation_id": cid, "tool": tool_name, "status": "ok"}
+    try:
+        yield call
+    except BaseException as e:
+        call["status"] = "error"
+        call["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        call["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        logger.log(
+            logging.WARNING if call["status"] == "error" else logging.INFO,
+            "tool call finished",
+            extra={"duration_ms": call["duration_ms"], "status": call["status"], "error": call.get("error")}
+        )
+        correlation_id_var.reset(cid_token)
+        tool_name_var.reset(tool_token)
+
+
+def traced_tool(fn: Callable, name: Optional[str] = None) -> Callable:
+    """ツール関数を相関ID・所要時間付きのログ文脈で包む（同期/非同期両対応・シグネチャ保持）"""
+    tool_name = name or fn.__name__
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with tool_call_context(tool_name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        with tool_call_context(tool_name):
+            return fn(*args, **kwargs)
+    return sync_wrapper
+
+
+def install_tool_tracing(mcp, wrappers: Iterable[Callable] = ()) -> None:
+    """
+    mcp.tool()で登録される全ツールにtraced_toolを適用する（各register_*_toolsより前に呼ぶ）
+    Args:
+        mcp: FastMCPインスタンス
+        wrappers: traced_toolの内側に追加で適用するラッパー（wrapper(fn, name)形式）
+    """
+    original_tool = mcp.tool
+    wrappers = tuple(wrappers)
+
+    def wrap(fn, name: Optional[str] = None):
+        tool_name = name or fn.__name__
+        for wrapper in wrappers:
+            fn = wrapper(fn, tool_name)
+        return traced_tool(fn, tool_name)
+
+    def tool(*args, **kwargs):
+        if args and callable(args[0]):
+            return original_tool(wrap(args[0], kwargs.get("name")), *args[1:], **kwargs)
+        decorator = original_tool(*args, **kwargs)
+
+        def register(fn):
+            return decorator(wrap(fn, kwargs.get("name")))
+        return register
+
+    mcp.tool = tool
+
+
+@contextmanager
+def file_sink(logger: logging.Logger, path: str, fmt: str = "%(message)s") -> Iterator[logging.Logger]:
+    """一時的に指定ファイルへもプレーンテキストで出力する（呼び出し単位のログファイル用）"""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(fmt))
+    logger.addHandler(handler)
+    try:
+        yield logger
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+__all__ = [
+    "setup_logging",
+    "shutdown_logging",
+    "get_logger",
+    "tool_call_context",
+    "traced_tool",
+    "install_tool_tracing",
+    "file_sink",
+    "new_correlation_id",
+    "correlation_id_var",
+    "JsonLineFormatter",
+]
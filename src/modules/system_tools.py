@@ -13,7 +13,7 @@ def register_system_tools(mcp, manager):
     async def chroma_get_server_info() -> dict:
         """サーバー情報取得"""
         if not manager.initialized:
-            await manager.initialize()
+            manager.initialize()
         
         try:
             server_info = {
@@ -27,12 +27,11 @@ def register_system_tools(mcp, manager):
             
             if manager.chroma_client:
                 try:
-                    collections = manager.chroma_client.list_collections()
-                    total_documents = sum(c.count() for c in collections)
+                    counts = manager.collection_counts()
                     server_info.update({
-                        "total_collections": len(collections),
-                        "total_documents": total_documents,
-                        "collection_names": [c.name for c in collections]
+                        "total_collections": len(counts),
+                        "total_documents": sum(counts.values()),
+                        "collection_names": list(counts)
                     })
                 except Exception as e:
                     server_info["collection_error"] = str(e)
@@ -85,7 +84,7 @@ def register_system_tools(mcp, manager):
                     backup_path = f"backup_{collection_name}_{timestamp}.json"
                 
                 # データ取得
-                results = collection.get()
+                results = manager.fetch(collection, reads=["ids", "documents", "metadatas"])
                 
                 backup_data = {
                     "collection_name": collection_name,
@@ -152,11 +151,8 @@ def register_system_tools(mcp, manager):
                 ids = data.get("ids", [])
                 
                 if documents:
-                    collection.add(
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
+                    from modules.batch_ops import write_in_batches
+                    write_in_batches(collection, "add", ids, documents=documents, metadatas=metadatas or None)
                 
                 manager.collections[collection_name] = collection
                 
@@ -0,0 +1,321 @@
+"""
+ツール単位の計測
+登録時に各ツールを包み、呼び出し回数・エラー数・レイテンシ分布・ペイロードサイズ・同時実行数を集計する
+
+集計値はchroma_performance_statsツールで参照でき、設定metrics.prometheus_fileを指定すると
+Prometheusのtextfile collector形式でも定期的に書き出す。
+"""
+
+from typing import Dict, Any, List, Optional, Callable
+from collections import deque
+from pathlib import Path
+import functools
+import inspect
+import itertools
+import math
+import os
+import threading
+import time
+
+# レイテンシのヒストグラム境界（ミリ秒）
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# パーセンタイル算出用に保持する直近サンプル数
+RECENT_SAMPLES = 1024
+# ペイロードサイズ見積りで1コンテナあたりに実測する要素数と最大深さ
+PAYLOAD_SAMPLE_ITEMS = 32
+PAYLOAD_MAX_DEPTH = 6
+
+
+def approx_payload_bytes(obj: Any, sample: int = PAYLOAD_SAMPLE_ITEMS, depth: int = PAYLOAD_MAX_DEPTH) -> int:
+    """
+    応答/引数のおおよそのJSONシリアライズサイズ（バイト）
+    大きなリスト/dictは先頭sample件のサイズから全体を外挿し、大きなペイロードでも一定コストで見積もる
+    """
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8", errors="ignore")) + 2
+    if obj is None or isinstance(obj, bool):
+        return 4
+    if isinstance(obj, (int, float)):
+        return 8
+    if depth <= 0:
+        return len(str(obj)) if not isinstance(obj, (dict, list, tuple)) else 2 + len(obj) * 8
+    if isinstance(obj, dict):
+        items = list(itertools.islice(obj.items(), sample))
+        measured = sum(len(str(k)) + 4 + approx_payload_bytes(v, sample, depth - 1) for k, v in items)
+        return 2 + (int(measured * len(obj) / len(items)) if items else 0)
+    if isinstance(obj, (list, tuple)):
+        items = list(itertools.islice(obj, sample))
+        measured = sum(approx_payload_bytes(v, sample, depth - 1) + 1 for v in items)
+        return 2 + (int(measured * len(obj) / len(items)) if items else 0)
+    return len(str(obj))
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+class ToolStats:
+    """1ツール分の集計値"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.max_response_bytes = 0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.recent_ms: deque = deque(maxlen=RECENT_SAMPLES)
+        self.last_called: Optional[float] = None
+
+    def observe(self, duration_ms: float, error: bool, failure: bool, request_bytes: int, response_bytes: int) -> None:
+        self.calls += 1
+        self.errors += int(error)
+        self.failures += int(failure)
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.max_response_bytes = max(self.max_response_bytes, response_bytes)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.recent_ms.append(duration_ms)
+        self.last_called = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_ms)
+        return {
+            "tool": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+            "p50_ms": _percentile(recent, 0.50),
+            "p95_ms": _percentile(recent, 0.95),
+            "p99_ms": _percentile(recent, 0.99),
+            "max_ms": round(self.max_ms, 3),
+            "total_ms": round(self.total_ms, 3),
+            "avg_request_bytes": self.request_bytes // self.calls if self.calls else 0,
+            "avg_response_bytes": self.response_bytes // self.calls if self.calls else 0,
+            "max_response_bytes": self.max_response_bytes,
+            "last_called": self.last_called
+        }
+
+
+class ToolMetricsRegistry:
+    """全ツールの集計値を保持する（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, ToolStats] = {}
+        self.started_at = time.time()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_stop = threading.Event()
+
+    def _get(self, name: str) -> ToolStats:
+        stats = self._tools.get(name)
+        if stats is None:
+            stats = self._tools[name] = ToolStats(name)
+        return stats
+
+    def register(self, name: str) -> None:
+        """ツールを0件の状態で登録（未呼び出しツールも一覧に出すため）"""
+        with self._lock:
+            self._get(name)
+
+    def begin(self, name: str) -> None:
+        with self._lock:
+            stats = self._get(name)
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+
+    def end(self, name: str, duration_ms: float, error: bool = False, failure: bool = False,
+            request_bytes: int = 0, response_bytes: int = 0) -> None:
+        with self._lock:
+            stats = self._get(name)
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.observe(duration_ms, error, failure, request_bytes, response_bytes)
+
+    def in_flight_total(self) -> int:
+        """実行中のツール呼び出し数（全ツール合計）"""
+        with self._lock:
+            return sum(stats.in_flight for stats in self._tools.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tools = {name: ToolStats(name) for name in self._tools}
+            self.started_at = time.time()
+
+    def snapshot(self, tool_name: Optional[str] = None, sort_by: str = "total_ms", top: Optional[int] = None,
+                 include_idle: bool = False) -> Dict[str, Any]:
+        """集計値の一覧（sort_byの降順）"""
+        with self._lock:
+            rows = [s.snapshot() for name, s in self._tools.items() if tool_name in (None, name)]
+        if not include_idle:
+            rows = [r for r in rows if r["calls"] or r["in_flight"]]
+        rows.sort(key=lambda r: (r.get(sort_by) is not None, r.get(sort_by) or 0), reverse=True)
+        if top:
+            rows = rows[:top]
+        return {
+            "since": self.started_at,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "total_calls": sum(r["calls"] for r in rows),
+            "total_errors": sum(r["errors"] for r in rows),
+            "tools": rows
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheusテキスト形式"""
+        lines = [
+            "# HELP chroma_mcp_tool_calls_total Tool invocations.",
+            "# TYPE chroma_mcp_tool_calls_total counter",
+        ]
+        with self._lock:
+            tools = [(name, s, list(s.bucket_counts)) for name, s in sorted(self._tools.items())]
+            for name, s, _ in tools:
+                lines.append(f'chroma_mcp_tool_calls_total{{tool="{name}"}} {s.calls}')
+            lines += ["# HELP chroma_mcp_tool_errors_total Tool invocations that raised.",
+                      "# TYPE chroma_mcp_tool_errors_total counter"]
+            for name, s, _ in tools:
+                lines.append(f'chroma_mcp_tool_errors_total{{tool="{name}"}} {s.errors}')
+            lines += ["# HELP chroma_mcp_tool_failures_total Tool invocations that returned success=false.",
+                      "# TYPE chroma_mcp_tool_failures_total counter"]
+            for name, s, _ in tools:
+                lines.append(f'chroma_mcp_tool_failures_total{{tool="{name}"}} {s.failures}')
+            lines += ["# HELP chroma_mcp_tool_in_flight Tool invocations currently running.",
+                      "# TYPE chroma_mcp_tool_in_flight gauge"]
+            for name, s, _ in tools:
+                lines.append(f'chroma_mcp_tool_in_flight{{tool="{name}"}} {s.in_flight}')
+            lines += ["# HELP chroma_mcp_tool_response_bytes_total Approximate response payload bytes.",
+                      "# TYPE chroma_mcp_tool_response_bytes_total counter"]
+            for name, s, _ in tools:
+                lines.append(f'chroma_mcp_tool_response_bytes_total{{tool="{name}"}} {s.response_bytes}')
+            lines += ["# HELP chroma_mcp_tool_latency_seconds Tool latency.",
+                      "# TYPE chroma_mcp_tool_latency_seconds histogram"]
+            for name, s, buckets in tools:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS_MS, buckets):
+                    cumulative += count
+                    lines.append(f'chroma_mcp_tool_latency_seconds_bucket{{tool="{name}",le="{bound / 1000:g}"}} {cumulative}')
+                lines.append(f'chroma_mcp_tool_latency_seconds_bucket{{tool="{name}",le="+Inf"}} {s.calls}')
+                lines.append(f'chroma_mcp_tool_latency_seconds_sum{{tool="{name}"}} {s.total_ms / 1000:.6f}')
+                lines.append(f'chroma_mcp_tool_latency_seconds_count{{tool="{name}"}} {s.calls}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> str:
+        """Prometheusテキストをアトミックに書き出す"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, target)
+        return str(target)
+
+    def start_prometheus_writer(self, path: str, interval: float = 15.0) -> None:
+        """Prometheusテキストを定期的に書き出すスレッドを起動"""
+        if self._writer and self._writer.is_alive():
+            return
+        self._writer_stop.clear()
+
+        def run():
+            while not self._writer_stop.wait(interval):
+                try:
+                    self.write_prometheus(path)
+                except Exception:
+                    pass
+
+        self._writer = threading.Thread(target=run, name="tool-metrics-prometheus", daemon=True)
+        self._writer.start()
+
+    def stop_prometheus_writer(self) -> None:
+        self._writer_stop.set()
+
+
+registry = ToolMetricsRegistry()
+
+
+def _is_failure(result: Any) -> bool:
+    return isinstance(result, dict) and result.get("success") is False
+
+
+def metered_tool(fn: Callable, name: Optional[str] = None, metrics: Optional[ToolMetricsRegistry] = None) -> Callable:
+    """ツール関数を計測付きで包む（同期/非同期両対応・シグネチャ保持）"""
+    tool_name = name or fn.__name__
+    target = metrics or registry
+    target.register(tool_name)
+
+    def request_size(args, kwargs) -> int:
+        return approx_payload_bytes([list(args), kwargs]) if args or kwargs else 0
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            target.begin(tool_name)
+            started = time.perf_counter()
+            error = False
+            result = None
+            try:
+                result = await fn(*args, **kwargs)
+                return result
+            except BaseException:
+                error = True
+                raise
+            finally:
+                target.end(tool_name, (time.perf_counter() - started) * 1000, error, _is_failure(result),
+                           request_size(args, kwargs), approx_payload_bytes(result) if result is not None else 0)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        target.begin(tool_name)
+        started = time.perf_counter()
+        error = False
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except BaseException:
+            error = True
+            raise
+        finally:
+            target.end(tool_name, (time.perf_counter() - started) * 1000, error, _is_failure(result),
+                       request_size(args, kwargs), approx_payload_bytes(result) if result is not None else 0)
+    return sync_wrapper
+
+
+def start_metrics_export() -> Optional[str]:
+    """設定metrics.prometheus_fileがあればPrometheusテキストの定期書き出しを開始"""
+    try:
+        from config.global_settings import GlobalSettings
+        settings = GlobalSettings()
+        path = settings.get_setting("metrics.prometheus_file", None)
+        interval = float(settings.get_setting("metrics.prometheus_interval", 15.0))
+    except Exception:
+        return None
+    if not path:
+        return None
+    registry.start_prometheus_writer(str(path), interval)
+    return str(path)
+
+
+__all__ = [
+    "ToolMetricsRegistry",
+    "registry",
+    "metered_tool",
+    "approx_payload_bytes",
+    "start_metrics_export",
+]
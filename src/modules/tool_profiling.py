@@ -0,0 +1,220 @@
+"""
+ツール呼び出し単位のプロファイリング（オプトイン）
+cProfileで1回の呼び出しを計測し、logs/profiles/に.prof（pstats形式）と上位関数の要約を保存する
+
+有効化の方法:
+- ツール引数 profile=True（引数を持つツールのみ）
+- 設定 profiling.enabled=true と profiling.tools（ツール名のリスト、"*"で全ツール）
+- chroma_profiling_config ツールで実行中に切り替え
+
+非同期ツールはイベントループのスレッドを計測しない（await中に同じループで動く他の呼び出しまで
+集計されてしまうため）。代わりにto_thread（asyncio.to_threadの代替）でワーカースレッドへ逃がした処理を
+スレッド内で計測し、呼び出し1回分を合算する（応答のprofile.scopeが"worker_threads"）。
+同時に1呼び出しのみ計測し、計測中の他の呼び出しは素通しする。
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Iterable
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import threading
+import time
+
+PROFILE_DIR = Path(__file__).parent.parent.parent / "logs" / "profiles"
+DEFAULT_TOP_N = 15
+
+
+class ProfilingConfig:
+    """プロファイリングの有効化状態（設定ファイル値で初期化し、実行中に変更可能）"""
+
+    def __init__(self):
+        self.enabled = False
+        self.tools: List[str] = []
+        self.top_n = DEFAULT_TOP_N
+        self.sort_by = "cumulative"
+        self.profile_dir = PROFILE_DIR
+        self._busy = threading.Lock()
+        self.profiles_written = 0
+
+    def load(self) -> "ProfilingConfig":
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            self.enabled = bool(settings.get_setting("profiling.enabled", False))
+            tools = settings.get_setting("profiling.tools", []) or []
+            self.tools = [tools] if isinstance(tools, str) else list(tools)
+            self.top_n = int(settings.get_setting("profiling.top_n", DEFAULT_TOP_N))
+            self.sort_by = str(settings.get_setting("profiling.sort_by", "cumulative"))
+            profile_dir = settings.get_setting("profiling.dir", None)
+            if profile_dir:
+                self.profile_dir = Path(str(profile_dir))
+        except Exception:
+            pass
+        return self
+
+    def update(self, enabled: Optional[bool] = None, tools: Optional[Iterable[str]] = None,
+               top_n: Optional[int] = None, sort_by: Optional[str] = None) -> Dict[str, Any]:
+        if enabled is not None:
+            self.enabled = enabled
+        if tools is not None:
+            self.tools = list(tools)
+        if top_n is not None:
+            self.top_n = max(1, top_n)
+        if sort_by is not None:
+            self.sort_by = sort_by
+        return self.describe()
+
+    def should_profile(self, tool_name: str) -> bool:
+        return self.enabled and ("*" in self.tools or tool_name in self.tools)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tools": list(self.tools),
+            "top_n": self.top_n,
+            "sort_by": self.sort_by,
+            "profile_dir": str(self.profile_dir),
+            "profiles_written": self.profiles_written
+        }
+
+
+config = ProfilingConfig()
+
+# 計測中の非同期ツール呼び出しで、ワーカースレッドごとのプロファイラを集める
+_thread_profiles: contextvars.ContextVar[Optional[List[cProfile.Profile]]] = contextvars.ContextVar(
+    "tool_profiling_thread_profiles", default=None
+)
+
+
+async def to_thread(func: Callable, /, *args, **kwargs) -> Any:
+    """
+    asyncio.to_threadの代わり（非同期ツールを計測中なら、ワーカースレッド内の処理をcProfileで計測する）
+    Args:
+        func: ワーカースレッドで実行する同期関数
+    Returns: funcの戻り値
+    """
+    profiles = _thread_profiles.get()
+    if profiles is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def run():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 同じ呼び出しの別スレッドを計測中など、他のプロファイラが有効な場合は計測せずに実行
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiles.append(profiler)
+    return await asyncio.to_thread(run)
+
+
+def summarize_profile(profiler, top_n: int, sort_by: str = "cumulative") -> List[Dict[str, Any]]:
+    """上位関数の要約（関数・呼び出し回数・自己時間・累積時間。profilerはcProfile.Profileかpstats.Stats）"""
+    stats = profiler if isinstance(profiler, pstats.Stats) else pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats(sort_by)
+    rows = []
+    for func in stats.fcn_list[:top_n]:
+        cc, nc, tt, ct, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            "function": f"{Path(filename).name}:{line}({name})" if line else name,
+            "calls": nc,
+            "primitive_calls": cc,
+            "self_s": round(tt, 4),
+            "cumulative_s": round(ct, 4)
+        })
+    return rows
+
+
+def _write_profile(profiler, tool_name: str, elapsed: float) -> Dict[str, Any]:
+    config.profile_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    path = config.profile_dir / f"{tool_name}_{stamp}.prof"
+    profiler.dump_stats(str(path))
+    config.profiles_written += 1
+    return {
+        "profile_file": str(path),
+        "wall_seconds": round(elapsed, 4),
+        "sort_by": config.sort_by,
+        "top_functions": summarize_profile(profiler, config.top_n, config.sort_by)
+    }
+
+
+def _attach(result: Any, summary: Dict[str, Any]) -> Any:
+    if isinstance(result, dict):
+        result = dict(result)
+        result["profile"] = summary
+    return result
+
+
+def profiled_tool(fn: Callable, name: Optional[str] = None) -> Callable:
+    """ツール関数をオプトインのcProfile計測付きで包む（同期/非同期両対応・シグネチャ保持）"""
+    tool_name = name or fn.__name__
+
+    def wants_profile(kwargs) -> bool:
+        return bool(kwargs.get("profile")) or config.should_profile(tool_name)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not wants_profile(kwargs) or not config._busy.acquire(blocking=False):
+                return await fn(*args, **kwargs)
+            # ループのスレッドは計測せず、to_threadで実行したワーカースレッド内の処理だけを集める
+            profiles: List[cProfile.Profile] = []
+            token = _thread_profiles.set(profiles)
+            started = time.perf_counter()
+            try:
+                try:
+                    result = await fn(*args, **kwargs)
+                finally:
+                    _thread_profiles.reset(token)
+                elapsed = time.perf_counter() - started
+                if not profiles:
+                    summary = {"wall_seconds": round(elapsed, 4), "top_functions": []}
+                else:
+                    summary = _write_profile(pstats.Stats(*profiles, stream=io.StringIO()), tool_name, elapsed)
+                summary.update({"scope": "worker_threads", "thread_calls": len(profiles)})
+                return _attach(result, summary)
+            finally:
+                config._busy.release()
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        if not wants_profile(kwargs) or not config._busy.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # 他のプロファイラ/デバッガが有効な場合は計測せずに実行
+                return fn(*args, **kwargs)
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+            return _attach(result, _write_profile(profiler, tool_name, time.perf_counter() - started))
+        finally:
+            config._busy.release()
+    return sync_wrapper
+
+
+__all__ = [
+    "ProfilingConfig",
+    "config",
+    "profiled_tool",
+    "summarize_profile",
+    "to_thread",
+]
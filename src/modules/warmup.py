@@ -0,0 +1,176 @@
+"""
+起動時ウォームアップ
+サーバー起動直後にバックグラウンドでChromaDB初期化・埋め込みモデル読み込み・HNSWインデックス読み込みを済ませ、
+再起動後の最初の検索がモデル/インデックス読み込みの待ち時間でタイムアウトしないようにする
+
+進捗と準備状態はchroma_health_checkで参照できる（manager.warmup）。
+設定: warmup.enabled / warmup.collections（ホットコレクション）/ warmup.query_text / warmup.include_default
+準備完了後、stats.rebuild_on_warmupが有効なら全コレクションを1回走査して統計ストアの分布を作る（準備状態には影響しない）
+"""
+
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+import threading
+import time
+
+from modules.structured_logging import get_logger
+
+logger = get_logger("warmup")
+
+DEFAULT_QUERY_TEXT = "warmup"
+
+
+class ServerWarmup:
+    """
+    ウォームアップの実行と状態管理
+    Args:
+        manager: ChromaDBManager
+        collections: 事前にクエリするコレクション（Noneで設定値）
+        query_text: ダミークエリの文字列
+        include_default: 既定コレクションも対象に含める
+    """
+
+    def __init__(self, manager,
+                 collections: Optional[List[str]] = None,
+                 query_text: str = DEFAULT_QUERY_TEXT,
+                 include_default: bool = True):
+        self.manager = manager
+        self.collections = list(collections or [])
+        self.query_text = query_text
+        self.include_default = include_default
+        self.enabled = True
+        self.rebuild_stats = True
+        self.status = "pending"
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self.errors: List[str] = []
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, manager) -> "ServerWarmup":
+        warmup = cls(manager)
+        try:
+            from config.global_settings import GlobalSettings
+            settings = GlobalSettings()
+            warmup.enabled = bool(settings.get_setting("warmup.enabled", True))
+            collections = settings.get_setting("warmup.collections", []) or []
+            warmup.collections = [collections] if isinstance(collections, str) else list(collections)
+            warmup.query_text = str(settings.get_setting("warmup.query_text", DEFAULT_QUERY_TEXT))
+            warmup.include_default = bool(settings.get_setting("warmup.include_default", True))
+            warmup.rebuild_stats = bool(settings.get_setting("stats.rebuild_on_warmup", True))
+        except Exception:
+            pass
+        return warmup
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "degraded", "disabled")
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def start(self) -> "ServerWarmup":
+        """バックグラウンドスレッドで開始（無効設定時は即座にdisabled）"""
+        if not self.enabled:
+            self.status = "disabled"
+            self._done.set()
+            return self
+        if self._thread is None:
+            self.status = "running"
+            self.started_at = datetime.now().isoformat()
+            self._thread = threading.Thread(target=self.run, name="server-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """完了まで待機（完了していればTrue）"""
+        return self._done.wait(timeout)
+
+    def _phase(self, name: str, fn) -> Any:
+        started = time.perf_counter()
+        entry: Dict[str, Any] = {"status": "running"}
+        self.phases[name] = entry
+        try:
+            result = fn()
+            entry["status"] = "ok"
+            return result
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e)
+            self.errors.append(f"{name}: {e}")
+            logger.warning("Warm-up phase failed", extra={"phase": name, "error": str(e)})
+            return None
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+
+    def _targets(self) -> List[str]:
+        targets = []
+        if self.include_default:
+            try:
+                from config.global_settings import GlobalSettings
+                targets.append(str(GlobalSettings().get_setting("default_collection.name", "sister_chat_history_v4")))
+            except Exception:
+                targets.append("sister_chat_history_v4")
+        for name in self.collections:
+            if name not in targets:
+                targets.append(name)
+        return targets
+
+    def _query(self, name: str) -> int:
+        collection = self.manager.chroma_client.get_collection(name)
+        self.manager.collections[name] = collection
+        count = collection.count()
+        if count:
+            # 埋め込み計算とHNSWインデックスのディスク読み込みを1件のクエリで済ませる
+            collection.query(query_texts=[self.query_text], n_results=1, include=[])
+        return count
+
+    def _rebuild_stats(self) -> int:
+        """全コレクションの統計分布を作り直す（件数は初期化時に記録済み）"""
+        rebuilt = 0
+        for name in self.manager.collection_counts():
+            self.manager.stats.rebuild(name, self.manager.chroma_client.get_collection(name))
+            rebuilt += 1
+        return rebuilt
+
+    def run(self) -> None:
+        """ウォームアップ本体（start()から別スレッドで呼ばれる）"""
+        total_started = time.perf_counter()
+        try:
+            if not self.manager.initialized:
+                if not self._phase("initialize", self.manager.initialize) or not self.manager.initialized:
+                    self.status = "failed"
+                    return
+            provider = getattr(self.manager, "embedding_provider", None)
+            if provider is not None:
+                self._phase("embedding_model", provider.load)
+            for name in self._targets():
+                self._phase(f"collection:{name}", lambda name=name: self._query(name))
+            self.status = "ready" if not self.errors else "degraded"
+            stats = getattr(self.manager, "stats", None)
+            if self.rebuild_stats and stats is not None and stats.enabled:
+                self._phase("stats", self._rebuild_stats)
+        finally:
+            self.finished_at = datetime.now().isoformat()
+            self._done.set()
+            logger.info("Warm-up finished", extra={
+                "status": self.status, "seconds": round(time.perf_counter() - total_started, 3), "errors": len(self.errors)
+            })
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "phases": {name: dict(entry) for name, entry in self.phases.items()},
+            "errors": list(self.errors)
+        }
+
+
+__all__ = [
+    "ServerWarmup",
+]
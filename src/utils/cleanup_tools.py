@@ -1,5 +1,114 @@
-from typing import Dict, Any
+from typing import List, Dict, Any, Optional
+import time
 from modules.learning_logger import log_learning_error
+from modules.paging import CollectionPager
+from modules.batch_ops import BatchDeleter, BatchUpserter, DEFAULT_BATCH_SIZE
+from modules.job_scheduler import report_progress
+
+# バックグラウンドジョブとして実行中のとき、この行数ごとに進捗を更新する
+PROGRESS_EVERY = 500
+# 結果に含めるIDの上限（件数は別に返す。コレクションの大きさに比例して応答が膨らまないように）
+MAX_REPORTED_IDS = 20
+
+
+class _IdReport:
+    """処理したIDの件数と先頭MAX_REPORTED_IDS件"""
+
+    def __init__(self):
+        self.count = 0
+        self.sample: List[str] = []
+
+    def add(self, doc_id: str) -> None:
+        self.count += 1
+        if len(self.sample) < MAX_REPORTED_IDS:
+            self.sample.append(doc_id)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"count": self.count, "sample": self.sample}
+
+
+def split_large_document(doc: str, chunk_size: int) -> List[str]:
+    """
+    大きなドキュメントをchunk_sizeごとに分割
+    """
+    return [doc[i:i+chunk_size] for i in range(0, len(doc), chunk_size)]
+
+
+def stream_cleanup(
+    collection,
+    min_length: Optional[int],
+    max_length: int,
+    split_large: bool,
+    delete_large: bool,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    1回のページ走査で空ドキュメント削除・大きいドキュメントの分割/削除をバッチ実行する
+    分割チャンクは決定的なID（<元ID>_split<n>）でupsertし、元ドキュメントの削除は
+    必ずチャンクの書き込み後に行うため、中断後に再実行しても欠損・重複しない
+    分割チャンク（メタデータにsplit_fromがある行）は空判定しない
+    （最後の短いチャンクが、同じ走査で再び読まれたときや次回の実行で空ドキュメントとして削除されないように）
+    Args:
+        collection: 対象コレクション
+        min_length: 空判定の最小長さ（Noneで空ドキュメント処理なし）
+        max_length: 分割/削除判定の最大長さ
+        split_large: Trueなら分割
+        delete_large: Trueなら大きいドキュメントを削除
+        batch_size: 1回のupsert/delete件数上限（None=自動調整）
+    Returns: 処理結果（removed_empty/removed_large/added_idsは件数と先頭MAX_REPORTED_IDS件のID）
+    """
+    started = time.perf_counter()
+    removed_empty = _IdReport()
+    removed_large = _IdReport()
+    split_count = 0
+    added_ids = _IdReport()
+    # 削除した件数はpagerに通知してoffsetを補正
+    pager = CollectionPager(collection, include=["documents", "metadatas"])
+    upserter = BatchUpserter(collection, batch_size=batch_size)
+    deleter = BatchDeleter(
+        collection,
+        batch_size=batch_size,
+        before_flush=upserter.flush,
+        on_flush=pager.note_deleted
+    )
+    for scanned, row in enumerate(pager.iter_rows(), 1):
+        if scanned % PROGRESS_EVERY == 0:
+            report_progress(scanned, message=f"scanned {scanned} rows")
+        doc_id = row["id"]
+        doc = row.get("document") or ""
+        is_split_chunk = "split_from" in (row.get("metadata") or {})
+        # 空ドキュメント削除
+        if min_length is not None and not is_split_chunk and len(doc.strip()) < min_length:
+            deleter.add(doc_id)
+            removed_empty.add(doc_id)
+        # 大きいドキュメント処理
+        elif len(doc) > max_length:
+            if delete_large:
+                deleter.add(doc_id)
+                removed_large.add(doc_id)
+            elif split_large:
+                base_meta = row.get("metadata") or {}
+                for idx, chunk in enumerate(split_large_document(doc, max_length)):
+                    new_id = f"{doc_id}_split{idx}"
+                    meta = dict(base_meta)
+                    meta["split_from"] = doc_id
+                    upserter.add(new_id, chunk, meta)
+                    added_ids.add(new_id)
+                deleter.add(doc_id)
+                split_count += 1
+    upserter.flush()
+    deleter.flush()
+    return {
+        "removed_empty": removed_empty.describe(),
+        "removed_large": removed_large.describe(),
+        "split_large_count": split_count,
+        "added_ids": added_ids.describe(),
+        "scan": pager.stats(),
+        "upsert_batches": upserter.timings(),
+        "delete_batches": deleter.timings(),
+        "elapsed_seconds": round(time.perf_counter() - started, 4)
+    }
+
 
 def chroma_cleanup_documents_impl(
     manager,
@@ -7,7 +116,8 @@ def chroma_cleanup_documents_impl(
     min_length: int = 1,
     max_length: int = 10000,
     split_large: bool = True,
-    delete_large: bool = False
+    delete_large: bool = False,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE
 ) -> Dict[str, Any]:
     """
     コレクション内の空ドキュメント削除・極端に大きいドキュメントの分割/削除（実装本体）
@@ -18,49 +128,15 @@ def chroma_cleanup_documents_impl(
         max_length: 分割/削除判定の最大長さ
         split_large: Trueなら分割、Falseなら削除
         delete_large: Trueなら大きいドキュメントを削除
+        batch_size: 1回のupsert/delete件数上限（None=自動調整）
     Returns: 処理結果
     """
     try:
         if not manager.initialized:
             manager.initialize()
         collection = manager.chroma_client.get_collection(collection_name)
-        all_docs = collection.get()
-        documents = all_docs.get("documents", [])
-        ids = all_docs.get("ids", [])
-        metadatas = all_docs.get("metadatas", [])
-        removed_empty = []
-        removed_large = []
-        split_count = 0
-        added_ids = []
-        # 空ドキュメント削除
-        for i, doc in enumerate(documents):
-            if len(doc.strip()) < min_length:
-                collection.delete(ids=[ids[i]])
-                removed_empty.append(ids[i])
-        # 大きいドキュメント処理
-        for i, doc in enumerate(documents):
-            if len(doc) > max_length:
-                if delete_large:
-                    collection.delete(ids=[ids[i]])
-                    removed_large.append(ids[i])
-                elif split_large:
-                    chunk_size = max_length
-                    chunks = [doc[j:j+chunk_size] for j in range(0, len(doc), chunk_size)]
-                    for idx, chunk in enumerate(chunks):
-                        new_id = f"{ids[i]}_split{idx}"
-                        meta = dict(metadatas[i]) if i < len(metadatas) else {}
-                        meta["split_from"] = ids[i]
-                        collection.add(documents=[chunk], metadatas=[meta], ids=[new_id])
-                        added_ids.append(new_id)
-                    collection.delete(ids=[ids[i]])
-                    split_count += 1
-        return {
-            "success": True,
-            "removed_empty": removed_empty,
-            "removed_large": removed_large,
-            "split_large_count": split_count,
-            "added_ids": added_ids
-        }
+        result = stream_cleanup(collection, min_length, max_length, split_large, delete_large, batch_size)
+        return {"success": True, **result}
     except Exception as e:
         log_learning_error({
             "function": "chroma_cleanup_documents_impl",
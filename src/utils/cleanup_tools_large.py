@@ -1,11 +1,7 @@
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 from modules.learning_logger import log_learning_error
-
-def split_large_document(doc: str, chunk_size: int) -> List[str]:
-    """
-    大きなドキュメントをchunk_sizeごとに分割
-    """
-    return [doc[i:i+chunk_size] for i in range(0, len(doc), chunk_size)]
+from modules.batch_ops import DEFAULT_BATCH_SIZE
+from utils.cleanup_tools import split_large_document, stream_cleanup
 
 
 def chroma_cleanup_large_documents_impl(
@@ -13,7 +9,8 @@ def chroma_cleanup_large_documents_impl(
     collection_name: str,
     max_length: int = 10000,
     split_large: bool = True,
-    delete_large: bool = False
+    delete_large: bool = False,
+    batch_size: Optional[int] = DEFAULT_BATCH_SIZE
 ) -> Dict[str, Any]:
     """
     極端に大きいドキュメントの特定・分割/削除
@@ -23,40 +20,16 @@ def chroma_cleanup_large_documents_impl(
         max_length: 分割/削除判定の最大長さ
         split_large: Trueなら分割、Falseなら削除
         delete_large: Trueなら大きいドキュメントを削除
+        batch_size: 1回のupsert/delete件数上限（None=自動調整）
     Returns: 処理結果
     """
     try:
         if not manager.initialized:
             manager.initialize()
         collection = manager.chroma_client.get_collection(collection_name)
-        all_docs = collection.get()
-        documents = all_docs.get("documents", [])
-        ids = all_docs.get("ids", [])
-        metadatas = all_docs.get("metadatas", [])
-        removed_large = []
-        split_count = 0
-        added_ids = []
-        for i, doc in enumerate(documents):
-            if len(doc) > max_length:
-                if delete_large:
-                    collection.delete(ids=[ids[i]])
-                    removed_large.append(ids[i])
-                elif split_large:
-                    chunks = split_large_document(doc, max_length)
-                    for idx, chunk in enumerate(chunks):
-                        new_id = f"{ids[i]}_split{idx}"
-                        meta = dict(metadatas[i]) if i < len(metadatas) else {}
-                        meta["split_from"] = ids[i]
-                        collection.add(documents=[chunk], metadatas=[meta], ids=[new_id])
-                        added_ids.append(new_id)
-                    collection.delete(ids=[ids[i]])
-                    split_count += 1
-        return {
-            "success": True,
-            "removed_large": removed_large,
-            "split_large_count": split_count,
-            "added_ids": added_ids
-        }
+        result = stream_cleanup(collection, None, max_length, split_large, delete_large, batch_size)
+        result.pop("removed_empty", None)
+        return {"success": True, **result}
     except Exception as e:
         log_learning_error({
             "function": "chroma_cleanup_large_documents_impl",
@@ -64,3 +37,9 @@ def chroma_cleanup_large_documents_impl(
             "error": str(e)
         })
         return {"success": False, "error": str(e)}
+
+
+__all__ = [
+    "split_large_document",
+    "chroma_cleanup_large_documents_impl",
+]